@@ -0,0 +1,310 @@
+
+"""
+Benchmark suite for the import / generate / write / state paths.
+
+For each project size it generates (or re-uses) a synthetic project, then times
+the stages below and records wall time, peak RSS and Python allocations into a
+JSON baseline. A later run can be compared against that baseline and exits
+non-zero when a stage regresses beyond the tolerance.
+
+Stages: read_project, expand_tags, reconcile_<table>, apply_diff_<table>,
+save_tags_db, get_project_state, rebuild_streaming (headless expand -> external
+sort -> merge-join -> write from the saved tags, on a fresh copy of the DBFs).
+
+Usage (from backend/):
+    python -m benchmarks.run_benchmarks --sizes 1k,10k --out benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --sizes 1k,10k --out /tmp/current.json --compare benchmarks/baseline.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from benchmarks.synthetic_project import SyntheticProject, DEFAULT_UDT_MIX, parse_size, size_label
+
+# (table type, key field, enable_guid) - same order as the pipeline
+TABLES = [("variable", "NAME", True), ("trend", "NAME", False), ("digalm", "TAG", False)]
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_CACHE = os.path.join(BENCH_DIR, ".cache")
+
+MB = 1024 * 1024
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None if it cannot be read)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class RssSampler:
+    """Samples RSS on a background thread so short peaks inside a stage are caught."""
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+class StageRecorder:
+    """
+    Collects per-stage measurements for one scenario run.
+
+    With `track_allocations` the stages run under tracemalloc (which slows them
+    down), so timings and allocations are taken from separate runs.
+    """
+    def __init__(self, track_allocations: bool = False):
+        self.track_allocations = track_allocations
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    @contextmanager
+    def measure(self, name: str):
+        result = {}
+        if self.track_allocations:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            blocks_before = sys.getallocatedblocks()
+            try:
+                yield
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result["alloc_peak_mb"] = round((peak - before) / MB, 2)
+                result["alloc_net_mb"] = round((current - before) / MB, 2)
+                result["alloc_blocks"] = sys.getallocatedblocks() - blocks_before
+        else:
+            with RssSampler() as sampler:
+                start = time.perf_counter()
+                try:
+                    yield
+                finally:
+                    result["seconds"] = round(time.perf_counter() - start, 4)
+            if sampler.peak is not None:
+                result["peak_rss_mb"] = round(sampler.peak / MB, 1)
+        self.stages[name] = result
+
+class Scenario:
+    """Runs the stages against a scratch copy of one synthetic project."""
+    def __init__(self, project: SyntheticProject, source_dir: str, work_dir: str, app):
+        self.project = project
+        self.source_dir = source_dir
+        self.work_dir = work_dir
+        self.app = app
+        self.grid_tags = project.grid_tags()
+
+    def run(self, recorder: StageRecorder):
+        scratch = os.path.join(self.work_dir, "project")
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.copytree(self.source_dir, scratch)
+        app = self.app
+
+        with recorder.measure("read_project"):
+            app.dbf_reader.read_project(scratch)
+
+        tags = [dict(t) for t in self.grid_tags]
+        with recorder.measure("expand_tags"):
+            expanded = app.udt_expander.expand_tags(tags)
+
+        diffs = {}
+        for table_type, key_field, enable_guid in TABLES:
+            path = os.path.join(scratch, f"{table_type}.dbf")
+            with recorder.measure(f"reconcile_{table_type}"):
+                diffs[table_type] = app.dbf_writer.reconcile_changes(expanded[table_type], path, key_field=key_field, enable_guid=enable_guid)
+
+        for table_type, _, _ in TABLES:
+            path = os.path.join(scratch, f"{table_type}.dbf")
+            with recorder.measure(f"apply_diff_{table_type}"):
+                app.dbf_writer.apply_diff(diffs[table_type], path, table_type)
+        del expanded, diffs
+
+        # The endpoints are async; each call runs on its own loop, through the same executors as the API
+        request = app.SaveTagsRequest(project_path=scratch, tags=tags)
+        with recorder.measure("save_tags_db"):
+            asyncio.run(app.save_tags_db(request))
+        with recorder.measure("get_project_state"):
+            asyncio.run(app.get_project_state(scratch))
+
+        shutil.rmtree(scratch, ignore_errors=True)
+        shutil.copytree(self.source_dir, scratch)
+        with recorder.measure("rebuild_streaming"):
+            app.pipeline.rebuild(scratch, app.iter_saved_tags(scratch), dict, app.Job("rebuild"))
+
+def load_app(work_dir: str):
+    """
+    Imports the API module with `work_dir` as cwd, so its SQLite file and
+    settings are created there instead of next to the real project_data.db.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.chdir(work_dir)
+    import main
+    return main
+
+def summarize(timing_runs: List[Dict[str, Dict[str, Any]]], alloc_run: Optional[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Median time / max RSS across repeats, merged with the allocation pass."""
+    stages = {}
+    for name in timing_runs[0]:
+        seconds = [run[name]["seconds"] for run in timing_runs]
+        rss = [run[name]["peak_rss_mb"] for run in timing_runs if "peak_rss_mb" in run[name]]
+        entry = {"seconds": round(statistics.median(seconds), 4), "seconds_min": min(seconds)}
+        if rss:
+            entry["peak_rss_mb"] = max(rss)
+        if alloc_run and name in alloc_run:
+            entry.update(alloc_run[name])
+        stages[name] = entry
+    return stages
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            min_seconds: float = 0.05, min_mb: float = 1.0) -> List[str]:
+    """
+    Prints a side-by-side table and returns the regressions. Tiny stages are only
+    flagged once the absolute change exceeds `min_seconds` / `min_mb` (noise floor).
+    """
+    regressions = []
+    metrics = [("seconds", min_seconds), ("peak_rss_mb", min_mb), ("alloc_peak_mb", min_mb)]
+    print(f"\n{'size':<6} {'stage':<24} {'metric':<14} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for label, result in current["sizes"].items():
+        base = baseline.get("sizes", {}).get(label)
+        if not base:
+            print(f"{label:<6} (no baseline for this size)")
+            continue
+        for stage, values in result["stages"].items():
+            base_values = base["stages"].get(stage, {})
+            for metric, floor in metrics:
+                if metric not in values or metric not in base_values:
+                    continue
+                old, new = base_values[metric], values[metric]
+                ratio = new / old if old else float("inf") if new else 1.0
+                flag = ""
+                if ratio > 1 + tolerance and new - old > floor:
+                    flag = "  REGRESSION"
+                    regressions.append(f"{label} {stage} {metric}: {old} -> {new} (x{ratio:.2f})")
+                print(f"{label:<6} {stage:<24} {metric:<14} {old:>10} {new:>10} {ratio:>7.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import / expand / reconcile / write / save / state on synthetic projects.")
+    parser.add_argument("--sizes", default="1k,10k", help="Comma separated sizes, e.g. 1k,10k,100k,500k")
+    parser.add_argument("--repeat", type=int, default=1, help="Timing runs per size (median is recorded)")
+    parser.add_argument("--no-allocations", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--udt-mix", default=json.dumps(DEFAULT_UDT_MIX), help="JSON weights for single/template rows")
+    parser.add_argument("--trend-ratio", type=float, default=0.3)
+    parser.add_argument("--alarm-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE, help="Where generated projects are kept between runs")
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "baseline.json"), help="Results file to write")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / growth before flagging (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    out_path = os.path.abspath(args.out)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    cache_dir = os.path.abspath(args.cache_dir)
+    udt_mix = json.loads(args.udt_mix)
+
+    work_dir = tempfile.mkdtemp(prefix="taggen-bench-")
+    try:
+        app = load_app(work_dir)
+        results = {
+            "version": 1,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "processor": platform.processor() or platform.machine(),
+                "cpu_count": os.cpu_count(),
+                "rss_source": "psutil" if psutil is not None else "procfs"
+            },
+            "settings": {"repeat": args.repeat, "allocations": not args.no_allocations},
+            "sizes": {}
+        }
+
+        for size in [parse_size(s) for s in args.sizes.split(",") if s.strip()]:
+            label = size_label(size)
+            project = SyntheticProject(size, udt_mix=udt_mix, trend_ratio=args.trend_ratio,
+                                       alarm_ratio=args.alarm_ratio, seed=args.seed)
+            source_dir = os.path.join(cache_dir, f"{label}-{project.fingerprint()}")
+            print(f"[{label}] preparing synthetic project in {source_dir}")
+            manifest = project.write(source_dir)
+
+            scenario = Scenario(project, source_dir, work_dir, app)
+            timing_runs = []
+            for i in range(max(args.repeat, 1)):
+                recorder = StageRecorder()
+                scenario.run(recorder)
+                timing_runs.append(recorder.stages)
+                print(f"[{label}] run {i + 1}: " + ", ".join(f"{k}={v['seconds']}s" for k, v in recorder.stages.items()))
+
+            alloc_run = None
+            if not args.no_allocations:
+                recorder = StageRecorder(track_allocations=True)
+                scenario.run(recorder)
+                alloc_run = recorder.stages
+                print(f"[{label}] allocations: " + ", ".join(f"{k}={v['alloc_peak_mb']}MB" for k, v in alloc_run.items()))
+
+            results["sizes"][label] = {
+                "project": {k: manifest[k] for k in ("fingerprint", "params", "grid_tags", "dbf_records")},
+                "stages": summarize(timing_runs, alloc_run)
+            }
+
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {out_path}")
+
+        if compare_path:
+            with open(compare_path, "r") as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, args.tolerance)
+            if regressions:
+                print(f"\n{len(regressions)} regression(s) beyond {int(args.tolerance * 100)}%:")
+                for r in regressions:
+                    print(f"  {r}")
+                sys.exit(1)
+            print("\nNo regressions.")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+
+"""
+Synthetic Plant SCADA project generator for the benchmark suite.
+
+Builds a grid tag list (UDT instances + imported single tags) and the matching
+variable/trend/digalm DBFs, shaped like ExampleFile/*DBFExample.csv. The DBFs are
+written from the expander's own output with some drift applied, so a Generate
+against them yields a realistic mix of new / modified / orphaned / unchanged.
+
+Usage (from backend/):
+    python -m benchmarks.synthetic_project --tags 10k --out /tmp/synthetic_10k
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+import dbf
+
+from services.dbf_writer import DBFWriter
+from services.udt_expander import UDTExpander
+
+DEFAULT_UDT_MIX = {"single": 0.4, "Motor_Basic": 0.35, "Valve_Basic": 0.25}
+
+MANIFEST_FILE = "synthetic.json"
+
+def parse_size(text: str) -> int:
+    """'1k' -> 1000, '500k' -> 500000, '1m' -> 1000000, '250' -> 250."""
+    text = str(text).strip().lower()
+    multiplier = 1
+    if text.endswith("k"):
+        multiplier, text = 1_000, text[:-1]
+    elif text.endswith("m"):
+        multiplier, text = 1_000_000, text[:-1]
+    return int(float(text) * multiplier)
+
+def size_label(n: int) -> str:
+    if n >= 1_000_000 and n % 1_000_000 == 0:
+        return f"{n // 1_000_000}m"
+    if n >= 1_000 and n % 1_000 == 0:
+        return f"{n // 1_000}k"
+    return str(n)
+
+class SyntheticProject:
+    """
+    Deterministic (seeded) synthetic project.
+
+    `tags` is the target number of variable.dbf records. `udt_mix` weights how
+    grid rows are drawn ("single" or a template name); trend/alarm ratios apply to
+    single tags (UDT members follow their template). Drift ratios control how the
+    DBFs on disk differ from what Generate will produce.
+    """
+    def __init__(self, tags: int, udt_mix: Optional[Dict[str, float]] = None,
+                 trend_ratio: float = 0.3, alarm_ratio: float = 0.2,
+                 modified_ratio: float = 0.05, new_ratio: float = 0.02, orphan_ratio: float = 0.02,
+                 seed: int = 1234, tags_per_area: int = 2000):
+        self.tags = tags
+        self.udt_mix = dict(udt_mix or DEFAULT_UDT_MIX)
+        self.trend_ratio = trend_ratio
+        self.alarm_ratio = alarm_ratio
+        self.modified_ratio = modified_ratio
+        self.new_ratio = new_ratio
+        self.orphan_ratio = orphan_ratio
+        self.seed = seed
+        self.tags_per_area = tags_per_area
+
+        self.expander = UDTExpander()
+        self.writer = DBFWriter()
+
+        unknown = [k for k in self.udt_mix if k != "single" and k not in self.expander.templates]
+        if unknown:
+            raise ValueError(f"Unknown UDT template(s) in mix: {', '.join(unknown)}")
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "tags": self.tags, "udt_mix": self.udt_mix,
+            "trend_ratio": self.trend_ratio, "alarm_ratio": self.alarm_ratio,
+            "modified_ratio": self.modified_ratio, "new_ratio": self.new_ratio,
+            "orphan_ratio": self.orphan_ratio, "seed": self.seed, "tags_per_area": self.tags_per_area
+        }
+
+    def fingerprint(self) -> str:
+        return hashlib.sha256(json.dumps(self.params(), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    # --- Grid tags ---
+
+    def _area(self, produced: int) -> Dict[str, str]:
+        n = produced // self.tags_per_area + 1
+        prefix = f"LW_Sub{n}"
+        return {
+            "prefix": prefix,
+            "io_device": f"{prefix}_CLX",
+            "cluster": "LW1_Cl",
+            "equip": f"LW1.Sub{n}",
+            "site": f"LW903 Sub{n}",
+        }
+
+    def _single(self, rng: random.Random, area: Dict[str, str], idx: int) -> Dict[str, Any]:
+        point = f"Point{idx:06d}"
+        name = f"{area['prefix']}_{point}"
+        is_analog = rng.random() < 0.3
+        desc = f"{'Level' if is_analog else 'Status'} {idx}"
+        tag = {
+            "id": name,
+            "entry_type": "single",
+            "is_manual_override": True,
+            "is_expanded": False,
+            "name": name,
+            "type": "REAL" if is_analog else "DIGITAL",
+            "cluster": area["cluster"],
+            "equipment": area["equip"],
+            "item": "",
+            "description": desc,
+            "var_addr": point,
+            "var_unit": area["io_device"],
+            "var_eng_units": "%" if is_analog else "",
+            "var_format": "###.#" if is_analog else "",
+            "var_raw_zero": "0" if is_analog else "",
+            "var_raw_full": "32000" if is_analog else "",
+            "var_eng_zero": "0" if is_analog else "",
+            "var_eng_full": "100" if is_analog else "",
+            "oid": f"0x{0x0012c630 + idx * 16:08x}",
+            "custom1": area["site"],
+            "custom2": "Alm_Prod" if rng.random() < 0.1 else "",
+            "custom3": "1" if rng.random() < 0.2 else "",
+            "guid": str(uuid.UUID(int=rng.getrandbits(128))),
+            "is_trend": False,
+            "is_alarm": False,
+        }
+        if rng.random() < self.trend_ratio:
+            tag.update({
+                "is_trend": True,
+                "trend_name": name, "trend_expr": name,
+                "trend_sample_per": "1",
+                "trend_filename": f"[DATA]:Trends\\{area['prefix']}\\{name}\\{name}",
+                "trend_files": "25", "trend_time": "0", "trend_period": "Saturday",
+                "trend_comment": f"{area['site']} - {desc}",
+                "trend_type": "TRN_PERIODIC",
+                "trend_stormethod": "Scaled (2-byte samples)",
+                "trend_cluster": area["cluster"], "trend_equip": area["equip"],
+            })
+        if rng.random() < self.alarm_ratio:
+            tag.update({
+                "is_alarm": True,
+                "alarm_tag": name, "alarm_name": name, "alarm_desc": desc,
+                "alarm_var_a": name, "alarm_var_b": f"NOT {area['prefix']}_OOS",
+                "alarm_category": rng.choice(["Alm_Prod", "Alm_Event", "Alm_Crit"]),
+                "alarm_help": f"{area['prefix']}_Power",
+                "alarm_priv": "Priv_Alarm", "alarm_area": f"Area_{area['prefix']}",
+                "alarm_comment": desc, "alarm_custom1": area["site"],
+                "alarm_cluster": area["cluster"], "alarm_equip": area["equip"],
+            })
+        return tag
+
+    def _instance(self, area: Dict[str, str], udt_type: str, idx: int) -> Dict[str, Any]:
+        name = f"{area['prefix']}_{udt_type.split('_')[0][0]}{idx:05d}"
+        return {
+            "id": name,
+            "entry_type": "udt_instance",
+            "is_manual_override": False,
+            "name": name,
+            "udt_type": udt_type,
+            "type": udt_type,
+            "var_addr": f"{area['io_device']}:{name}",
+            "var_unit": area["io_device"],
+            "description": f"{udt_type.split('_')[0]} {idx}",
+            "cluster": area["cluster"],
+        }
+
+    def grid_tags(self) -> List[Dict[str, Any]]:
+        """The rows the grid would send to Generate (what /api/state returns)."""
+        rng = random.Random(self.seed)
+        kinds = list(self.udt_mix.keys())
+        weights = [self.udt_mix[k] for k in kinds]
+        member_counts = {k: len(self.expander.flatten(self.expander.templates, k)) for k in self.expander.templates}
+
+        tags = []
+        produced = 0
+        idx = 0
+        while produced < self.tags:
+            kind = rng.choices(kinds, weights)[0]
+            area = self._area(produced)
+            if kind == "single":
+                tags.append(self._single(rng, area, idx))
+                produced += 1
+            else:
+                tags.append(self._instance(area, kind, idx))
+                produced += member_counts[kind]
+            idx += 1
+        return tags
+
+    # --- DBFs on disk ---
+
+    def dbf_records(self, tags: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Expander output with drift applied (dropped = new, edited = modified, extra = orphaned)."""
+        rng = random.Random(self.seed + 1)
+        expanded = self.expander.expand_tags([dict(t) for t in tags])
+        records = {}
+        for table_type, recs in expanded.items():
+            out = []
+            for r in recs:
+                roll = rng.random()
+                if roll < self.new_ratio:
+                    continue
+                if roll < self.new_ratio + self.modified_ratio:
+                    r = dict(r)
+                    field = "DESC" if table_type == "digalm" else "COMMENT"
+                    r[field] = (r.get(field, "") + " (old)").strip()
+                out.append(r)
+
+            key_field = "TAG" if table_type == "digalm" else "NAME"
+            for i in range(int(len(recs) * self.orphan_ratio)):
+                orphan = dict(recs[i % len(recs)]) if recs else {}
+                orphan[key_field] = f"Retired_{table_type}_{i:06d}"
+                if table_type == "digalm":
+                    orphan["NAME"] = orphan[key_field]
+                out.append(orphan)
+            records[table_type] = out
+        return records
+
+    def write(self, path: str, force: bool = False) -> Dict[str, Any]:
+        """
+        Writes the DBFs (and a manifest) into `path`. Re-uses an existing directory
+        whose manifest matches these parameters unless `force` is set.
+        """
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not force and os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("fingerprint") == self.fingerprint():
+                return manifest
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        start = time.perf_counter()
+        tags = self.grid_tags()
+        records = self.dbf_records(tags)
+        counts = {}
+        for table_type, recs in records.items():
+            schema = self.writer.schemas[table_type]
+            schema_def = "; ".join(f"{n} {t}({l})" for n, t, l in schema)
+            field_names = [n for n, _, _ in schema]
+            table = dbf.Table(os.path.join(path, f"{table_type}.dbf"), schema_def)
+            table.open(dbf.READ_WRITE)
+            for r in recs:
+                table.append({k: r[k] for k in field_names if r.get(k)})
+            table.close()
+            counts[table_type] = len(recs)
+
+        manifest = {
+            "fingerprint": self.fingerprint(),
+            "params": self.params(),
+            "grid_tags": len(tags),
+            "dbf_records": counts,
+            "generated_in": round(time.perf_counter() - start, 2)
+        }
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Plant SCADA project (variable/trend/digalm DBFs).")
+    parser.add_argument("--tags", default="10k", help="Number of variable records, e.g. 1k, 10k, 100k, 500k")
+    parser.add_argument("--out", required=True, help="Output project directory")
+    parser.add_argument("--udt-mix", default=json.dumps(DEFAULT_UDT_MIX), help='JSON weights, e.g. \'{"single": 0.5, "Motor_Basic": 0.5}\'')
+    parser.add_argument("--trend-ratio", type=float, default=0.3)
+    parser.add_argument("--alarm-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--force", action="store_true", help="Regenerate even if the manifest matches")
+    args = parser.parse_args()
+
+    project = SyntheticProject(parse_size(args.tags), udt_mix=json.loads(args.udt_mix),
+                               trend_ratio=args.trend_ratio, alarm_ratio=args.alarm_ratio, seed=args.seed)
+    manifest = project.write(args.out, force=args.force)
+    print(json.dumps(manifest, indent=2))
+
+if __name__ == "__main__":
+    main()
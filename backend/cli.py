@@ -0,0 +1,276 @@
+
+"""
+Headless command line for batch work on many projects, without the API or a browser.
+
+Usage (from backend/):
+    python cli.py import   PROJECT [PROJECT ...]   # read the DBFs into the SQLite state
+    python cli.py validate PROJECT ...             # expand saved tags + pre-flight checks only
+    python cli.py generate PROJECT ...             # expand saved tags + reconcile, counts only
+    python cli.py diff     PROJECT ...             # same, plus the changed keys / fields per table
+    python cli.py write    PROJECT ...             # generate + write the DBFs (--stream: bounded-memory rebuild)
+    python cli.py write --all --workers 8 --out summary.json
+
+Projects are spread over a process pool (one project per task). A JSON summary
+with per-project counts, diffs and stage timings goes to stdout (or --out) and
+progress lines go to stderr. Exits with 1 if any project failed.
+
+Only the standard library is imported up front; the services (dbf, SQLAlchemy,
+expander, ...) are imported in the worker that needs them, so `--help` and the
+parent process start fast.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(BACKEND_DIR, "project_data.db")
+
+COMMANDS = ("import", "validate", "generate", "diff", "write")
+CHANGE_TYPES = ("new", "modified", "renamed", "orphaned", "unchanged")
+
+# Services of this process, built on first use (see _services)
+_worker = {}
+
+def _services(options: dict) -> dict:
+    db_path = options["db"]
+    if _worker.get("db_path") != db_path:
+        from database import create_session_factory
+        from services.project_scanner import ProjectScanner
+        from services.dbf_reader import DBFReader
+        from services.dbf_writer import DBFWriter
+        from services.udt_expander import UDTExpander
+        from services.diff_store import DiffStore
+        from services.pipeline import TagPipeline
+        from services.history import HistoryStore
+
+        # Projects already run in parallel, so each one expands serially
+        expander = UDTExpander(workers=1) if options["parallel_projects"] else UDTExpander()
+        sessions = create_session_factory(db_path)
+        history = HistoryStore(sessions)
+        _worker.update({
+            "db_path": db_path,
+            "sessions": sessions,
+            "expander": expander,
+            "history": history,
+            # Every handle is used right after it is issued, one project at a time
+            "pipeline": TagPipeline(ProjectScanner(), DBFReader(), DBFWriter(), expander, DiffStore(max_entries=1), history=history),
+        })
+    return _worker
+
+def _load_templates(svc: dict):
+    from services.tag_store import load_templates
+    db = svc["sessions"]()
+    try:
+        return load_templates(db, svc["expander"].templates)
+    finally:
+        db.close()
+
+def _diff_detail(diff: dict) -> dict:
+    """Changed keys per table: new / orphaned as key lists, modified with their changed fields, renamed as old -> new."""
+    from services.diff_store import record_key
+    detail = {}
+    for table_type, changes in diff.items():
+        detail[table_type] = {
+            "new": [record_key(table_type, "new", r) for r in changes.get("new", [])],
+            "modified": [{"key": record_key(table_type, "modified", r), "changed_fields": r.get("changed_fields", [])}
+                         for r in changes.get("modified", [])],
+            "renamed": [{"old_key": r.get("old_key"), "key": record_key(table_type, "renamed", r)} for r in changes.get("renamed", [])],
+            "orphaned": [record_key(table_type, "orphaned", r) for r in changes.get("orphaned", [])],
+        }
+    return detail
+
+def run_project(command: str, project_path: str, options: dict) -> dict:
+    """Runs one command against one project (in a pool worker). Never raises; failures are reported in the result."""
+    started = time.perf_counter()
+    result = {"project": project_path, "command": command, "status": "ok", "pid": os.getpid()}
+    job = None
+    try:
+        from services.job_manager import Job
+        from services.tag_record import to_plain
+        from services.tag_store import sync_tags, iter_saved_tags
+        from services.reference_graph import ReferenceGraph
+
+        svc = _services(options)
+        pipeline = svc["pipeline"]
+        job = Job(command, project_path)
+
+        if command == "import":
+            tags = pipeline.import_project(project_path, job)
+            with job.stage("save_state"):
+                db = svc["sessions"]()
+                try:
+                    plain = to_plain(tags)
+                    before_ids = {}
+                    before = svc["history"].current_rows(db, project_path, before_ids)
+                    result["tags"] = sync_tags(db, project_path, plain, commit=False)["count"]
+                    result["references"] = ReferenceGraph(svc["expander"]).sync(db, project_path, plain, commit=False)
+                    result["history"] = svc["history"].record_save(db, project_path, before, "Import from DBF", commit=False,
+                                                                   before_ids=before_ids)
+                    db.commit()
+                finally:
+                    db.close()
+            return result
+
+        # Tags to generate from: the saved state (default) or the DBFs themselves
+        if options["source"] == "dbf":
+            tags = pipeline.import_project(project_path, job)
+        else:
+            tags = iter_saved_tags(svc["sessions"], project_path)
+            first = next(tags, None)
+            if first is None:
+                raise ValueError("No saved tags for this project; run `import` first or use --source dbf")
+            tags = _chain(first, tags)
+
+        if command == "write" and options["stream"]:
+            rebuilt = pipeline.rebuild(project_path, tags, lambda: _load_templates(svc), job, options["run_size"])
+            result["counts"] = rebuilt["counts"]
+            result["validation"] = rebuilt["validation"]
+            result["written"] = True
+            return result
+
+        if not isinstance(tags, list):
+            with job.stage("load_state"):
+                tags = list(tags)
+        if command == "validate":
+            with job.stage("expand"):
+                expanded = svc["expander"].expand_tags(tags, override_templates=_load_templates(svc))
+            with job.stage("validate"):
+                result["validation"] = pipeline.validate(project_path, expanded, options["max_violations"])
+            if result["validation"]["errors"]:
+                result["status"] = "failed"
+            return result
+        generated = pipeline.generate(project_path, tags, lambda: _load_templates(svc), job, page_size=0)
+        result["counts"] = generated["counts"]
+        validation = generated["validation"]
+        result["validation"] = {k: validation[k] for k in ("errors", "warnings", "counts")}
+        if command == "diff":
+            result["diff"] = _diff_detail(pipeline.diff_store.get(generated["handle"])["diff"])
+        if command == "write":
+            pipeline.write(project_path, None, job, handle=generated["handle"])
+            result["written"] = True
+        else:
+            pipeline.diff_store.discard(generated["handle"])
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if job is not None:
+            result["timings"] = {s["name"]: s["duration"] for s in job.stages}
+        result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+def _totals(results: list) -> dict:
+    totals = {}
+    for r in results:
+        for table_type, counts in (r.get("counts") or {}).items():
+            table_totals = totals.setdefault(table_type, dict.fromkeys(CHANGE_TYPES, 0))
+            for change_type, n in counts.items():
+                table_totals[change_type] = table_totals.get(change_type, 0) + n
+    return totals
+
+def _report(result: dict):
+    counts = result.get("counts")
+    detail = ""
+    if counts:
+        detail = " " + ", ".join(f"{t}: +{c.get('new', 0)} ~{c.get('modified', 0)} >{c.get('renamed', 0)} -{c.get('orphaned', 0)}" for t, c in counts.items())
+    elif "tags" in result:
+        detail = f" {result['tags']} tags"
+    validation = result.get("validation")
+    if validation:
+        detail += f" [validation: {validation['errors']} error(s), {validation['warnings']} warning(s)]"
+    error = f" {result['error']}" if result.get("error") else ""
+    print(f"[{result['status']}] {result['project']} ({result['seconds']:.2f}s){detail}{error}", file=sys.stderr)
+
+def _read_projects(args, parser) -> list:
+    projects = list(args.projects)
+    if args.projects_file:
+        with open(args.projects_file, "r", encoding="utf-8") as f:
+            projects += [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    if args.all:
+        from database import create_session_factory
+        from services.tag_store import saved_projects
+        db = create_session_factory(args.db)()
+        try:
+            projects += saved_projects(db)
+        finally:
+            db.close()
+    # Paths are the keys of the saved state, so they are used exactly as given
+    projects = list(dict.fromkeys(projects))
+    if not projects:
+        parser.error("no projects given (pass paths, --projects-file or --all)")
+    return projects
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Batch import / generate / diff / write for Plant SCADA projects.")
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("projects", nargs="*", help="Project directories (as saved in the SQLite state)")
+    parser.add_argument("--projects-file", help="File with one project path per line")
+    parser.add_argument("--all", action="store_true", help="Every project with saved state in the database")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite state file (default: backend/project_data.db)")
+    parser.add_argument("--source", choices=("db", "dbf"), default="db",
+                        help="Generate from the saved tags (default) or straight from the project's DBFs")
+    parser.add_argument("--stream", action="store_true", help="write: streaming rebuild with bounded memory (no diff is kept)")
+    parser.add_argument("--run-size", type=int, default=50000, help="Records per in-memory sort run for --stream")
+    parser.add_argument("--max-violations", type=int, default=1000, help="validate: violations listed per project (counts cover all)")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument("--out", help="Write the JSON summary here instead of stdout")
+    return parser
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.db = os.path.abspath(args.db)
+    projects = _read_projects(args, parser)
+
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(projects)))
+    options = {"db": args.db, "source": args.source, "stream": args.stream, "run_size": args.run_size, "max_violations": args.max_violations,
+               "parallel_projects": workers > 1}
+    started = time.perf_counter()
+    results = {}
+
+    if workers == 1:
+        for project in projects:
+            results[project] = run_project(args.command, project, options)
+            _report(results[project])
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_project, args.command, project, options): project for project in projects}
+            for future in as_completed(futures):
+                project = futures[future]
+                try:
+                    results[project] = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    results[project] = {"project": project, "command": args.command, "status": "failed",
+                                        "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                _report(results[project])
+
+    ordered = [results[p] for p in projects]
+    failed = sum(1 for r in ordered if r["status"] != "ok")
+    summary = {
+        "command": args.command,
+        "workers": workers,
+        "seconds": round(time.perf_counter() - started, 4),
+        "succeeded": len(ordered) - failed,
+        "failed": failed,
+        "totals": _totals(ordered),
+        "projects": ordered,
+    }
+    text = json.dumps(summary, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,18 @@
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from models import Base
+from services.executors import db_io
+from services.tag_search import ensure_search_index
+
+# Async engine for the light state endpoints (aiosqlite + greenlet, see requirements.txt; without
+# them run_db falls back to the db executor)
+try:
+    import aiosqlite
+    import greenlet
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:
+    aiosqlite = None
 
 # Create SQLite database in the current directory
 SQLALCHEMY_DATABASE_URL = "sqlite:///./project_data.db"
@@ -11,8 +22,61 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def use_wal(db_engine):
+    """
+    WAL journal on every connection: readers see the last commit while a save or edit is
+    writing, instead of waiting for its lock (a writer still excludes other writers).
+    """
+    @event.listens_for(db_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; a power cut can lose the last commits, never corrupt the file
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        except Exception as e:
+            print(f"Could not switch SQLite to WAL: {e}")
+        finally:
+            cursor.close()
+
+use_wal(engine)
+
+if aiosqlite is not None:
+    async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    use_wal(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+def create_columns(db_engine):
+    """Columns declared after their table existed (create_all only adds them with new tables)."""
+    inspector = inspect(db_engine)
+    with db_engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db_engine.dialect)}"
+                if isinstance(default, (bool, int)):
+                    ddl += f" DEFAULT {int(default)}"
+                elif isinstance(default, str):
+                    ddl += " DEFAULT '" + default.replace("'", "''") + "'"
+                conn.execute(text(ddl))
+
+def create_indexes(db_engine):
+    """Indexes declared after their table existed (create_all only adds them with new tables)."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db_engine, checkfirst=True)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    create_columns(engine)
+    create_indexes(engine)
+    ensure_search_index(engine)
 
 def get_db():
     db = SessionLocal()
@@ -20,3 +84,35 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def with_session(fn, *args):
+    """fn(session, *args) on a fresh session, closed afterwards (for executor threads)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+async def run_db(fn, *args):
+    """
+    fn(session, *args) for async endpoints: plain sync ORM code that commits itself. On the
+    aiosqlite engine its queries await the driver instead of holding a thread; without
+    aiosqlite it runs on a regular session in the db executor.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn, *args)
+    return await db_io.run(with_session, fn, *args)
+
+def create_session_factory(db_path: str, timeout: float = 60.0):
+    """
+    Session factory for a SQLite file given by path (the CLI's --db). Worker
+    processes wait up to `timeout` seconds for each other's write locks.
+    """
+    db_engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False, "timeout": timeout})
+    use_wal(db_engine)
+    Base.metadata.create_all(bind=db_engine)
+    create_columns(db_engine)
+    create_indexes(db_engine)
+    ensure_search_index(db_engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
@@ -1,28 +1,74 @@
 
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Request, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.routing import APIRoute
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import uvicorn
+import logging
 import os
+import time
 
 from services.project_scanner import ProjectScanner
 from services.tag_sanitizer import TagSanitizer
 from services.dbf_writer import DBFWriter
-from services.udt_expander import UDTExpander
+from services.udt_expander import UDTExpander, shutdown_expand_pool, template_closure, template_version
+from services.field_expressions import ExpressionError
 from services.dbf_reader import DBFReader
 from services.settings_service import SettingsService
-from models import Base, TagEntry, GlobalReplacement, ProjectState, UdtTemplate, ProjectState
-from database import engine, init_db, get_db
+from services.job_manager import Job, JobManager
+from services.diff_store import DiffStore, DiffNotFoundError, StaleDiffError
+from services.external_sort import DEFAULT_RUN_SIZE
+from services.validator import PreflightError
+from services.reference_graph import ReferenceGraph
+from services import tag_search
+from services.bulk_edit import BulkEditor, BulkEditConflict
+from services import hierarchy
+from services.history import HistoryStore, HistoryConflict, state_values
+from services.project_locks import ProjectLockManager, LockTimeout
+from services.warmup import ProjectWarmup
+from services.dbf_cache import dbf_rows
+from services.live_sync import ProjectChannels, delta_message, reset_message
+from services.pipeline import TagPipeline, IMPORT_STAGES, GENERATE_STAGES, WRITE_STAGES, REBUILD_STAGES
+from services.metrics import metrics, profiler
+from services.serialization import PayloadResponse, Rows, negotiate
+from services import tag_store
+from services.tag_store import STATE_KEYS, RowVersionConflict, current_revision, iter_state_rows, load_templates, sync_tags
+from models import Base, TagEntry, GlobalReplacement, ProjectState, UdtTemplate
+from database import engine, init_db, SessionLocal, run_db, with_session
+from services.executors import dbf_io, db_io
 from sqlalchemy.orm import Session
-from fastapi import Depends
+import asyncio
 import json
 import datetime
 
+logger = logging.getLogger(__name__)
+
 # Init DB
 init_db()
 
-app = FastAPI(title="PlantSCADA Tag Management")
+# Requests slower than this are logged with their stage breakdown
+SLOW_REQUEST_SECONDS = float(os.environ.get("TAGGEN_SLOW_REQUEST_MS", "1000")) / 1000.0
+
+class ProfiledRoute(APIRoute):
+    """Wraps every endpoint so a request with an X-Profile header is profiled in the thread that runs it."""
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiler.wrap(endpoint), **kwargs)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up is not awaited: the server is ready at once, /api/ready reports the progress
+    warmup.start(settings_service.get_defaults().get("last_opened_project"))
+    yield
+    job_manager.shutdown()
+    dbf_io.shutdown()
+    db_io.shutdown()
+    shutdown_expand_pool()
+
+app = FastAPI(title="PlantSCADA Tag Management", default_response_class=PayloadResponse, lifespan=lifespan)
+app.router.route_class = ProfiledRoute
 
 # CORS setup
 app.add_middleware(
@@ -31,8 +77,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id"],
 )
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Times every request, collects the stages/counters it triggered and logs it
+    when slower than SLOW_REQUEST_SECONDS. `X-Profile: cprofile` (or `pyinstrument`)
+    profiles the endpoint; the report id comes back in `X-Profile-Id`.
+    """
+    with metrics.request_scope(request.method, request.url.path) as scope:
+        with profiler.requested(request.headers.get("x-profile")) as profile, \
+                negotiate(request.headers.get("accept"), request.headers.get("accept-encoding")):
+            response = await call_next(request)
+        elapsed = time.perf_counter() - scope.started
+
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    metrics.observe("taggen_request_seconds", elapsed, method=request.method, route=route_path, status=response.status_code)
+
+    timings = [f"{s['name']};dur={s['seconds'] * 1000:.1f}" for s in scope.stages]
+    response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={elapsed * 1000:.1f}"])
+    if profile:
+        response.headers["X-Profile-Id"] = profile[0]
+
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        metrics.inc("taggen_slow_requests_total", route=route_path)
+        logger.warning("Slow request: %s %s -> %s in %.0fms [%s]", request.method, request.url.path, response.status_code,
+                       elapsed * 1000, scope.breakdown())
+    return response
+
 # Services
 settings_service = SettingsService()
 defaults = settings_service.get_defaults()
@@ -41,6 +116,37 @@ sanitizer = TagSanitizer()
 dbf_writer = DBFWriter()
 dbf_reader = DBFReader()
 udt_expander = UDTExpander()
+diff_store = DiffStore(max_entries=8, ttl=3600)
+history = HistoryStore(SessionLocal)
+pipeline = TagPipeline(scanner, dbf_reader, dbf_writer, udt_expander, diff_store, history=history)
+reference_graph = ReferenceGraph(udt_expander, history)
+bulk_editor = BulkEditor(reference_graph, history)
+job_manager = JobManager(max_workers=2, result_ttl=900)
+# Per-project reader / writer locks: reads of a project run side by side, writes get it to themselves
+project_locks = ProjectLockManager()
+# Jobs are queued work: they wait longer for their project than a request does
+JOB_LOCK_TIMEOUT = 600.0
+# Preloads the last opened project in the background after a restart
+warmup = ProjectWarmup(SessionLocal, udt_expander, pipeline.dbf_paths, project_locks)
+# Row-level deltas of every saved-tag write, per project, for /api/projects/live subscribers
+live_channels = ProjectChannels()
+
+@app.exception_handler(LockTimeout)
+def lock_timeout_handler(request: Request, exc: LockTimeout):
+    return JSONResponse(status_code=503, content={"detail": str(exc), "holders": exc.holders},
+                        headers={"Retry-After": str(max(1, int(project_locks.default_timeout / 6)))})
+
+@app.exception_handler(RowVersionConflict)
+def row_version_conflict_handler(request: Request, exc: RowVersionConflict):
+    return JSONResponse(status_code=409, content={"detail": str(exc), "conflicts": exc.conflicts, "revision": exc.revision})
+
+def _job_locked(mode: str, project_path: str, operation: str, fn):
+    """Job function that holds the project lock (`shared` / `exclusive`) while it runs."""
+    def run(job: Job):
+        with getattr(project_locks, mode)(project_path, operation, JOB_LOCK_TIMEOUT):
+            job.check_cancelled()
+            return fn(job)
+    return run
 
 # Pydantic Models for API
 class ProjectModel(BaseModel):
@@ -56,9 +162,14 @@ class SanitizeResponse(BaseModel):
 class GenerateRequest(BaseModel):
     project_path: str
     tags: List[Dict[str, Any]] # Flexible dict for now
+    page_size: int = 200 # Records per change type returned inline
 
 class GenerateResponse(BaseModel):
-    diff: Dict[str, Any] # {'variable': {new:[], mod:[]...}, 'trend': ...}
+    handle: str # Server-side diff handle for /api/write
+    counts: Dict[str, Dict[str, int]] # {'variable': {new: n, modified: n, ...}, ...}
+    validation: Optional[Dict[str, Any]] = None # Pre-flight report: {ok, errors, warnings, counts, violations, ...}
+    diff: Dict[str, Any] # First page: {'variable': {new:[], modified:[], orphaned:[]}, 'trend': ...}
+    page_size: int
 
 class GlobalReplacementModel(BaseModel):
     character: str
@@ -66,6 +177,10 @@ class GlobalReplacementModel(BaseModel):
 
 # Endpoints
 
+def _project_lock(project_path: str, operation: str, dry_run: bool):
+    """Exclusive for an edit, shared for its dry run."""
+    return project_locks.shared(project_path, operation) if dry_run else project_locks.exclusive(project_path, operation)
+
 @app.get("/api/projects", response_model=List[ProjectModel])
 def list_projects():
     """Lists available SCADA projects."""
@@ -99,9 +214,16 @@ from models import Base, TagEntry, GlobalReplacement, ProjectState, UdtTemplate
 
 class TemplateMember(BaseModel):
     suffix: str
-    type: str # DIGITAL, INT, REAL..
-    address_offset: str
-    comment_template: str
+    type: str = "" # DIGITAL, INT, REAL.. (unused when `template` is set)
+    address_offset: str = ""
+    comment_template: str = "{parent_desc}"
+    template: Optional[str] = None # Nests this template's members under suffix / address_offset / comment_template
+    # Field expressions (services/field_expressions.py); string properties above may use them too
+    name: Optional[str] = None # Tag name, instead of <instance name><sanitized suffix>
+    address: Optional[str] = None # Full address, instead of <instance var_addr><address_offset>
+    item: Optional[str] = None
+    equip: Optional[str] = None
+    fields: Optional[Dict[str, Dict[str, str]]] = None # {variable|trend|digalm: {DBF field: expression}}
     is_trend: bool = False
     is_alarm: bool = False
     alarm_category: Optional[str] = "1"
@@ -114,138 +236,198 @@ class TemplateModel(BaseModel):
 
 # Helper to get all templates (Default + DB)
 def get_all_templates(db: Session):
-    # Start with defaults
-    templates = udt_expander.templates.copy()
-    
-    # Load from DB
-    db_templates = db.query(UdtTemplate).all()
-    for t in db_templates:
-        try:
-            members = json.loads(t.members_json)
-            # Ensure format matches what expander expects
-            templates[t.name] = {
-                "description": t.description,
-                "members": members
-            }
-        except:
-            continue
-    return templates
+    return load_templates(db, udt_expander.templates)
 
 @app.get("/api/templates")
-def list_templates(db: Session = Depends(get_db)):
-    all_temps = get_all_templates(db)
+async def list_templates():
+    all_temps = await run_db(get_all_templates)
     return list(all_temps.keys())
 
 @app.get("/api/templates/detail")
-def list_templates_detail(db: Session = Depends(get_db)):
+async def list_templates_detail():
     """Returns full template objects for the builder."""
-    return get_all_templates(db)
+    return await run_db(get_all_templates)
+
+@app.get("/api/templates/{name}/members")
+async def get_template_members(name: str):
+    """Leaf members of a template with its nested templates flattened (what an instance expands to)."""
+    templates = await run_db(get_all_templates)
+    if name not in templates:
+        raise HTTPException(status_code=404, detail=f"Template {name} not found")
+    try:
+        return {"name": name, "version": template_version(templates, name), "members": udt_expander.flatten(templates, name)}
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-@app.post("/api/templates")
-def save_template(template: TemplateModel, db: Session = Depends(get_db)):
-    # Check if exists
-    existing = db.query(UdtTemplate).filter(UdtTemplate.name == template.name).first()
-    members_json = json.dumps([m.dict() for m in template.members])
-    
+def _store_template(db: Session, name: str, description: str, members_json: str):
+    existing = db.query(UdtTemplate).filter(UdtTemplate.name == name).first()
     if existing:
-        existing.description = template.description
+        existing.description = description
         existing.members_json = members_json
     else:
-        new_t = UdtTemplate(name=template.name, description=template.description, members_json=members_json)
+        new_t = UdtTemplate(name=name, description=description, members_json=members_json)
         db.add(new_t)
-    
     db.commit()
+
+@app.post("/api/templates")
+async def save_template(template: TemplateModel):
+    members = [m.dict(exclude_none=True) for m in template.members]
+    # Nested templates must exist and must not lead back to this one
+    templates = await run_db(get_all_templates)
+    templates[template.name] = {"description": template.description, "members": members}
+    try:
+        template_closure(templates, template.name)
+        # Compiles every member expression, nested ones included
+        udt_expander.compiled_members(templates, template.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await run_db(_store_template, template.name, template.description, json.dumps(members))
     return {"status": "saved", "name": template.name}
 
-@app.delete("/api/templates/{name}")
-def delete_template(name: str, db: Session = Depends(get_db)):
+def _delete_template(db: Session, name: str):
     db.query(UdtTemplate).filter(UdtTemplate.name == name).delete()
     db.commit()
+
+@app.delete("/api/templates/{name}")
+async def delete_template(name: str):
+    templates = await run_db(get_all_templates)
+    nesting = sorted(t for t, body in templates.items() if t != name
+                     and any(m.get("template") == name for m in (body.get("members", []) if isinstance(body, dict) else [])))
+    if nesting:
+        raise HTTPException(status_code=409, detail=f"Template {name} is nested in: {', '.join(nesting)}")
+    await run_db(_delete_template, name)
     return {"status": "deleted"}
 
+# DBF reads / writes run on the dbf_io executor (services/executors.py), so the event loop and
+# the request threadpool stay free for small requests while a large project is read or written.
+# Project locks are taken inside the executor thread: waiting for one never blocks the loop.
+
 @app.post("/api/generate", response_model=GenerateResponse)
-def generate_tags(request: GenerateRequest, db: Session = Depends(get_db)):
+async def generate_tags(request: GenerateRequest):
     """
     1. Expand Tags (using DB templates)
     2. Reconcile with DBF
     3. Return Diff
     """
-    templates = get_all_templates(db)
-    
-    # 1. Expand
-    expanded = udt_expander.expand_tags(request.tags, override_templates=templates)
-    
-    # 2. Reconcile for each table type
-    diffs = {}
-    
-    # Check variable.dbf
-    var_dbf = scanner.get_dbf_path(request.project_path, "variable.dbf")
-    diffs["variable"] = dbf_writer.reconcile_changes(expanded["variable"], var_dbf, key_field="NAME", enable_guid=True)
-    
-    # Check trend.dbf
-    trend_dbf = scanner.get_dbf_path(request.project_path, "trend.dbf")
-    diffs["trend"] = dbf_writer.reconcile_changes(expanded["trend"], trend_dbf, key_field="NAME", enable_guid=False)
-    
-    # Check digalm.dbf
-    digalm_dbf = scanner.get_dbf_path(request.project_path, "digalm.dbf")
-    diffs["digalm"] = dbf_writer.reconcile_changes(expanded["digalm"], digalm_dbf, key_field="TAG", enable_guid=False)
-    
-    return {"diff": diffs}
+    def run():
+        job = Job("generate", request.project_path, GENERATE_STAGES)
+        with project_locks.shared(request.project_path, "generate"):
+            return PayloadResponse(pipeline.generate(request.project_path, request.tags, _load_templates_for_job, job, request.page_size))
+    try:
+        return await dbf_io.run(run)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/expand")
-def expand_single_tag(tag: Dict[str, Any], db: Session = Depends(get_db)):
+async def expand_single_tag(tag: Dict[str, Any]):
     """
     Returns the expanded members for a single UDT instance.
     Returns: { variable: [...], trend: [...], digalm: [...] }
     """
-    templates = get_all_templates(db)
+    templates = await run_db(get_all_templates)
     
-    # Wrap in list
-    expanded = udt_expander.expand_tags([tag], override_templates=templates)
+    # Wrap in list; expansion is CPU work, kept off the event loop
+    try:
+        expanded = await db_io.run(udt_expander.expand_tags, [tag], templates)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # Return the dict directly - frontend expects { variable: [], trend: [], digalm: [] }
-    return expanded
+    return PayloadResponse(expanded)
+class ValidateRequest(BaseModel):
+    project_path: str
+    tags: List[Dict[str, Any]]
+    max_violations: Optional[int] = None # Violations listed (counts always cover all); None = server default, 0 = counts only
+
+@app.post("/api/validate")
+async def validate_tags(request: ValidateRequest):
+    """Pre-flight checks only: expand the tags and report schema / key / reference / cluster violations."""
+    def run():
+        expanded = udt_expander.expand_tags(request.tags, override_templates=_load_templates_for_job())
+        with project_locks.shared(request.project_path, "validate"):
+            return PayloadResponse(pipeline.validate(request.project_path, expanded, request.max_violations))
+    try:
+        return await dbf_io.run(run)
+    except ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 class WriteRequest(BaseModel):
     project_path: str
-    diff: Dict[str, Any]
+    handle: Optional[str] = None # Diff handle from /api/generate
+    excluded: Optional[Dict[str, Dict[str, List[str]]]] = None # {table: {new|modified|orphaned: [keys or "*"]}} to skip
+    included: Optional[Dict[str, Dict[str, List[str]]]] = None # Keys re-accepted under an excluded "*"
+    diff: Optional[Dict[str, Any]] = None # Legacy: full diff posted back by the client
 
 @app.post("/api/write")
-def write_changes(request: WriteRequest):
+async def write_changes(request: WriteRequest):
     """
     Commit changes to DBF files.
     """
+    if not request.handle and request.diff is None:
+        raise HTTPException(status_code=422, detail="Either 'handle' or 'diff' is required")
+    def run():
+        job = Job("write", request.project_path, WRITE_STAGES)
+        with project_locks.exclusive(request.project_path, "write"):
+            return pipeline.write(request.project_path, request.diff, job, request.handle, request.excluded, request.included)
     try:
-        # Apply changes for each table
-        diff = request.diff
-        
-        # Variable
-        if "variable" in diff:
-            path = scanner.get_dbf_path(request.project_path, "variable.dbf")
-            dbf_writer.apply_diff(diff["variable"], path, "variable")
-            
-        # Trend
-        if "trend" in diff:
-            path = scanner.get_dbf_path(request.project_path, "trend.dbf")
-            dbf_writer.apply_diff(diff["trend"], path, "trend")
-            
-        # DigAlm
-        if "digalm" in diff:
-            path = scanner.get_dbf_path(request.project_path, "digalm.dbf")
-            dbf_writer.apply_diff(diff["digalm"], path, "digalm")
-            
-        return {"status": "success", "message": "Changes committed successfully."}
-        
+        return await dbf_io.run(run)
+    except LockTimeout:
+        raise
+    except DiffNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Diff {request.handle} not found or expired. Re-run Generate.")
+    except StaleDiffError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PreflightError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        # The handle belongs to another project
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# --- Diff Query API ---
+# Summary first, then pages of one change type, then one record's side-by-side detail.
+
+@app.get("/api/diff/{handle}")
+def get_diff_summary(handle: str):
+    try:
+        return diff_store.summary(handle)
+    except DiffNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Diff {handle} not found or expired")
+
+@app.get("/api/diff/{handle}/{table_type}/record")
+def get_diff_record(handle: str, table_type: str, key: str):
+    try:
+        return diff_store.record(handle, table_type, key)
+    except DiffNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Diff {handle} not found or expired")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Record {key} not in {table_type} diff")
+
+@app.get("/api/diff/{handle}/{table_type}")
+def query_diff(handle: str, table_type: str, change_type: str = "new", offset: int = 0, limit: int = 100,
+               field: Optional[str] = None, prefix: Optional[str] = None, full: bool = False):
+    """Paged slice of new/modified/orphaned (or, explicitly, unchanged) records."""
+    try:
+        return PayloadResponse(diff_store.query(handle, table_type, change_type, max(offset, 0), min(max(limit, 1), 5000), field, prefix, full))
+    except DiffNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Diff {handle} not found or expired")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _project_settings_json(db: Session, project_path: str) -> Optional[str]:
+    state = db.query(ProjectState).filter(ProjectState.project_path == project_path).first()
+    return state.settings_json if state else None
+
 @app.get("/api/settings")
-def get_settings(project_path: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_settings(project_path: Optional[str] = None):
     # 1. Try to load from Project DB
     if project_path:
-        state = db.query(ProjectState).filter(ProjectState.project_path == project_path).first()
-        if state and state.settings_json:
+        settings_json = await run_db(_project_settings_json, project_path)
+        if settings_json:
             try:
-                return json.loads(state.settings_json)
+                return json.loads(settings_json)
             except:
                 pass
 
@@ -256,22 +438,24 @@ class SettingsUpdate(BaseModel):
     project_path: Optional[str] = None
     settings: Dict[str, Any]
 
+def _store_project_settings(db: Session, project_path: str, settings_str: str):
+    state = db.query(ProjectState).filter(ProjectState.project_path == project_path).first()
+    timestamp = datetime.datetime.now().isoformat()
+
+    if state:
+        state.settings_json = settings_str
+    else:
+        # Create new state if doesn't exist (though usually it should for a valid project)
+        state = ProjectState(project_path=project_path, tags_json="[]", settings_json=settings_str, updated_at=timestamp)
+        db.add(state)
+
+    db.commit()
+
 @app.post("/api/settings")
-def update_settings(update: SettingsUpdate, db: Session = Depends(get_db)):
+async def update_settings(update: SettingsUpdate):
     # If project specific
     if update.project_path:
-        state = db.query(ProjectState).filter(ProjectState.project_path == update.project_path).first()
-        settings_str = json.dumps(update.settings)
-        timestamp = datetime.datetime.now().isoformat()
-        
-        if state:
-            state.settings_json = settings_str
-        else:
-            # Create new state if doesn't exist (though usually it should for a valid project)
-            state = ProjectState(project_path=update.project_path, tags_json="[]", settings_json=settings_str, updated_at=timestamp)
-            db.add(state)
-        
-        db.commit()
+        await run_db(_store_project_settings, update.project_path, json.dumps(update.settings))
         return {"status": "saved", "scope": "project"}
 
     # Fallback to Global
@@ -287,12 +471,158 @@ class ImportRequest(BaseModel):
     project_path: str
 
 @app.post("/api/import")
-def import_project(request: ImportRequest):
+async def import_project(request: ImportRequest):
     """
     Reads existing DBFs and returns unified tag list.
     """
-    tags = dbf_reader.read_project(request.project_path)
-    return tags
+    def run():
+        job = Job("import", request.project_path, IMPORT_STAGES)
+        with project_locks.shared(request.project_path, "import"):
+            return PayloadResponse(pipeline.import_project(request.project_path, job))
+    return await dbf_io.run(run)
+
+# --- Background Jobs ---
+# Long-running import/generate/write work is queued on a bounded worker pool.
+# Submit returns a job id; progress streams over SSE from /api/jobs/{id}/events.
+
+def _load_templates_for_job() -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return get_all_templates(db)
+    finally:
+        db.close()
+
+def _get_job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    return job
+
+@app.post("/api/jobs/import")
+def submit_import_job(request: ImportRequest):
+    job = job_manager.submit(
+        "import", request.project_path,
+        _job_locked("shared", request.project_path, "import", lambda j: pipeline.import_project(request.project_path, j)),
+        IMPORT_STAGES
+    )
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/api/jobs/generate")
+def submit_generate_job(request: GenerateRequest):
+    job = job_manager.submit(
+        "generate", request.project_path,
+        _job_locked("shared", request.project_path, "generate",
+                    lambda j: pipeline.generate(request.project_path, request.tags, _load_templates_for_job, j, request.page_size)),
+        GENERATE_STAGES
+    )
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/api/jobs/write")
+def submit_write_job(request: WriteRequest):
+    if not request.handle and request.diff is None:
+        raise HTTPException(status_code=422, detail="Either 'handle' or 'diff' is required")
+    job = job_manager.submit(
+        "write", request.project_path,
+        _job_locked("exclusive", request.project_path, "write",
+                    lambda j: pipeline.write(request.project_path, request.diff, j, request.handle, request.excluded, request.included)),
+        WRITE_STAGES
+    )
+    return {"job_id": job.id, "status": job.status}
+
+class RebuildRequest(BaseModel):
+    project_path: str
+    tags: Optional[List[Dict[str, Any]]] = None # Defaults to the tags saved in SQLite for the project
+    run_size: Optional[int] = None
+
+@app.post("/api/jobs/rebuild")
+def submit_rebuild_job(request: RebuildRequest):
+    """
+    Headless full rebuild (generate + write without review), streamed with bounded
+    memory. The saved tags are read from SQLite in batches unless `tags` is sent.
+    """
+    tags = request.tags if request.tags is not None else iter_saved_tags(request.project_path)
+    job = job_manager.submit(
+        "rebuild", request.project_path,
+        _job_locked("exclusive", request.project_path, "rebuild",
+                    lambda j: pipeline.rebuild(request.project_path, tags, _load_templates_for_job, j, request.run_size or DEFAULT_RUN_SIZE)),
+        REBUILD_STAGES
+    )
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/api/jobs")
+def list_jobs():
+    return job_manager.list_jobs()
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    return _get_job_or_404(job_id).snapshot()
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = _get_job_or_404(job_id)
+    if job.status == "succeeded":
+        return PayloadResponse(job.result)
+    if job.status in ("failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=job.error or f"Job {job.status}")
+    raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = _get_job_or_404(job_id)
+    return {"cancelled": job.cancel(), "status": job.status}
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events stream of job snapshots until the job finishes."""
+    job = _get_job_or_404(job_id)
+
+    async def event_stream():
+        last_version = -1
+        while True:
+            if job.version != last_version:
+                snap = job.snapshot()
+                last_version = snap["version"]
+                yield f"event: progress\ndata: {json.dumps(snap)}\n\n"
+                if snap["status"] in ("succeeded", "failed", "cancelled"):
+                    yield f"event: {snap['status']}\ndata: {json.dumps(snap)}\n\n"
+                    break
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Metrics & Profiling ---
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of stage timings and record counters."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/locks")
+def list_locks():
+    """Projects currently locked or waited for: readers (by operation), the writer and the queue depth."""
+    return project_locks.snapshot()
+
+@app.get("/api/executors")
+def list_executors():
+    """Thread pools behind the async endpoints: size, calls running and calls queued."""
+    return [dbf_io.snapshot(), db_io.snapshot()]
+
+@app.get("/api/metrics/profiles")
+def list_profiles():
+    return {"modes": profiler.available_modes(), "reports": profiler.list_reports()}
+
+@app.get("/api/metrics/profiles/{report_id}", response_class=PlainTextResponse)
+def get_profile(report_id: str):
+    report = profiler.get(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Profile {report_id} not found")
+    return PlainTextResponse(report["text"])
+
+@app.get("/api/ready")
+def readiness():
+    """Readiness probe: ready as soon as the API serves requests; `warmup` reports the background preload."""
+    return {"ready": True, "warmup": warmup.snapshot(), "dbf_cache": dbf_rows.snapshot()}
 
 @app.get("/")
 def read_root():
@@ -301,248 +631,302 @@ def read_root():
 class SaveTagsRequest(BaseModel):
     project_path: str
     tags: List[Dict[str, Any]]
+    base_revision: Optional[int] = None # Project revision the client loaded; rows changed / added since then are not overwritten (409)
+
+def _save_tags(db: Session, request: SaveTagsRequest) -> Dict[str, Any]:
+    with project_locks.exclusive(request.project_path, "save"):
+        before_ids = {}
+        before = history.current_rows(db, request.project_path, before_ids)
+        # Tags, reference graph and history version go in one transaction: a failure leaves none of them
+        saved = sync_tags(db, request.project_path, request.tags, request.base_revision, commit=False)
+        # Only tags whose references changed are re-indexed
+        references = reference_graph.sync(db, request.project_path, request.tags, get_all_templates(db), commit=False)
+        version = history.record_save(db, request.project_path, before, commit=False, before_ids=before_ids)
+        db.commit()
+        # Published under the lock, so subscribers get the revisions in order
+        live_channels.publish(request.project_path, delta_message(db, request.project_path, "save", saved["revision"], saved["previous"],
+                                                                  saved["updated"], saved["added"], saved["deleted"]))
+    return {"status": "saved", "count": saved["count"], "revision": saved["revision"], "previous": saved["previous"],
+            "rows": [[str(row_id), version] for row_id, version in saved["rows"]],
+            "added": [{"client_id": client_id, "id": str(row_id)} for client_id, row_id in saved["added"]],
+            "references": references, "history": version}
 
 @app.post("/api/save_tags")
-def save_tags_db(request: SaveTagsRequest, db: Session = Depends(get_db)):
+async def save_tags_db(request: SaveTagsRequest):
     """
     Full-Fidelity Save to SQLite.
-    Replaces all tags for the given project.
+    Makes the project's saved tags equal to `tags`; unchanged rows keep their id and version.
+    `rows` has the [id, version] each tag was saved as, in request order (new rows also in `added`). Tags carrying `version` (as /api/state returns it) or
+    a `base_revision` are checked against newer writes: 409 with the conflicting rows.
     """
-    # 1. Delete existing
-    db.query(TagEntry).filter(TagEntry.project_path == request.project_path).delete()
-    
-    # 2. Iterate and Map
-    new_entries = []
-    timestamp = datetime.datetime.now().isoformat()
-    
-    for t in request.tags:
-        # Helper: Get value with fallback
-        def g(key, default=""):
-            return t.get(key, default) or default # Handle None
-
-        # Determine Entry Type
-        etype = g("entry_type", "single") 
-        if g("type") == "udt_instance": etype = "udt_instance" # Check legacy key if needed
-        # Frontend updated to use 'entry_type' but let's be safe
-        
-        entry = TagEntry(
-            project_path = request.project_path,
-            entry_type = etype,
-            is_manual_override = t.get("is_manual_override", False),
-            is_expanded = t.get("is_expanded", False),
-            
-            # Identity
-            name = g("citectName") or g("name"), 
-            
-            cluster = g("cluster"),
-            type = g("udt_type") if etype == "udt_instance" else (g("dataType") or g("type") or g("TYPE")),
-            description = g("description") or g("comment") or g("COMMENT"),
-            equipment = g("equipment"),
-            item = g("item"),
-            
-            # Variable
-            var_addr = g("address") or g("var_addr"),
-            var_unit = g("unit") or g("var_unit"),
-            var_eng_units = g("engUnits") or g("var_eng_units"),
-            var_eng_zero = g("engZero") or g("var_eng_zero"),
-            var_eng_full = g("engFull") or g("var_eng_full"),
-            var_format = g("format") or g("var_format"),
-            
-            # Variable Advanced
-            var_raw_zero = g("rawZero") or g("var_raw_zero"),
-            var_raw_full = g("rawFull") or g("var_raw_full"),
-            editcode = g("editCode") or g("editcode"), 
-            linked = g("linked"), oid = g("oid"),
-            ref1 = g("ref1"), ref2 = g("ref2"), deadband = g("deadband"),
-            custom = g("custom"), taggenlink = g("tagGenLink") or g("taggenlink"), 
-            historian = g("historian"),
-            write_roles = g("writeRoles") or g("write_roles"), 
-            guid = g("guid"),
-            
-            # Custom
-            custom1 = g("custom1"), custom2 = g("custom2"), custom3 = g("custom3"),
-            custom4 = g("custom4"), custom5 = g("custom5"), custom6 = g("custom6"),
-            custom7 = g("custom7"), custom8 = g("custom8"),
-
-            # Trend
-            is_trend = t.get("isTrend", False) or t.get("is_trend", False),
-            trend_name = g("trendName") or g("trend_name"),
-            trend_expr = g("trend_expr"),
-            trend_sample_per = g("samplePeriod") or g("trend_sample_per"),
-            trend_type = g("trendType") or g("trend_type"),
-            trend_filename = g("trendFilename") or g("trend_filename"),
-            trend_storage = g("trendStorage") or g("trend_storage") or g("trend_stormethod"),
-            trend_files = g("trendFiles") or g("trend_files"),
-            
-            # Advanced Trend
-            trend_trig = g("trend_trig"), trend_priv = g("trend_priv"), trend_area = g("trend_area"),
-            trend_time = g("trend_time"), trend_period_rec = g("trend_period_rec") or g("trend_period"),
-            
-            trend_eng_units = g("trend_eng_units"), trend_format = g("trend_format"),
-            trend_eng_zero = g("trend_eng_zero"), trend_eng_full = g("trend_eng_full"),
-            trend_comment = g("trend_comment"), trend_cluster = g("trend_cluster"),
-            trend_taggenlink = g("trend_taggenlink"), trend_editcode = g("trend_editcode"),
-            trend_linked = g("trend_linked"), trend_deadband = g("trend_deadband"),
-            trend_equip = g("trend_equip"), trend_item = g("trend_item"),
-            trend_historian = g("trend_historian"),
-
-            trend_spcflag = g("trend_spcflag"), 
-            trend_lsl = g("trend_lsl"), trend_usl = g("trend_usl"),
-            trend_subgrpsize = g("trend_subgrpsize"), trend_xdoublebar = g("trend_xdoublebar"),
-            trend_range = g("trend_range"), trend_sdeviation = g("trend_sdeviation"),
-            
-            # Alarm
-            is_alarm = t.get("isAlarm", False) or t.get("is_alarm", False),
-            alarm_tag = g("alarm_tag") or g("alarmTag"), 
-            alarm_name = g("alarmName") or g("alarm_name"), 
-            alarm_desc = g("alarm_desc"),
-            alarm_var_a = g("alarm_var_a"),
-            alarm_var_b = g("alarm_var_b"),
-            alarm_category = g("alarmCategory") or g("alarm_category"),
-            alarm_help = g("alarm_help") or g("alarmHelp"),
-            alarm_area = g("alarm_area") or g("alarmArea"),
-            alarm_priv = g("alarm_priv"),
-            alarm_priority = g("alarm_priority"),
-            alarm_delay = g("alarm_delay"),
-            alarm_paging = g("alarm_paging"),
-            alarm_paginggrp = g("alarm_paginggrp"),
-            
-            alarm_comment = g("alarm_comment"), alarm_cluster = g("alarm_cluster"),
-            alarm_taggenlink = g("alarm_taggenlink"), alarm_editcode = g("alarm_editcode"),
-            alarm_linked = g("alarm_linked"), alarm_equip = g("alarm_equip"),
-            alarm_item = g("alarm_item"), alarm_historian = g("alarm_historian"),
-            
-            alarm_custom1 = g("alarm_custom1"), alarm_custom2 = g("alarm_custom2"),
-            alarm_custom3 = g("alarm_custom3"), alarm_custom4 = g("alarm_custom4"),
-            alarm_custom5 = g("alarm_custom5"), alarm_custom6 = g("alarm_custom6"),
-            alarm_custom7 = g("alarm_custom7"), alarm_custom8 = g("alarm_custom8")
-        )
-        new_entries.append(entry)
-        
-    db.add_all(new_entries)
-    
-    # Update Project State (Timestamp)
-    state = db.query(ProjectState).filter(ProjectState.project_path == request.project_path).first()
-    if state:
-        state.updated_at = timestamp
-        # Optionally update tags_json too for legacy/quick load? 
-        # Or remove tags_json reliance? 
-        # Let's keep it in sync for now as backup.
-        state.tags_json = json.dumps(request.tags)
-    else:
-        state = ProjectState(project_path=request.project_path, tags_json=json.dumps(request.tags), updated_at=timestamp)
-        db.add(state)
-        
-    db.commit()
-    return {"status": "saved", "count": len(new_entries)}
+    # Row diffing for a whole project is CPU work: it runs on the db executor, not the event loop
+    return await db_io.run(with_session, _save_tags, request)
 
-@app.get("/api/state")
-def get_project_state(path: str, db: Session = Depends(get_db)):
-    # Prefer loading from TagEntry table if data exists
-    entries = db.query(TagEntry).filter(TagEntry.project_path == path).all()
-    
-    if entries:
-        # Reconstruct Dicts from TagEntry
-        tags = []
-        for e in entries:
-            # Map back to Frontend CamelCase / Hybrid
-            t = {
-                "id": str(e.id), # Use DB ID?
-                "entry_type": e.entry_type,
-                "is_manual_override": e.is_manual_override,
-                "is_expanded": e.is_expanded,
-                
-                "name": e.name, # Prefix/Name
-                "citectName": e.name, # Alias
-                "cluster": e.cluster,
-                "udt_type": e.type if e.entry_type == "udt_instance" else "",
-                "type": e.type, # Raw Type
-                
-                "address": e.var_addr, "var_addr": e.var_addr,
-                "unit": e.var_unit, "var_unit": e.var_unit,
-                "engUnits": e.var_eng_units, "var_eng_units": e.var_eng_units,
-                "engZero": e.var_eng_zero, "var_eng_zero": e.var_eng_zero,
-                "engFull": e.var_eng_full, "var_eng_full": e.var_eng_full,
-                "format": e.var_format, "var_format": e.var_format,
-                "description": e.description,
-                "equipment": e.equipment,
-                "item": e.item,
-                
-                # Advanced Var
-                "rawZero": e.var_raw_zero, "var_raw_zero": e.var_raw_zero,
-                "rawFull": e.var_raw_full, "var_raw_full": e.var_raw_full,
-                "editCode": e.editcode, "editcode": e.editcode,
-                "linked": e.linked, "oid": e.oid,
-                "ref1": e.ref1, "ref2": e.ref2, "deadband": e.deadband,
-                "custom": e.custom, "taggenlink": e.taggenlink, "historian": e.historian,
-                
-                "custom1": e.custom1, "custom2": e.custom2, "custom3": e.custom3, "custom4": e.custom4,
-                "custom5": e.custom5, "custom6": e.custom6, "custom7": e.custom7, "custom8": e.custom8,
-
-                "guid": e.guid, "writeRoles": e.write_roles,
-                
-                # Trend
-                "isTrend": e.is_trend, "is_trend": e.is_trend,
-                "trendName": e.trend_name, "trend_name": e.trend_name,
-                "samplePeriod": e.trend_sample_per, "trend_sample_per": e.trend_sample_per,
-                "trendType": e.trend_type, "trend_type": e.trend_type,
-                "trendFilename": e.trend_filename, "trend_filename": e.trend_filename,
-                "trendFiles": e.trend_files, "trend_files": e.trend_files,
-                "trend_expr": e.trend_expr,
-                "trendStorage": e.trend_storage, "trend_storage": e.trend_storage, "trend_stormethod": e.trend_storage,
-                "trend_trig": e.trend_trig, "trend_priv": e.trend_priv, "trend_area": e.trend_area,
-                "trend_time": e.trend_time, "trend_period": e.trend_period_rec, 
-                "trend_period_rec": e.trend_period_rec,
-                
-                "trend_eng_units": e.trend_eng_units, "trend_format": e.trend_format,
-                "trend_eng_zero": e.trend_eng_zero, "trend_eng_full": e.trend_eng_full,
-                "trend_comment": e.trend_comment, "trend_cluster": e.trend_cluster,
-                "trend_taggenlink": e.trend_taggenlink, "trend_editcode": e.trend_editcode,
-                "trend_linked": e.trend_linked, "trend_deadband": e.trend_deadband,
-                "trend_equip": e.trend_equip, "trend_item": e.trend_item,
-                "trend_historian": e.trend_historian,
-                
-                "trend_spcflag": e.trend_spcflag, "trend_lsl": e.trend_lsl, "trend_usl": e.trend_usl,
-                "trend_subgrpsize": e.trend_subgrpsize, "trend_xdoublebar": e.trend_xdoublebar,
-                "trend_range": e.trend_range, "trend_sdeviation": e.trend_sdeviation,
-                
-                # Alarm
-                "isAlarm": e.is_alarm, "is_alarm": e.is_alarm,
-                "alarmTag": e.alarm_tag, "alarm_tag": e.alarm_tag,
-                "alarmName": e.alarm_name, "alarm_name": e.alarm_name,
-                "alarmCategory": e.alarm_category, "alarm_category": e.alarm_category,
-                "alarm_desc": e.alarm_desc,
-                "alarm_help": e.alarm_help, "alarm_area": e.alarm_area,
-                "alarm_delay": e.alarm_delay, "alarm_priv": e.alarm_priv,
-                "alarm_var_a": e.alarm_var_a, "alarm_var_b": e.alarm_var_b,
-                "alarm_priority": e.alarm_priority,
-                "alarm_var_a": e.alarm_var_a, "alarm_var_b": e.alarm_var_b,
-                "alarm_priority": e.alarm_priority,
-                "alarm_paging": e.alarm_paging, "alarm_paginggrp": e.alarm_paginggrp,
-                
-                "alarm_comment": e.alarm_comment, "alarm_cluster": e.alarm_cluster,
-                "alarm_taggenlink": e.alarm_taggenlink, "alarm_editcode": e.alarm_editcode,
-                "alarm_linked": e.alarm_linked, "alarm_equip": e.alarm_equip,
-                "alarm_item": e.alarm_item, "alarm_historian": e.alarm_historian,
-                
-                "alarm_custom1": e.alarm_custom1, "alarm_custom2": e.alarm_custom2,
-                "alarm_custom3": e.alarm_custom3, "alarm_custom4": e.alarm_custom4,
-                "alarm_custom5": e.alarm_custom5, "alarm_custom6": e.alarm_custom6,
-                "alarm_custom7": e.alarm_custom7, "alarm_custom8": e.alarm_custom8
-            }
-            tags.append(t)
-        
+# Reads that take no project lock run on the async engine (run_db). Endpoints that lock the
+# project, and the large state load, run on the db executor: a lock wait or a long row build
+# would otherwise hold the event loop.
+
+@app.get("/api/search")
+async def search_tags(project_path: str, q: str, limit: int = 50, offset: int = 0, fields: Optional[str] = None,
+                      prefix: bool = True, raw: bool = False):
+    """
+    Full-text search over the saved tags (name, description, address, equipment, item, alarm desc), best match first
+    (grid order when the query matches more than tag_search.RANK_MAX_MATCHES tags).
+    `q`: words (prefix matched) and "quoted phrases"; `fields`: comma separated subset; `raw`: FTS5 syntax as is.
+    """
+    try:
+        return await run_db(tag_search.search, project_path, q, limit, offset, fields.split(",") if fields else None, prefix, raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Hierarchy ---
+# Cluster -> equipment -> item tree with counts, expanded lazily (services/hierarchy.py).
+# `levels`: comma separated (default cluster,equipment,item); `path`: repeated, one value per level from the top
+
+@app.get("/api/hierarchy")
+async def get_hierarchy(project_path: str, levels: Optional[str] = None, path: List[str] = Query([]), depth: int = 1,
+                        limit: int = hierarchy.MAX_GROUPS, offset: int = 0):
+    """Groups below `path` with tag / trend / alarm counts, `depth` levels deep."""
+    try:
+        return await run_db(hierarchy.children, project_path, levels.split(",") if levels else None, path, depth, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/hierarchy/rows")
+async def get_hierarchy_rows(project_path: str, levels: Optional[str] = None, path: List[str] = Query([]),
+                             limit: int = hierarchy.MAX_ROWS, offset: int = 0):
+    """Saved tags under a tree node, in the /api/state row format."""
+    try:
+        rows, total = await run_db(hierarchy.rows, project_path, levels.split(",") if levels else None, path, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PayloadResponse({"tags": Rows(STATE_KEYS, rows), "total": total})
+
+class BulkEditRequest(BaseModel):
+    project_path: str
+    filter: List[Dict[str, Any]] = [] # [{field, op, value}], all must hold; op: eq, ne, in, not_in, contains, startswith, endswith, like, empty, not_empty
+    operations: List[Dict[str, Any]] # [{field, set}] or [{field, find, replace, regex?, ignore_case?, count?}], applied in order
+    dry_run: bool = True # Preview: counts and a before / after sample, nothing is committed
+    expect_matched: Optional[int] = None # Matched count from the preview; the apply is refused (409) if it changed
+    sample: int = 20
+
+def _bulk_edit(db: Session, request: BulkEditRequest) -> Dict[str, Any]:
+    # A preview is rolled back, it only needs the rows to hold still
+    with _project_lock(request.project_path, "bulk_edit", request.dry_run):
+        result = bulk_editor.run(db, request.project_path, request.filter, request.operations, request.dry_run,
+                                 request.expect_matched, max(request.sample, 0))
+        if "revision" in result:
+            live_channels.publish(request.project_path, delta_message(db, request.project_path, "bulk_edit", result["revision"],
+                                                                      result["revision"] - 1, [op["field"] for op in result["operations"]]))
+        return result
+
+@app.post("/api/tags/bulk_edit")
+async def bulk_edit_tags(request: BulkEditRequest):
+    """Set / find-replace over the saved tags selected by a filter, in one transaction (preview with dry_run, then apply)."""
+    try:
+        return await db_io.run(with_session, _bulk_edit, request)
+    except BulkEditConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- History ---
+# Versions of the saved tags and DBF writes, as deltas (services/history.py)
+
+def _shared(operation: str, fn):
+    """fn(db, project_path, *args) under the project's shared lock, for db_io.run(with_session, ...)."""
+    def run(db: Session, project_path: str, *args):
+        with project_locks.shared(project_path, operation):
+            return fn(db, project_path, *args)
+    return run
+
+@app.get("/api/history")
+async def list_history(project_path: str, limit: int = 100, offset: int = 0):
+    """Versions of a project, newest first."""
+    return await db_io.run(with_session, _shared("history", history.versions), project_path, limit, offset)
+
+@app.get("/api/history/diff")
+async def diff_history(project_path: str, from_version: int, to_version: int, limit: int = 200, offset: int = 0):
+    """Net tag / DBF changes between two versions (0 = before the first one)."""
+    try:
+        return await db_io.run(with_session, _shared("history", history.diff), project_path, from_version, to_version, limit, offset)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Version {e.args[0]} not found for this project")
+
+@app.get("/api/history/{version}/tags")
+async def history_tags(version: int, project_path: str):
+    """The saved tags as of a version, in the /api/state row format (read-only preview)."""
+    try:
+        rows = await db_io.run(with_session, _shared("history", history.tags_at), project_path, version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Version {version} not found for this project")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PayloadResponse({"version": version, "tags": Rows(STATE_KEYS, [state_values(r) for r in rows])})
+
+class RestoreRequest(BaseModel):
+    project_path: str
+    version: int
+    tags: bool = True # Restore the saved tags
+    dbf: bool = False # Also undo the DBF writes made after the version
+    force: bool = False # Overwrite rows / files changed outside the history
+    dry_run: bool = False
+
+def _restore(db: Session, request: RestoreRequest) -> Dict[str, Any]:
+    with _project_lock(request.project_path, "restore", request.dry_run):
+        result = history.restore(db, request.project_path, request.version, request.tags, request.dbf, request.force, request.dry_run,
+                                 dbf_writer, pipeline.dbf_paths(request.project_path), reference_graph)
+        if "revision" in result:
+            # Deleted rows of a restore are only known by name: subscribers reload
+            live_channels.publish(request.project_path, reset_message(result["revision"], result["revision"] - 1, "restore"))
+        return result
+
+@app.post("/api/history/restore")
+async def restore_history(request: RestoreRequest):
+    """Brings the project back to a version; the restore is recorded as a new version."""
+    try:
+        # May rewrite DBF files
+        return await dbf_io.run(with_session, _restore, request)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Version {request.version} not found for this project")
+    except HistoryConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Reference Graph ---
+# Which trend / alarm rows and UDT members refer to which variables (services/reference_graph.py)
+
+@app.get("/api/references")
+async def get_references(project_path: str, name: str):
+    """Direct references to `name` and from the rows it owns."""
+    return await db_io.run(with_session, _shared("references", reference_graph.references), project_path, name)
+
+@app.get("/api/references/impact")
+async def get_reference_impact(project_path: str, name: str):
+    """What breaks if the saved tag `name` is deleted."""
+    return await db_io.run(with_session, _shared("references", reference_graph.impact), project_path, name)
+
+class CascadeRenameRequest(BaseModel):
+    project_path: str
+    old_name: str
+    new_name: str
+    dry_run: bool = False # Report the changes without committing them
+
+def _rename(db: Session, request: CascadeRenameRequest) -> Dict[str, Any]:
+    with _project_lock(request.project_path, "rename", request.dry_run):
+        result = reference_graph.rename(db, request.project_path, request.old_name, request.new_name, request.dry_run)
+        if "revision" in result:
+            live_channels.publish(request.project_path, delta_message(db, request.project_path, "rename", result["revision"],
+                                                                      result["revision"] - 1))
+        return result
+
+@app.post("/api/references/rename")
+async def cascade_rename(request: CascadeRenameRequest):
+    """Renames a saved tag and rewrites every dependent reference in one transaction."""
+    try:
+        return await db_io.run(with_session, _rename, request)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Tag {request.old_name} not found in the saved state")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def _rebuild_references(db: Session, project_path: str) -> Dict[str, int]:
+    with project_locks.exclusive(project_path, "references"):
+        return reference_graph.rebuild(db, project_path)
+
+@app.post("/api/references/rebuild")
+async def rebuild_references(project_path: str):
+    """Re-indexes the project's saved tags from scratch."""
+    return await db_io.run(with_session, _rebuild_references, project_path)
+
+def iter_saved_tags(path: str):
+    """Saved tags of a project as /api/state dicts, fetched lazily in batches (own session, safe in job threads)."""
+    return tag_store.iter_saved_tags(SessionLocal, path)
+
+def _load_state(db: Session, path: str):
+    with project_locks.shared(path, "state"):
+        tags = list(iter_state_rows(db, path))
         # Check ProjectState for updated_at
         state = db.query(ProjectState).filter(ProjectState.project_path == path).first()
+    return tags, state
+
+@app.get("/api/state")
+async def get_project_state(path: str):
+    # Prefer loading from TagEntry table if data exists
+    # Each row is mapped to its frontend keys (CamelCase / Hybrid aliases from the
+    # schema registry) as a plain tuple; PayloadResponse encodes them row by row,
+    # or keys-once for columnar clients. Building the rows is CPU work, so it runs
+    # on the db executor instead of the event loop.
+    tags, state = await db_io.run(with_session, _load_state, path)
+
+    if tags:
         updated_at = state.updated_at if state else ""
-        return {"found": True, "tags": tags, "updated_at": updated_at}
+        # The revision the rows are at: the client's `since` / `base_revision` for live sync and saves
+        revision = (state.revision or 0) if state else 0
+        return PayloadResponse({"found": True, "tags": Rows(STATE_KEYS, tags), "updated_at": updated_at, "revision": revision})
         
     # Fallback to legacy JSON blob
-    state = db.query(ProjectState).filter(ProjectState.project_path == path).first()
     if not state:
         return {"found": False}
     return {"found": True, "tags": json.loads(state.tags_json), "updated_at": state.updated_at}
 
+# --- Live Sync ---
+# Row-level deltas of the saved tags pushed to every open grid of a project (services/live_sync.py)
+
+@app.websocket("/api/projects/live")
+async def project_live(websocket: WebSocket, project_path: str, since: Optional[int] = None):
+    """
+    Subscribes to a project's saved-tag changes. The server sends {"type": "hello", revision} first;
+    with `since` (the revision the client holds) the missed deltas follow, or a reset when they are
+    not all kept. Then every write arrives as a delta (apply it when its `previous` is the client's
+    revision) or a reset (reload /api/state). A "ping" text is answered with {"type": "pong"}.
+    """
+    await websocket.accept()
+    # Subscribed before the revision is read: nothing committed in between is missed
+    queue = live_channels.subscribe(project_path)
+    try:
+        revision = await run_db(current_revision, project_path)
+        await websocket.send_json({"type": "hello", "project_path": project_path, "revision": revision})
+        if since is not None and since != revision:
+            missed = live_channels.replay(project_path, since, revision) if since < revision else None
+            for message in missed if missed is not None else [reset_message(revision, since, "replay")]:
+                await websocket.send_json(message)
+
+        async def pump():
+            sent = revision
+            while True:
+                message = await queue.get()
+                # Already covered by the hello / replay
+                if message["type"] == "delta" and message["revision"] <= sent:
+                    continue
+                await websocket.send_json(message)
+                sent = max(sent, message.get("revision", sent))
+
+        async def listen():
+            while True:
+                if (await websocket.receive_text()).strip().lower() == "ping" and not queue.full():
+                    # Through the queue: pump is the only task sending
+                    queue.put_nowait({"type": "pong"})
+
+        tasks = [asyncio.create_task(pump()), asyncio.create_task(listen())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_channels.unsubscribe(project_path, queue)
+
+@app.get("/api/projects/live/status")
+def live_status():
+    """Open live subscriptions per project."""
+    return live_channels.snapshot()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
 
@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -21,6 +21,7 @@ class TagEntry(Base):
     entry_type = Column(String, default="single")  # 'single', 'udt_instance', 'member'
     project_path = Column(String, index=True, default="") # Scope to specific project
     parent_id = Column(Integer, nullable=True)     # For members, points to udt_instance ID
+    version = Column(Integer, default=0)           # Project revision of the row's last change (optimistic checks, live deltas)
     
     # --- CONTROL FLAGS ---
     is_manual_override = Column(Boolean, default=False) # Protection flag: If True, UDT logic skips overwriting
@@ -143,6 +144,14 @@ class TagEntry(Base):
     alarm_custom7 = Column(String, default="")
     alarm_custom8 = Column(String, default="")
 
+    __table_args__ = (
+        # Covering index for the cluster -> equipment -> item tree (services/hierarchy.py): GROUP BY
+        # and the trend / alarm counts are answered from the index alone
+        Index("ix_tag_entries_hierarchy", "project_path", "cluster", "equipment", "item", "is_trend", "is_alarm"),
+        # Rows written by one revision (live deltas of bulk edits / renames)
+        Index("ix_tag_entries_version", "project_path", "version"),
+    )
+
 class ProjectState(Base):
     __tablename__ = "project_states"
     
@@ -150,6 +159,7 @@ class ProjectState(Base):
     tags_json = Column(String) # JSON blob of the entire grid state
     settings_json = Column(String, default="{}") # Project-specific defaults
     updated_at = Column(String) # ISO timestamp
+    revision = Column(Integer, default=0) # Bumped by every write to the saved tags (services/live_sync.py)
 
 class UdtTemplate(Base):
     __tablename__ = "udt_templates"
@@ -158,3 +168,45 @@ class UdtTemplate(Base):
     description = Column(String, default="")
     members_json = Column(String) # JSON list of members
 
+class TagReference(Base):
+    """
+    One edge of the tag reference graph: `source_key` in `source_table` refers to the
+    variable `target` through `field`. Built from the saved tags (services/reference_graph.py).
+    """
+    __tablename__ = "tag_references"
+
+    id = Column(Integer, primary_key=True)
+    project_path = Column(String, default="")
+    owner = Column(String, default="")        # Saved tag (single / member / udt_instance name) the edge was expanded from
+    owner_hash = Column(String, default="")   # Fingerprint of the owner's referencing fields, unchanged owners are skipped on save
+    source_table = Column(String, default="") # trend / digalm, or variable for a UDT member
+    source_key = Column(String, default="")   # trend NAME / digalm TAG / member variable NAME
+    field = Column(String, default="")        # EXPR / VAR_A / VAR_B, or UDT (member -> its instance)
+    target = Column(String, default="")       # Referenced tag name
+
+    __table_args__ = (
+        Index("ix_tag_references_target", "project_path", "target"),
+        Index("ix_tag_references_owner", "project_path", "owner"),
+    )
+
+class ProjectVersion(Base):
+    """
+    One entry of a project's history (services/history.py): a save, bulk edit, rename,
+    DBF write or restore, stored as a compressed delta against the previous version.
+    """
+    __tablename__ = "project_versions"
+
+    id = Column(Integer, primary_key=True)        # Version number (increasing, shared by all projects)
+    project_path = Column(String, default="")
+    kind = Column(String, default="save")         # baseline / save / bulk_edit / rename / write / rebuild / restore
+    created_at = Column(String)                   # ISO timestamp
+    message = Column(String, default="")
+    stats_json = Column(String, default="{}")     # Change counts, DBF mtimes after a write
+    tag_delta = Column(LargeBinary, nullable=True)  # zlib JSON {key: [old fields, new fields]} of the saved tags
+    dbf_delta = Column(LargeBinary, nullable=True)  # zlib JSON {table: {key: [old record, new record]}} of a DBF write
+    checkpoint = Column(LargeBinary, nullable=True) # zlib JSON of every saved tag after this version (every few saves)
+
+    __table_args__ = (
+        Index("ix_project_versions_project", "project_path", "id"),
+    )
+
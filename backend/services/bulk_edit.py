@@ -0,0 +1,258 @@
+
+import datetime
+import re
+import time
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, and_, func, insert, literal, not_, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import TagEntry, ProjectState
+from services.metrics import metrics
+from services.reference_graph import OWNER_COLUMNS
+from services.tag_schema import API_FIELDS
+from services.tag_store import STATE_COLUMNS, STATE_KEYS, claim_revision, next_revision, state_row
+
+# Grid keys (camelCase / snake_case aliases) -> TagEntry column, as save_tags accepts them
+COLUMN_BY_KEY = {key: f.column for f in API_FIELDS for key in (f.column,) + f.aliases}
+# Columns an operation may write; entry_type / parent_id hold the UDT structure and stay put
+EDITABLE_COLUMNS = frozenset(f.column for f in API_FIELDS) - {"entry_type"}
+FILTER_COLUMNS = EDITABLE_COLUMNS | {"id", "entry_type", "parent_id"}
+BOOLEAN_COLUMNS = frozenset(c.name for c in TagEntry.__table__.columns if isinstance(c.type, Boolean))
+
+FILTER_OPS = ("eq", "ne", "in", "not_in", "contains", "startswith", "endswith", "like", "empty", "not_empty")
+# Rows fetched / staged per batch in the compiled-regex pass
+UPDATE_CHUNK = 5000
+DEFAULT_SAMPLE = 20
+
+# Ids selected by the filter, fixed before the first operation so later operations act on the
+# same rows even when an earlier one edits a filtered column. Per connection (TEMP), emptied per run.
+_temp = MetaData()
+_selection = Table("bulk_edit_selection", _temp, Column("id", Integer, primary_key=True), prefixes=["TEMPORARY"])
+# New values of the compiled-regex pass, merged with one UPDATE (a row-by-row executemany is ~3x slower)
+_values = Table("bulk_edit_values", _temp, Column("id", Integer, primary_key=True), Column("value", String), prefixes=["TEMPORARY"])
+
+class BulkEditConflict(Exception):
+    """The filter no longer selects the number of tags the preview reported."""
+
+def _column(key: str, allowed) -> str:
+    column = COLUMN_BY_KEY.get(key, key)
+    if column not in allowed:
+        raise ValueError(f"Unknown or read-only field: {key}")
+    return column
+
+def _coerce(column: str, value: Any) -> Any:
+    if column in BOOLEAN_COLUMNS:
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "y")
+        return bool(value)
+    if column in ("id", "parent_id"):
+        return int(value)
+    return "" if value is None else str(value)
+
+def build_filter(project_path: str, predicates: List[Dict[str, Any]]):
+    """
+    [{field, op, value}] -> SQL WHERE clause (all predicates must hold), scoped to the project.
+    contains / startswith / endswith / like follow SQLite LIKE: case-insensitive for ASCII.
+    """
+    clauses = [TagEntry.project_path == project_path]
+    for p in predicates or []:
+        column_name = _column(p.get("field", ""), FILTER_COLUMNS)
+        column = getattr(TagEntry, column_name)
+        op = p.get("op", "eq")
+        value = p.get("value")
+        if op == "eq":
+            clauses.append(column == _coerce(column_name, value))
+        elif op == "ne":
+            clauses.append(column != _coerce(column_name, value))
+        elif op in ("in", "not_in"):
+            if not isinstance(value, list):
+                raise ValueError(f"'{op}' needs a list value")
+            values = [_coerce(column_name, v) for v in value]
+            clauses.append(column.in_(values) if op == "in" else column.notin_(values))
+        elif op in ("contains", "startswith", "endswith"):
+            clauses.append(getattr(column, op)(_coerce(column_name, value), autoescape=True))
+        elif op == "like":
+            clauses.append(column.like(_coerce(column_name, value)))
+        elif op in ("empty", "not_empty"):
+            blank = or_(column.is_(None), column == "")
+            clauses.append(blank if op == "empty" else not_(blank))
+        else:
+            raise ValueError(f"Unknown filter op '{op}', expected one of: {', '.join(FILTER_OPS)}")
+    return and_(*clauses)
+
+class BulkEditor:
+    """
+    Bulk edits over the saved tags of a project: a filter plus set / find-replace operations,
+    applied in one transaction without the grid round-trip.
+
+    Operations:
+      {"field", "set": value}                              one UPDATE ... WHERE id IN selection
+      {"field", "find", "replace"}                         literal, case-sensitive: one UPDATE with replace()
+      {"field", "find", "replace", "regex" / "ignore_case"} compiled pattern over the selected rows,
+                                                           changed rows written back by id in chunks
+
+    The FTS triggers re-index edited rows as part of the same UPDATEs; edits to the columns the
+    reference graph is built from re-index the edited owners before the commit.
+    """
+    def __init__(self, reference_graph=None, history=None):
+        self.reference_graph = reference_graph
+        # HistoryStore: applied edits are recorded as project versions
+        self.history = history
+
+    def parse_operations(self, operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        parsed = []
+        for op in operations or []:
+            column = _column(op.get("field", ""), EDITABLE_COLUMNS)
+            if "set" in op:
+                parsed.append({"field": column, "kind": "set", "value": _coerce(column, op["set"])})
+                continue
+            if "find" not in op:
+                raise ValueError(f"Operation on {column} needs 'set' or 'find' / 'replace'")
+            if column in BOOLEAN_COLUMNS:
+                raise ValueError(f"Find / replace does not apply to the flag {column}, use 'set'")
+            find, replace = str(op["find"]), str(op.get("replace") or "")
+            if not find:
+                raise ValueError(f"Empty 'find' on {column}")
+            if op.get("regex") or op.get("ignore_case"):
+                pattern = find if op.get("regex") else re.escape(find)
+                try:
+                    compiled = re.compile(pattern, re.IGNORECASE if op.get("ignore_case") else 0)
+                except re.error as e:
+                    raise ValueError(f"Invalid pattern for {column}: {e}")
+                if not op.get("regex"):
+                    # Literal text: backslashes in the replacement are not group references
+                    replace = replace.replace("\\", "\\\\")
+                parsed.append({"field": column, "kind": "regex", "find": find, "replace": replace, "pattern": compiled,
+                               "count": int(op.get("count") or 0)})
+            else:
+                parsed.append({"field": column, "kind": "replace", "find": find, "replace": replace})
+        if not parsed:
+            raise ValueError("No operations given")
+        return parsed
+
+    def run(self, db: Session, project_path: str, predicates: List[Dict[str, Any]], operations: List[Dict[str, Any]],
+            dry_run: bool = True, expect_matched: Optional[int] = None, sample: int = DEFAULT_SAMPLE) -> Dict[str, Any]:
+        """
+        Applies `operations` to the tags selected by `predicates`. With `dry_run` (the default)
+        everything runs and is rolled back: the result is the preview (matched / changed counts
+        and a before / after sample per operation). `expect_matched` (the preview's count) makes
+        the apply fail with BulkEditConflict if the selection changed in between.
+        """
+        start = time.perf_counter()
+        parsed = self.parse_operations(operations)
+        where = build_filter(project_path, predicates)
+        touches_graph = self.reference_graph is not None and any(op["field"] in OWNER_COLUMNS for op in parsed)
+        if touches_graph and not dry_run:
+            # Build a missing graph from the unedited state first (it commits on its own); a
+            # preview only reports the edges it would rewrite in the graph as it is
+            self.reference_graph.ensure(db, project_path)
+
+        try:
+            _temp.create_all(db.connection(), checkfirst=True)
+            db.execute(_selection.delete())
+            db.execute(insert(_selection).from_select(["id"], select(TagEntry.id).where(where)))
+            matched = db.execute(select(func.count()).select_from(_selection)).scalar()
+            if expect_matched is not None and matched != expect_matched:
+                raise BulkEditConflict(f"The filter now selects {matched} tags, the preview selected {expect_matched}. Preview again.")
+
+            selected = TagEntry.id.in_(select(_selection.c.id))
+            owners_before = []
+            if touches_graph:
+                owners_before = [n for (n,) in db.query(TagEntry.name).filter(selected) if n]
+            record = self.history is not None and not dry_run
+            if record:
+                ids = [i for (i,) in db.execute(select(_selection.c.id))]
+                history_before = self.history.rows_by_id(db, project_path, ids)
+
+            # Edited rows are stamped with the project revision this run claims
+            revision = next_revision(db, project_path)
+            results = [self._apply(db, op, selected, sample, revision) for op in parsed]
+
+            edges = None
+            if touches_graph:
+                rows = [dict(zip(STATE_KEYS, state_row(r))) for r in db.query(*STATE_COLUMNS).filter(selected)]
+                edges = self.reference_graph.reindex(db, project_path, owners_before, rows)
+
+            result = {
+                "matched": matched,
+                "operations": results,
+                "changed": sum(r["changed"] for r in results),
+                "edges_rewritten": edges,
+                "dry_run": dry_run,
+            }
+            if record and result["changed"]:
+                result["version"] = self.history.record_rows(db, project_path, "bulk_edit", history_before,
+                                                             self.history.rows_by_id(db, project_path, ids),
+                                                             f"Bulk edit of {', '.join(sorted({op['field'] for op in parsed}))}")
+            db.execute(_selection.delete())
+            if dry_run:
+                db.rollback()
+            else:
+                if result["changed"]:
+                    result["revision"] = revision
+                    state = claim_revision(db, project_path, revision)
+                else:
+                    state = db.query(ProjectState).filter(ProjectState.project_path == project_path).first()
+                if state:
+                    state.updated_at = datetime.datetime.now().isoformat()
+                db.commit()
+                metrics.inc("taggen_bulk_edit_rows_total", result["changed"])
+        except Exception:
+            db.rollback()
+            raise
+        elapsed = time.perf_counter() - start
+        metrics.record_stage("bulk_edit", elapsed)
+        result["seconds"] = round(elapsed, 4)
+        return result
+
+    def _apply(self, db: Session, op: Dict[str, Any], selected, sample: int, revision: int) -> Dict[str, Any]:
+        field = op["field"]
+        column = getattr(TagEntry, field)
+        report = {"field": field, "kind": op["kind"], "changed": 0, "sample": []}
+
+        if op["kind"] == "regex":
+            # One pass over the selected values; only rows whose text changes are written back
+            pattern, replace, count = op["pattern"], op["replace"], op["count"]
+            query = db.query(TagEntry.id, TagEntry.name, column).filter(selected)
+            if not pattern.flags & re.IGNORECASE and not any(c in op["find"] for c in "\\.^$*+?{}[]|()"):
+                # A pattern without metacharacters is plain text: let SQLite skip the rows without it
+                query = query.filter(func.instr(column, op["find"]) > 0)
+            changes = []
+            for row_id, name, value in query.yield_per(UPDATE_CHUNK):
+                if not value:
+                    continue
+                try:
+                    new_value = pattern.sub(replace, value, count)
+                except (re.error, IndexError) as e:
+                    raise ValueError(f"Invalid replacement for {field}: {e}")
+                if new_value != value:
+                    changes.append({"id": row_id, "value": new_value})
+                    if len(report["sample"]) < sample:
+                        report["sample"].append({"id": str(row_id), "name": name, "before": value, "after": new_value})
+            db.execute(_values.delete())
+            for i in range(0, len(changes), UPDATE_CHUNK):
+                db.execute(insert(_values), changes[i:i + UPDATE_CHUNK])
+            if changes:
+                staged = select(_values.c.value).where(_values.c.id == TagEntry.id).scalar_subquery()
+                db.execute(update(TagEntry.__table__).where(TagEntry.id.in_(select(_values.c.id))).values({field: staged, "version": revision})
+                           .execution_options(synchronize_session=False))
+                db.execute(_values.delete())
+            report["changed"] = len(changes)
+            return report
+
+        # Set-based: the WHERE leaves out rows the edit would not change
+        if op["kind"] == "set":
+            new_value = op["value"]
+            differs = or_(column.is_(None), column != new_value)
+        else:
+            new_value = func.replace(column, op["find"], op["replace"])
+            differs = func.instr(column, op["find"]) > 0
+        condition = and_(selected, differs)
+        if sample:
+            report["sample"] = [{"id": str(r[0]), "name": r[1], "before": r[2], "after": r[3]}
+                                for r in db.query(TagEntry.id, TagEntry.name, column, new_value if op["kind"] != "set" else literal(new_value))
+                                .filter(condition).limit(sample)]
+        report["changed"] = db.execute(update(TagEntry.__table__).where(condition).values({field: new_value, "version": revision})
+                                       .execution_options(synchronize_session=False)).rowcount
+        return report
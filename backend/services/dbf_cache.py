@@ -0,0 +1,95 @@
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import dbf
+from services.metrics import metrics
+from services.tag_schema import DBF_INTERNED
+
+# Rows kept across all cached tables; a table larger than this is never cached (the
+# out-of-core reconcile reads those straight from disk anyway)
+DBF_CACHE_RECORDS = int(os.environ.get("TAGGEN_DBF_CACHE_RECORDS", "400000"))
+
+class DbfRowCache:
+    """
+    Parsed DBF rows - stripped string tuples in the file's column order - keyed by path.
+
+    An entry is valid while the file's mtime and size are unchanged, so a write by this
+    process or by Plant SCADA itself is picked up on the next read. Import, reconcile and
+    the startup warm-up share the entries; iterating the dbf library's records is the slow
+    part of all three. Rows must be treated as read-only.
+    """
+    def __init__(self, max_records: int = DBF_CACHE_RECORDS):
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # path -> (signature, field names, rows)
+        self._records = 0
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def rows(self, path: str) -> Optional[Tuple[Tuple[str, ...], List[Tuple[str, ...]]]]:
+        """(field names, rows) of a DBF, deleted rows included; None if the file does not exist."""
+        key = os.path.abspath(path)
+        signature = self._signature(key)
+        if signature is None:
+            self.invalidate(key)
+            return None
+        table_type = os.path.splitext(os.path.basename(key))[0].lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                metrics.inc("taggen_dbf_cache_hits_total", table=table_type)
+                return entry[1], entry[2]
+
+        metrics.inc("taggen_dbf_cache_misses_total", table=table_type)
+        start = time.perf_counter()
+        table = dbf.Table(key)
+        table.open(dbf.READ_ONLY)
+        try:
+            field_names = tuple(table.field_names)
+            interned = [i for i, name in enumerate(field_names) if name in DBF_INTERNED]
+            rows = []
+            for record in table:
+                values = [str(v).strip() for v in record]
+                for i in interned:
+                    values[i] = sys.intern(values[i])
+                rows.append(tuple(values))
+        finally:
+            table.close()
+        metrics.record_stage(f"dbf_parse_{table_type}", time.perf_counter() - start)
+
+        # Changed while we read it: hand out the rows, but do not keep them
+        if self._signature(key) == signature and len(rows) <= self.max_records:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._records -= len(old[2])
+                self._entries[key] = (signature, field_names, rows)
+                self._records += len(rows)
+                while self._records > self.max_records:
+                    _, (_, _, evicted) = self._entries.popitem(last=False)
+                    self._records -= len(evicted)
+        return field_names, rows
+
+    def invalidate(self, path: str):
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._records -= len(entry[2])
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"tables": len(self._entries), "records": self._records, "max_records": self.max_records}
+
+dbf_rows = DbfRowCache()
@@ -3,52 +3,72 @@ import struct
 import uuid
 import os
 import shutil
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import dbf 
+from services.dbf_cache import dbf_rows
+from services.metrics import metrics
+from services.external_sort import ExternalSorter, merge_join, DEFAULT_RUN_SIZE
+from services.tag_schema import DBF_SCHEMAS, DBF_FIELD_NAMES, DBF_RECORD_TYPES, DBF_VALUE_GETTERS, GenericDbfRecord
+
+def _field_signature(*fields: str):
+    """Rename-matching signature: the stripped values of `fields`, or None unless all are set."""
+    def signature(record: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+        values = tuple(str(record.get(f) or "").strip() for f in fields)
+        return values if all(values) else None
+    return signature
+
+_equip_item = _field_signature("EQUIP", "ITEM")
+_unit_addr = _field_signature("UNIT", "ADDR")
+
+# reconcile_changes(mode="auto") switches to the out-of-core sorted merge from this many DBF rows
+SORTED_RECONCILE_MIN_RECORDS = int(os.environ.get("TAGGEN_SORTED_RECONCILE_RECORDS", "250000"))
+
+def dbf_record_count(path: str) -> int:
+    """Record count from the DBF header (bytes 4-7), without opening the table. 0 if missing."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(8)
+    except OSError:
+        return 0
+    if len(header) < 8:
+        return 0
+    return struct.unpack("<I", header[4:8])[0]
 
 class DBFWriter:
     def __init__(self):
-        # Schemas derived from example files (Field Name, Type, Length)
-        self.schemas = {
-             "variable": [
-                ("NAME", "C", 79), ("TYPE", "C", 16), ("UNIT", "C", 31), ("ADDR", "C", 254),
-                ("RAW_ZERO", "C", 11), ("RAW_FULL", "C", 11), ("ENG_ZERO", "C", 11), ("ENG_FULL", "C", 11),
-                ("ENG_UNITS", "C", 8), ("FORMAT", "C", 11), ("COMMENT", "C", 254), ("EDITCODE", "C", 16),
-                ("LINKED", "C", 1), ("OID", "C", 10), ("REF1", "C", 11), ("REF2", "C", 11),
-                ("DEADBAND", "C", 11), ("CUSTOM", "C", 128), ("TAGGENLINK", "C", 32), ("CLUSTER", "C", 16),
-                ("EQUIP", "C", 254), ("ITEM", "C", 63), ("HISTORIAN", "C", 6),
-                ("CUSTOM1", "C", 254), ("CUSTOM2", "C", 254), ("CUSTOM3", "C", 254), ("CUSTOM4", "C", 254),
-                ("CUSTOM5", "C", 254), ("CUSTOM6", "C", 254), ("CUSTOM7", "C", 254), ("CUSTOM8", "C", 254),
-                ("WRITEROLES", "C", 254), ("GUID", "C", 36)
-            ],
-            "trend": [
-                ("NAME", "C", 79), ("EXPR", "C", 254), ("TRIG", "C", 254), ("SAMPLEPER", "C", 16),
-                ("PRIV", "C", 16), ("AREA", "C", 16), ("ENG_UNITS", "C", 8), ("FORMAT", "C", 11),
-                ("FILENAME", "C", 253), ("FILES", "C", 4), ("TIME", "C", 32), ("PERIOD", "C", 32),
-                ("COMMENT", "C", 254), ("TYPE", "C", 32), ("SPCFLAG", "C", 4), ("LSL", "C", 16),
-                ("USL", "C", 16), ("SUBGRPSIZE", "C", 8), ("XDOUBLEBAR", "C", 16), ("RANGE", "C", 16),
-                ("SDEVIATION", "C", 16), ("STORMETHOD", "C", 64), ("CLUSTER", "C", 16), ("TAGGENLINK", "C", 32),
-                ("EDITCODE", "C", 16), ("LINKED", "C", 1), ("DEADBAND", "C", 16), ("EQUIP", "C", 254),
-                ("ITEM", "C", 63), ("HISTORIAN", "C", 6), ("ENG_ZERO", "C", 11), ("ENG_FULL", "C", 11)
-            ],
-             "digalm": [
-                ("TAG", "C", 79), ("NAME", "C", 79), ("DESC", "C", 254), ("VAR_A", "C", 254), ("VAR_B", "C", 254),
-                ("CATEGORY", "C", 16), ("HELP", "C", 64), ("PRIV", "C", 16), ("AREA", "C", 16),
-                ("COMMENT", "C", 254), ("SEQUENCE", "C", 16), ("DELAY", "C", 16), ("CUSTOM1", "C", 64),
-                ("CUSTOM2", "C", 64), ("CUSTOM3", "C", 64), ("CUSTOM4", "C", 64), ("CUSTOM5", "C", 64),
-                ("CUSTOM6", "C", 64), ("CUSTOM7", "C", 64), ("CUSTOM8", "C", 64), ("CLUSTER", "C", 16),
-                ("TAGGENLINK", "C", 32), ("PAGING", "C", 8), ("PAGINGGRP", "C", 80), ("EDITCODE", "C", 16),
-                ("LINKED", "C", 1), ("EQUIP", "C", 254), ("ITEM", "C", 63), ("HISTORIAN", "C", 6)
-            ]
-        }
+        self.schemas = DBF_SCHEMAS
 
     def generate_guid(self) -> str:
         return str(uuid.uuid4())
 
-    def reconcile_changes(self, staging_data: List[Dict], existing_dbf_path: str, key_field: str = "NAME", enable_guid: bool = True) -> Dict[str, List]:
+    def reconcile_changes(self, staging_data: List[Dict], existing_dbf_path: str, key_field: str = "NAME", enable_guid: bool = True,
+                          mode: str = "auto", renamed_keys: Optional[Dict[str, str]] = None) -> Dict[str, List]:
         """
         Compares staging data against an existing DBF.
+
+        `mode` "memory" indexes the existing rows in a dict; "sorted" merge-joins both
+        sides through spill files (see iter_reconcile_sorted) and is meant for DBFs larger
+        than memory. "auto" picks "sorted" once the DBF header counts at least
+        SORTED_RECONCILE_MIN_RECORDS rows. Both give the same changes; the sorted mode
+        lists them in key order.
+
+        What the sorted mode bounds is the existing DBF: it is never indexed whole, only the
+        rows reported as modified / orphaned are kept. `staging_data` is the caller's list and
+        the returned lists are in memory (DiffStore keeps diffs in memory); "unchanged" and
+        "new" hold references to the staging records, not copies. Memory therefore grows with
+        the staging size plus the changes, not with the size of the DBF.
+
+        Orphaned rows that reappear under another key are reported as "renamed"
+        (see detect_renames); `renamed_keys` carries renames found in another table.
         """
+        if mode == "auto":
+            mode = "sorted" if dbf_record_count(existing_dbf_path) >= SORTED_RECONCILE_MIN_RECORDS else "memory"
+        if mode == "sorted":
+            diff = {"new": [], "modified": [], "orphaned": [], "unchanged": []}
+            for change_type, item in self.iter_reconcile_sorted(staging_data, existing_dbf_path, key_field, enable_guid):
+                diff[change_type].append(item)
+            return self.detect_renames(diff, key_field, enable_guid, renamed_keys)
         
         diff = {
             "new": [],
@@ -58,60 +78,38 @@ class DBFWriter:
         }
         
         existing_records = {} # Map Key -> Record Dict
+        table_type = os.path.splitext(os.path.basename(existing_dbf_path))[0].lower()
         
         if os.path.exists(existing_dbf_path):
             try:
-                table = dbf.Table(existing_dbf_path)
-                table.open(dbf.READ_ONLY)
-                for record in table:
-                    # Capture all fields to dict
-                    rec_dict = {field: str(record[field]).strip() for field in table.field_names}
+                start = time.perf_counter()
+                field_names, rows = dbf_rows.rows(existing_dbf_path)
+                record_type = DBF_RECORD_TYPES.get(table_type, GenericDbfRecord)
+                for values in rows:
+                    # Capture all fields as a compact record
+                    rec_dict = record_type.from_row(field_names, values)
                     key = rec_dict.get(key_field)
                     if key:
                         existing_records[key] = rec_dict
-                table.close()
+                metrics.inc("taggen_records_read_total", len(rows), table=table_type)
+                metrics.record_stage(f"dbf_read_{table_type}", time.perf_counter() - start)
             except Exception as e:
                 print(f"Error reading DBF {existing_dbf_path}: {e}")
 
+        compare_start = time.perf_counter()
+        fields_compared = 0
+
         # Compare Staging to Existing
         for record in staging_data:
             key = record.get(key_field)
             
             if key in existing_records:
-                existing_rec = existing_records[key]
-                
-                # --- GUID LOGIC for existing records ---
-                if enable_guid:
-                    existing_guid = existing_rec.get('GUID') or existing_rec.get('OID') 
-                    if existing_guid:
-                        record['GUID'] = existing_guid
-                    elif 'GUID' not in record:
-                        record['GUID'] = self.generate_guid()
-
-                # --- MODIFICATION CHECK ---
-                is_modified = False
-                for k, v in record.items():
-                    # Compare only fields present in staging (we enforce schema later)
-                    if k in existing_rec:
-                        val_stage = str(v).strip()
-                        val_exist = existing_rec[k]
-                        if val_stage != val_exist:
-                            is_modified = True
-                            break
-                            
-                if is_modified:
-                    # Return both existing and proposed for side-by-side comparison
-                    diff["modified"].append({
-                        "existing": existing_rec,
-                        "proposed": record,
-                        "changed_fields": [k for k, v in record.items() 
-                                          if k in existing_rec and str(v).strip() != existing_rec[k]]
-                    })
-                else:
-                    diff["unchanged"].append(record)
+                change_type, item, compared = self._compare_existing(record, existing_records[key], enable_guid)
+                fields_compared += compared
+                diff[change_type].append(item)
             else:
                 # --- NEW RECORD ---
-                if enable_guid and 'GUID' not in record:
+                if enable_guid and not record.get('GUID'):
                     record['GUID'] = self.generate_guid()
                 diff["new"].append(record)
         
@@ -120,9 +118,184 @@ class DBFWriter:
         for key, rec in existing_records.items():
             if key not in staging_keys:
                 diff["orphaned"].append(rec)
-                
+
+        metrics.inc("taggen_fields_compared_total", fields_compared, table=table_type)
+        metrics.record_stage(f"compare_{table_type}", time.perf_counter() - compare_start)
+        return self.detect_renames(diff, key_field, enable_guid, renamed_keys)
+
+    def detect_renames(self, diff: Dict[str, List], key_field: str = "NAME", enable_guid: bool = True,
+                       renamed_keys: Optional[Dict[str, str]] = None) -> Dict[str, List]:
+        """
+        Moves orphaned/new pairs that are the same tag under a new key (e.g. a renamed
+        UDT prefix) into diff["renamed"], so they are written as in-place key updates
+        that keep the row's GUID instead of a delete + append.
+
+        Matched, in order, one-to-one only (ambiguous candidates stay new + orphaned):
+        1. GUID - the new record carries the GUID/OID of an orphaned row (enable_guid tables)
+        2. `renamed_keys` - old key -> new key, from a table reconciled earlier
+           (variable renames carry over to the trend / alarm rows of the same tag)
+        3. EQUIP + ITEM - both set, and unique on both sides
+        4. UNIT + ADDR (variable) - the same I/O point; catches generated UDT members,
+           whose EQUIP follows the renamed prefix and which have no GUID yet
+        """
+        renamed = []
+        orphans, news = diff["orphaned"], diff["new"]
+        taken_orphans, taken_new = set(), set()
+
+        def unique_index(items, signature, taken):
+            index = {}
+            for i, item in enumerate(items):
+                if i in taken:
+                    continue
+                sig = signature(item)
+                if sig:
+                    index[sig] = None if sig in index else i # None = ambiguous
+            return index
+
+        strategies = []
+        if enable_guid:
+            strategies.append((lambda r: r.get("GUID") or r.get("OID"), lambda r: str(r.get("GUID") or "").strip()))
+        if renamed_keys:
+            strategies.append((lambda r: renamed_keys.get(r.get(key_field)), lambda r: r.get(key_field)))
+        strategies.append((_equip_item, _equip_item))
+        strategies.append((_unit_addr, _unit_addr))
+
+        for orphan_sig, new_sig in strategies:
+            if len(taken_orphans) == len(orphans) or len(taken_new) == len(news):
+                break
+            orphan_index = unique_index(orphans, orphan_sig, taken_orphans)
+            new_index = unique_index(news, new_sig, taken_new)
+            for sig, o in orphan_index.items():
+                n = new_index.get(sig)
+                if o is None or n is None:
+                    continue
+                existing_rec, record = orphans[o], news[n]
+                if enable_guid:
+                    existing_guid = existing_rec.get('GUID') or existing_rec.get('OID')
+                    if existing_guid:
+                        record['GUID'] = existing_guid
+                renamed.append({
+                    "existing": existing_rec,
+                    "proposed": record,
+                    "old_key": existing_rec.get(key_field),
+                    "changed_fields": [k for k, v in record.items()
+                                       if k in existing_rec and str(v).strip() != existing_rec[k]]
+                })
+                taken_orphans.add(o)
+                taken_new.add(n)
+
+        if renamed:
+            diff["new"] = [r for i, r in enumerate(news) if i not in taken_new]
+            diff["orphaned"] = [r for i, r in enumerate(orphans) if i not in taken_orphans]
+        diff["renamed"] = renamed
         return diff
 
+    def _compare_existing(self, record: Dict[str, Any], existing_rec: Dict[str, Any], enable_guid: bool):
+        """Staging record vs the existing row with its key -> (change type, diff item, fields compared)."""
+        # --- GUID LOGIC for existing records ---
+        if enable_guid:
+            existing_guid = existing_rec.get('GUID') or existing_rec.get('OID') 
+            if existing_guid:
+                record['GUID'] = existing_guid
+            elif 'GUID' not in record:
+                record['GUID'] = self.generate_guid()
+
+        # --- MODIFICATION CHECK ---
+        fields_compared = 0
+        is_modified = False
+        for k, v in record.items():
+            # Compare only fields present in staging (we enforce schema later)
+            if k in existing_rec:
+                fields_compared += 1
+                val_stage = str(v).strip()
+                val_exist = existing_rec[k]
+                if val_stage != val_exist:
+                    is_modified = True
+                    break
+                    
+        if is_modified:
+            # Return both existing and proposed for side-by-side comparison
+            return "modified", {
+                "existing": existing_rec,
+                "proposed": record,
+                "changed_fields": [k for k, v in record.items() 
+                                  if k in existing_rec and str(v).strip() != existing_rec[k]]
+            }, fields_compared
+        return "unchanged", record, fields_compared
+
+    def iter_reconcile_sorted(self, staging_data: List[Dict], existing_dbf_path: str, key_field: str = "NAME", enable_guid: bool = True,
+                              run_size: int = DEFAULT_RUN_SIZE, spill_dir: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Out-of-core reconcile: yields (change_type, item) as they are found, items shaped
+        like reconcile_changes' lists.
+
+        Existing rows go into an external sort as (key, row number, values) and the staging
+        side as (key, index) pointers into `staging_data`; both sorts spill past their run
+        size. The two sorted streams are merge-joined in one pass, so only one key group of
+        existing rows is in memory at a time (`staging_data` itself stays the caller's list). Matching rules are the ones of the in-memory mode (last row wins per key,
+        deleted rows count as existing).
+        """
+        table_type = os.path.splitext(os.path.basename(existing_dbf_path))[0].lower()
+        record_type = DBF_RECORD_TYPES.get(table_type, GenericDbfRecord)
+        field_names = []
+        fields_compared = 0
+
+        with ExternalSorter(run_size, spill_dir, name=f"reconcile_{table_type}") as existing, \
+                ExternalSorter(run_size * 4, spill_dir, name=f"reconcile_staging_{table_type}") as staging:
+            if os.path.exists(existing_dbf_path):
+                try:
+                    start = time.perf_counter()
+                    table = dbf.Table(existing_dbf_path)
+                    table.open(dbf.READ_ONLY)
+                    field_names = list(table.field_names)
+                    key_pos = field_names.index(key_field) if key_field in field_names else None
+                    if key_pos is not None:
+                        for recno, record in enumerate(table):
+                            values = tuple([str(v).strip() for v in record])
+                            if values[key_pos]:
+                                existing.add((values[key_pos], recno, values))
+                    metrics.inc("taggen_records_read_total", len(table), table=table_type)
+                    table.close()
+                    metrics.record_stage(f"dbf_read_{table_type}", time.perf_counter() - start)
+                except Exception as e:
+                    print(f"Error reading DBF {existing_dbf_path}: {e}")
+
+            for i, record in enumerate(staging_data):
+                key = record.get(key_field)
+                if type(key) is str:
+                    staging.add((key, i))
+                else:
+                    # Can never match an existing row
+                    if enable_guid and not record.get('GUID'):
+                        record['GUID'] = self.generate_guid()
+                    yield "new", record
+
+            # Includes time spent by the consumer between items
+            compare_start = time.perf_counter()
+            for key, staged, rows in merge_join(staging, existing):
+                if not rows:
+                    for _, i in staged:
+                        record = staging_data[i]
+                        if enable_guid and not record.get('GUID'):
+                            record['GUID'] = self.generate_guid()
+                        yield "new", record
+                    continue
+
+                existing_rec = record_type.from_row(field_names, rows[-1][2])
+                if not staged:
+                    yield "orphaned", existing_rec
+                    continue
+
+                for _, i in staged:
+                    change_type, item, compared = self._compare_existing(staging_data[i], existing_rec, enable_guid)
+                    fields_compared += compared
+                    yield change_type, item
+            compare_time = time.perf_counter() - compare_start
+
+        metrics.inc("taggen_fields_compared_total", fields_compared, table=table_type)
+        metrics.inc("taggen_sorted_reconciles_total", table=table_type)
+        metrics.record_stage(f"compare_{table_type}", compare_time)
+
     def apply_diff(self, diff: Dict[str, Any], target_path: str, table_type: str):
         """
         Applies the diff to the target DBF file.
@@ -144,6 +317,8 @@ class DBFWriter:
 
         field_names = set(table.field_names)
         key_field = "TAG" if table_type == "digalm" else "NAME"
+        start = time.perf_counter()
+        touched = {"deleted": 0, "modified": 0, "renamed": 0, "new": 0}
         
         # 3. Process Orphans (Delete)
         orphaned_names = set(r.get("NAME") or r.get("TAG") for r in diff["orphaned"])
@@ -154,6 +329,7 @@ class DBFWriter:
             val = str(record[key_field]).strip()
             if val in orphaned_names:
                 dbf.delete(record)
+                touched["deleted"] += 1
                 
         # 4. Process Modified (extract 'proposed' from new structure)
         mod_map = {}
@@ -164,6 +340,12 @@ class DBFWriter:
             else:
                 rec = m
             mod_map[rec[key_field]] = rec
+
+        # Renamed rows are updated in place under their old key (key field included), keeping the GUID
+        renamed_keys = set()
+        for r in diff.get("renamed", []):
+            mod_map[r["old_key"]] = r["proposed"]
+            renamed_keys.add(r["old_key"])
             
         if mod_map:
              for record in table:
@@ -181,6 +363,7 @@ class DBFWriter:
                                         record[k] = v
                                     except Exception as e:
                                         print(f"Warning: Failed to write {k}={v}: {e}")
+                        touched["renamed" if rec_key in renamed_keys else "modified"] += 1
                     except Exception as e:
                         print(f"Error accessing record context for {rec_key}: {e}")
         
@@ -190,7 +373,159 @@ class DBFWriter:
             safe_rec = {k: v for k, v in new_rec.items() if k in field_names}
             try:
                 table.append(safe_rec)
+                touched["new"] += 1
             except Exception as e:
                 print(f"Warning: Failed to append record {new_rec.get(key_field)}: {e}")
-            
+
+        for change, count in touched.items():
+            metrics.inc("taggen_records_written_total", count, table=table_type, change=change)
+        # Deletes only flip the record's delete flag
+        metrics.inc("taggen_bytes_written_total", table.record_length * (touched["modified"] + touched["renamed"] + touched["new"]) + touched["deleted"], table=table_type)
         table.close()
+        # Same-size rewrites can land within the file system's mtime resolution
+        dbf_rows.invalidate(target_path)
+        metrics.record_stage(f"dbf_write_{table_type}", time.perf_counter() - start)
+
+    # --- Streaming rebuild (bounded memory, see TagPipeline.rebuild) ---
+
+    @staticmethod
+    def staging_item(record: Dict[str, Any], table_type: str, key_field: str) -> tuple:
+        """
+        Expanded record -> sortable (key, values, extra) tuple for an ExternalSorter.
+        Values are in schema order; keys that can never match an existing row sort as "".
+        """
+        key = record.get(key_field)
+        if type(key) is not str:
+            key = ""
+        fields = DBF_FIELD_NAMES[table_type]
+        if isinstance(record, DBF_RECORD_TYPES[table_type]):
+            values = DBF_VALUE_GETTERS[table_type](record)
+            extra = record._extra or None
+        else:
+            values = tuple(record.get(f, "") for f in fields)
+            extra = {k: v for k, v in record.items() if k not in DBF_RECORD_TYPES[table_type]._field_set} or None
+        return (key, values, extra)
+
+    def stream_apply(self, staging: Iterable[tuple], target_path: str, table_type: str, key_field: str = "NAME",
+                     enable_guid: bool = True, run_size: int = DEFAULT_RUN_SIZE, spill_dir: Optional[str] = None) -> Dict[str, int]:
+        """
+        reconcile_changes + apply_diff in one pass with bounded memory.
+
+        `staging` yields staging_item tuples sorted by key. The existing DBF is streamed
+        into an external sort by key (row number kept), both sides are merge-joined and
+        each new / modified / orphaned record is written as soon as it is found.
+        Returns the change counts; no diff is kept. Deleted rows are not treated as
+        existing, so a deleted tag that is still generated is appended again.
+        """
+        fields = DBF_FIELD_NAMES[table_type]
+        counts = {"new": 0, "modified": 0, "orphaned": 0, "unchanged": 0}
+
+        with ExternalSorter(run_size, spill_dir, name=f"existing_{table_type}") as existing:
+            field_names = []
+            if os.path.exists(target_path):
+                start = time.perf_counter()
+                try:
+                    table = dbf.Table(target_path)
+                    table.open(dbf.READ_ONLY)
+                    field_names = list(table.field_names)
+                    key_pos = field_names.index(key_field) if key_field in field_names else None
+                    if key_pos is not None:
+                        for recno, record in enumerate(table):
+                            if dbf.is_deleted(record):
+                                continue
+                            values = tuple([str(v).strip() for v in record])
+                            if values[key_pos]:
+                                existing.add((values[key_pos], recno, values))
+                    metrics.inc("taggen_records_read_total", len(table), table=table_type)
+                    table.close()
+                except Exception as e:
+                    print(f"Error reading DBF {target_path}: {e}")
+                metrics.record_stage(f"dbf_read_{table_type}", time.perf_counter() - start)
+
+                shutil.copy2(target_path, target_path + ".bak")
+                table = dbf.Table(target_path)
+            else:
+                schema_def = "; ".join([f"{n} {t}({l})" for n,t,l in self.schemas[table_type]])
+                table = dbf.Table(target_path, schema_def)
+            table.open(dbf.READ_WRITE)
+            field_names = list(table.field_names)
+            writable = set(field_names)
+
+            # Positions compared between a staging tuple and an existing row
+            existing_pos = {name: i for i, name in enumerate(field_names)}
+            compare = [(i, existing_pos[f]) for i, f in enumerate(fields) if f in existing_pos]
+            guid_stage = fields.index("GUID") if "GUID" in fields else None
+            guid_sources = [existing_pos[f] for f in ("GUID", "OID") if f in existing_pos]
+
+            start = time.perf_counter()
+            fields_compared = 0
+
+            def write_items(values, extra):
+                items = [(k, v) for k, v in zip(fields, values) if k in writable]
+                if extra:
+                    items.extend((k, v) for k, v in extra.items() if k in writable)
+                return items
+
+            for key, staged, rows in merge_join(staging, existing):
+                if not rows:
+                    for _, values, extra in staged:
+                        # New rows get a GUID as in reconcile_changes
+                        if enable_guid and guid_stage is not None and not values[guid_stage]:
+                            values = values[:guid_stage] + (self.generate_guid(),) + values[guid_stage + 1:]
+                        try:
+                            table.append(dict(write_items(values, extra)))
+                            counts["new"] += 1
+                        except Exception as e:
+                            print(f"Warning: Failed to append record {key}: {e}")
+                    continue
+
+                if not staged:
+                    for _, recno, _ in rows:
+                        dbf.delete(table[recno])
+                        counts["orphaned"] += 1
+                    continue
+
+                # Same semantics as reconcile_changes: compare against the last row with this key
+                existing_values = rows[-1][2]
+                for _, values, extra in staged:
+                    if enable_guid and guid_stage is not None:
+                        existing_guid = next((existing_values[i] for i in guid_sources if existing_values[i]), None)
+                        if existing_guid:
+                            values = values[:guid_stage] + (existing_guid,) + values[guid_stage + 1:]
+
+                    is_modified = False
+                    for i, j in compare:
+                        fields_compared += 1
+                        if str(values[i]).strip() != existing_values[j]:
+                            is_modified = True
+                            break
+                    if not is_modified and extra:
+                        is_modified = any(k in existing_pos and str(v).strip() != existing_values[existing_pos[k]] for k, v in extra.items())
+
+                    if not is_modified:
+                        counts["unchanged"] += 1
+                        continue
+                    changes = write_items(values, extra)
+                    for _, recno, _ in rows:
+                        record = table[recno]
+                        try:
+                            with record:
+                                for k, v in changes:
+                                    try:
+                                        record[k] = v
+                                    except Exception as e:
+                                        print(f"Warning: Failed to write {k}={v}: {e}")
+                        except Exception as e:
+                            print(f"Error accessing record context for {key}: {e}")
+                    counts["modified"] += 1
+
+            touched = {"deleted": counts["orphaned"], "modified": counts["modified"], "new": counts["new"]}
+            for change, count in touched.items():
+                metrics.inc("taggen_records_written_total", count, table=table_type, change=change)
+            metrics.inc("taggen_bytes_written_total", table.record_length * (touched["modified"] + touched["new"]) + touched["deleted"], table=table_type)
+            metrics.inc("taggen_fields_compared_total", fields_compared, table=table_type)
+            table.close()
+            dbf_rows.invalidate(target_path)
+            metrics.record_stage(f"stream_merge_{table_type}", time.perf_counter() - start)
+
+        return counts
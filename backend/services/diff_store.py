@@ -0,0 +1,252 @@
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from services.tag_record import to_plain, json_default
+
+CHANGE_TYPES = ["new", "modified", "renamed", "orphaned"]
+QUERY_TYPES = CHANGE_TYPES + ["unchanged"] # unchanged is only returned when asked for explicitly
+KEY_FIELDS = {"variable": "NAME", "trend": "NAME", "digalm": "TAG"}
+
+class DiffNotFoundError(KeyError):
+    """The handle is unknown (never issued, evicted or already written)."""
+    pass
+
+class StaleDiffError(Exception):
+    """A DBF file changed on disk after the diff was generated."""
+    pass
+
+def record_key(table_type: str, change_type: str, record: Dict[str, Any]) -> str:
+    """Key used to identify a diff entry (NAME, or TAG for digalm; the new key for renames)."""
+    if change_type in ("modified", "renamed"):
+        record = record.get("proposed", record)
+    return record.get(KEY_FIELDS.get(table_type, "NAME"), "")
+
+class DiffStore:
+    """
+    Keeps generated diffs server-side under a content-hashed handle so the
+    browser only receives counts / pages and /api/write only sends back the handle.
+
+    Entries remember the mtime of each DBF at reconcile time; a write against a
+    handle whose files have since changed is rejected as stale.
+    """
+    def __init__(self, max_entries: int = 8, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict() # handle -> entry
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def snapshot_mtimes(dbf_paths: Dict[str, str]) -> Dict[str, Optional[int]]:
+        """mtime_ns per table; None if the file does not exist yet."""
+        mtimes = {}
+        for table_type, path in dbf_paths.items():
+            mtimes[table_type] = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        return mtimes
+
+    @staticmethod
+    def content_handle(project_path: str, diff: Dict[str, Any], mtimes: Dict[str, Optional[int]]) -> str:
+        """
+        Hash of the changes only: with the DBFs unchanged (same mtimes) the unchanged records
+        follow from them, so that section, usually most of the diff, is counted, not serialized.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(project_path.encode("utf-8"))
+        hasher.update(json.dumps(mtimes, sort_keys=True).encode("utf-8"))
+        for table_type in sorted(diff):
+            changes = diff[table_type]
+            hasher.update(f"{table_type}:{len(changes.get('unchanged', []))}".encode("utf-8"))
+            for change_type in sorted(changes):
+                if change_type != "unchanged":
+                    hasher.update(change_type.encode("utf-8"))
+                    hasher.update(json.dumps(changes[change_type], sort_keys=True, separators=(",", ":"), default=json_default).encode("utf-8"))
+        return hasher.hexdigest()[:32]
+
+    def put(self, project_path: str, diff: Dict[str, Any], dbf_paths: Dict[str, str], mtimes: Dict[str, Optional[int]],
+            validation: Optional[Dict[str, Any]] = None) -> str:
+        handle = self.content_handle(project_path, diff, mtimes)
+
+        with self._lock:
+            self._entries[handle] = {
+                "project_path": project_path,
+                "diff": diff,
+                "paths": dict(dbf_paths),
+                "mtimes": dict(mtimes),
+                "validation": validation, # Pre-flight report (services/validator.py), None if not run
+                "created_at": time.time()
+            }
+            self._entries.move_to_end(handle)
+            self._evict()
+        return handle
+
+    def get(self, handle: str) -> Dict[str, Any]:
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(handle)
+            if entry is None:
+                raise DiffNotFoundError(handle)
+            self._entries.move_to_end(handle)
+            return entry
+
+    def discard(self, handle: str):
+        with self._lock:
+            self._entries.pop(handle, None)
+
+    def check_fresh(self, handle: str):
+        entry = self.get(handle)
+        current = self.snapshot_mtimes(entry["paths"])
+        stale = [t for t, m in entry["mtimes"].items() if current.get(t) != m]
+        if stale:
+            raise StaleDiffError(f"DBF files changed since the diff was generated: {', '.join(stale)}. Re-run Generate.")
+
+    def select(self, handle: str, excluded: Optional[Dict[str, Dict[str, List[str]]]] = None,
+               included: Optional[Dict[str, Dict[str, List[str]]]] = None) -> Dict[str, Any]:
+        """
+        Returns the stored diff minus the excluded keys, in the shape apply_diff expects.
+        `excluded` is {table: {change_type: [keys]}}; a "*" key excludes the whole
+        change type except for any keys listed in `included` (Reject All + re-accept).
+        """
+        diff = self.get(handle)["diff"]
+        excluded = excluded or {}
+        included = included or {}
+        selected = {}
+        for table_type, changes in diff.items():
+            skip = excluded.get(table_type, {})
+            keep = included.get(table_type, {})
+            selected[table_type] = {}
+            for change_type in CHANGE_TYPES:
+                items = changes.get(change_type, [])
+                skip_keys = set(skip.get(change_type, []))
+                if "*" in skip_keys:
+                    keep_keys = set(keep.get(change_type, []))
+                    items = [r for r in items if record_key(table_type, change_type, r) in keep_keys]
+                elif skip_keys:
+                    items = [r for r in items if record_key(table_type, change_type, r) not in skip_keys]
+                selected[table_type][change_type] = items
+        return selected
+
+    # --- Query API (summary first, then pages, then single-record detail) ---
+
+    def summary(self, handle: str) -> Dict[str, Any]:
+        """Counts per table plus how often each field changed (for the field filter)."""
+        entry = self.get(handle)
+        changed_fields = {}
+        for table_type, changes in entry["diff"].items():
+            field_counts = {}
+            for m in changes.get("modified", []):
+                for f in m.get("changed_fields", []):
+                    field_counts[f] = field_counts.get(f, 0) + 1
+            changed_fields[table_type] = field_counts
+        return {
+            "handle": handle,
+            "project_path": entry["project_path"],
+            "created_at": entry["created_at"],
+            "counts": self.counts(entry["diff"]),
+            "changed_fields": changed_fields,
+            "validation": entry.get("validation")
+        }
+
+    def query(self, handle: str, table_type: str, change_type: str, offset: int = 0, limit: int = 100,
+              field: Optional[str] = None, prefix: Optional[str] = None, full: bool = False) -> Dict[str, Any]:
+        """
+        One page of a change type, optionally filtered by changed field (modified only)
+        and key prefix. Rows are lightweight summaries unless `full` is set.
+        """
+        if change_type not in QUERY_TYPES:
+            raise ValueError(f"Unknown change type '{change_type}'")
+        entry = self.get(handle)
+        items = entry["diff"].get(table_type, {}).get(change_type, [])
+
+        if field or prefix:
+            cache_key = (table_type, change_type, field, prefix)
+            with self._lock:
+                filtered = entry.setdefault("filters", OrderedDict()).get(cache_key)
+            if filtered is None:
+                # Filtered outside the lock; concurrent queries for the same key just compute it twice
+                needle = prefix.casefold() if prefix else None
+                filtered = [
+                    r for r in items
+                    if (not field or change_type != "modified" or field in r.get("changed_fields", []))
+                    and (not needle or record_key(table_type, change_type, r).casefold().startswith(needle))
+                ]
+                with self._lock:
+                    cache = entry["filters"]
+                    cache[cache_key] = filtered
+                    while len(cache) > 16:
+                        cache.popitem(last=False)
+            items = filtered
+
+        page = items[offset:offset + limit]
+        if full:
+            rows = [to_plain(r.get("proposed", r) if change_type in ("modified", "renamed") else r) for r in page]
+        else:
+            rows = [self._summarize(table_type, change_type, r) for r in page]
+        return {"total": len(items), "offset": offset, "limit": limit, "items": rows}
+
+    def record(self, handle: str, table_type: str, key: str) -> Dict[str, Any]:
+        """Side-by-side payload for one record, looked up through a lazily built key index."""
+        entry = self.get(handle)
+        with self._lock:
+            table_index = entry.setdefault("index", {}).get(table_type)
+        if table_index is None:
+            table_index = {}
+            for change_type in QUERY_TYPES:
+                for i, r in enumerate(entry["diff"].get(table_type, {}).get(change_type, [])):
+                    table_index[record_key(table_type, change_type, r)] = (change_type, i)
+            with self._lock:
+                entry["index"][table_type] = table_index
+
+        if key not in table_index:
+            raise KeyError(key)
+        change_type, i = table_index[key]
+        item = to_plain(entry["diff"][table_type][change_type][i])
+        if change_type == "modified":
+            return {"change_type": change_type, "key": key, "existing": item["existing"],
+                    "proposed": item["proposed"], "changed_fields": item["changed_fields"]}
+        if change_type == "renamed":
+            return {"change_type": change_type, "key": key, "old_key": item["old_key"], "existing": item["existing"],
+                    "proposed": item["proposed"], "changed_fields": item["changed_fields"]}
+        if change_type == "orphaned":
+            return {"change_type": change_type, "key": key, "existing": item, "proposed": None, "changed_fields": []}
+        if change_type == "new":
+            return {"change_type": change_type, "key": key, "existing": None, "proposed": item, "changed_fields": []}
+        return {"change_type": change_type, "key": key, "existing": item, "proposed": item, "changed_fields": []}
+
+    @staticmethod
+    def _summarize(table_type: str, change_type: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        rec = item.get("proposed", item) if change_type in ("modified", "renamed") else item
+        row = {
+            "key": record_key(table_type, change_type, item),
+            "comment": rec.get("COMMENT") or rec.get("DESC") or ""
+        }
+        if change_type in ("modified", "renamed"):
+            row["changed_fields"] = item.get("changed_fields", [])
+        if change_type == "renamed":
+            row["old_key"] = item.get("old_key", "")
+        return row
+
+    @staticmethod
+    def counts(diff: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        return {
+            table_type: {change_type: len(items) for change_type, items in changes.items()}
+            for table_type, changes in diff.items()
+        }
+
+    @staticmethod
+    def first_page(diff: Dict[str, Any], page_size: int) -> Dict[str, Any]:
+        """The first `page_size` entries of each change type. Unchanged records are never included."""
+        return {
+            table_type: {change_type: to_plain(changes.get(change_type, [])[:page_size]) for change_type in CHANGE_TYPES}
+            for table_type, changes in diff.items()
+        }
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for handle in [h for h, e in self._entries.items() if e["created_at"] < cutoff]:
+            del self._entries[handle]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,82 @@
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from services.metrics import metrics, profiler
+
+# Threads for DBF reads / writes (import, generate, write, restore) and for heavy SQLite state work
+# (full state loads and saves). Kept apart from the server's request threadpool, so a few big
+# projects cannot use up the threads small requests need.
+DBF_IO_WORKERS = int(os.environ.get("TAGGEN_DBF_IO_WORKERS", "2"))
+DB_WORKERS = int(os.environ.get("TAGGEN_DB_WORKERS", "4"))
+
+class IOExecutor:
+    """
+    A bounded thread pool that async endpoints await. Work runs with the caller's context
+    variables (request metrics scope, negotiated response format, requested profile - the
+    work is profiled in the worker thread), and the pool's queue depth / running count are
+    exported as taggen_executor_{queued,running}{executor=...}.
+    """
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self._executor: Optional[ThreadPoolExecutor] = None # Started on first use, again after a shutdown
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the pool without blocking the event loop."""
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+        self._move(queued=1)
+
+        def call():
+            self._move(queued=-1, running=1)
+            metrics.observe("taggen_executor_wait_seconds", time.perf_counter() - submitted, executor=self.name)
+            try:
+                return context.run(profiler.call, fn, *args, **kwargs)
+            finally:
+                self._move(running=-1)
+
+        future = self._pool().submit(call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Client went away: drop the work if it has not started yet
+            if future.cancel():
+                self._move(queued=-1)
+            raise
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"taggen-{self.name}")
+            return self._executor
+
+    def _move(self, queued: int = 0, running: int = 0):
+        with self._lock:
+            self.queued += queued
+            self.running += running
+        if queued:
+            metrics.add("taggen_executor_queued", queued, executor=self.name)
+        if running:
+            metrics.add("taggen_executor_running", running, executor=self.name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"name": self.name, "workers": self.workers, "running": self.running, "queued": self.queued}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+dbf_io = IOExecutor("dbf_io", DBF_IO_WORKERS)
+db_io = IOExecutor("db", DB_WORKERS)
@@ -0,0 +1,117 @@
+
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from services.metrics import metrics
+
+# Items held in memory per sorted run before it is spilled to disk
+DEFAULT_RUN_SIZE = 50000
+# Items per pickle frame inside a spill file
+SPILL_BATCH = 2048
+
+_first = itemgetter(0)
+
+class ExternalSorter:
+    """
+    Sorts a stream of tuples by their first element with bounded memory.
+
+    Items are collected into runs of `run_size`; a full run is sorted and pickled to
+    a spill file, and iteration k-way merges the runs (heapq.merge). The sort is
+    stable, so items with equal keys come back in the order they were added. Inputs
+    smaller than one run never touch disk.
+    """
+    def __init__(self, run_size: int = DEFAULT_RUN_SIZE, spill_dir: Optional[str] = None, name: str = "sort"):
+        self.run_size = max(int(run_size), 1)
+        self.spill_dir = spill_dir
+        self.name = name
+        self.count = 0
+        self._buffer = []
+        self._runs = [] # spill file paths, in the order they were written
+        self._tmpdir = None
+
+    def add(self, item: Tuple[Any, ...]):
+        self._buffer.append(item)
+        self.count += 1
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def extend(self, items: Iterable[Tuple[Any, ...]]):
+        for item in items:
+            self.add(item)
+
+    @property
+    def spilled_runs(self) -> int:
+        return len(self._runs)
+
+    def _spill(self):
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.mkdtemp(prefix=f"taggen_{self.name}_", dir=self.spill_dir)
+        buffer = self._buffer
+        buffer.sort(key=_first)
+        path = os.path.join(self._tmpdir, f"run{len(self._runs):05d}.pkl")
+        with open(path, "wb") as f:
+            for i in range(0, len(buffer), SPILL_BATCH):
+                pickle.dump(buffer[i:i + SPILL_BATCH], f, pickle.HIGHEST_PROTOCOL)
+        self._runs.append(path)
+        self._buffer = []
+        metrics.inc("taggen_spill_runs_total", sorter=self.name)
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Tuple[Any, ...]]:
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        self._buffer.sort(key=_first)
+        if not self._runs:
+            return iter(self._buffer)
+        streams = [self._read_run(path) for path in self._runs]
+        # The in-memory tail was added last, so it goes last to keep the merge stable
+        streams.append(iter(self._buffer))
+        return heapq.merge(*streams, key=_first)
+
+    def close(self):
+        self._buffer = []
+        self._runs = []
+        if self._tmpdir is not None:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def merge_join(left: Iterable[Tuple[Any, ...]], right: Iterable[Tuple[Any, ...]]) -> Iterator[Tuple[Any, List[tuple], List[tuple]]]:
+    """
+    Joins two streams already sorted by their first element in a single pass.
+    Yields (key, left_items, right_items) per distinct key; one side is empty when
+    the key only occurs on the other.
+    """
+    left_groups = groupby(left, key=_first)
+    right_groups = groupby(right, key=_first)
+    l = next(left_groups, None)
+    r = next(right_groups, None)
+    while l is not None or r is not None:
+        if r is None or (l is not None and l[0] < r[0]):
+            yield l[0], list(l[1]), []
+            l = next(left_groups, None)
+        elif l is None or r[0] < l[0]:
+            yield r[0], [], list(r[1])
+            r = next(right_groups, None)
+        else:
+            yield l[0], list(l[1]), list(r[1])
+            l = next(left_groups, None)
+            r = next(right_groups, None)
@@ -0,0 +1,209 @@
+
+import ast
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from services.tag_record import TAG_FIELDS
+
+# Field expressions for generated tags: "{parent_desc} Motor {number}", "{offset(parent_addr, index * 2)}",
+# "{upper(cluster)}_{sanitize(name)}". Text outside braces is literal ({{ / }} for braces); inside is
+# a small expression language, optionally followed by a format spec ("{index:03d}").
+#
+# Names an expression can use:
+#   instance columns   name, description, var_addr, cluster, equipment, custom1..8, ... (the TagEntry columns)
+#   parent aliases     parent_name / parent (name), parent_desc (description), parent_addr (var_addr)
+#   member context     index (0-based member position), number (index + 1), suffix, item,
+#                      tag / addr / desc (the generated name, address and comment, once computed)
+# plus the functions in FUNCTIONS, arithmetic (+ - * // %), comparisons, `and` / `or` / `not`,
+# `a if cond else b`, indexing and slicing.
+
+PARENT_ALIASES = {"parent_name": "name", "parent": "name", "parent_desc": "description", "parent_addr": "var_addr"}
+MEMBER_NAMES = ("index", "number", "suffix", "item", "tag", "addr", "desc")
+INSTANCE_NAMES = frozenset(TAG_FIELDS)
+
+class ExpressionError(ValueError):
+    """A field expression that does not parse, uses something outside the language, or fails to evaluate."""
+    pass
+
+_TRAILING_NUMBER = re.compile(r"(\d+)(\D*)$")
+
+def offset(address: Any, delta: Any) -> str:
+    """Adds `delta` to the last number in an address, keeping its zero padding: offset("N7:010", 2) -> "N7:012"."""
+    address = str(address)
+    match = _TRAILING_NUMBER.search(address)
+    if not match:
+        raise ExpressionError(f"offset(): no number in address '{address}'")
+    digits = match.group(1)
+    value = int(digits) + int(delta)
+    if value < 0:
+        raise ExpressionError(f"offset(): '{address}' {int(delta):+d} is negative")
+    return f"{address[:match.start(1)]}{str(value).zfill(len(digits))}{match.group(2)}"
+
+def _number(value: Any) -> Union[int, float]:
+    text = str(value).strip()
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+# sanitize() is the expander's TagSanitizer (global replacement rules), passed in at call time
+FUNCTIONS = {
+    "upper": lambda v: str(v).upper(),
+    "lower": lambda v: str(v).lower(),
+    "title": lambda v: str(v).title(),
+    "strip": lambda v, chars=None: str(v).strip(chars),
+    "replace": lambda v, old, new: str(v).replace(str(old), str(new)),
+    "pad": lambda v, width, fill="0": str(v).rjust(int(width), str(fill)[:1] or "0"),
+    "left": lambda v, n: str(v)[:int(n)],
+    "right": lambda v, n: str(v)[-int(n):] if int(n) else "",
+    "default": lambda v, fallback: v if v not in (None, "") else fallback,
+    "offset": offset,
+    "num": _number,
+    "int": lambda v: int(_number(v)),
+    "str": str,
+    "len": lambda v: len(str(v)),
+}
+CALLABLE_NAMES = frozenset(FUNCTIONS) | {"sanitize"}
+
+_BIN_OPS = (ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.Div)
+_CMP_OPS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn)
+_ALLOWED = (ast.Expression, ast.Constant, ast.Name, ast.Load, ast.BinOp, ast.UnaryOp, ast.USub, ast.UAdd, ast.Not,
+            ast.BoolOp, ast.And, ast.Or, ast.Compare, ast.IfExp, ast.Call, ast.Subscript, ast.Slice) + _BIN_OPS + _CMP_OPS
+
+def parse_template(text: str) -> List[Union[str, Tuple[str, str]]]:
+    """Text -> literal strings and (expression, format spec) pairs, in order."""
+    parts = []
+    literal = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch in "{}" and text[i + 1:i + 2] == ch:
+            literal.append(ch)
+            i += 2
+            continue
+        if ch == "}":
+            raise ExpressionError(f"Unmatched '}}' at {i} in: {text}")
+        if ch != "{":
+            literal.append(ch)
+            i += 1
+            continue
+        # Expression up to the matching brace; quotes and brackets may contain ':' / '}'
+        j, depth, quote, spec_at = i + 1, 0, None, None
+        while j < n:
+            c = text[j]
+            if quote:
+                if c == "\\":
+                    j += 1
+                elif c == quote:
+                    quote = None
+            elif c in "'\"":
+                quote = c
+            elif c in "([":
+                depth += 1
+            elif c in ")]":
+                depth -= 1
+            elif c == ":" and depth == 0 and spec_at is None:
+                spec_at = j
+            elif c == "}" and depth == 0:
+                break
+            j += 1
+        if j >= n:
+            raise ExpressionError(f"Unclosed '{{' at {i} in: {text}")
+        if literal:
+            parts.append("".join(literal))
+            literal = []
+        expression = text[i + 1:spec_at if spec_at is not None else j].strip()
+        if not expression:
+            raise ExpressionError(f"Empty expression at {i} in: {text}")
+        parts.append((expression, text[spec_at + 1:j] if spec_at is not None else ""))
+        i = j + 1
+    if literal:
+        parts.append("".join(literal))
+    return parts
+
+class _Resolver(ast.NodeTransformer):
+    """Checks an expression against the language and points its names at the call arguments."""
+    def __init__(self, source: str):
+        self.source = source
+
+    def generic_visit(self, node):
+        if not isinstance(node, _ALLOWED):
+            raise ExpressionError(f"'{type(node).__name__}' is not allowed in: {self.source}")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (str, int, float, bool)) and node.value is not None:
+            raise ExpressionError(f"Unsupported literal in: {self.source}")
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in CALLABLE_NAMES or node.keywords:
+            raise ExpressionError(f"Only {', '.join(sorted(CALLABLE_NAMES))}(...) can be called, in: {self.source}")
+        node.args = [self.visit(a) for a in node.args]
+        if any(isinstance(a, ast.Starred) for a in node.args):
+            raise ExpressionError(f"Unsupported call in: {self.source}")
+        return node
+
+    def visit_Name(self, node):
+        name = PARENT_ALIASES.get(node.id, node.id)
+        if name in MEMBER_NAMES:
+            # m["index"]
+            return ast.copy_location(ast.Subscript(ast.Name("m", ast.Load()), ast.Constant(name), ast.Load()), node)
+        if name in INSTANCE_NAMES:
+            # (e.get("description") or "")
+            get = ast.Call(ast.Attribute(ast.Name("e", ast.Load()), "get", ast.Load()), [ast.Constant(name)], [])
+            return ast.copy_location(ast.BoolOp(ast.Or(), [get, ast.Constant("")]), node)
+        if node.id in CALLABLE_NAMES:
+            raise ExpressionError(f"{node.id} is a function, call it as {node.id}(...), in: {self.source}")
+        raise ExpressionError(f"Unknown name '{node.id}' in: {self.source}")
+
+@lru_cache(maxsize=4096)
+def compile_template(text: str) -> Union[str, Callable[[Any, Dict[str, Any], Callable[[str], str]], str]]:
+    """
+    Template text -> the text itself when it has no expressions, otherwise a function
+    f(instance, member_context, sanitize) -> str. The whole template becomes one f-string
+    compiled to bytecode, so evaluating it is a single call with no parsing.
+    """
+    parts = parse_template(text)
+    if all(isinstance(p, str) for p in parts):
+        return "".join(parts)
+
+    values = []
+    for part in parts:
+        if isinstance(part, str):
+            values.append(ast.Constant(part))
+            continue
+        expression, spec = part
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"Invalid expression '{expression}': {e.msg}")
+        body = _Resolver(expression).visit(tree).body
+        if "{" in spec or "}" in spec:
+            raise ExpressionError(f"Nested format specs are not supported: {text}")
+        values.append(ast.FormattedValue(body, -1, ast.JoinedStr([ast.Constant(spec)]) if spec else None))
+
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg("e"), ast.arg("m"), ast.arg("sanitize")], kwonlyargs=[],
+                              kw_defaults=[], defaults=[])
+    function = ast.Expression(ast.Lambda(arguments, ast.JoinedStr(values)))
+    ast.fix_missing_locations(function)
+    code = compile(function, f"<template {text!r}>", "eval")
+    return eval(code, {"__builtins__": {}, **FUNCTIONS})
+
+def render(template: Union[str, Callable], instance: Any, context: Dict[str, Any], sanitize: Callable[[str], str]) -> str:
+    """Evaluates a compiled template (plain text passes through)."""
+    if template.__class__ is str:
+        return template
+    try:
+        return template(instance, context, sanitize)
+    except ExpressionError:
+        raise
+    except Exception as e:
+        raise ExpressionError(f"{type(e).__name__}: {e}")
+
+def check_template(text: str, sample: Optional[Dict[str, Any]] = None) -> str:
+    """Compiles `text` and renders it against a sample instance (raises ExpressionError); returns the rendering."""
+    context = {"index": 0, "number": 1, "suffix": ".Member", "item": "Member", "tag": "TAG_Member", "addr": "N7:0", "desc": "Description"}
+    sample = sample or {"name": "TAG", "description": "Description", "var_addr": "N7:0", "cluster": "Cluster1"}
+    return render(compile_template(text), sample, context, lambda v: str(v))
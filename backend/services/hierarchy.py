@@ -0,0 +1,135 @@
+
+from typing import Dict, Any, List, Optional, Sequence
+
+from sqlalchemy import Integer, func, or_
+from sqlalchemy.orm import Session
+
+from models import TagEntry
+from services.metrics import metrics
+from services.tag_store import STATE_COLUMNS, state_row
+
+# Columns a tree can be grouped by (the grid's Cluster / Equipment / Item / Tag Type)
+HIERARCHY_LEVELS = ("cluster", "equipment", "item", "type", "entry_type")
+# Served from ix_tag_entries_hierarchy without touching the table
+DEFAULT_LEVELS = ("cluster", "equipment", "item")
+
+MAX_GROUPS = 5000
+MAX_ROWS = 5000
+
+def parse_levels(levels: Optional[Sequence[str]]) -> List[str]:
+    levels = [l.strip() for l in levels or DEFAULT_LEVELS if l.strip()]
+    unknown = [l for l in levels if l not in HIERARCHY_LEVELS]
+    if unknown or not levels:
+        raise ValueError(f"Unknown hierarchy level(s): {', '.join(unknown) or '(none)'}; expected: {', '.join(HIERARCHY_LEVELS)}")
+    if len(set(levels)) != len(levels):
+        raise ValueError("A hierarchy level may only appear once")
+    return levels
+
+def _scope(project_path: str, levels: List[str], path: Sequence[str]):
+    """Filter for the node at `path` (one value per leading level; '' also matches NULL)."""
+    if len(path) > len(levels):
+        raise ValueError(f"Path is {len(path)} deep, the hierarchy has {len(levels)} levels")
+    clauses = [TagEntry.project_path == project_path]
+    for level, value in zip(levels, path):
+        column = getattr(TagEntry, level)
+        clauses.append(or_(column == "", column.is_(None)) if value == "" else column == value)
+    return clauses
+
+def _group_column(level: str):
+    """A level's value with NULL folded into '' (one group in GROUP BY, COUNT(DISTINCT) and paging)."""
+    return func.coalesce(getattr(TagEntry, level), "")
+
+def _counts(row) -> Dict[str, int]:
+    return {"tags": row.tags, "trends": int(row.trends or 0), "alarms": int(row.alarms or 0)}
+
+def children(db: Session, project_path: str, levels: Optional[Sequence[str]] = None, path: Sequence[str] = (),
+             depth: int = 1, limit: int = MAX_GROUPS, offset: int = 0) -> Dict[str, Any]:
+    """
+    Groups below the node at `path` with their tag / trend / alarm counts, `depth` levels deep
+    (1 = the next level only, which is what a lazy tree expands). One GROUP BY over the
+    covering index per call; the root is path=[].
+
+    Each group: {value, path, tags, trends, alarms, groups (the next level's count), children
+    (nested groups while depth allows)}. `limit` / `offset` page the first level's groups.
+    """
+    levels = parse_levels(levels)
+    path = list(path or [])
+    scope = _scope(project_path, levels, path)
+    start = len(path)
+    if start == len(levels):
+        raise ValueError("The path is a leaf; fetch its tags from /api/hierarchy/rows")
+    group_levels = levels[start:start + max(depth, 1)]
+    next_level = levels[start + len(group_levels)] if start + len(group_levels) < len(levels) else None
+
+    columns = [_group_column(l) for l in group_levels]
+    first = columns[0]
+    aggregates = [func.count().label("tags"), func.sum(TagEntry.is_trend, type_=Integer).label("trends"),
+                  func.sum(TagEntry.is_alarm, type_=Integer).label("alarms")]
+    if next_level:
+        aggregates.append(func.count(func.distinct(_group_column(next_level))).label("groups"))
+    limit, offset = max(1, min(limit, MAX_GROUPS)), max(offset, 0)
+
+    # The scope filter still uses the index; NULL and '' are grouped, counted and paged as one value
+    with metrics.timer("hierarchy"):
+        query = db.query(*columns, *aggregates).filter(*scope).group_by(*columns).order_by(*columns)
+        if len(columns) == 1:
+            rows = query.limit(limit).offset(offset).all()
+            page = [row[0] for row in rows]
+        else:
+            # Page on the first level, deeper levels come whole for the paged values
+            page = [v for (v,) in db.query(first).filter(*scope).group_by(first).order_by(first).limit(limit).offset(offset)]
+            rows = query.filter(first.in_(page)).all() if page else []
+        complete = offset == 0 and len(page) < limit
+        if complete:
+            # Every group is on the page: the totals are its sums, no second pass over the index
+            totals = {k: sum(_counts(row)[k] for row in rows) for k in ("tags", "trends", "alarms")}
+            total_groups = len(page)
+        else:
+            totals = _counts(db.query(*aggregates[:3]).filter(*scope).one())
+            total_groups = db.query(func.count(func.distinct(first))).filter(*scope).scalar()
+
+    # Rows arrive sorted, so nesting keeps one node per value prefix
+    root = {"children": []}
+    nodes = {}
+    for row in rows:
+        values = list(row[:len(group_levels)])
+        parent = root
+        for i, value in enumerate(values):
+            key = tuple(values[:i + 1])
+            node = nodes.get(key)
+            if node is None:
+                node = {"value": value, "path": path + list(key), "level": group_levels[i], "tags": 0, "trends": 0, "alarms": 0}
+                if i + 1 < len(values):
+                    node["children"] = []
+                elif next_level:
+                    node["groups"] = 0
+                nodes[key] = node
+                parent["children"].append(node)
+                if parent is not root:
+                    parent["groups"] = len(parent["children"])
+            for k, v in _counts(row).items():
+                node[k] += v
+            parent = node
+        if next_level:
+            parent["groups"] += row.groups
+
+    metrics.inc("taggen_hierarchy_queries_total")
+    return {
+        "levels": levels,
+        "path": path,
+        "level": group_levels[0],
+        "groups": root["children"],
+        "total_groups": total_groups,
+        "totals": totals,
+    }
+
+def rows(db: Session, project_path: str, levels: Optional[Sequence[str]] = None, path: Sequence[str] = (),
+         limit: int = MAX_ROWS, offset: int = 0):
+    """Saved tags under the node at `path` as STATE_KEYS tuples (grid order), and how many there are."""
+    levels = parse_levels(levels)
+    scope = _scope(project_path, levels, list(path or []))
+    with metrics.timer("hierarchy_rows"):
+        total = db.query(func.count(TagEntry.id)).filter(*scope).scalar()
+        page = [state_row(r) for r in db.query(*STATE_COLUMNS).filter(*scope).order_by(TagEntry.id)
+                .limit(max(1, min(limit, MAX_ROWS))).offset(max(offset, 0))]
+    return page, total
@@ -0,0 +1,566 @@
+
+import datetime
+import json
+import os
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import TagEntry, ProjectVersion
+from services.metrics import metrics
+from services.tag_store import STATE_KEYS, claim_revision, next_revision
+from services.tag_schema import API_FIELDS, DBF_FIELD_NAMES, DBF_KEY_FIELDS, StateMapper
+
+# Saved tag columns a version records (everything /api/state returns except the row id)
+HISTORY_COLUMNS = [f.column for f in API_FIELDS]
+_COLUMNS = [getattr(TagEntry, c) for c in HISTORY_COLUMNS]
+_state_mapper = StateMapper(HISTORY_COLUMNS)
+_TYPE, _ENTRY_TYPE = HISTORY_COLUMNS.index("type"), HISTORY_COLUMNS.index("entry_type")
+
+def state_values(values: tuple) -> tuple:
+    """HISTORY_COLUMNS tuple -> values in STATE_KEYS order (/api/state rows; no id / version, the row is not saved)."""
+    return _state_mapper.values(values) + ("", values[_TYPE] if values[_ENTRY_TYPE] == "udt_instance" else "", None)
+
+# A save stores the full tag state every this many tag versions, so any version can be
+# materialized from the nearest checkpoint instead of replaying the whole chain
+CHECKPOINT_EVERY = 25
+
+# key -> [old fields or None (did not exist), new fields or None (gone)]; added / removed
+# rows carry every column, modified rows only the changed ones. A removed row also carries
+# its row "id", so that undoing the removal puts it back at its place in the grid.
+Delta = Dict[str, List[Optional[Dict[str, Any]]]]
+
+class HistoryConflict(Exception):
+    """The current tags / DBFs are not what the history expects (changed outside of it)."""
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8"), 6)
+
+def _unpack(blob: Optional[bytes]):
+    return json.loads(zlib.decompress(blob)) if blob else None
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
+
+def row_key(name: Optional[str], ordinal: int) -> str:
+    """Tags are tracked by name (a moved or re-inserted row gets a new id); repeated names by their order."""
+    name = name or ""
+    return name if ordinal == 0 else f"{name} #{ordinal}"
+
+def _split_key(key: str) -> Tuple[str, int]:
+    name, sep, ordinal = key.rpartition(" #")
+    if sep and ordinal.isdigit():
+        return name, int(ordinal)
+    return key, 0
+
+# --- Deltas ---
+
+def row_delta(before: Dict[str, tuple], after: Dict[str, tuple], before_ids: Optional[Dict[str, int]] = None) -> Delta:
+    """Delta between two {key: HISTORY_COLUMNS tuple} states; `before_ids` are the row ids of `before`."""
+    delta = {}
+    for key, old in before.items():
+        new = after.get(key)
+        if new is None:
+            delta[key] = [dict(zip(HISTORY_COLUMNS, old)), None]
+            if before_ids and key in before_ids:
+                delta[key][0]["id"] = before_ids[key]
+        elif new != old:
+            changed = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+            delta[key] = [{HISTORY_COLUMNS[i]: old[i] for i in changed}, {HISTORY_COLUMNS[i]: new[i] for i in changed}]
+    for key, new in after.items():
+        if key not in before:
+            delta[key] = [None, dict(zip(HISTORY_COLUMNS, new))]
+    return delta
+
+def reverse(delta: Delta) -> Delta:
+    return {key: [new, old] for key, (old, new) in delta.items()}
+
+def compose(first: Delta, second: Delta) -> Delta:
+    """The net delta of applying `first`, then `second`. Keys that end where they started drop out."""
+    net = dict(first)
+    for key, (old2, new2) in second.items():
+        if key not in net:
+            net[key] = [old2, new2]
+            continue
+        old1, new1 = net[key]
+        # What the key held before `first`; fields only `second` touched were unchanged by `first`
+        old = None if old1 is None else {**(old2 or {}), **old1}
+        # An add in `second` brings the whole row, a modification overlays `first`'s result
+        new = None if new2 is None else ({**(new1 or {}), **new2} if old2 is not None else new2)
+        if old is None and new is None:
+            del net[key]
+        elif old is not None and new is not None:
+            changed = [f for f in new if old.get(f) != new[f]]
+            if changed:
+                net[key] = [{f: old.get(f) for f in changed}, {f: new[f] for f in changed}]
+            else:
+                del net[key]
+        else:
+            net[key] = [old, new]
+    return net
+
+def delta_counts(delta: Delta) -> Dict[str, int]:
+    counts = Counter("added" if old is None else "removed" if new is None else "modified" for old, new in delta.values())
+    return {"added": counts["added"], "modified": counts["modified"], "removed": counts["removed"]}
+
+def _plain(record) -> Dict[str, Any]:
+    # Records are CompactRecords or dicts
+    return dict(record)
+
+def write_delta(diff: Dict[str, Any]) -> Dict[str, Delta]:
+    """The DBF changes a write applied (an apply_diff diff per table) as a delta per table."""
+    tables = {}
+    for table_type, changes in diff.items():
+        if table_type not in DBF_FIELD_NAMES:
+            continue
+        key_field, fields = DBF_KEY_FIELDS[table_type], set(DBF_FIELD_NAMES[table_type])
+        delta = {}
+        for record in changes.get("new", []):
+            delta[str(record.get(key_field))] = [None, {k: v for k, v in _plain(record).items() if k in fields}]
+        for record in changes.get("orphaned", []):
+            delta[str(record.get(key_field))] = [{k: v for k, v in _plain(record).items() if k in fields}, None]
+        for item in changes.get("modified", []):
+            existing, proposed = _plain(item["existing"]), _plain(item["proposed"])
+            changed = [f for f in item.get("changed_fields") or proposed if f in fields]
+            delta[str(proposed.get(key_field))] = [{f: existing.get(f) for f in changed}, {f: proposed.get(f) for f in changed}]
+        for item in changes.get("renamed", []):
+            # Written in place under the old key; history keeps it as a remove + add
+            delta[str(item["old_key"])] = [{k: v for k, v in _plain(item["existing"]).items() if k in fields}, None]
+            delta[str(_plain(item["proposed"]).get(key_field))] = [None, {k: v for k, v in _plain(item["proposed"]).items() if k in fields}]
+        if delta:
+            tables[table_type] = delta
+    return tables
+
+def delta_to_diff(table_type: str, delta: Delta) -> Dict[str, List]:
+    """A delta in the shape DBFWriter.apply_diff takes."""
+    key_field = DBF_KEY_FIELDS[table_type]
+    diff = {"new": [], "modified": [], "orphaned": [], "renamed": []}
+    for key, (old, new) in delta.items():
+        if old is None:
+            diff["new"].append(new)
+        elif new is None:
+            diff["orphaned"].append({key_field: key, **old})
+        else:
+            diff["modified"].append({"existing": old, "proposed": {key_field: key, **new}, "changed_fields": list(new)})
+    return diff
+
+class HistoryStore:
+    """
+    Versioned history of each project's saved tags and DBF writes, in SQLite.
+
+    Every save / bulk edit / rename / restore stores the row-level delta of the saved tags
+    (by tag name), every DBF write the records it changed. Saves add a full checkpoint
+    every CHECKPOINT_EVERY tag versions.
+
+    Restoring version V composes the reversed deltas of the versions after it into one
+    net delta and applies only that: the work follows how much changed since V, not the
+    size of the project. Rows that no longer hold what the history expects (edited
+    outside of it) make the restore fail with HistoryConflict unless forced.
+    """
+    def __init__(self, session_factory=None, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.session_factory = session_factory
+        self.checkpoint_every = checkpoint_every
+
+    # --- Reading saved tags ---
+
+    @staticmethod
+    def current_rows(db: Session, project_path: str, ids: Optional[Dict[str, int]] = None) -> Dict[str, tuple]:
+        """Every saved tag of the project as {key: HISTORY_COLUMNS tuple}; fills `ids` with {key: row id} when given."""
+        seen = Counter()
+        rows = {}
+        for row in db.query(TagEntry.id, *_COLUMNS).filter(TagEntry.project_path == project_path).order_by(TagEntry.id).yield_per(5000):
+            name = row.name or ""
+            key = row_key(name, seen[name])
+            rows[key] = tuple(row)[1:]
+            if ids is not None:
+                ids[key] = row.id
+            seen[name] += 1
+        return rows
+
+    @staticmethod
+    def _locate(db: Session, project_path: str, keys: Iterable[str]) -> Dict[str, Tuple[int, tuple]]:
+        """key -> (row id, HISTORY_COLUMNS tuple) for the keys that exist."""
+        wanted = {}
+        for key in keys:
+            name, ordinal = _split_key(key)
+            wanted.setdefault(name, {})[ordinal] = key
+        found = {}
+        names = list(wanted)
+        for i in range(0, len(names), 500):
+            seen = Counter()
+            for row in db.query(TagEntry.id, *_COLUMNS).filter(TagEntry.project_path == project_path, TagEntry.name.in_(names[i:i + 500])) \
+                    .order_by(TagEntry.id):
+                name = row.name or ""
+                key = wanted[name].get(seen[name])
+                seen[name] += 1
+                if key is not None:
+                    found[key] = (row.id, tuple(row)[1:])
+        return found
+
+    def rows_by_id(self, db: Session, project_path: str, ids: List[int]) -> Dict[str, tuple]:
+        """Some saved tags (bulk edit / rename) keyed as in current_rows."""
+        names = set()
+        for i in range(0, len(ids), 500):
+            names.update(n or "" for (n,) in db.query(TagEntry.name).filter(TagEntry.id.in_(ids[i:i + 500])))
+        wanted = set(ids)
+        located = self._locate(db, project_path, self._keys_for_names(db, project_path, names))
+        return {key: values for key, (row_id, values) in located.items() if row_id in wanted}
+
+    @staticmethod
+    def _keys_for_names(db: Session, project_path: str, names: Iterable[str]) -> List[str]:
+        names = list(names)
+        counts = {}
+        for i in range(0, len(names), 500):
+            counts.update(db.query(TagEntry.name, func.count()).filter(TagEntry.project_path == project_path, TagEntry.name.in_(names[i:i + 500]))
+                          .group_by(TagEntry.name))
+        return [row_key(name, n) for name in names for n in range(counts.get(name, 1))]
+
+    # --- Recording ---
+
+    def _head(self, db: Session, project_path: str) -> Optional[ProjectVersion]:
+        return db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path).order_by(ProjectVersion.id.desc()).first()
+
+    def _add(self, db: Session, project_path: str, kind: str, message: str = "", tag_delta: Optional[Delta] = None,
+             dbf_delta: Optional[Dict[str, Delta]] = None, checkpoint: Optional[Dict[str, tuple]] = None,
+             stats: Optional[Dict[str, Any]] = None) -> ProjectVersion:
+        stats = dict(stats or {})
+        if tag_delta is not None:
+            stats["tags"] = delta_counts(tag_delta)
+        if dbf_delta is not None:
+            stats["dbf"] = {t: delta_counts(d) for t, d in dbf_delta.items()}
+        version = ProjectVersion(
+            project_path=project_path, kind=kind, created_at=_now(), message=message, stats_json=json.dumps(stats),
+            tag_delta=_pack(tag_delta) if tag_delta is not None else None,
+            dbf_delta=_pack(dbf_delta) if dbf_delta is not None else None,
+            checkpoint=_pack({"columns": HISTORY_COLUMNS, "rows": checkpoint}) if checkpoint is not None else None,
+        )
+        db.add(version)
+        db.flush()
+        metrics.inc("taggen_history_versions_total", kind=kind)
+        return version
+
+    def _baseline(self, db: Session, project_path: str, before: Dict[str, tuple]):
+        """First version of a project saved before history existed: its current state as a checkpoint."""
+        if before and self._head(db, project_path) is None:
+            self._add(db, project_path, "baseline", "State before history was recorded", {}, checkpoint=before)
+
+    def _needs_checkpoint(self, db: Session, project_path: str) -> bool:
+        last = db.query(func.max(ProjectVersion.id)).filter(ProjectVersion.project_path == project_path,
+                                                            ProjectVersion.checkpoint.isnot(None)).scalar()
+        if last is None:
+            return True
+        since = db.query(func.count(ProjectVersion.id)).filter(ProjectVersion.project_path == project_path, ProjectVersion.id > last,
+                                                               ProjectVersion.tag_delta.isnot(None)).scalar()
+        return since + 1 >= self.checkpoint_every
+
+    def record_save(self, db: Session, project_path: str, before: Dict[str, tuple], message: str = "",
+                    commit: bool = True, before_ids: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        Records a full save: `before` is current_rows() read before the save replaced the tags
+        (`before_ids` the row ids it filled in, kept for the rows the save removed).
+        Does not commit when nothing changed; otherwise commits the new version, unless commit=False
+        (the version then goes in with the caller's commit of the save itself).
+        """
+        start = time.perf_counter()
+        after = self.current_rows(db, project_path)
+        delta = row_delta(before, after, before_ids)
+        if not delta and self._head(db, project_path) is not None:
+            return {"version": None, "tags": delta_counts(delta)}
+        self._baseline(db, project_path, before)
+        checkpoint = after if self._needs_checkpoint(db, project_path) else None
+        version = self._add(db, project_path, "save", message, delta, checkpoint=checkpoint)
+        if commit:
+            db.commit()
+        metrics.record_stage("history_record", time.perf_counter() - start)
+        return {"version": version.id, "tags": delta_counts(delta)}
+
+    def record_rows(self, db: Session, project_path: str, kind: str, before: Dict[str, tuple], after: Dict[str, tuple],
+                    message: str = "") -> Optional[int]:
+        """
+        Records an edit of some rows (keys as in current_rows) inside the caller's transaction.
+        A project without history gets its baseline from the unedited rows first.
+        """
+        delta = row_delta(before, after)
+        if not delta:
+            return None
+        if self._head(db, project_path) is None:
+            # The pre-edit state of the whole project: current rows with the edited ones put back
+            state = self.current_rows(db, project_path)
+            for key, (old, new) in delta.items():
+                if old is None:
+                    state.pop(key, None)
+                else:
+                    state[key] = before[key]
+            self._baseline(db, project_path, state)
+        return self._add(db, project_path, kind, message, delta).id
+
+    def record_write(self, project_path: str, diff: Dict[str, Any], dbf_paths: Dict[str, str], kind: str = "write",
+                     message: str = "") -> Optional[int]:
+        """Records a DBF write (the diff as applied) on a session of its own; safe in job threads."""
+        db = self.session_factory()
+        try:
+            delta = write_delta(diff) if diff is not None else None
+            stats = {"mtimes": self._mtimes(dbf_paths)}
+            version = self._add(db, project_path, kind, message, dbf_delta=delta, stats=stats)
+            db.commit()
+            return version.id
+        except Exception as e:
+            print(f"Error recording history for {project_path}: {e}")
+            db.rollback()
+            return None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mtimes(dbf_paths: Dict[str, str]) -> Dict[str, Optional[int]]:
+        return {t: os.stat(p).st_mtime_ns if os.path.exists(p) else None for t, p in dbf_paths.items()}
+
+    # --- Queries ---
+
+    @staticmethod
+    def _summary(version: ProjectVersion) -> Dict[str, Any]:
+        return {
+            "version": version.id,
+            "kind": version.kind,
+            "created_at": version.created_at,
+            "message": version.message,
+            "stats": json.loads(version.stats_json or "{}"),
+            "checkpoint": version.checkpoint is not None,
+        }
+
+    def versions(self, db: Session, project_path: str, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """Newest first. Deltas are not loaded."""
+        q = db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path)
+        total = q.count()
+        rows = q.order_by(ProjectVersion.id.desc()).limit(limit).offset(offset) \
+            .with_entities(ProjectVersion.id, ProjectVersion.kind, ProjectVersion.created_at, ProjectVersion.message,
+                           ProjectVersion.stats_json, ProjectVersion.checkpoint.isnot(None).label("has_checkpoint"))
+        return {
+            "project_path": project_path,
+            "total": total,
+            "versions": [{"version": r.id, "kind": r.kind, "created_at": r.created_at, "message": r.message,
+                          "stats": json.loads(r.stats_json or "{}"), "checkpoint": bool(r.has_checkpoint)} for r in rows],
+        }
+
+    def _chain(self, db: Session, project_path: str, after: int, upto: Optional[int] = None) -> List[ProjectVersion]:
+        """Versions in (after, upto], oldest first."""
+        q = db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path, ProjectVersion.id > after)
+        if upto is not None:
+            q = q.filter(ProjectVersion.id <= upto)
+        return q.order_by(ProjectVersion.id).all()
+
+    def _get(self, db: Session, project_path: str, version: int) -> ProjectVersion:
+        row = db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path, ProjectVersion.id == version).first()
+        if row is None:
+            raise KeyError(version)
+        return row
+
+    def net_delta(self, db: Session, project_path: str, from_version: int, to_version: int) -> Tuple[Delta, Dict[str, Delta]]:
+        """Net tag / DBF change going from one version to another (either direction)."""
+        low, high = sorted((from_version, to_version))
+        for v in (low, high):
+            if v != 0:
+                self._get(db, project_path, v)
+        tags, dbf_tables = {}, {}
+        for version in self._chain(db, project_path, low, high):
+            tags = compose(tags, _unpack(version.tag_delta) or {})
+            for table_type, delta in (_unpack(version.dbf_delta) or {}).items():
+                dbf_tables[table_type] = compose(dbf_tables.get(table_type, {}), delta)
+        if from_version > to_version:
+            tags, dbf_tables = reverse(tags), {t: reverse(d) for t, d in dbf_tables.items()}
+        return tags, dbf_tables
+
+    @staticmethod
+    def _changes(delta: Delta, limit: int, offset: int) -> List[Dict[str, Any]]:
+        changes = []
+        for key in sorted(delta)[offset:offset + limit]:
+            old, new = delta[key]
+            change = "added" if old is None else "removed" if new is None else "modified"
+            fields = new if old is None else old if new is None else {f: [old.get(f), new[f]] for f in new}
+            changes.append({"key": key, "change": change, "fields": fields})
+        return changes
+
+    def diff(self, db: Session, project_path: str, from_version: int, to_version: int, limit: int = 200, offset: int = 0) -> Dict[str, Any]:
+        tags, dbf_tables = self.net_delta(db, project_path, from_version, to_version)
+        return {
+            "from": from_version,
+            "to": to_version,
+            "tags": {"counts": delta_counts(tags), "changes": self._changes(tags, limit, offset)},
+            "dbf": {t: {"counts": delta_counts(d), "changes": self._changes(d, limit, offset)} for t, d in dbf_tables.items()},
+        }
+
+    def tags_at(self, db: Session, project_path: str, version: int) -> List[tuple]:
+        """The saved tags as of `version` (HISTORY_COLUMNS tuples in grid order), from the nearest checkpoint."""
+        self._get(db, project_path, version)
+        base = db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path, ProjectVersion.id <= version,
+                                               ProjectVersion.checkpoint.isnot(None)).order_by(ProjectVersion.id.desc()).first()
+        if base is None:
+            raise ValueError(f"No checkpoint at or before version {version}")
+        snapshot = _unpack(base.checkpoint)
+        columns = snapshot["columns"]
+        state = {key: dict(zip(columns, values)) for key, values in snapshot["rows"].items()}
+        empty = {f.column: f.empty for f in API_FIELDS}
+        for v in self._chain(db, project_path, base.id, version):
+            for key, (old, new) in (_unpack(v.tag_delta) or {}).items():
+                if new is None:
+                    state.pop(key, None)
+                elif old is None:
+                    state[key] = dict(new)
+                else:
+                    state.setdefault(key, {}).update(new)
+        return [tuple(row.get(c, empty[c]) for c in HISTORY_COLUMNS) for row in state.values()]
+
+    # --- Restore ---
+
+    def restore(self, db: Session, project_path: str, version: int, tags: bool = True, dbf: bool = False,
+                force: bool = False, dry_run: bool = False, writer=None, dbf_paths: Optional[Dict[str, str]] = None,
+                reference_graph=None) -> Dict[str, Any]:
+        """
+        Brings the saved tags (and with `dbf` the DBF files) back to `version`. Only the rows
+        in the net delta since then are touched; removed rows come back under their old id
+        (their grid position) while it is free. The restore is itself recorded as a version,
+        so it can be undone. A dry run only reads: counts and conflicts come from the net delta.
+        """
+        start = time.perf_counter()
+        self._get(db, project_path, version)
+        later = self._chain(db, project_path, version)
+        if not later:
+            return {"version": version, "restored_to": version, "new_version": None, "tags": delta_counts({}), "dbf": {}, "dry_run": dry_run}
+
+        tag_net, dbf_net = {}, {}
+        # Newest first, each version undone on top of the ones after it
+        for v in reversed(later):
+            if tags and v.tag_delta is not None:
+                tag_net = compose(tag_net, reverse(_unpack(v.tag_delta)))
+            if dbf:
+                if v.kind == "rebuild":
+                    raise ValueError(f"Version {v.id} rebuilt the DBFs without a diff, they cannot be restored past it")
+                for table_type, delta in (_unpack(v.dbf_delta) or {}).items():
+                    dbf_net[table_type] = compose(dbf_net.get(table_type, {}), reverse(delta))
+
+        result = {"version": version, "tags": delta_counts(tag_net), "dbf": {t: delta_counts(d) for t, d in dbf_net.items()}, "dry_run": dry_run}
+        if not tag_net and not dbf_net:
+            # Later versions cancel out (or only touched what was not asked for): nothing to restore
+            result.update(restored_to=version, new_version=None, conflicts=[])
+            return result
+        if dbf and dbf_net:
+            self._check_dbf_fresh(db, project_path, dbf_paths, force)
+        if dry_run:
+            result["conflicts"] = self._plan_tags(db, project_path, tag_net, force)[0][:50] if tag_net else []
+            return result
+
+        revision = next_revision(db, project_path)
+        try:
+            conflicts = self._apply_tags(db, project_path, tag_net, force, not force, reference_graph, revision) if tag_net else []
+            result["conflicts"] = conflicts[:50]
+            if dbf and dbf_net:
+                for table_type, delta in dbf_net.items():
+                    writer.apply_diff(delta_to_diff(table_type, delta), dbf_paths[table_type], table_type)
+            stats = {"restored_to": version}
+            if dbf and dbf_net:
+                stats["mtimes"] = self._mtimes(dbf_paths)
+            new_version = self._add(db, project_path, "restore", f"Restored version {version}", tag_net if tag_net else None,
+                                    dbf_net if dbf_net else None, stats=stats)
+            if tag_net:
+                result["revision"] = revision
+                claim_revision(db, project_path, revision).updated_at = _now()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        result["new_version"] = new_version.id
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        metrics.record_stage("history_restore", time.perf_counter() - start)
+        return result
+
+    def _check_dbf_fresh(self, db: Session, project_path: str, dbf_paths: Dict[str, str], force: bool):
+        """The DBFs must still be as the last recorded write left them, or the reversed deltas do not apply."""
+        last = db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path, ProjectVersion.kind.in_(("write", "rebuild", "restore")),
+                                               ProjectVersion.stats_json.like('%"mtimes"%')).order_by(ProjectVersion.id.desc()).first()
+        if last is None or force:
+            return
+        recorded = json.loads(last.stats_json).get("mtimes", {})
+        current = self._mtimes(dbf_paths)
+        changed = [t for t, m in recorded.items() if t in current and current[t] != m]
+        if changed:
+            raise HistoryConflict(f"DBF files changed outside the history since version {last.id}: {', '.join(changed)}. "
+                                  "Restore with force to apply anyway.")
+
+    def _plan_tags(self, db: Session, project_path: str, delta: Delta, force: bool) -> Tuple[List[str], List[Dict], List[Dict], Dict[str, int]]:
+        """
+        Reads what applying a net delta would do, without writing: (conflicting keys, rows to
+        insert, row updates, {key: id} of rows to delete). Conflicts are rows that do not hold
+        what the delta expects; they are overwritten with `force` and skipped otherwise.
+        """
+        located = self._locate(db, project_path, delta)
+        conflicts = []
+        inserts, updates, deletes = [], [], {}
+        index = {c: i for i, c in enumerate(HISTORY_COLUMNS)}
+        for key, (expected, target) in delta.items():
+            current = located.get(key)
+            if expected is None:
+                if current is not None:
+                    conflicts.append(key)
+                    if not force:
+                        continue
+                    deletes[key] = current[0]
+                inserts.append(target)
+                continue
+            if current is None:
+                conflicts.append(key)
+                if target is not None and force:
+                    inserts.append({**expected, **target})
+                continue
+            row_id, values = current
+            if any(values[index[f]] != v for f, v in expected.items() if f in index):
+                conflicts.append(key)
+                if not force:
+                    continue
+            if target is None:
+                deletes[key] = row_id
+            else:
+                updates.append({"id": row_id, **{f: v for f, v in target.items() if f in index}})
+        return conflicts, inserts, updates, deletes
+
+    def _apply_tags(self, db: Session, project_path: str, delta: Delta, force: bool, strict: bool, reference_graph=None,
+                    revision: int = 0) -> List[str]:
+        """
+        Applies a net delta to tag_entries (rows located by key) and returns the conflicting keys
+        (see _plan_tags); they raise HistoryConflict when `strict`. Written rows get `revision` as
+        their version. Re-inserted rows keep the id the delta recorded for them unless it was taken
+        since; the ids of deleted rows are recorded in the delta in turn.
+        """
+        conflicts, inserts, updates, delete_ids = self._plan_tags(db, project_path, delta, force)
+        if conflicts and strict:
+            raise HistoryConflict(f"{len(conflicts)} tag(s) changed outside the history (e.g. {', '.join(conflicts[:5])}). "
+                                  "Restore with force to overwrite them.")
+        for key, row_id in delete_ids.items():
+            if delta[key][1] is None:
+                delta[key][0] = {**delta[key][0], "id": row_id}
+        deletes = list(delete_ids.values())
+        wanted = [row["id"] for row in inserts if row.get("id") is not None]
+        taken = set()
+        for i in range(0, len(wanted), 500):
+            taken.update(row_id for (row_id,) in db.query(TagEntry.id).filter(TagEntry.id.in_(wanted[i:i + 500])))
+        taken.difference_update(deletes)
+        inserts = [{**{f: v for f, v in row.items() if f in HISTORY_COLUMNS or (f == "id" and v not in taken)},
+                    "project_path": project_path, "version": revision} for row in inserts]
+        updates = [{**row, "version": revision} for row in updates]
+        for i in range(0, len(deletes), 500):
+            db.query(TagEntry).filter(TagEntry.id.in_(deletes[i:i + 500])).delete(synchronize_session=False)
+        if updates:
+            db.bulk_update_mappings(TagEntry, updates)
+        if inserts:
+            db.bulk_insert_mappings(TagEntry, inserts)
+        db.flush()
+
+        if reference_graph is not None:
+            names = sorted({_split_key(k)[0] for k in delta})
+            rows = [dict(zip(STATE_KEYS, state_values(tuple(r)))) for i in range(0, len(names), 500)
+                    for r in db.query(*_COLUMNS).filter(TagEntry.project_path == project_path, TagEntry.name.in_(names[i:i + 500]))]
+            reference_graph.reindex(db, project_path, names, rows)
+        return conflicts
@@ -0,0 +1,182 @@
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional
+from services.metrics import metrics
+
+class JobCancelled(Exception):
+    """Raised inside a running job once a cancel has been requested."""
+    pass
+
+class Job:
+    """
+    Tracks one unit of background work (import / generate / write).
+
+    The pipeline code reports progress through `stage()`; the same object is also
+    used for synchronous requests, where nobody watches it and it is simply dropped.
+    """
+    def __init__(self, kind: str, project_path: str = "", stages: Optional[List[str]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.project_path = project_path
+        self.status = "queued" # queued, running, succeeded, failed, cancelled
+        self.planned_stages = list(stages or [])
+        self.stages = [] # [{name, status, started_at, duration}]
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0 # Bumped on every change so streams know when to push
+
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._future = None
+
+    # --- Progress reporting (called from the worker) ---
+
+    @contextmanager
+    def stage(self, name: str, cancellable: bool = True):
+        if cancellable:
+            self.check_cancelled()
+        entry = {"name": name, "status": "running", "started_at": time.time(), "duration": None}
+        with self._lock:
+            self.stages.append(entry)
+            self.version += 1
+        start = time.perf_counter()
+        try:
+            yield entry
+            entry["status"] = "done"
+        except BaseException:
+            entry["status"] = "failed"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry["duration"] = round(elapsed, 4)
+                self.version += 1
+            metrics.record_stage(name, elapsed, metric="taggen_pipeline_stage_seconds", kind=self.kind)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    # --- Lifecycle ---
+
+    def cancel(self) -> bool:
+        """Requests cancellation. Running jobs stop at the next stage boundary."""
+        if self.is_finished:
+            return False
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            # Never started - finish it here since the worker will not run
+            self._finish("cancelled")
+        return True
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def _finish(self, status: str, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self.version += 1
+        metrics.inc("taggen_jobs_total", kind=self.kind, status=status)
+
+    def progress(self) -> float:
+        if self.status == "succeeded":
+            return 1.0
+        if not self.planned_stages:
+            return 0.0
+        done = sum(1 for s in self.stages if s["status"] == "done")
+        return min(done / len(self.planned_stages), 1.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-safe view of the job (without the result payload)."""
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "project_path": self.project_path,
+                "status": self.status,
+                "progress": round(self.progress(), 3),
+                "planned_stages": list(self.planned_stages),
+                "stages": [dict(s) for s in self.stages],
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "version": self.version
+            }
+
+class JobManager:
+    """
+    Runs jobs on a bounded worker pool and keeps finished jobs around for
+    `result_ttl` seconds so clients can collect the result after the stream ends.
+    """
+    def __init__(self, max_workers: int = 2, result_ttl: float = 900.0):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="taggen-job")
+        self.result_ttl = result_ttl
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, project_path: str, fn: Callable[[Job], Any], stages: Optional[List[str]] = None) -> Job:
+        """Queues `fn(job)` and returns the job immediately."""
+        self._purge()
+        job = Job(kind, project_path, stages)
+        with self._lock:
+            self.jobs[job.id] = job
+        job._future = self.executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]):
+        if job._cancel.is_set():
+            job._finish("cancelled")
+            return
+        with job._lock:
+            job.status = "running"
+            job.started_at = time.time()
+            job.version += 1
+        try:
+            result = fn(job)
+            job._finish("succeeded", result=result)
+        except JobCancelled:
+            job._finish("cancelled")
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job._finish("failed", error=str(e))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge()
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job.cancel() if job else False
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        self._purge()
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [j.snapshot() for j in sorted(jobs, key=lambda j: j.created_at)]
+
+    def _purge(self):
+        """Drops finished jobs whose results have outlived the TTL."""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [jid for jid, j in self.jobs.items()
+                       if j.is_finished and j.finished_at and j.finished_at < cutoff]
+            for jid in expired:
+                del self.jobs[jid]
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+        self.executor.shutdown(wait=False)
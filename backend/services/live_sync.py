@@ -0,0 +1,137 @@
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from sqlalchemy.orm import Session
+
+from models import TagEntry
+from services.metrics import metrics
+from services.tag_store import COLUMN_KEYS, STATE_COLUMNS, STATE_KEYS, state_row
+
+# Messages a slow client may fall behind by before it is told to reload instead
+LIVE_QUEUE_SIZE = 256
+# Recent deltas per project, replayed to a client that reconnects with ?since=<revision>
+LIVE_REPLAY = 64
+# A write touching more rows than this is announced as a reset (reload) rather than as a delta
+DELTA_MAX_ROWS = int(os.environ.get("TAGGEN_DELTA_MAX_ROWS", "5000"))
+
+def reset_message(revision: int, previous: Optional[int] = None, source: str = "") -> Dict[str, Any]:
+    return {"type": "reset", "revision": revision, "previous": previous, "source": source}
+
+def delta_message(db: Session, project_path: str, source: str, revision: int, previous: int,
+                  changed: Union[None, Iterable[str], Dict[int, Iterable[str]]] = None,
+                  added: Iterable[Any] = (), deleted: Iterable[int] = ()) -> Optional[Dict[str, Any]]:
+    """
+    The rows a committed write stamped with `revision`, as a row-level delta:
+    {"type": "delta", revision, previous, source, updated: [{id, version, fields}], added: [{id, client_id, version, fields}],
+    deleted: [ids]}. Updated rows carry only the keys of their `changed` columns (a list for every row, or
+    {id: columns}; None sends all of them), added rows every key. None when the write changed nothing.
+    """
+    if revision == previous:
+        return None
+    deleted = [str(i) for i in deleted]
+    client_ids = {row_id: client_id for client_id, row_id in added}
+    rows = db.query(*STATE_COLUMNS).filter(TagEntry.project_path == project_path, TagEntry.version == revision) \
+        .order_by(TagEntry.id).limit(DELTA_MAX_ROWS + 1).all()
+    if len(rows) + len(deleted) > DELTA_MAX_ROWS:
+        return reset_message(revision, previous, source)
+
+    if changed is not None and not isinstance(changed, dict):
+        changed = frozenset(changed)
+    message = {"type": "delta", "revision": revision, "previous": previous, "source": source,
+               "updated": [], "added": [], "deleted": deleted}
+    for row in rows:
+        fields = dict(zip(STATE_KEYS, state_row(row)))
+        row_id = fields.pop("id")
+        version = fields.pop("version")
+        if row.id in client_ids:
+            message["added"].append({"id": row_id, "client_id": client_ids[row.id], "version": version, "fields": fields})
+            continue
+        columns = changed.get(row.id) if isinstance(changed, dict) else changed
+        if columns is not None:
+            fields = {k: fields[k] for c in columns for k in COLUMN_KEYS.get(c, ())}
+        message["updated"].append({"id": row_id, "version": version, "fields": fields})
+    return message
+
+class ProjectChannels:
+    """
+    Per-project broadcast of saved-tag changes to WebSocket subscribers.
+
+    Writers call `publish` from whichever thread committed (executor, request threadpool);
+    each subscriber is an asyncio queue on the event loop that serves its socket, filled
+    through call_soon_threadsafe. A subscriber whose queue overflows has its backlog replaced
+    by one reset message, so a stalled client costs bounded memory and reloads when it catches up.
+    """
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE, replay: int = LIVE_REPLAY):
+        self.queue_size = queue_size
+        self.replay_size = replay
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Dict[asyncio.Queue, asyncio.AbstractEventLoop]] = {}
+        self._recent: Dict[str, deque] = {}
+
+    def subscribe(self, project_path: str) -> asyncio.Queue:
+        """A queue receiving the project's messages (call on the event loop that will read it)."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(project_path, {})[queue] = asyncio.get_running_loop()
+        metrics.add("taggen_live_subscribers", 1)
+        return queue
+
+    def unsubscribe(self, project_path: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(project_path, {})
+            if subscribers.pop(queue, None) is None:
+                return
+            if not subscribers:
+                del self._subscribers[project_path]
+        metrics.add("taggen_live_subscribers", -1)
+
+    def publish(self, project_path: str, message: Optional[Dict[str, Any]]):
+        """Sends a delta / reset to every subscriber of the project (thread-safe; None is ignored)."""
+        if message is None:
+            return
+        with self._lock:
+            recent = self._recent.setdefault(project_path, deque(maxlen=self.replay_size))
+            recent.append(message)
+            subscribers = list(self._subscribers.get(project_path, {}).items())
+        metrics.inc("taggen_live_messages_total", type=message["type"], source=message.get("source") or "")
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                # Loop already closed: the socket is gone and unsubscribes on its way out
+                pass
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, message: Dict[str, Any]):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            metrics.inc("taggen_live_overflows_total")
+            queue.put_nowait(reset_message(message["revision"], source="overflow"))
+
+    def replay(self, project_path: str, since: int, revision: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        The messages that take a client from `since` to `revision`, or None when the kept ones
+        do not cover that range without a gap (too old, or written without a broadcast, e.g. the CLI).
+        """
+        if since == revision:
+            return []
+        with self._lock:
+            recent = [m for m in self._recent.get(project_path, ()) if since < m["revision"] <= revision]
+        expected = since
+        for message in recent:
+            if message["previous"] != expected:
+                return None
+            expected = message["revision"]
+        return recent if expected == revision else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"projects": {p: len(s) for p, s in self._subscribers.items()},
+                    "subscribers": sum(len(s) for s in self._subscribers.values())}
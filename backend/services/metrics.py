@@ -0,0 +1,316 @@
+
+import contextvars
+import functools
+import inspect
+import io
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# Seconds; roughly 5ms .. 2min, enough to separate "instant" from "go get a coffee"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+class RequestScope:
+    """Stage timings and counter increments collected while serving one request."""
+    def __init__(self, method: str = "", path: str = ""):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = [] # [{name, seconds}] in completion order
+        self.counters: Dict[str, float] = {}
+
+    def breakdown(self) -> str:
+        parts = [f"{s['name']}={s['seconds'] * 1000:.0f}ms" for s in self.stages]
+        parts += [f"{k}={v:g}" for k, v in sorted(self.counters.items())]
+        return ", ".join(parts)
+
+_current_scope: contextvars.ContextVar[Optional[RequestScope]] = contextvars.ContextVar("taggen_request_scope", default=None)
+
+class MetricsRegistry:
+    """
+    Minimal in-process counters and histograms, exported in the Prometheus text
+    format by /api/metrics. Everything is keyed by (metric name, label set).
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {} # name -> (type, help)
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {} # [bucket counts..., count, sum]
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self._help[name] = (metric_type, help_text)
+
+    # --- Recording ---
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not value:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+        scope = _current_scope.get()
+        if scope is not None:
+            short = name[len("taggen_"):] if name.startswith("taggen_") else name
+            short = short[:-len("_total")] if short.endswith("_total") else short
+            scope.counters[short] = scope.counters.get(short, 0) + value
+
+    def add(self, name: str, value: float, **labels):
+        """Moves a gauge up or down (in-flight counts, queue depths)."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += 1
+            values[-1] += seconds
+
+    def record_stage(self, name: str, seconds: float, metric: str = "taggen_stage_seconds", **labels):
+        """Observes a stage duration and adds it to the current request's breakdown."""
+        self.observe(metric, seconds, stage=name, **labels)
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.stages.append({"name": name, "seconds": seconds})
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Times a block as a service-level stage (taggen_stage_seconds{stage=name})."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - start, **labels)
+
+    # --- Request scope ---
+
+    @contextmanager
+    def request_scope(self, method: str = "", path: str = ""):
+        scope = RequestScope(method, path)
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _current_scope.reset(token)
+
+    @staticmethod
+    def current_scope() -> Optional[RequestScope]:
+        return _current_scope.get()
+
+    # --- Export ---
+
+    def render(self) -> str:
+        out = io.StringIO()
+        with self._lock:
+            for name in sorted(self._counters):
+                self._write_header(out, name, "counter")
+                for key, value in sorted(self._counters[name].items()):
+                    out.write(f"{name}{_format_labels(key)} {value:g}\n")
+            for name in sorted(self._gauges):
+                self._write_header(out, name, "gauge")
+                for key, value in sorted(self._gauges[name].items()):
+                    out.write(f"{name}{_format_labels(key)} {value:g}\n")
+            for name in sorted(self._histograms):
+                self._write_header(out, name, "histogram")
+                for key, values in sorted(self._histograms[name].items()):
+                    for bound, count in zip(self.buckets, values):
+                        out.write(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count}\n")
+                    out.write(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {values[-2]}\n")
+                    out.write(f"{name}_count{_format_labels(key)} {values[-2]}\n")
+                    out.write(f"{name}_sum{_format_labels(key)} {values[-1]:.6f}\n")
+        return out.getvalue()
+
+    def _write_header(self, out: io.StringIO, name: str, default_type: str):
+        metric_type, help_text = self._help.get(name, (default_type, ""))
+        if help_text:
+            out.write(f"# HELP {name} {help_text}\n")
+        out.write(f"# TYPE {name} {metric_type}\n")
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            # Gauges describe live state (held locks ...), their holders keep adjusting them
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling. The API wraps each endpoint with `wrap()`; when
+    the request asked for a profile (X-Profile header), the endpoint call runs under
+    cProfile - or pyinstrument if installed and requested - in the thread that
+    actually executes it. Reports are kept in memory for later retrieval.
+    """
+    def __init__(self, max_reports: int = 20, top: int = 40):
+        self.max_reports = max_reports
+        self.top = top
+        self._reports = OrderedDict() # id -> {created_at, mode, path, text}
+        self._lock = threading.Lock()
+        self._mode: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("taggen_profile_mode", default=None)
+        self._report_id: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("taggen_profile_report", default=None)
+
+    @staticmethod
+    def available_modes() -> List[str]:
+        modes = ["cprofile"]
+        try:
+            import pyinstrument # noqa: F401
+            modes.append("pyinstrument")
+        except ImportError:
+            pass
+        return modes
+
+    @contextmanager
+    def requested(self, header_value: Optional[str]):
+        """Activates profiling for the current request; yields a list that receives the report id."""
+        mode = (header_value or "").strip().lower()
+        if mode in ("1", "true", "yes", "on"):
+            mode = "cprofile"
+        if mode not in self.available_modes():
+            yield None
+            return
+        holder: List[str] = []
+        mode_token = self._mode.set(mode)
+        id_token = self._report_id.set(holder)
+        try:
+            yield holder
+        finally:
+            self._mode.reset(mode_token)
+            self._report_id.reset(id_token)
+
+    def wrap(self, endpoint):
+        """Wraps a route endpoint so it can be profiled in whichever thread/loop runs it."""
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def async_wrapper(*args, **kwargs):
+                if self._mode.get() is None:
+                    return await endpoint(*args, **kwargs)
+                # Work handed to an I/O executor is profiled in its worker thread (`call`); the
+                # event-loop profile is only kept when the endpoint did its work on the loop
+                with self._profile(endpoint.__name__, keep_if_reported=False):
+                    return await endpoint(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            if self._mode.get() is None:
+                return endpoint(*args, **kwargs)
+            with self._profile(endpoint.__name__):
+                return endpoint(*args, **kwargs)
+        return wrapper
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) in the current thread, profiled when the request it runs for asked for it (executor threads)."""
+        if self._mode.get() is None:
+            return fn(*args, **kwargs)
+        label = getattr(fn, "__name__", "call")
+        if args and callable(args[0]):
+            # Wrappers such as with_session(fn, ...): name the function doing the work
+            label += f"({getattr(args[0], '__name__', '')})"
+        with self._profile(label):
+            return fn(*args, **kwargs)
+
+    @contextmanager
+    def _profile(self, label: str, keep_if_reported: bool = True):
+        mode = self._mode.get()
+        holder = self._report_id.get()
+        reported = len(holder) if holder is not None else 0
+        if mode == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                if keep_if_reported or not self._reported_since(reported):
+                    self._store(mode, label, profiler.output_text(unicode=True, color=False))
+            return
+
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if keep_if_reported or not self._reported_since(reported):
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(self.top)
+                self._store(mode, label, text.getvalue())
+
+    def _reported_since(self, count: int) -> bool:
+        holder = self._report_id.get()
+        return holder is not None and len(holder) > count
+
+    def _store(self, mode: str, label: str, text: str):
+        report_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._reports[report_id] = {"id": report_id, "created_at": time.time(), "mode": mode, "endpoint": label, "text": text}
+            while len(self._reports) > self.max_reports:
+                self._reports.popitem(last=False)
+        holder = self._report_id.get()
+        if holder is not None:
+            holder.append(report_id)
+
+    def get(self, report_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._reports.get(report_id)
+
+    def list_reports(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{k: v for k, v in r.items() if k != "text"} for r in self._reports.values()]
+
+metrics = MetricsRegistry()
+profiler = RequestProfiler()
+
+metrics.describe("taggen_pipeline_stage_seconds", "histogram", "Duration of import/generate/write pipeline stages.")
+metrics.describe("taggen_stage_seconds", "histogram", "Duration of service-level stages (DBF read/compare/write, JSON serialization).")
+metrics.describe("taggen_request_seconds", "histogram", "HTTP request duration by route.")
+metrics.describe("taggen_slow_requests_total", "counter", "Requests slower than the slow-request threshold.")
+metrics.describe("taggen_records_read_total", "counter", "DBF records read.")
+metrics.describe("taggen_records_expanded_total", "counter", "DBF records produced by tag/UDT expansion.")
+metrics.describe("taggen_expand_chunks_total", "counter", "Entry chunks expanded on the parallel expansion pool.")
+metrics.describe("taggen_expand_worker_primes_total", "counter", "Chunks sent again with the templates to an expansion worker that did not hold them yet.")
+metrics.describe("taggen_expand_pool_fallbacks_total", "counter", "Parallel expansions that fell back to serial (pool broken or not startable).")
+metrics.describe("taggen_fields_compared_total", "counter", "Field comparisons made while reconciling.")
+metrics.describe("taggen_records_written_total", "counter", "DBF records appended, updated or deleted.")
+metrics.describe("taggen_bytes_written_total", "counter", "Approximate DBF bytes written (record length x records touched).")
+metrics.describe("taggen_jobs_total", "counter", "Background jobs by final status.")
+metrics.describe("taggen_lock_waiting", "gauge", "Requests / jobs queued for a project lock.")
+metrics.describe("taggen_lock_held", "gauge", "Project locks currently held.")
+metrics.describe("taggen_lock_wait_seconds", "histogram", "Time spent waiting for a project lock.")
+metrics.describe("taggen_lock_timeouts_total", "counter", "Project lock waits that timed out.")
+metrics.describe("taggen_executor_queued", "gauge", "Calls waiting for an I/O executor thread.")
+metrics.describe("taggen_executor_running", "gauge", "Calls running on an I/O executor.")
+metrics.describe("taggen_executor_wait_seconds", "histogram", "Time a call queued before an I/O executor thread picked it up.")
+metrics.describe("taggen_warmup_seconds", "histogram", "Duration of each startup warm-up step.")
+metrics.describe("taggen_dbf_cache_hits_total", "counter", "DBF reads served from the parsed row cache.")
+metrics.describe("taggen_dbf_cache_misses_total", "counter", "DBF reads that parsed the file.")
+metrics.describe("taggen_live_subscribers", "gauge", "Open live-sync WebSocket subscriptions.")
+metrics.describe("taggen_live_messages_total", "counter", "Live-sync deltas / resets published, by source.")
+metrics.describe("taggen_live_overflows_total", "counter", "Live-sync subscribers that fell behind and were sent a reset.")
@@ -0,0 +1,188 @@
+
+from typing import List, Dict, Any, Callable, Iterable, Optional
+from services.job_manager import Job
+from services.diff_store import DiffStore
+from services.external_sort import ExternalSorter, DEFAULT_RUN_SIZE
+from services.validator import TagValidator, PreflightError, project_clusters
+from services.metrics import metrics
+
+# (table type, dbf file, key field, enable_guid)
+DBF_TABLES = [
+    ("variable", "variable.dbf", "NAME", True),
+    ("trend", "trend.dbf", "NAME", False),
+    ("digalm", "digalm.dbf", "TAG", False),
+]
+
+# Expanded records a streaming rebuild hands to the validator at a time (per table)
+VALIDATE_BATCH = 5000
+
+IMPORT_STAGES = ["read_dbf"]
+GENERATE_STAGES = ["load_templates", "expand", "validate"] + [f"reconcile_{t}" for t, _, _, _ in DBF_TABLES]
+WRITE_STAGES = [f"write_{t}" for t, _, _, _ in DBF_TABLES]
+REBUILD_STAGES = ["load_templates", "expand_sort", "validate"] + [f"rebuild_{t}" for t, _, _, _ in DBF_TABLES]
+
+class TagPipeline:
+    """
+    The import / generate / write steps, shared by the synchronous endpoints
+    and the background job engine. Each step reports its stages on `job`.
+    """
+    def __init__(self, scanner, reader, writer, expander, diff_store: DiffStore, validator: Optional[TagValidator] = None,
+                 history=None):
+        self.scanner = scanner
+        self.reader = reader
+        self.writer = writer
+        self.expander = expander
+        self.diff_store = diff_store
+        self.validator = validator or TagValidator()
+        # HistoryStore: writes and rebuilds are recorded as project versions
+        self.history = history
+
+    def dbf_paths(self, project_path: str) -> Dict[str, str]:
+        return {t: self.scanner.get_dbf_path(project_path, name) for t, name, _, _ in DBF_TABLES}
+
+    def validate(self, project_path: str, expanded: Dict[str, List[Any]], max_violations: Optional[int] = None) -> Dict[str, Any]:
+        """Pre-flight report for expanded records (clusters are checked when the project has a cluster.dbf)."""
+        clusters = project_clusters(self.scanner.get_dbf_path(project_path, "cluster.dbf"))
+        return self.validator.validate(expanded, clusters, max_violations)
+
+    def start_validation(self, project_path: str, max_violations: Optional[int] = None):
+        """validate() for records that arrive in batches (ValidationRun.add, then finish)."""
+        clusters = project_clusters(self.scanner.get_dbf_path(project_path, "cluster.dbf"))
+        return self.validator.start(clusters, max_violations)
+
+    def import_project(self, project_path: str, job: Job) -> List[Dict[str, Any]]:
+        """Reads existing DBFs and returns the unified tag list."""
+        with job.stage("read_dbf"):
+            return self.reader.read_project(project_path)
+
+    def generate(self, project_path: str, tags: List[Dict[str, Any]], load_templates: Callable[[], Dict[str, Any]], job: Job, page_size: int = 200) -> Dict[str, Any]:
+        """
+        1. Expand Tags (using DB templates)
+        2. Pre-flight validation (lengths, duplicate keys, references, clusters)
+        3. Reconcile with DBF
+        4. Store the Diff server-side and return its handle, counts, validation report and first page
+        """
+        with job.stage("load_templates"):
+            templates = load_templates()
+
+        with job.stage("expand"):
+            expanded = self.expander.expand_tags(tags, override_templates=templates)
+
+        with job.stage("validate"):
+            validation = self.validate(project_path, expanded)
+
+        paths = self.dbf_paths(project_path)
+        mtimes = self.diff_store.snapshot_mtimes(paths)
+
+        diffs = {}
+        renamed_keys = {} # old -> new key, so variable renames carry over to the trend/alarm rows
+        for table_type, _, key_field, enable_guid in DBF_TABLES:
+            with job.stage(f"reconcile_{table_type}"):
+                diffs[table_type] = self.writer.reconcile_changes(expanded[table_type], paths[table_type], key_field=key_field,
+                                                                  enable_guid=enable_guid, renamed_keys=renamed_keys)
+            renamed_keys.update((r["old_key"], r["proposed"].get(key_field)) for r in diffs[table_type]["renamed"])
+
+        handle = self.diff_store.put(project_path, diffs, paths, mtimes, validation)
+        return {
+            "handle": handle,
+            "counts": self.diff_store.counts(diffs),
+            "validation": validation,
+            "diff": self.diff_store.first_page(diffs, page_size),
+            "page_size": page_size
+        }
+
+    def write(self, project_path: str, diff: Optional[Dict[str, Any]], job: Job,
+              handle: Optional[str] = None, excluded: Optional[Dict[str, Dict[str, List[str]]]] = None,
+              included: Optional[Dict[str, Dict[str, List[str]]]] = None) -> Dict[str, Any]:
+        """
+        Commit changes to DBF files.
+
+        Either a full `diff` (legacy clients) or a `handle` from generate plus the
+        keys the user rejected. Handles are refused if any DBF changed since generate
+        or if pre-flight validation found errors (the DBF would reject the values halfway
+        through the write). Cancellation is only honoured before the first file is touched.
+        """
+        if handle:
+            entry = self.diff_store.get(handle)
+            if entry["project_path"] != project_path:
+                raise ValueError(f"Diff {handle} belongs to another project")
+            self.diff_store.check_fresh(handle)
+            validation = entry.get("validation")
+            if validation and validation["errors"]:
+                raise PreflightError(validation)
+            diff = self.diff_store.select(handle, excluded, included)
+
+        job.check_cancelled()
+        for table_type, dbf_name, _, _ in DBF_TABLES:
+            if table_type not in diff:
+                continue
+            with job.stage(f"write_{table_type}", cancellable=False):
+                path = self.scanner.get_dbf_path(project_path, dbf_name)
+                self.writer.apply_diff(diff[table_type], path, table_type)
+
+        if handle:
+            # The files now differ from what the diff was computed against
+            self.diff_store.discard(handle)
+        result = {"status": "success", "message": "Changes committed successfully."}
+        if self.history is not None:
+            result["version"] = self.history.record_write(project_path, diff, self.dbf_paths(project_path))
+        return result
+
+    def rebuild(self, project_path: str, tags: Iterable[Dict[str, Any]], load_templates: Callable[[], Dict[str, Any]], job: Job,
+                run_size: int = DEFAULT_RUN_SIZE, spill_dir: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Headless full rebuild: generate + write in one streaming pass, no diff review.
+
+        expand (generator) -> external sort by key per table -> merge-join against the
+        key-sorted existing DBF rows -> patch the DBF. At most `run_size` records per
+        sorter are in memory at a time (the rest are spilled to `spill_dir`), so `tags`
+        can be a lazy iterator over any number of saved tags.
+
+        The expanded records go through the same pre-flight validation as generate, in
+        batches; if it finds errors, PreflightError is raised before any DBF is touched.
+        """
+        with job.stage("load_templates"):
+            templates = load_templates()
+
+        sorters = {t: ExternalSorter(run_size, spill_dir, name=f"staging_{t}") for t, _, _, _ in DBF_TABLES}
+        try:
+            validation = self.start_validation(project_path)
+            with job.stage("expand_sort"):
+                key_fields = {t: key_field for t, _, key_field, _ in DBF_TABLES}
+                batches = {t: [] for t in sorters}
+                batch_size = min(run_size, VALIDATE_BATCH)
+                for table_type, record in self.expander.iter_expand(tags, override_templates=templates):
+                    sorters[table_type].add(self.writer.staging_item(record, table_type, key_fields[table_type]))
+                    batch = batches[table_type]
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        validation.add(table_type, batch)
+                        batches[table_type] = []
+                for table_type, sorter in sorters.items():
+                    validation.add(table_type, batches[table_type])
+                    metrics.inc("taggen_records_expanded_total", sorter.count, table=table_type)
+
+            with job.stage("validate"):
+                report = validation.finish()
+            if report["errors"]:
+                raise PreflightError(report)
+
+            job.check_cancelled()
+            paths = self.dbf_paths(project_path)
+            counts = {}
+            for table_type, _, key_field, enable_guid in DBF_TABLES:
+                with job.stage(f"rebuild_{table_type}", cancellable=False):
+                    counts[table_type] = self.writer.stream_apply(iter(sorters[table_type]), paths[table_type], table_type,
+                                                                  key_field=key_field, enable_guid=enable_guid,
+                                                                  run_size=run_size, spill_dir=spill_dir)
+            spilled = {t: s.spilled_runs for t, s in sorters.items()}
+        finally:
+            for sorter in sorters.values():
+                sorter.close()
+
+        result = {"status": "success", "counts": counts, "spilled_runs": spilled,
+                  "validation": {k: report[k] for k in ("errors", "warnings", "counts")}}
+        if self.history is not None:
+            # No diff to keep: the version only marks that DBF restores cannot reach past it
+            result["version"] = self.history.record_write(project_path, None, paths, kind="rebuild", message="Streaming rebuild")
+        return result
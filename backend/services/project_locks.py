@@ -0,0 +1,153 @@
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from services.metrics import metrics
+
+SHARED = "shared"
+EXCLUSIVE = "exclusive"
+
+# Seconds a request waits for its project before giving up (jobs pass their own)
+DEFAULT_TIMEOUT = 30.0
+
+def lock_key(project_path: str) -> str:
+    """The same project reached by a relative path, a trailing slash or other case (Windows) shares one lock."""
+    return os.path.normcase(os.path.abspath(project_path))
+
+class LockTimeout(Exception):
+    """The project stayed locked by other requests / jobs for longer than the caller would wait."""
+    def __init__(self, project_path: str, mode: str, waited: float, holders: Dict[str, Any]):
+        self.project_path = project_path
+        self.mode = mode
+        self.waited = waited
+        self.holders = holders
+        busy = f"{holders['readers']} reader(s)" if holders["readers"] else f"'{holders['writer'] or 'a writer'}'"
+        super().__init__(f"Project {project_path} is busy ({busy}); gave up on the {mode} lock after {waited:.1f}s")
+
+class _ProjectLock:
+    """
+    Reader / writer state of one project, guarded by the manager's condition.
+    Writers are preferred: once one is waiting, new readers queue behind it, so a steady
+    stream of reads cannot starve a write.
+    """
+    __slots__ = ("readers", "writer", "waiting_readers", "waiting_writers", "reader_ops")
+
+    def __init__(self):
+        self.readers = 0
+        self.writer = None # operation name of the exclusive holder
+        self.waiting_readers = 0
+        self.waiting_writers = 0
+        self.reader_ops: Dict[str, int] = {}
+
+    @property
+    def idle(self) -> bool:
+        return not (self.readers or self.writer or self.waiting_readers or self.waiting_writers)
+
+    def holders(self) -> Dict[str, Any]:
+        return {"readers": self.readers, "reader_ops": dict(self.reader_ops), "writer": self.writer,
+                "waiting_readers": self.waiting_readers, "waiting_writers": self.waiting_writers}
+
+class ProjectLockManager:
+    """
+    Project-scoped reader / writer locks for the API and the job pool.
+
+    Imports, generates, validation and state / history reads take the project's lock
+    shared and run side by side; DBF writes, saves, bulk edits, renames and restores take
+    it exclusive. Different projects never wait for each other. Locks live in this
+    process only: CLI workers coordinate through SQLite's own file lock.
+
+    The lock is not re-entrant: take it once, at the request or job entry point.
+    """
+    def __init__(self, default_timeout: float = DEFAULT_TIMEOUT):
+        self.default_timeout = default_timeout
+        self._cond = threading.Condition()
+        self._projects: Dict[str, _ProjectLock] = {}
+
+    @contextmanager
+    def shared(self, project_path: str, operation: str = "", timeout: Optional[float] = None):
+        self._acquire(project_path, SHARED, operation, timeout)
+        try:
+            yield
+        finally:
+            self._release(project_path, SHARED, operation)
+
+    @contextmanager
+    def exclusive(self, project_path: str, operation: str = "", timeout: Optional[float] = None):
+        self._acquire(project_path, EXCLUSIVE, operation, timeout)
+        try:
+            yield
+        finally:
+            self._release(project_path, EXCLUSIVE, operation)
+
+    def _acquire(self, project_path: str, mode: str, operation: str, timeout: Optional[float]):
+        """Waits up to `timeout` seconds (None = the default, a negative value = forever)."""
+        timeout = self.default_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        key = lock_key(project_path)
+        with self._cond:
+            lock = self._projects.get(key)
+            if lock is None:
+                lock = self._projects[key] = _ProjectLock()
+            if mode == SHARED:
+                ready = lambda: lock.writer is None and not lock.waiting_writers
+            else:
+                ready = lambda: lock.writer is None and not lock.readers
+
+            if not ready():
+                if mode == SHARED:
+                    lock.waiting_readers += 1
+                else:
+                    lock.waiting_writers += 1
+                metrics.add("taggen_lock_waiting", 1, mode=mode)
+                try:
+                    acquired = self._cond.wait_for(ready, None if timeout < 0 else timeout)
+                finally:
+                    if mode == SHARED:
+                        lock.waiting_readers -= 1
+                    else:
+                        lock.waiting_writers -= 1
+                    metrics.add("taggen_lock_waiting", -1, mode=mode)
+                if not acquired:
+                    waited = time.perf_counter() - start
+                    holders = lock.holders()
+                    if lock.idle:
+                        del self._projects[key]
+                    # A reader held back only by this writer can go now
+                    self._cond.notify_all()
+                    metrics.inc("taggen_lock_timeouts_total", mode=mode)
+                    metrics.observe("taggen_lock_wait_seconds", waited, mode=mode)
+                    raise LockTimeout(project_path, mode, waited, holders)
+
+            if mode == SHARED:
+                lock.readers += 1
+                lock.reader_ops[operation] = lock.reader_ops.get(operation, 0) + 1
+            else:
+                lock.writer = operation or "write"
+        metrics.add("taggen_lock_held", 1, mode=mode)
+        metrics.observe("taggen_lock_wait_seconds", time.perf_counter() - start, mode=mode)
+
+    def _release(self, project_path: str, mode: str, operation: str):
+        key = lock_key(project_path)
+        with self._cond:
+            lock = self._projects[key]
+            if mode == SHARED:
+                lock.readers -= 1
+                left = lock.reader_ops.get(operation, 1) - 1
+                if left:
+                    lock.reader_ops[operation] = left
+                else:
+                    lock.reader_ops.pop(operation, None)
+            else:
+                lock.writer = None
+            if lock.idle:
+                del self._projects[key]
+            self._cond.notify_all()
+        metrics.add("taggen_lock_held", -1, mode=mode)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Projects currently locked or waited for, with their holders and queue depth."""
+        with self._cond:
+            return [{"project_path": path, **lock.holders()} for path, lock in sorted(self._projects.items())]
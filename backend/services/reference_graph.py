@@ -0,0 +1,343 @@
+
+import datetime
+import hashlib
+import json
+import re
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import TagEntry, TagReference
+from services.metrics import metrics
+from services.tag_store import STATE_COLUMNS, STATE_KEYS, claim_revision, iter_state_rows, load_templates, next_revision, state_row
+from services.udt_expander import TemplateError, template_version
+from services.field_expressions import ExpressionError
+
+# --- Tag expressions ---
+
+# Fields whose value is an expression over variable tags: table -> fields
+REFERENCE_FIELDS = {
+    "trend": ("EXPR",),
+    "digalm": ("VAR_A", "VAR_B"),
+}
+# The same fields on a saved tag (TagEntry columns / grid keys)
+REFERENCE_COLUMNS = ("trend_expr", "alarm_var_a", "alarm_var_b")
+# TagEntry columns an owner's edges are expanded from; edits to any other column leave the graph as is
+OWNER_COLUMNS = ("entry_type", "name", "type", "is_trend", "is_alarm", "trend_name", "alarm_tag") + REFERENCE_COLUMNS
+
+# Tag names as the sanitizer leaves them (letters, digits, '_', '/', ^0xXX escapes), optionally
+# followed by .Field accessors (which are not part of the name) and a '(' for function calls
+_TOKEN = re.compile(r"(?<![\w/^.])([A-Za-z_][\w/]*(?:\^0x[0-9A-Fa-f]{2}[\w/]*)*)((?:\.[A-Za-z_]\w*)*)\s*(\()?")
+_STRING_LITERAL = re.compile(r'("[^"]*")')
+# Cicode operators / constants that look like identifiers
+EXPRESSION_KEYWORDS = frozenset(("AND", "OR", "NOT", "XOR", "MOD", "BITAND", "BITOR", "BITXOR", "TRUE", "FALSE"))
+
+def expression_references(expression: str) -> List[str]:
+    """Tag names referenced by a trend / alarm expression (function names, keywords and literals skipped)."""
+    names = []
+    for name, _, call in _TOKEN.findall(_STRING_LITERAL.sub(" ", expression)):
+        if call or name.upper() in EXPRESSION_KEYWORDS:
+            continue
+        names.append(name)
+    return names
+
+def rename_references(expression: str, mapping: Dict[str, str]) -> str:
+    """`expression` with every tag name in `mapping` replaced; literals, functions and .Field accessors are kept."""
+    def replace(match):
+        name = match.group(1)
+        if match.group(3) or name not in mapping:
+            return match.group(0)
+        return mapping[name] + match.group(0)[len(name):]
+
+    # Odd parts of the split are the string literals
+    parts = _STRING_LITERAL.split(expression)
+    for i in range(0, len(parts), 2):
+        parts[i] = _TOKEN.sub(replace, parts[i])
+    return "".join(parts)
+
+def _chunks(values: List[str], size: int = 500):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+# --- Graph ---
+
+Edge = Tuple[str, str, str, str] # (source_table, source_key, field, target)
+
+class ReferenceGraph:
+    """
+    Persisted index of which trend / alarm rows and UDT members refer to which variables,
+    for impact analysis and cascading renames without scanning every tag.
+
+    Edges are expanded per saved tag (the "owner") with the same UDTExpander the
+    generate step uses, so they match what would be written. Each edge carries a
+    fingerprint of its owner's referencing fields; `sync` (called on save) only
+    re-expands owners whose fingerprint changed and only touches their rows. Saved
+    rows that share a name share that owner: its edges are the union of theirs and
+    its fingerprint covers all of them.
+    """
+    def __init__(self, expander, history=None):
+        self.expander = expander
+        # HistoryStore: cascading renames are recorded as project versions
+        self.history = history
+
+    # --- Building ---
+
+    @staticmethod
+    def _produces_edges(tag: Dict[str, Any], templates: Dict[str, Any]) -> bool:
+        entry_type = tag.get("entry_type", "single")
+        if entry_type == "udt_instance":
+            return tag.get("udt_type") in templates
+        return entry_type in ("single", "member") and bool(tag.get("is_trend") or tag.get("is_alarm"))
+
+    @staticmethod
+    def _fingerprint(tag: Dict[str, Any], template_signatures: Dict[str, str]) -> str:
+        if tag.get("entry_type") == "udt_instance":
+            values = ("udt_instance", tag.get("name"), tag.get("udt_type"), template_signatures[tag.get("udt_type")])
+        else:
+            values = (tag.get("entry_type", "single"), tag.get("name"), bool(tag.get("is_trend")), bool(tag.get("is_alarm")),
+                      tag.get("trend_name"), tag.get("trend_expr"), tag.get("alarm_tag"), tag.get("alarm_var_a"), tag.get("alarm_var_b"))
+        text = "\x1f".join("" if v is None else str(v) for v in values)
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+    @staticmethod
+    def _template_signatures(templates: Dict[str, Any]) -> Dict[str, str]:
+        # Member names / trend / alarm flags of an instance come from its template and the ones it nests
+        signatures = {}
+        for name, t in templates.items():
+            try:
+                signatures[name] = template_version(templates, name)
+            except TemplateError:
+                signatures[name] = hashlib.blake2b(json.dumps(t, sort_keys=True, default=str).encode("utf-8"), digest_size=8).hexdigest()
+        return signatures
+
+    def owner_edges(self, tag: Dict[str, Any], templates: Dict[str, Any]) -> Set[Edge]:
+        """Edges of one saved tag: its trend / alarm references and, for a UDT instance, its members."""
+        owner = tag.get("name") or ""
+        instance = tag.get("entry_type") == "udt_instance"
+        edges = set()
+        try:
+            for table_type, record in self.expander.iter_expand([tag], override_templates=templates):
+                if table_type == "variable":
+                    if instance:
+                        edges.add(("variable", record.NAME, "UDT", owner))
+                    continue
+                key = record.TAG if table_type == "digalm" else record.NAME
+                for field in REFERENCE_FIELDS[table_type]:
+                    value = getattr(record, field)
+                    if value:
+                        for target in expression_references(value):
+                            edges.add((table_type, key, field, target))
+        except ExpressionError as e:
+            # Generate reports it; the graph keeps the edges expanded so far
+            print(f"Reference graph: {e}")
+        return edges
+
+    def _owners(self, tags: Iterable[Dict[str, Any]], templates: Dict[str, Any]) -> Dict[Any, Tuple[str, str, Dict[str, Any]]]:
+        """Tags that produce edges, keyed by row id (position for rows without one): (owner name, fingerprint, tag)."""
+        signatures = self._template_signatures(templates)
+        owners = {}
+        for i, tag in enumerate(tags):
+            if tag.get("name") and self._produces_edges(tag, templates):
+                key = tag.get("id") if tag.get("id") not in (None, "") else ("#", i)
+                owners[key] = (tag["name"], self._fingerprint(tag, signatures), tag)
+        return owners
+
+    @staticmethod
+    def _owner_hashes(owners: Dict[Any, Tuple[str, str, Dict[str, Any]]]) -> Dict[str, str]:
+        """Fingerprint per owner name; a name saved on several rows gets one over all of theirs."""
+        fingerprints = {}
+        for name, fingerprint, _ in owners.values():
+            fingerprints.setdefault(name, set()).add(fingerprint)
+        return {name: next(iter(fps)) if len(fps) == 1 else
+                hashlib.blake2b("\x1f".join(sorted(fps)).encode("utf-8"), digest_size=8).hexdigest()
+                for name, fps in fingerprints.items()}
+
+    def _insert(self, db: Session, project_path: str, owners: Dict[Any, Tuple[str, str, Dict[str, Any]]], templates: Dict[str, Any]) -> int:
+        hashes = self._owner_hashes(owners)
+        edges = {}
+        for name, _, tag in owners.values():
+            edges.setdefault(name, set()).update(self.owner_edges(tag, templates))
+        rows = [{"project_path": project_path, "owner": name, "owner_hash": hashes[name], "source_table": source_table,
+                 "source_key": source_key, "field": field, "target": target}
+                for name, owned in edges.items() for source_table, source_key, field, target in owned]
+        if rows:
+            db.bulk_insert_mappings(TagReference, rows)
+        return len(rows)
+
+    def _delete_owners(self, db: Session, project_path: str, owners: Iterable[str]) -> int:
+        removed = 0
+        for chunk in _chunks(list(owners)):
+            removed += db.query(TagReference).filter(TagReference.project_path == project_path, TagReference.owner.in_(chunk)) \
+                .delete(synchronize_session=False)
+        return removed
+
+    def sync(self, db: Session, project_path: str, tags: Iterable[Dict[str, Any]], templates: Optional[Dict[str, Any]] = None,
+             commit: bool = True) -> Dict[str, int]:
+        """
+        Brings the graph in line with `tags` (the full saved state of the project).
+        Owners that are new, gone or whose fingerprint changed are the only ones re-expanded / rewritten.
+        commit=False leaves the changes in the caller's transaction.
+        """
+        with metrics.timer("reference_sync"):
+            if templates is None:
+                templates = load_templates(db, self.expander.templates)
+            incoming = self._owners(tags, templates)
+            hashes = self._owner_hashes(incoming)
+            stored = dict(db.query(TagReference.owner, TagReference.owner_hash).filter(TagReference.project_path == project_path).distinct())
+
+            changed = {o for o, h in hashes.items() if stored.get(o) != h}
+            stale = [o for o in stored if o not in hashes or o in changed]
+            removed = self._delete_owners(db, project_path, stale)
+            added = self._insert(db, project_path, {k: v for k, v in incoming.items() if v[0] in changed}, templates)
+            if commit:
+                db.commit()
+        metrics.inc("taggen_reference_edges_written_total", added)
+        return {"owners": len(hashes), "owners_changed": len(changed) + sum(1 for o in stored if o not in hashes),
+                "edges_added": added, "edges_removed": removed}
+
+    def reindex(self, db: Session, project_path: str, owners: Iterable[str], tags: Iterable[Dict[str, Any]],
+                templates: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Replaces the edges of `owners` (names before an edit) with those of `tags` (the edited
+        rows as /api/state dicts, every row of each name) inside the caller's transaction.
+        Returns the edges written.
+        """
+        if templates is None:
+            templates = load_templates(db, self.expander.templates)
+        self._delete_owners(db, project_path, owners)
+        return self._insert(db, project_path, self._owners(tags, templates), templates)
+
+    def rebuild(self, db: Session, project_path: str) -> Dict[str, int]:
+        """Drops and rebuilds the project's graph from its saved tags."""
+        db.query(TagReference).filter(TagReference.project_path == project_path).delete(synchronize_session=False)
+        return self.sync(db, project_path, (dict(zip(STATE_KEYS, values)) for values in iter_state_rows(db, project_path)))
+
+    def ensure(self, db: Session, project_path: str):
+        """Builds the graph on first use for projects saved before it existed."""
+        if db.query(TagReference.id).filter(TagReference.project_path == project_path).first() is None:
+            self.rebuild(db, project_path)
+
+    # --- Queries ---
+
+    @staticmethod
+    def _edge_dict(edge: TagReference) -> Dict[str, str]:
+        return {"table": edge.source_table, "key": edge.source_key, "field": edge.field, "target": edge.target, "owner": edge.owner}
+
+    def references(self, db: Session, project_path: str, name: str) -> Dict[str, Any]:
+        """Direct edges into `name` (who refers to it) and out of rows owned by `name`."""
+        self.ensure(db, project_path)
+        q = db.query(TagReference).filter(TagReference.project_path == project_path)
+        return {
+            "name": name,
+            "referenced_by": [self._edge_dict(e) for e in q.filter(TagReference.target == name)],
+            "references": [self._edge_dict(e) for e in q.filter(TagReference.owner == name)],
+        }
+
+    def impact(self, db: Session, project_path: str, name: str) -> Dict[str, Any]:
+        """
+        What deleting the saved tag `name` does: the rows that go with it (its own trend /
+        alarm, the members of a UDT instance) and the references elsewhere left dangling.
+        """
+        self.ensure(db, project_path)
+        q = db.query(TagReference).filter(TagReference.project_path == project_path)
+        owned = q.filter(TagReference.owner == name).all()
+
+        variables = {name} | {e.source_key for e in owned if e.field == "UDT"}
+        removed = sorted({(e.source_table, e.source_key) for e in owned} | {("variable", v) for v in variables})
+        broken = []
+        for chunk in _chunks(sorted(variables)):
+            broken.extend(q.filter(TagReference.target.in_(chunk), TagReference.owner != name))
+        broken.sort(key=lambda e: (e.source_table, e.source_key, e.field))
+        return {
+            "name": name,
+            "removed": [{"table": t, "key": k} for t, k in removed],
+            "broken": [self._edge_dict(e) for e in broken],
+            "counts": {"removed": len(removed), "broken": len(broken)},
+        }
+
+    # --- Cascading rename ---
+
+    def rename(self, db: Session, project_path: str, old: str, new: str, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Renames the saved tag `old` to `new` and rewrites every dependent in the same transaction:
+        the tag's own trend / alarm keys, the saved member rows of a UDT instance (found through
+        its UDT edges: the member names its template generates), and the
+        EXPR / VAR_A / VAR_B expressions of other tags that refer to any renamed name. The graph
+        edges of every touched tag are rebuilt before the single commit. `dry_run` rolls back.
+        """
+        if not new or new == old:
+            raise ValueError("The new name must be non-empty and differ from the old one")
+        self.ensure(db, project_path)
+        templates = load_templates(db, self.expander.templates)
+
+        entries = db.query(TagEntry).filter(TagEntry.project_path == project_path)
+        owner_rows = entries.filter(TagEntry.name == old).all()
+        if not owner_rows:
+            raise KeyError(old)
+        if entries.filter(TagEntry.name == new).first() is not None:
+            raise ValueError(f"A tag named '{new}' already exists")
+
+        edges = db.query(TagReference).filter(TagReference.project_path == project_path)
+        mapping = {old: new}
+        # Generated members of a UDT instance are named <instance><suffix>
+        for e in edges.filter(TagReference.owner == old, TagReference.field == "UDT"):
+            if e.source_key.startswith(old):
+                mapping[e.source_key] = new + e.source_key[len(old):]
+        # Saved member rows of the instance are the ones named like a generated member
+        members = sorted(k for k in mapping if k != old)
+        member_rows = [r for chunk in _chunks(members) for r in entries.filter(TagEntry.name.in_(chunk), TagEntry.entry_type == "member")]
+        taken = [n for chunk in _chunks([v for k, v in mapping.items() if k != old])
+                 for (n,) in db.query(TagEntry.name).filter(TagEntry.project_path == project_path, TagEntry.name.in_(chunk))]
+        if taken:
+            raise ValueError(f"Renamed members would collide with existing tags: {', '.join(sorted(taken)[:10])}")
+
+        dependents = set()
+        for chunk in _chunks(list(mapping)):
+            dependents.update(o for (o,) in edges.filter(TagReference.target.in_(chunk)).with_entities(TagReference.owner).distinct())
+        renamed_owners = {old} | {r.name for r in member_rows}
+        dependent_rows = [r for chunk in _chunks(sorted(dependents - renamed_owners)) for r in entries.filter(TagEntry.name.in_(chunk))]
+
+        touched_ids = [r.id for r in owner_rows + member_rows + dependent_rows]
+        history_before = self.history.rows_by_id(db, project_path, touched_ids) if self.history is not None and not dry_run else None
+
+        changes = []
+        revision = next_revision(db, project_path)
+        for row in owner_rows + member_rows + dependent_rows:
+            before = {c: getattr(row, c) for c in ("name", "trend_name", "alarm_tag", "alarm_name") + REFERENCE_COLUMNS}
+            if row.name in mapping:
+                renamed_to = mapping[row.name]
+                for column in ("trend_name", "alarm_tag", "alarm_name"):
+                    if getattr(row, column) == row.name:
+                        setattr(row, column, renamed_to)
+                row.name = renamed_to
+            for column in REFERENCE_COLUMNS:
+                value = getattr(row, column)
+                if value:
+                    setattr(row, column, rename_references(value, mapping))
+            fields = {c: [v, getattr(row, c)] for c, v in before.items() if getattr(row, c) != v}
+            if fields:
+                row.version = revision
+                changes.append({"name": before["name"], "fields": fields})
+
+        # Re-index every touched owner from its updated row
+        touched = renamed_owners | {r.name for r in dependent_rows}
+        db.flush()
+        updated_names = [mapping.get(n, n) for n in touched]
+        rows = [dict(zip(STATE_KEYS, state_row(r))) for chunk in _chunks(updated_names)
+                for r in db.query(*STATE_COLUMNS).filter(TagEntry.project_path == project_path, TagEntry.name.in_(chunk))]
+        edges_written = self.reindex(db, project_path, touched, rows, templates)
+
+        result = {"old": old, "new": new, "renamed": mapping, "changed_rows": len(changes), "changes": changes,
+                  "edges_rewritten": edges_written, "dry_run": dry_run}
+        if dry_run:
+            db.rollback()
+            return result
+
+        if history_before is not None:
+            result["version"] = self.history.record_rows(db, project_path, "rename", history_before,
+                                                         self.history.rows_by_id(db, project_path, touched_ids), f"Renamed {old} to {new}")
+        result["revision"] = revision
+        claim_revision(db, project_path, revision).updated_at = datetime.datetime.now().isoformat()
+        db.commit()
+        metrics.inc("taggen_cascading_renames_total")
+        return result
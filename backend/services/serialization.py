@@ -0,0 +1,188 @@
+
+import contextvars
+import gzip
+import json
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+
+from services.metrics import metrics
+from services.tag_record import CompactRecord, json_default
+
+# Optional accelerators: orjson for encoding, brotli / msgpack for the negotiated formats
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+# Lists of objects sent keys-once: {"$columns": [...], "$rows": [[...], ...]}
+COLUMNAR_MEDIA_TYPE = "application/vnd.taggen.columnar+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 4096
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+class Rows:
+    """
+    Tabular payload (e.g. /api/state rows): one key list and value tuples. Encoded
+    keys-once for columnar clients, expanded to objects row by row for everyone else.
+    """
+    __slots__ = ("keys", "rows")
+
+    def __init__(self, keys: Sequence[str], rows: List[Sequence[Any]]):
+        self.keys = list(keys)
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def dicts(self):
+        keys = self.keys
+        return (dict(zip(keys, row)) for row in self.rows)
+
+# --- Negotiation (set per request by the API middleware) ---
+
+_negotiation: contextvars.ContextVar[Tuple[str, str]] = contextvars.ContextVar("taggen_negotiation", default=("", ""))
+
+@contextmanager
+def negotiate(accept: Optional[str], accept_encoding: Optional[str]):
+    token = _negotiation.set(((accept or "").lower(), (accept_encoding or "").lower()))
+    try:
+        yield
+    finally:
+        _negotiation.reset(token)
+
+def _accepts(header: str, token: str) -> bool:
+    """True if `token` is listed in the header without q=0."""
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() == token:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+def negotiated_format() -> str:
+    accept = _negotiation.get()[0]
+    if msgpack is not None and any(_accepts(accept, t) for t in MSGPACK_MEDIA_TYPES):
+        return "msgpack"
+    if _accepts(accept, COLUMNAR_MEDIA_TYPE):
+        return "columnar"
+    return "json"
+
+def negotiated_encoding() -> Optional[str]:
+    accept_encoding = _negotiation.get()[1]
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return "br"
+    if _accepts(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+# --- Encoding ---
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Rows):
+        return list(value.dicts())
+    return json_default(value)
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes; orjson when installed (records and Rows are handled by the default hook)."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+def _dumps_rows_json(content: Any) -> Optional[bytes]:
+    """Top-level {..., key: Rows} payloads are encoded row by row, so no list of dicts is built."""
+    if not isinstance(content, dict) or not any(isinstance(v, Rows) for v in content.values()):
+        return None
+    parts = []
+    for key, value in content.items():
+        if isinstance(value, Rows):
+            encoded = b",".join(dumps(d) for d in value.dicts())
+            parts.append(dumps(key) + b":[" + encoded + b"]")
+        else:
+            parts.append(dumps(key) + b":" + dumps(value))
+    return b"{" + b",".join(parts) + b"}"
+
+def to_columnar(value: Any) -> Any:
+    """
+    Replaces lists of objects with {"$columns", "$rows"} (recursively). Keys are the
+    union in first-seen order; a missing key is sent as null and dropped again by the
+    client decoder, so null values do not survive this format.
+    """
+    if isinstance(value, Rows):
+        return {"$columns": value.keys, "$rows": value.rows}
+    if isinstance(value, (dict, CompactRecord)):
+        return {k: to_columnar(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) > 1 and all(isinstance(v, (dict, CompactRecord)) for v in value):
+            columns = {}
+            for v in value:
+                for k in v.keys():
+                    columns.setdefault(k, None)
+            keys = list(columns)
+            return {"$columns": keys, "$rows": [[to_columnar(v.get(k)) for k in keys] for v in value]}
+        return [to_columnar(v) for v in value]
+    return value
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, Rows):
+        return list(value.dicts())
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    return str(value)
+
+def encode(content: Any, fmt: str) -> Tuple[bytes, str]:
+    """Encodes `content` in the given format, returning (body, media type)."""
+    if fmt == "msgpack":
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True), MSGPACK_MEDIA_TYPES[0]
+    if fmt == "columnar":
+        return dumps(to_columnar(content)), COLUMNAR_MEDIA_TYPE
+    body = _dumps_rows_json(content)
+    return (body if body is not None else dumps(content)), JSON_MEDIA_TYPE
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if encoding is None or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    with metrics.timer("compress_response"):
+        if encoding == "br":
+            return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+
+class PayloadResponse(Response):
+    """
+    JSON response encoded with orjson, in the format and compression the request
+    negotiated (Accept: JSON / columnar JSON / MessagePack; Accept-Encoding: br / gzip).
+
+    Endpoints with large payloads return it directly, which also skips FastAPI's
+    jsonable_encoder pass. Encoding and compression show up as the
+    serialize_json and compress_response stages.
+    """
+    media_type = JSON_MEDIA_TYPE
+
+    def __init__(self, content: Any = None, status_code: int = 200, headers: Optional[Dict[str, str]] = None,
+                 media_type: Optional[str] = None, background: Optional[BackgroundTask] = None):
+        with metrics.timer("serialize_json"):
+            body, negotiated_type = encode(content, negotiated_format())
+        body, content_encoding = compress(body, negotiated_encoding())
+        super().__init__(body, status_code, headers, media_type or negotiated_type, background)
+        self.headers["Vary"] = "Accept, Accept-Encoding"
+        if content_encoding:
+            self.headers["Content-Encoding"] = content_encoding
+
+    def render(self, content: Any) -> bytes:
+        # __init__ already produced the encoded body
+        return content
@@ -0,0 +1,238 @@
+
+import sys
+from collections import deque
+from collections.abc import MutableMapping
+from itertools import repeat
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+
+from models import TagEntry
+
+class CompactRecord(MutableMapping):
+    """
+    Dict-compatible record backed by __slots__ instead of a per-row hash table.
+
+    Each subclass is generated from a field list (see make_record_class). Known
+    fields live in slots, anything else goes to a small `_extra` dict, so code
+    written against plain dicts (get / [] / in / items / update) keeps working.
+    A slot that was never assigned behaves like a missing key.
+
+    Records are only turned into real dicts at the JSON boundary (to_dict / to_plain).
+    """
+    __slots__ = ("_extra",)
+
+    FIELDS: Sequence[str] = ()
+    INTERNED: frozenset = frozenset() # Low-cardinality fields whose values are sys.intern'ed on read
+    _field_set: frozenset = frozenset()
+
+    def __init__(self, data: Any = None, **kwargs):
+        self._extra = None
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    # --- Construction ---
+
+    @classmethod
+    def blank(cls):
+        """A record with every field set to '' (what the expander starts from)."""
+        rec = cls.__new__(cls)
+        rec._extra = None
+        for field in cls.FIELDS:
+            setattr(rec, field, "")
+        return rec
+
+    @classmethod
+    def from_row(cls, field_names: Sequence[str], values: Iterable[Any]):
+        """Builds a record from parallel name/value sequences (a DBF or SQL row)."""
+        rec = cls.__new__(cls)
+        rec._extra = None
+        fields = cls._field_set
+        interned = cls.INTERNED
+        for name, value in zip(field_names, values):
+            if name in interned and type(value) is str:
+                value = sys.intern(value)
+            if name in fields:
+                setattr(rec, name, value)
+            else:
+                rec._set_extra(name, value)
+        return rec
+
+    @classmethod
+    def from_values(cls, values: Iterable[Any]):
+        """Builds a record from values in FIELDS order (what the compiled schema mappers produce)."""
+        rec = cls.__new__(cls)
+        rec._extra = None
+        # map() drives setattr from C instead of a Python-level loop
+        deque(map(setattr, repeat(rec), cls.FIELDS, values), maxlen=0)
+        return rec
+
+    def _set_extra(self, key: str, value: Any):
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    # --- Mapping protocol ---
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self._field_set:
+            setattr(self, key, value)
+        else:
+            self._set_extra(key, value)
+
+    def __delitem__(self, key: str):
+        if key in self._field_set:
+            try:
+                delattr(self, key)
+                return
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            del self._extra[key]
+            return
+        raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._field_set:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._field_set:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def items(self) -> List[tuple]:
+        out = []
+        for field in self.FIELDS:
+            try:
+                out.append((field, getattr(self, field)))
+            except AttributeError:
+                pass
+        if self._extra:
+            out.extend(self._extra.items())
+        return out
+
+    def keys(self) -> List[str]:
+        return [k for k, _ in self.items()]
+
+    def values(self) -> List[Any]:
+        return [v for _, v in self.items()]
+
+    def update(self, data: Any = (), **kwargs):
+        pairs = data.items() if hasattr(data, "items") else data
+        fields = self._field_set
+        for key, value in pairs:
+            if key in fields:
+                setattr(self, key, value)
+            else:
+                self._set_extra(key, value)
+        for key, value in kwargs.items():
+            self[key] = value
+
+    # --- Conversion ---
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def copy(self):
+        rec = self.__class__.__new__(self.__class__)
+        rec._extra = dict(self._extra) if self._extra else None
+        for field, value in self.items():
+            if field in self._field_set:
+                setattr(rec, field, value)
+        return rec
+
+    __copy__ = copy
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CompactRecord):
+            return self.items() == other.items()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.items()
+
+    def __setstate__(self, state):
+        self._extra = None
+        self.update(state)
+
+def make_record_class(name: str, fields: Sequence[str], interned: Iterable[str] = (), module: Optional[str] = None):
+    """
+    Creates a CompactRecord subclass with one slot per field. Pass `module` (the
+    caller's __name__) and bind the result to the same global name so records pickle.
+    """
+    fields = tuple(fields)
+    clashes = [f for f in fields if hasattr(CompactRecord, f)]
+    if clashes:
+        raise ValueError(f"{name}: field names clash with record methods: {', '.join(clashes)}")
+    namespace = {
+        "__slots__": fields,
+        "FIELDS": fields,
+        "INTERNED": frozenset(interned),
+        "_field_set": frozenset(fields),
+        "__module__": module or __name__,
+    }
+    return type(name, (CompactRecord,), namespace)
+
+def to_plain(value: Any) -> Any:
+    """Recursively turns records inside lists/dicts into plain dicts (JSON boundary)."""
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    return value
+
+def json_default(value: Any) -> Any:
+    """`default=` hook for json.dumps so records serialize as objects."""
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    return str(value)
+
+# --- Flat tag record (grid row / TagEntry) ---
+
+# Every TagEntry column except the project scope, plus keys the reader/grid use
+# that have no column of their own.
+TAG_FIELDS = [c.name for c in TagEntry.__table__.columns if c.name != "project_path"] + ["udt_type", "trend_stormethod"]
+
+TAG_INTERNED = [
+    "entry_type", "cluster", "type", "equipment", "var_unit", "var_eng_units", "var_format",
+    "var_raw_zero", "var_raw_full", "var_eng_zero", "var_eng_full", "historian", "linked", "editcode",
+    "trend_sample_per", "trend_type", "trend_files", "trend_time", "trend_period", "trend_priv", "trend_area",
+    "trend_stormethod", "trend_storage", "trend_cluster", "trend_equip", "trend_eng_units", "trend_format",
+    "alarm_category", "alarm_priv", "alarm_area", "alarm_help", "alarm_cluster", "alarm_equip", "alarm_delay",
+    "custom1", "alarm_custom1", "udt_type",
+]
+
+TagRecord = make_record_class("TagRecord", TAG_FIELDS, TAG_INTERNED, module=__name__)
@@ -0,0 +1,336 @@
+
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from typing import Dict, Any, NamedTuple, Optional, Sequence, Tuple
+
+from services.tag_record import make_record_class
+
+# Single source of truth for the DBF layouts, how each DBF field maps onto the
+# flat grid / TagEntry model, and the API aliases of every TagEntry column.
+# The reader, expander, writer and the save/state endpoints all use mappers
+# compiled from these tables instead of hand-written field lists.
+
+class DbfField(NamedTuple):
+    name: str # DBF column
+    type: str
+    length: int
+    flat: str # Grid key the column round-trips with (reader output, imported rows)
+    default: Any = "" # Used when `flat` is missing from an entry (or the column from a DBF)
+    generated: Optional[Tuple[str, Any]] = None # (key, default) used instead for rows that are not imported
+    fallback: Optional[str] = None # Key used when the value is empty (e.g. trend NAME -> name)
+
+def _field(name, dbf_type, length, flat, default="", generated=None, fallback=None):
+    return DbfField(name, dbf_type, length, flat, default, generated, fallback)
+
+DBF_FIELDS = {
+    "variable": [
+        _field("NAME", "C", 79, "name"),
+        _field("TYPE", "C", 16, "type", "DIGITAL"),
+        _field("UNIT", "C", 31, "var_unit"),
+        _field("ADDR", "C", 254, "var_addr"),
+        _field("RAW_ZERO", "C", 11, "var_raw_zero"),
+        _field("RAW_FULL", "C", 11, "var_raw_full"),
+        _field("ENG_ZERO", "C", 11, "var_eng_zero"),
+        _field("ENG_FULL", "C", 11, "var_eng_full"),
+        _field("ENG_UNITS", "C", 8, "var_eng_units"),
+        _field("FORMAT", "C", 11, "var_format"),
+        _field("COMMENT", "C", 254, "description"), # Description maps to Variable Comment
+        _field("EDITCODE", "C", 16, "editcode"),
+        _field("LINKED", "C", 1, "linked"),
+        _field("OID", "C", 10, "oid"),
+        _field("REF1", "C", 11, "ref1"),
+        _field("REF2", "C", 11, "ref2"),
+        _field("DEADBAND", "C", 11, "deadband"),
+        _field("CUSTOM", "C", 128, "custom"),
+        _field("TAGGENLINK", "C", 32, "taggenlink"),
+        _field("CLUSTER", "C", 16, "cluster", "Cluster1"),
+        _field("EQUIP", "C", 254, "equipment"),
+        _field("ITEM", "C", 63, "item"), # Item often blank for single tags
+        _field("HISTORIAN", "C", 6, "historian"),
+    ] + [_field(f"CUSTOM{i}", "C", 254, f"custom{i}") for i in range(1, 9)] + [
+        _field("WRITEROLES", "C", 254, "write_roles"),
+        _field("GUID", "C", 36, "guid"),
+    ],
+
+    # Imported rows use the exact trend_* values, new rows fall back to the shared
+    # var_* fields and defaults (`generated`)
+    "trend": [
+        _field("NAME", "C", 79, "trend_name", fallback="name"),
+        _field("EXPR", "C", 254, "trend_expr", fallback="name"),
+        _field("TRIG", "C", 254, "trend_trig"),
+        _field("SAMPLEPER", "C", 16, "trend_sample_per", None, ("trend_sample_per", "1")),
+        _field("PRIV", "C", 16, "trend_priv"),
+        _field("AREA", "C", 16, "trend_area"),
+        _field("ENG_UNITS", "C", 8, "trend_eng_units", generated=("var_eng_units", "")),
+        _field("FORMAT", "C", 11, "trend_format", generated=("var_format", "")),
+        _field("FILENAME", "C", 253, "trend_filename"),
+        _field("FILES", "C", 4, "trend_files", None, ("trend_files", "2")),
+        _field("TIME", "C", 32, "trend_time"),
+        _field("PERIOD", "C", 32, "trend_period"),
+        _field("COMMENT", "C", 254, "trend_comment", generated=("description", "")),
+        _field("TYPE", "C", 32, "trend_type", None, ("trend_type", "TRN_PERIODIC")),
+        _field("SPCFLAG", "C", 4, "trend_spcflag"),
+        _field("LSL", "C", 16, "trend_lsl"),
+        _field("USL", "C", 16, "trend_usl"),
+        _field("SUBGRPSIZE", "C", 8, "trend_subgrpsize"),
+        _field("XDOUBLEBAR", "C", 16, "trend_xdoublebar"),
+        _field("RANGE", "C", 16, "trend_range"),
+        _field("SDEVIATION", "C", 16, "trend_sdeviation"),
+        _field("STORMETHOD", "C", 64, "trend_stormethod", None, ("trend_stormethod", "Scaled")),
+        _field("CLUSTER", "C", 16, "trend_cluster", generated=("cluster", "")),
+        _field("TAGGENLINK", "C", 32, "trend_taggenlink", generated=("taggenlink", "")),
+        _field("EDITCODE", "C", 16, "trend_editcode", generated=("editcode", "")),
+        _field("LINKED", "C", 1, "trend_linked", generated=("linked", "")),
+        _field("DEADBAND", "C", 16, "trend_deadband", generated=("deadband", "")),
+        _field("EQUIP", "C", 254, "trend_equip", generated=("equipment", "")),
+        _field("ITEM", "C", 63, "trend_item", generated=("item", "")),
+        _field("HISTORIAN", "C", 6, "trend_historian", generated=("historian", "")),
+        _field("ENG_ZERO", "C", 11, "trend_eng_zero", generated=("var_eng_zero", "")),
+        _field("ENG_FULL", "C", 11, "trend_eng_full", generated=("var_eng_full", "")),
+    ],
+
+    "digalm": [
+        _field("TAG", "C", 79, "alarm_tag", fallback="name"),
+        _field("NAME", "C", 79, "alarm_name", fallback="name"),
+        _field("DESC", "C", 254, "alarm_desc", fallback="description"),
+        _field("VAR_A", "C", 254, "alarm_var_a", fallback="name"),
+        _field("VAR_B", "C", 254, "alarm_var_b"),
+        _field("CATEGORY", "C", 16, "alarm_category", None, ("alarm_category", "1")),
+        _field("HELP", "C", 64, "alarm_help"),
+        _field("PRIV", "C", 16, "alarm_priv"),
+        _field("AREA", "C", 16, "alarm_area"),
+        _field("COMMENT", "C", 254, "alarm_comment", generated=("description", "")),
+        _field("SEQUENCE", "C", 16, "alarm_sequence"),
+        _field("DELAY", "C", 16, "alarm_delay"),
+    ] + [_field(f"CUSTOM{i}", "C", 64, f"alarm_custom{i}", generated=(f"custom{i}", "")) for i in range(1, 9)] + [
+        _field("CLUSTER", "C", 16, "alarm_cluster", generated=("cluster", "")),
+        _field("TAGGENLINK", "C", 32, "alarm_taggenlink", generated=("taggenlink", "")),
+        _field("PAGING", "C", 8, "alarm_paging"),
+        _field("PAGINGGRP", "C", 80, "alarm_paginggrp"),
+        _field("EDITCODE", "C", 16, "alarm_editcode", generated=("editcode", "")),
+        _field("LINKED", "C", 1, "alarm_linked", generated=("linked", "")),
+        _field("EQUIP", "C", 254, "alarm_equip", generated=("equipment", "")),
+        _field("ITEM", "C", 63, "alarm_item", generated=("item", "")),
+        _field("HISTORIAN", "C", 6, "alarm_historian", generated=("historian", "")),
+    ],
+}
+
+# Schemas derived from example files (Field Name, Type, Length)
+DBF_SCHEMAS = {t: [(f.name, f.type, f.length) for f in fields] for t, fields in DBF_FIELDS.items()}
+DBF_FIELD_NAMES = {t: [f.name for f in fields] for t, fields in DBF_FIELDS.items()}
+DBF_KEY_FIELDS = {"variable": "NAME", "trend": "NAME", "digalm": "TAG"}
+
+# Values of these fields repeat across thousands of rows, so they are interned on read
+DBF_INTERNED = [
+    "TYPE", "UNIT", "CLUSTER", "EQUIP", "ENG_UNITS", "FORMAT", "RAW_ZERO", "RAW_FULL", "ENG_ZERO", "ENG_FULL",
+    "EDITCODE", "LINKED", "HISTORIAN", "SAMPLEPER", "PRIV", "AREA", "FILES", "TIME", "PERIOD", "STORMETHOD",
+    "TRIG", "CATEGORY", "HELP", "DELAY", "PAGING", "PAGINGGRP", "CUSTOM1", "WRITEROLES",
+]
+
+# One compact record type per DBF (see services/tag_record.py)
+VariableRecord = make_record_class("VariableRecord", DBF_FIELD_NAMES["variable"], DBF_INTERNED, module=__name__)
+TrendRecord = make_record_class("TrendRecord", DBF_FIELD_NAMES["trend"], DBF_INTERNED, module=__name__)
+DigalmRecord = make_record_class("DigalmRecord", DBF_FIELD_NAMES["digalm"], DBF_INTERNED, module=__name__)
+GenericDbfRecord = make_record_class("GenericDbfRecord", [], DBF_INTERNED, module=__name__)
+
+DBF_RECORD_TYPES = {"variable": VariableRecord, "trend": TrendRecord, "digalm": DigalmRecord}
+# Record -> value tuple in schema order (records built by the expander have every slot set)
+DBF_VALUE_GETTERS = {t: attrgetter(*names) for t, names in DBF_FIELD_NAMES.items()}
+
+# --- TagEntry columns <-> API keys ---
+
+class ApiField(NamedTuple):
+    column: str # TagEntry column
+    aliases: Tuple[str, ...] # Keys accepted on save, first non-empty wins
+    exports: Tuple[str, ...] # Keys emitted by /api/state
+    empty: Any = "" # Stored when no alias has a value
+
+def _api(column, *aliases, exports=None, empty=""):
+    aliases = aliases or (column,)
+    return ApiField(column, tuple(aliases), tuple(exports or aliases), empty)
+
+# `id` is handled by the endpoints, as is `type` for udt_instance rows (it holds the template name)
+API_FIELDS = [
+    _api("entry_type", empty="single"),
+    _api("is_manual_override", empty=False),
+    _api("is_expanded", empty=False),
+
+    # Identity
+    _api("name", "citectName", "name"),
+    _api("cluster"),
+    _api("type", "dataType", "type", "TYPE", exports=("type",)),
+    _api("description", "description", "comment", "COMMENT", exports=("description",)),
+    _api("equipment"),
+    _api("item"),
+
+    # Variable
+    _api("var_addr", "address", "var_addr"),
+    _api("var_unit", "unit", "var_unit"),
+    _api("var_eng_units", "engUnits", "var_eng_units"),
+    _api("var_eng_zero", "engZero", "var_eng_zero"),
+    _api("var_eng_full", "engFull", "var_eng_full"),
+    _api("var_format", "format", "var_format"),
+    _api("var_raw_zero", "rawZero", "var_raw_zero"),
+    _api("var_raw_full", "rawFull", "var_raw_full"),
+    _api("editcode", "editCode", "editcode"),
+    _api("linked"), _api("oid"), _api("ref1"), _api("ref2"), _api("deadband"),
+    _api("custom"), _api("taggenlink", "tagGenLink", "taggenlink"), _api("historian"),
+    _api("write_roles", "writeRoles", "write_roles"),
+    _api("guid"),
+] + [_api(f"custom{i}") for i in range(1, 9)] + [
+
+    # Trend
+    _api("is_trend", "isTrend", "is_trend", empty=False),
+    _api("trend_name", "trendName", "trend_name"),
+    _api("trend_expr"),
+    _api("trend_sample_per", "samplePeriod", "trend_sample_per"),
+    _api("trend_type", "trendType", "trend_type"),
+    _api("trend_filename", "trendFilename", "trend_filename"),
+    _api("trend_storage", "trendStorage", "trend_storage", "trend_stormethod"),
+    _api("trend_files", "trendFiles", "trend_files"),
+    _api("trend_trig"), _api("trend_priv"), _api("trend_area"), _api("trend_time"),
+    _api("trend_period_rec", "trend_period_rec", "trend_period"),
+] + [_api(f"trend_{f}") for f in (
+    "eng_units", "format", "eng_zero", "eng_full", "comment", "cluster", "taggenlink", "editcode",
+    "linked", "deadband", "equip", "item", "historian",
+    "spcflag", "lsl", "usl", "subgrpsize", "xdoublebar", "range", "sdeviation",
+)] + [
+
+    # Alarm
+    _api("is_alarm", "isAlarm", "is_alarm", empty=False),
+    _api("alarm_tag", "alarm_tag", "alarmTag"),
+    _api("alarm_name", "alarmName", "alarm_name"),
+    _api("alarm_category", "alarmCategory", "alarm_category"),
+    _api("alarm_help", "alarm_help", "alarmHelp", exports=("alarm_help",)),
+    _api("alarm_area", "alarm_area", "alarmArea", exports=("alarm_area",)),
+] + [_api(f"alarm_{f}") for f in (
+    "desc", "var_a", "var_b", "priv", "priority", "sequence", "delay", "paging", "paginggrp",
+    "comment", "cluster", "taggenlink", "editcode", "linked", "equip", "item", "historian",
+)] + [_api(f"alarm_custom{i}") for i in range(1, 9)]
+
+# --- Compiled mappers ---
+
+class FieldMapper:
+    """
+    Converts a mapping into a tuple of target values with one dict merge and one
+    itemgetter call; only targets with several candidate keys need a Python step.
+
+    Each target reads `keys` in order and takes the first truthy value, otherwise the
+    value of the last key. Missing keys read as their entry in `defaults`. When
+    `empty` is given per target, a falsy result is replaced by it.
+    """
+    def __init__(self, targets: Sequence[str], keys: Sequence[Sequence[str]], defaults: Dict[str, Any],
+                 empty: Optional[Sequence[Any]] = None):
+        self.targets = tuple(targets)
+        self._defaults = dict(defaults)
+        self._getter = _tuple_getter([k[-1] for k in keys])
+        self._chains = [(i, tuple(k[:-1])) for i, k in enumerate(keys) if len(k) > 1]
+        self._empty = None if empty is None else [(i, e) for i, e in enumerate(empty)]
+
+    def __call__(self, source) -> Sequence[Any]:
+        merged = {**self._defaults, **source}
+        values = self._getter(merged)
+        if not self._chains and self._empty is None:
+            return values
+        values = list(values)
+        for i, keys in self._chains:
+            for key in keys:
+                value = merged[key]
+                if value:
+                    values[i] = value
+                    break
+        if self._empty is not None:
+            for i, empty in self._empty:
+                if not values[i]:
+                    values[i] = empty
+        return values
+
+    def to_dict(self, source) -> Dict[str, Any]:
+        return dict(zip(self.targets, self(source)))
+
+def _tuple_getter(keys: Sequence[Any]):
+    """itemgetter that always returns a tuple (even for a single key)."""
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda source: (source[key],)
+    return itemgetter(*keys)
+
+def _merge_default(defaults: Dict[str, Any], key: str, value: Any, context: str):
+    if key in defaults and defaults[key] != value:
+        raise ValueError(f"{context}: conflicting defaults for '{key}' ({defaults[key]!r} / {value!r})")
+    defaults[key] = value
+
+@lru_cache(maxsize=None)
+def flat_to_dbf(table_type: str, imported: bool = True) -> FieldMapper:
+    """
+    Grid entry -> DBF values in schema order (UDTExpander for single/member rows).
+    `imported` selects the exact flat keys; otherwise `generated` sources are used.
+    """
+    defaults: Dict[str, Any] = {}
+    keys = []
+    for f in DBF_FIELDS[table_type]:
+        key, default = (f.flat, f.default) if imported or f.generated is None else f.generated
+        _merge_default(defaults, key, default, f"{table_type}.{f.name}")
+        if f.fallback:
+            _merge_default(defaults, f.fallback, "", f"{table_type}.{f.name}")
+            keys.append((key, f.fallback))
+        else:
+            keys.append((key,))
+    return FieldMapper(DBF_FIELD_NAMES[table_type], keys, defaults)
+
+class DbfRowMapper:
+    """DBF row values (in the file's column order) -> flat grid keys, via one itemgetter."""
+    def __init__(self, table_type: str, field_names: Sequence[str]):
+        positions = {name: i for i, name in enumerate(field_names)}
+        self._positions = positions
+        self.width = len(field_names)
+        self.keys = tuple(f.flat for f in DBF_FIELDS[table_type])
+        # Columns missing from the file read a default appended after the row
+        self._missing = tuple(f.default if isinstance(f.default, str) else "" for f in DBF_FIELDS[table_type] if f.name not in positions)
+        index = []
+        extra = 0
+        for f in DBF_FIELDS[table_type]:
+            if f.name in positions:
+                index.append(positions[f.name])
+            else:
+                index.append(self.width + extra)
+                extra += 1
+        self._getter = _tuple_getter(index)
+
+    def column(self, values: Sequence[str], name: str) -> Optional[str]:
+        """Raw value of one DBF column (None if the file has no such column)."""
+        i = self._positions.get(name)
+        return values[i] if i is not None else None
+
+    def items(self, values: Sequence[str]):
+        if self._missing:
+            values = list(values) + list(self._missing)
+        return zip(self.keys, self._getter(values))
+
+@lru_cache(maxsize=32)
+def dbf_to_flat(table_type: str, field_names: Tuple[str, ...]) -> DbfRowMapper:
+    return DbfRowMapper(table_type, field_names)
+
+@lru_cache(maxsize=None)
+def api_to_columns() -> FieldMapper:
+    """Grid/API row -> TagEntry column values (save_tags_db)."""
+    defaults = {}
+    for f in API_FIELDS:
+        for alias in f.aliases:
+            _merge_default(defaults, alias, f.empty, f"save.{f.column}")
+    return FieldMapper([f.column for f in API_FIELDS], [f.aliases for f in API_FIELDS], defaults,
+                       empty=[f.empty for f in API_FIELDS])
+
+class StateMapper:
+    """TagEntry column tuple -> /api/state keys (every column under each of its exports)."""
+    def __init__(self, columns: Sequence[str]):
+        positions = {name: i for i, name in enumerate(columns)}
+        pairs = [(key, positions[f.column]) for f in API_FIELDS for key in f.exports]
+        self.keys = tuple(k for k, _ in pairs)
+        self._getter = _tuple_getter([i for _, i in pairs])
+
+    def values(self, row: Sequence[Any]) -> Tuple[Any, ...]:
+        return self._getter(row)
+
+    def __call__(self, row: Sequence[Any]) -> Dict[str, Any]:
+        return dict(zip(self.keys, self._getter(row)))
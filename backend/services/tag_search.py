@@ -0,0 +1,195 @@
+
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.metrics import metrics
+
+# Columns of tag_entries mirrored into the FTS5 index, with their bm25 weight (name ranks highest)
+SEARCH_COLUMNS = [
+    ("name", 10.0),
+    ("description", 3.0),
+    ("var_addr", 4.0),
+    ("equipment", 3.0),
+    ("item", 2.0),
+    ("alarm_desc", 1.0),
+]
+SEARCH_FIELDS = [c for c, _ in SEARCH_COLUMNS]
+
+SEARCH_TABLE = "tag_search"
+SEARCH_SOURCE = "tag_search_source"
+HIGHLIGHT = ("<mark>", "</mark>")
+MAX_LIMIT = 500
+# Above this many matches hits come back in id (grid) order instead of by bm25: ranking has to
+# score every match, which is what makes a one-word query over half the database slow
+RANK_MAX_MATCHES = 5000
+
+def project_key(project_path: str) -> str:
+    """Single-token stand-in for a project path, so scoping is part of the MATCH (the same as the SQL below)."""
+    return "prj" + project_path.encode("utf-8").hex().upper()
+
+_cols = ", ".join(SEARCH_FIELDS + ["project_key"])
+_new = ", ".join([f"new.{c}" for c in SEARCH_FIELDS] + ["'prj' || hex(new.project_path)"])
+_old = ", ".join([f"old.{c}" for c in SEARCH_FIELDS] + ["'prj' || hex(old.project_path)"])
+
+# External-content FTS5 index over tag_entries: the index stores only tokens, the text is read
+# back through a view by rowid (= tag_entries.id). The view adds `project_key`, the project
+# path as one token, so a project's hits are a term lookup instead of a row read per match.
+# Triggers keep the index in step with every write (save, cascading rename, bulk edits), so no
+# code path has to remember to re-index.
+# Tag names split on '_' / '.' ("LW_Sub1_Point7" -> lw, sub1, point7); 2- and 3-character
+# prefix indexes make the usual "pum*" queries index lookups instead of term scans.
+SEARCH_DDL = [
+    f"""CREATE VIEW IF NOT EXISTS {SEARCH_SOURCE} AS
+        SELECT id, {", ".join(SEARCH_FIELDS)}, 'prj' || hex(project_path) AS project_key FROM tag_entries""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        {_cols}, content='{SEARCH_SOURCE}', content_rowid='id', tokenize='unicode61', prefix='2 3')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON tag_entries BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON tag_entries BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF {", ".join(SEARCH_FIELDS)}, project_path ON tag_entries BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, {_cols}) VALUES ('delete', old.id, {_old});
+        INSERT INTO {SEARCH_TABLE}(rowid, {_cols}) VALUES (new.id, {_new});
+    END""",
+]
+
+def ensure_search_index(engine) -> bool:
+    """
+    Creates the FTS5 index and its triggers if missing (and indexes rows saved before it existed).
+    Returns False, without failing start-up, when the SQLite build has no FTS5.
+    """
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": SEARCH_TABLE}).first()
+            for statement in SEARCH_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+        return True
+    except Exception as e:
+        print(f"Full-text search disabled: {e}")
+        return False
+
+_PHRASE = re.compile(r'"([^"]*)"|(\S+)')
+# What unicode61 indexes as one token ('_', '.', ':' ... separate tokens)
+_WORD = re.compile(r"[^\W_]+")
+_RAW_TERM = re.compile(r'"([^"]*)"(\*?)|([^\W_]+)(\*?)')
+_RAW_OPERATORS = frozenset(("AND", "OR", "NOT", "NEAR"))
+
+def build_query(query: str, prefix: bool = True) -> str:
+    """
+    User input -> FTS5 MATCH expression. "quoted text" is a phrase, every other word is a
+    term (a prefix with `prefix`); all of them must match. Words are quoted, so FTS5
+    operators / punctuation in the input are taken literally.
+    """
+    parts = []
+    for phrase, word in _PHRASE.findall(query):
+        if phrase:
+            parts.append('"' + phrase.replace('"', '""') + '"')
+        elif word:
+            parts.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(parts)
+
+def query_tokens(query: str, prefix: bool = True, raw: bool = False) -> List[Tuple[str, bool]]:
+    """(token, is_prefix) pairs of the searched words, lowercased as the index stores them."""
+    tokens = []
+    if raw:
+        for phrase, phrase_star, word, word_star in _RAW_TERM.findall(query):
+            if word and word in _RAW_OPERATORS:
+                continue
+            words = _WORD.findall(phrase or word)
+            tokens += [(w.lower(), bool(phrase_star or word_star) and i == len(words) - 1) for i, w in enumerate(words)]
+        return tokens
+    for phrase, word in _PHRASE.findall(query):
+        words = _WORD.findall(phrase or word)
+        tokens += [(w.lower(), prefix and not phrase and i == len(words) - 1) for i, w in enumerate(words)]
+    return tokens
+
+def highlighter(tokens: List[Tuple[str, bool]]):
+    """text -> text with every token matching one of `tokens` wrapped in HIGHLIGHT, or None if nothing matched."""
+    exact = {t for t, is_prefix in tokens if not is_prefix}
+    prefixes = tuple(t for t, is_prefix in tokens if is_prefix)
+
+    def mark(match):
+        token = match.group(0).lower()
+        if token in exact or token.startswith(prefixes):
+            return HIGHLIGHT[0] + match.group(0) + HIGHLIGHT[1]
+        return match.group(0)
+
+    def highlight(value: str) -> Optional[str]:
+        if not value:
+            return None
+        marked = _WORD.sub(mark, value)
+        return marked if marked != value else None
+    return highlight
+
+def search(db: Session, project_path: str, query: str, limit: int = 50, offset: int = 0, fields: Optional[List[str]] = None,
+           prefix: bool = True, raw: bool = False) -> Dict[str, Any]:
+    """
+    Full-text search over one project's tags, best bm25 match first.
+
+    `fields` restricts matching to some of SEARCH_FIELDS; `raw` passes `query` to FTS5
+    unchanged (NEAR, OR, column filters, ...). Each hit carries its id, the indexed
+    columns, the entry type and the columns whose text matched, highlighted.
+    """
+    terms = query if raw else build_query(query, prefix)
+    if not terms.strip():
+        return {"query": query, "match": "", "total": 0, "ranked": False, "items": []}
+    fields = fields or SEARCH_FIELDS
+    unknown = [f for f in fields if f not in SEARCH_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown search field(s): {', '.join(unknown)}")
+    match = f"{{{' '.join(fields)}}} : ({terms})"
+    params = {"match": match, "scoped": f'project_key : "{project_key(project_path)}" AND {match}', "project": project_path,
+              "limit": max(1, min(limit, MAX_LIMIT)), "offset": max(offset, 0)}
+    weights = ", ".join(str(w) for _, w in SEARCH_COLUMNS) + ", 0.0"
+
+    with metrics.timer("search"):
+        try:
+            total = db.execute(text(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :scoped"), params).scalar()
+            ranked = total <= RANK_MAX_MATCHES
+            if ranked:
+                # Scored on the terms alone: with the project token in the MATCH, bm25 would walk
+                # that token's whole doclist for its statistics
+                hits = db.execute(text(f"""
+                    SELECT s.rowid, bm25({SEARCH_TABLE}, {weights}) AS score
+                    FROM {SEARCH_TABLE} s JOIN tag_entries e ON e.id = s.rowid
+                    WHERE {SEARCH_TABLE} MATCH :match AND e.project_path = :project
+                    ORDER BY score LIMIT :limit OFFSET :offset"""), params).all()
+            else:
+                hits = db.execute(text(f"""
+                    SELECT rowid, NULL FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :scoped
+                    ORDER BY rowid LIMIT :limit OFFSET :offset"""), params).all()
+        except Exception as e:
+            # Malformed raw queries surface as sqlite3.OperationalError ("fts5: syntax error ...")
+            raise ValueError(f"Invalid search query: {getattr(e, 'orig', e)}")
+
+        # Content is only read for the page
+        rows = {}
+        if hits:
+            ids = ", ".join(str(int(rowid)) for rowid, _ in hits)
+            rows = {r[0]: r for r in db.execute(text(f"SELECT id, entry_type, {', '.join(SEARCH_FIELDS)} FROM tag_entries WHERE id IN ({ids})"))}
+
+    highlight = highlighter(query_tokens(query, prefix, raw))
+    searched = set(fields)
+    items = []
+    for rowid, score in hits:
+        row = rows.get(rowid)
+        if row is None:
+            continue
+        values = {c: row[2 + i] or "" for i, c in enumerate(SEARCH_FIELDS)}
+        marked = {c: highlight(v) for c, v in values.items() if c in searched}
+        items.append({
+            "id": str(row[0]),
+            "entry_type": row[1],
+            **values,
+            "highlights": {c: h for c, h in marked.items() if h},
+            "rank": round(score, 4) if score is not None else None,
+        })
+    metrics.inc("taggen_search_queries_total")
+    return {"query": query, "match": terms, "total": total, "ranked": ranked, "items": items}
@@ -0,0 +1,244 @@
+
+import datetime
+import json
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from models import TagEntry, ProjectState, UdtTemplate
+from services.tag_schema import API_FIELDS, StateMapper, api_to_columns
+
+# Columns loaded for /api/state (plain tuples, no ORM instances)
+STATE_FIELDS = ["id"] + [f.column for f in API_FIELDS] + ["version"]
+STATE_COLUMNS = [getattr(TagEntry, c) for c in STATE_FIELDS]
+state_mapper = StateMapper(STATE_FIELDS)
+# id as string, udt_type = template name of udt_instance rows, version = revision of the row's last change
+STATE_KEYS = state_mapper.keys + ("id", "udt_type", "version")
+# TagEntry column -> the /api/state keys it shows up under (live deltas send only the changed ones)
+COLUMN_KEYS = {f.column: f.exports for f in API_FIELDS}
+COLUMN_KEYS["type"] += ("udt_type",)
+COLUMN_KEYS["entry_type"] += ("udt_type",)
+
+def state_row(row) -> tuple:
+    """One STATE_COLUMNS row -> values in STATE_KEYS order."""
+    return state_mapper.values(row) + (str(row.id), row.type if row.entry_type == "udt_instance" else "", row.version or 0)
+
+def iter_state_rows(db: Session, project_path: str) -> Iterator[tuple]:
+    """Saved tags of a project as STATE_KEYS tuples, fetched in batches."""
+    for row in db.query(*STATE_COLUMNS).filter(TagEntry.project_path == project_path).yield_per(2000):
+        yield state_row(row)
+
+def iter_saved_tags(session_factory, project_path: str) -> Iterator[Dict[str, Any]]:
+    """Saved tags as /api/state dicts, lazily, on a session of their own (safe in job threads / worker processes)."""
+    db = session_factory()
+    try:
+        for values in iter_state_rows(db, project_path):
+            yield dict(zip(STATE_KEYS, values))
+    finally:
+        db.close()
+
+class RowVersionConflict(Exception):
+    """Saved rows changed by another writer since the client loaded them (optimistic version check)."""
+    def __init__(self, conflicts: List[Dict[str, Any]], revision: int):
+        super().__init__(f"{len(conflicts)} tag(s) were changed by someone else since revision {min(c['expected'] for c in conflicts)}. "
+                         "Reload them and save again.")
+        self.conflicts = conflicts
+        self.revision = revision
+
+def current_revision(db: Session, project_path: str) -> int:
+    """Revision of the project's saved tags (0 before the first versioned write)."""
+    return db.query(ProjectState.revision).filter(ProjectState.project_path == project_path).scalar() or 0
+
+def next_revision(db: Session, project_path: str) -> int:
+    """The revision a write is about to stamp on the rows it changes (callers hold the project's write lock)."""
+    return current_revision(db, project_path) + 1
+
+def claim_revision(db: Session, project_path: str, revision: int) -> ProjectState:
+    """Records `revision` as the project's current one (in the caller's transaction)."""
+    state = db.query(ProjectState).filter(ProjectState.project_path == project_path).first()
+    if state is None:
+        state = ProjectState(project_path=project_path, tags_json="[]", updated_at=datetime.datetime.now().isoformat())
+        db.add(state)
+    state.revision = revision
+    return state
+
+# Columns a save compares / writes
+SAVE_COLUMNS = [f.column for f in API_FIELDS]
+_SAVE_QUERY = [TagEntry.id, TagEntry.version] + [getattr(TagEntry, c) for c in SAVE_COLUMNS]
+_SAVE_INDEX = {c: i for i, c in enumerate(SAVE_COLUMNS)}
+_NAME, _TYPE, _ENTRY_TYPE = _SAVE_INDEX["name"], _SAVE_INDEX["type"], _SAVE_INDEX["entry_type"]
+_CONFLICT_SAMPLE = 50
+
+def _client_id(tag: Dict[str, Any]):
+    value = tag.get("id")
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _client_version(tag: Dict[str, Any], base_revision: Optional[int]) -> Optional[int]:
+    value = tag.get("version")
+    if value is None or value == "":
+        return base_revision
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return base_revision
+
+def _same(old, new) -> bool:
+    # NULL (rows written outside the save) and "" are the same empty cell
+    return old == new or (old is None and new == "") or (old == "" and new is None)
+
+def sync_tags(db: Session, project_path: str, tags: List[Dict[str, Any]], base_revision: Optional[int] = None,
+              commit: bool = True) -> Dict[str, Any]:
+    """
+    Full-Fidelity Save to SQLite.
+    Makes the project's saved tags equal to `tags` (grid order) while keeping row ids stable:
+    incoming tags are matched to saved rows by `id`, then by name, and only rows whose values
+    changed are written. Every written row gets the new project revision as its `version`.
+
+    Optimistic checks: a tag that carries `version` (or, without one, the request's
+    `base_revision`) must not overwrite a row changed after that revision, and with
+    `base_revision` rows added by someone else since then are not deleted. Any such row
+    makes the whole save fail with RowVersionConflict before anything is written.
+    With commit=False the changes stay in the caller's transaction (history, references).
+
+    Returns {count, revision, previous, rows [(id, version) per tag, in request order],
+    added [(client id, id)], updated {id: columns}, deleted [ids]}.
+    """
+    to_columns = api_to_columns()
+    existing = {}
+    by_name: Dict[str, List[int]] = {}
+    for row in db.query(*_SAVE_QUERY).filter(TagEntry.project_path == project_path).order_by(TagEntry.id).yield_per(5000):
+        existing[row.id] = row
+        by_name.setdefault(row.name or "", []).append(row.id)
+
+    # Aliases (camelCase / snake_case / DBF names) are resolved by a mapper compiled
+    # from the schema registry; rows are compared as SAVE_COLUMNS tuples
+    incoming = []
+    for t in tags:
+        values = list(to_columns(t))
+        # Determine Entry Type
+        if t.get("type") == "udt_instance": values[_ENTRY_TYPE] = "udt_instance" # Check legacy key if needed
+        # UDT instances store their template name as the type
+        if values[_ENTRY_TYPE] == "udt_instance":
+            values[_TYPE] = t.get("udt_type") or ""
+        incoming.append(tuple(values))
+
+    # Match: ids first (so a name match never takes a row another tag refers to), then names in grid order
+    matched: List[Optional[int]] = [None] * len(tags)
+    claimed = set()
+    for i, t in enumerate(tags):
+        row_id = _client_id(t)
+        if row_id in existing and row_id not in claimed:
+            matched[i] = row_id
+            claimed.add(row_id)
+    for i, row in enumerate(incoming):
+        if matched[i] is None:
+            for row_id in by_name.get(row[_NAME] or "", ()):
+                if row_id not in claimed:
+                    matched[i] = row_id
+                    claimed.add(row_id)
+                    break
+
+    # Grid order is id order: rows stay in place while they keep ascending ids; a row after
+    # an inserted or moved one is re-inserted (new id) behind it
+    previous = current_revision(db, project_path)
+    revision = previous + 1
+    conflicts, updates, inserts, keep = [], [], [], set()
+    updated: Dict[int, List[str]] = {}
+    saved_rows: List[Optional[Tuple[int, int]]] = [None] * len(tags)
+    last_kept, appending = 0, False
+    for i, row in enumerate(incoming):
+        row_id = matched[i]
+        old = existing.get(row_id) if row_id is not None else None
+        if old is None:
+            changed = SAVE_COLUMNS
+        elif old[2:] == row:
+            changed = []
+        else:
+            changed = [c for c, before, after in zip(SAVE_COLUMNS, old[2:], row) if not _same(before, after)]
+        expected = _client_version(tags[i], base_revision)
+        if old is not None and changed and expected is not None and (old.version or 0) > expected:
+            conflicts.append({"id": str(row_id), "name": old.name, "expected": expected, "version": old.version})
+            continue
+        if old is not None and not appending and row_id > last_kept:
+            last_kept = row_id
+            keep.add(row_id)
+            if changed:
+                updates.append({"id": row_id, **{c: row[_SAVE_INDEX[c]] for c in changed}, "version": revision})
+                updated[row_id] = changed
+            saved_rows[i] = (row_id, revision if changed else old.version or 0)
+            continue
+        appending = True
+        inserts.append((i, {**dict(zip(SAVE_COLUMNS, row)), "project_path": project_path, "version": revision}))
+
+    deleted = [row_id for row_id in existing if row_id not in keep]
+    if base_revision is not None:
+        claimed_ids = {row_id for row_id in matched if row_id is not None}
+        conflicts += [{"id": str(row_id), "name": existing[row_id].name, "expected": base_revision, "version": existing[row_id].version}
+                      for row_id in deleted if row_id not in claimed_ids and (existing[row_id].version or 0) > base_revision]
+    if conflicts:
+        raise RowVersionConflict(conflicts[:_CONFLICT_SAMPLE], previous)
+
+    # Inserted before the deletes: SQLite hands out max(id) + 1, so a deleted id is not reused by the same save
+    added = []
+    if inserts:
+        # Core insert: batched multi-row INSERT .. RETURNING, ids in parameter order
+        ids = db.execute(insert(TagEntry.__table__).returning(TagEntry.id, sort_by_parameter_order=True), [row for _, row in inserts]).scalars().all()
+        for (i, _), row_id in zip(inserts, ids):
+            added.append((tags[i].get("id"), row_id))
+            saved_rows[i] = (row_id, revision)
+    if updates:
+        db.bulk_update_mappings(TagEntry, updates)
+    for i in range(0, len(deleted), 500):
+        db.query(TagEntry).filter(TagEntry.id.in_(deleted[i:i + 500])).delete(synchronize_session=False)
+
+    # Update Project State (Timestamp); tags_json is kept in sync as a backup
+    state = claim_revision(db, project_path, revision if updates or inserts or deleted else previous)
+    state.updated_at = datetime.datetime.now().isoformat()
+    state.tags_json = json.dumps(tags)
+
+    if commit:
+        db.commit()
+    return {"count": len(tags), "revision": state.revision, "previous": previous, "rows": saved_rows,
+            "added": added, "updated": updated, "deleted": deleted}
+
+def save_tags(db: Session, project_path: str, tags: List[Dict[str, Any]]) -> int:
+    """
+    Full-Fidelity Save to SQLite (no version checks).
+    Replaces all tags for the given project and returns how many were stored.
+    """
+    return sync_tags(db, project_path, tags)["count"]
+
+@lru_cache(maxsize=1024)
+def parse_members(members_json: str) -> List[Dict[str, Any]]:
+    """A template's members_json, parsed once per distinct text (shared between loads: read-only)."""
+    return json.loads(members_json)
+
+def load_templates(db: Session, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """Built-in templates overlaid with the ones saved in the DB."""
+    # Start with defaults
+    templates = defaults.copy()
+
+    # Load from DB
+    db_templates = db.query(UdtTemplate).all()
+    for t in db_templates:
+        try:
+            members = parse_members(t.members_json)
+            # Ensure format matches what expander expects
+            templates[t.name] = {
+                "description": t.description,
+                "members": members
+            }
+        except:
+            continue
+    return templates
+
+def saved_projects(db: Session) -> List[str]:
+    """Every project path that has saved state."""
+    return [p for (p,) in db.query(ProjectState.project_path).order_by(ProjectState.project_path)]
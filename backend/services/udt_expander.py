@@ -1,10 +1,128 @@
 
-from typing import List, Dict, Any
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from services.tag_sanitizer import TagSanitizer
+from services.metrics import metrics
+from services.tag_record import CompactRecord
+from services.tag_schema import DBF_FIELD_NAMES, DBF_RECORD_TYPES, DBF_VALUE_GETTERS, VariableRecord, TrendRecord, DigalmRecord, flat_to_dbf
+from services.field_expressions import ExpressionError, compile_template, render
+
+# Parallel expansion: worker processes (TAGGEN_EXPAND_WORKERS, default one per core),
+# the entry count below which the pool start-up costs more than it saves, and entries per task
+EXPAND_WORKERS = int(os.environ.get("TAGGEN_EXPAND_WORKERS", "0")) or (os.cpu_count() or 1)
+PARALLEL_MIN_ENTRIES = 20000
+PARALLEL_CHUNK_SIZE = 5000
+# Worker processes start from a clean interpreter (forkserver where available, else spawn): forking
+# the server would copy its threads' locks and open SQLite connections into every worker
+POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+# Flattened member lists kept per (template, version)
+FLAT_CACHE_SIZE = 256
+PARENT_DESC = "{parent_desc}"
+
+class TemplateError(ValueError):
+    """A template member refers to a template that does not exist, or (through others) to its own template."""
+    pass
+
+def _members(template: Any) -> List[Dict[str, Any]]:
+    return template.get("members", []) if isinstance(template, dict) else []
+
+def template_closure(templates: Dict[str, Any], name: str) -> List[str]:
+    """
+    `name` and every template it nests, directly or not, in depth-first order.
+    Raises TemplateError on a missing template or a cycle (with the path that loops).
+    """
+    order = []
+    done = set()
+
+    def visit(current: str, path: List[str]):
+        if current in path:
+            raise TemplateError(f"Template cycle: {' -> '.join(path[path.index(current):] + [current])}")
+        if current in done:
+            return
+        if current not in templates:
+            raise TemplateError(f"Template '{path[-1]}' nests unknown template '{current}'" if path else f"Unknown template '{current}'")
+        for member in _members(templates[current]):
+            if member.get("template"):
+                visit(member["template"], path + [current])
+        done.add(current)
+        order.append(current)
+
+    visit(name, [])
+    return order
+
+def template_version(templates: Dict[str, Any], name: str) -> str:
+    """Content hash of a template and everything it nests: changes whenever its expansion can."""
+    closure = sorted(template_closure(templates, name))
+    text = json.dumps([[n, templates[n]] for n in closure], sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+def _compose(outer: Dict[str, Any], inner: Dict[str, Any]) -> Dict[str, Any]:
+    """A member of a nested template as seen from the outer one: suffix, address and comment prefixed."""
+    leaf = dict(inner)
+    leaf["suffix"] = f"{outer.get('suffix', '')}{inner.get('suffix', '')}"
+    leaf["address_offset"] = f"{outer.get('address_offset', '')}{inner.get('address_offset', '')}"
+    # "{parent_desc} Motor 1" + "{parent_desc} Run Status" -> "{parent_desc} Motor 1 Run Status"
+    leaf["comment_template"] = inner.get("comment_template", PARENT_DESC).replace(PARENT_DESC, outer.get("comment_template") or PARENT_DESC)
+    return leaf
+
+# Member keys that feed the member context (in evaluation order); every other string key is a plain field
+CONTEXT_KEYS = ("suffix", "item", "name", "address_offset", "address", "comment_template", "equip")
+
+class CompiledMember:
+    """
+    A template member with every string property compiled (services/field_expressions.py):
+    constants stay strings, expressions become functions; other values (numbers such as a
+    sample_period of 5) pass through unchanged. Optional keys beyond the classic ones:
+      name / address / item / equip   replace the generated tag name, full address, ITEM, EQUIP
+      fields: {variable|trend|digalm: {DBF_FIELD: expression}}   set any DBF field last
+    """
+    __slots__ = ("member", "suffix", "item", "name", "address_offset", "address", "comment", "equip", "constants", "dynamic", "fields")
+
+    def __init__(self, member: Dict[str, Any]):
+        self.member = member
+        compiled = {}
+        for key, value in member.items():
+            if isinstance(value, str) and key != "template":
+                try:
+                    compiled[key] = compile_template(value)
+                except ExpressionError as e:
+                    raise ExpressionError(f"Member {member.get('suffix', '')}, {key}: {e}")
+        self.suffix = compiled.get("suffix", "")
+        self.item = compiled.get("item")
+        self.name = compiled.get("name")
+        self.address_offset = compiled.get("address_offset", "")
+        self.address = compiled.get("address")
+        self.comment = compiled.get("comment_template", "")
+        self.equip = compiled.get("equip")
+        others = {k: v for k, v in compiled.items() if k not in CONTEXT_KEYS}
+        self.constants = {k: v for k, v in member.items() if not isinstance(v, str) and k not in CONTEXT_KEYS and k not in ("fields", "template")}
+        self.constants.update((k, v) for k, v in others.items() if v.__class__ is str)
+        self.dynamic = [(k, v) for k, v in others.items() if v.__class__ is not str]
+        self.fields = {}
+        for table_type, overrides in (member.get("fields") or {}).items():
+            if table_type not in DBF_FIELD_NAMES or not isinstance(overrides, dict):
+                raise ExpressionError(f"Member {member.get('suffix', '')}: 'fields' takes variable / trend / digalm field maps")
+            unknown = [f for f in overrides if f not in DBF_FIELD_NAMES[table_type]]
+            if unknown:
+                raise ExpressionError(f"Member {member.get('suffix', '')}: unknown {table_type} field(s) {', '.join(unknown)}")
+            try:
+                self.fields[table_type] = [(f, compile_template(str(v))) for f, v in overrides.items()]
+            except ExpressionError as e:
+                raise ExpressionError(f"Member {member.get('suffix', '')}, fields.{table_type}: {e}")
 
 class UDTExpander:
-    def __init__(self):
+    def __init__(self, workers: int = EXPAND_WORKERS, parallel_threshold: int = PARALLEL_MIN_ENTRIES):
         self.sanitizer = TagSanitizer()
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
         # Basic templates
         self.templates = {
             "Motor_Basic": {
@@ -58,50 +176,168 @@ class UDTExpander:
             }
         }
         
-        # Schemas for forcing full field presence (Copied from DBFWriter to ensure consistency)
-        self.schemas = {
-             "variable": [
-                "NAME", "TYPE", "UNIT", "ADDR", "RAW_ZERO", "RAW_FULL", "ENG_ZERO", "ENG_FULL",
-                "ENG_UNITS", "FORMAT", "COMMENT", "EDITCODE", "LINKED", "OID", "REF1", "REF2",
-                "DEADBAND", "CUSTOM", "TAGGENLINK", "CLUSTER", "EQUIP", "ITEM", "HISTORIAN",
-                "CUSTOM1", "CUSTOM2", "CUSTOM3", "CUSTOM4", "CUSTOM5", "CUSTOM6", "CUSTOM7", "CUSTOM8",
-                "WRITEROLES", "GUID"
-            ],
-            "trend": [
-                "NAME", "EXPR", "TRIG", "SAMPLEPER", "PRIV", "AREA", "ENG_UNITS", "FORMAT",
-                "FILENAME", "FILES", "TIME", "PERIOD", "COMMENT", "TYPE", "SPCFLAG", "LSL",
-                "USL", "SUBGRPSIZE", "XDOUBLEBAR", "RANGE", "SDEVIATION", "STORMETHOD", "CLUSTER", "TAGGENLINK",
-                "EDITCODE", "LINKED", "DEADBAND", "EQUIP", "ITEM", "HISTORIAN", "ENG_ZERO", "ENG_FULL"
-            ],
-             "digalm": [
-                "TAG", "NAME", "DESC", "VAR_A", "VAR_B", "CATEGORY", "HELP", "PRIV", "AREA",
-                "COMMENT", "SEQUENCE", "DELAY", "CUSTOM1", "CUSTOM2", "CUSTOM3", "CUSTOM4", "CUSTOM5",
-                "CUSTOM6", "CUSTOM7", "CUSTOM8", "CLUSTER", "TAGGENLINK", "PAGING", "PAGINGGRP", "EDITCODE",
-                "LINKED", "EQUIP", "ITEM", "HISTORIAN"
-            ]
-        }
+        # Schemas for forcing full field presence (shared registry, see services/tag_schema.py)
+        self.schemas = DBF_FIELD_NAMES
+
+        self._flat_cache = OrderedDict() # (template name, version) -> flattened members
+        self._compiled_cache = OrderedDict() # (template name, version) -> [CompiledMember]
+        self._flat_lock = threading.Lock()
 
-    def _get_default_record(self, schema_type: str) -> Dict[str, str]:
-        """Returns a dict with all schema fields initialized to empty string."""
-        return {field: "" for field in self.schemas.get(schema_type, [])}
+    def _get_default_record(self, schema_type: str) -> CompactRecord:
+        """Returns a record with all schema fields initialized to empty string."""
+        return DBF_RECORD_TYPES[schema_type].blank()
 
     def get_templates(self) -> List[str]:
         return list(self.templates.keys())
 
-    def expand_tags(self, tag_entries: List[Dict], override_templates: Dict[str, Any] = None) -> Dict[str, List[Dict]]:
+    def flatten(self, templates: Dict[str, Any], name: str) -> List[Dict[str, Any]]:
+        """
+        Leaf members of template `name`, with members that nest another template
+        ({"suffix", "address_offset", "comment_template", "template"}) replaced by that
+        template's own leaves, composed (see _compose). Memoized per template version, so a
+        deep hierarchy costs one hash per expand call once it has been flattened.
+        Raises TemplateError for cycles and missing templates.
+        """
+        key = (name, template_version(templates, name))
+        with self._flat_lock:
+            flat = self._flat_cache.get(key)
+            if flat is not None:
+                self._flat_cache.move_to_end(key)
+                return flat
+
+        flat = []
+        for member in _members(templates[name]):
+            if member.get("template"):
+                flat.extend(_compose(member, leaf) for leaf in self.flatten(templates, member["template"]))
+            else:
+                flat.append(member)
+        metrics.inc("taggen_templates_flattened_total")
+        with self._flat_lock:
+            self._flat_cache[key] = flat
+            while len(self._flat_cache) > FLAT_CACHE_SIZE:
+                self._flat_cache.popitem(last=False)
+        return flat
+
+    def compiled_members(self, templates: Dict[str, Any], name: str) -> List[CompiledMember]:
+        """
+        flatten() with every member's expressions compiled, memoized the same way: each
+        template version is parsed once, however many instances expand from it.
+        Raises TemplateError / ExpressionError (both ValueErrors).
+        """
+        key = (name, template_version(templates, name))
+        with self._flat_lock:
+            compiled = self._compiled_cache.get(key)
+            if compiled is not None:
+                self._compiled_cache.move_to_end(key)
+                return compiled
+        compiled = [CompiledMember(m) for m in self.flatten(templates, name)]
+        with self._flat_lock:
+            self._compiled_cache[key] = compiled
+            while len(self._compiled_cache) > FLAT_CACHE_SIZE:
+                self._compiled_cache.popitem(last=False)
+        return compiled
+
+    def expand_tags(self, tag_entries: List[Dict], override_templates: Dict[str, Any] = None, workers: Optional[int] = None) -> Dict[str, List[Dict]]:
         """
         Takes a list of 'TagEntry' dictionaries (Flattened Full-Fidelity Schema).
         Returns a dictionary of 'variable', 'trend', 'digalm' lists ready for DBF comparison/writing.
         
         This logic now respects 'is_manual_override'.
+
+        Lists of at least `parallel_threshold` entries are expanded on a process pool
+        (see _expand_parallel); the output is the same as the serial path, in the same order.
+        """
+        workers = self.workers if workers is None else workers
+        output = None
+        if workers > 1 and isinstance(tag_entries, list) and len(tag_entries) >= self.parallel_threshold:
+            output = self._expand_parallel(tag_entries, override_templates, workers)
+
+        if output is None:
+            output = {
+                "variable": [],
+                "trend": [],
+                "digalm": []
+            }
+            for table_type, record in self.iter_expand(tag_entries, override_templates):
+                output[table_type].append(record)
+
+        for table_type, records in output.items():
+            metrics.inc("taggen_records_expanded_total", len(records), table=table_type)
+        return output
+
+    def _expand_parallel(self, tag_entries: List[Dict], override_templates: Optional[Dict[str, Any]], workers: int) -> Optional[Dict[str, List[CompactRecord]]]:
+        """
+        Splits the entries into chunks and expands them on the shared process pool, at most
+        `workers` chunks at a time. Chunks carry only the key of the templates and sanitizer
+        rules: a worker that does not hold that set yet hands the chunk back, and it is sent
+        again with the set, which the worker then keeps (so each worker is primed once per
+        version). Records come back as value tuples and chunks are merged in input order.
+        Returns None (caller expands serially) if the pool cannot be used.
         """
         templates = override_templates if override_templates else self.templates
-        
+        config = pickle.dumps((templates, dict(self.sanitizer.replacements)), pickle.HIGHEST_PROTOCOL)
+        config_key = hashlib.sha1(config).hexdigest()
+        chunks = [tag_entries[i:i + PARALLEL_CHUNK_SIZE] for i in range(0, len(tag_entries), PARALLEL_CHUNK_SIZE)]
         output = {
             "variable": [],
             "trend": [],
             "digalm": []
         }
+
+        def merge(part):
+            for table_type, rows in part.items():
+                from_values = DBF_RECORD_TYPES[table_type].from_values
+                records = output[table_type]
+                for values, extra in rows:
+                    rec = from_values(values)
+                    if extra:
+                        rec._extra = extra
+                    records.append(rec)
+
+        def collect(pool):
+            future, chunk = pending.popleft()
+            part = future.result()
+            if part is None:
+                # That worker was not primed with this config yet
+                metrics.inc("taggen_expand_worker_primes_total")
+                future = pool.submit(_expand_chunk, config_key, chunk, config)
+                pending.appendleft((future, chunk))
+                part = future.result()
+                pending.popleft()
+            merge(part)
+
+        pending = deque()
+        try:
+            pool = expand_pool()
+            for chunk in chunks:
+                pending.append((pool.submit(_expand_chunk, config_key, chunk), chunk))
+                if len(pending) >= workers:
+                    collect(pool)
+            while pending:
+                collect(pool)
+        except (BrokenProcessPool, OSError) as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died: the next parallel call starts a new pool
+                shutdown_expand_pool()
+            print(f"Parallel expansion failed, expanding serially: {e}")
+            metrics.inc("taggen_expand_pool_fallbacks_total")
+            return None
+        finally:
+            # A template error raised by a worker: drop the chunks not started yet
+            for future, _ in pending:
+                future.cancel()
+        metrics.inc("taggen_expand_chunks_total", len(chunks))
+        return output
+
+    def iter_expand(self, tag_entries: Iterable[Dict], override_templates: Dict[str, Any] = None) -> Iterator[Tuple[str, CompactRecord]]:
+        """
+        Generator form of expand_tags: yields (table_type, record) one entry at a time,
+        so streaming callers never hold the whole expansion in memory.
+        """
+        templates = override_templates if override_templates else self.templates
+        suffixes = {} # member suffix -> sanitized, the same few suffixes repeat for every instance
+        flattened = {} # udt_type -> compiled leaf members (None: the template cannot be expanded)
+        sanitize = self.sanitizer.sanitize
         
         for entry in tag_entries:
             # --- COMMON IDENTITY ---
@@ -121,148 +357,47 @@ class UDTExpander:
             if entry_type == "single" or entry_type == "member":
                 
                 # 1. MAP FLAT -> VARIABLE DBF
-                var_rec = self._get_default_record("variable")
-                
-                # Explicit Mapping from Flat Model (var_*) to DBF
-                var_rec.update({
-                    "NAME": entry.get("name", ""),
-                    "TYPE": entry.get("type", "DIGITAL"),
-                    "UNIT": entry.get("var_unit", ""),
-                    "ADDR": entry.get("var_addr", ""),
-                    "RAW_ZERO": entry.get("var_raw_zero", ""),
-                    "RAW_FULL": entry.get("var_raw_full", ""),
-                    "ENG_ZERO": entry.get("var_eng_zero", ""),
-                    "ENG_FULL": entry.get("var_eng_full", ""),
-                    "ENG_UNITS": entry.get("var_eng_units", ""),
-                    "FORMAT": entry.get("var_format", ""),
-                    "COMMENT": entry.get("description", ""), # Description maps to Variable Comment
-                    "EDITCODE": entry.get("editcode", ""),
-                    "LINKED": entry.get("linked", ""),
-                    "OID": entry.get("oid", ""),
-                    "REF1": entry.get("ref1", ""), "REF2": entry.get("ref2", ""),
-                    "DEADBAND": entry.get("deadband", ""),
-                    "CUSTOM": entry.get("custom", ""),
-                    "TAGGENLINK": entry.get("taggenlink", ""),
-                    "CLUSTER": entry.get("cluster", "Cluster1"),
-                    "EQUIP": entry.get("equipment", ""),
-                    "ITEM": entry.get("item", ""), # Item often blank for single tags
-                    "HISTORIAN": entry.get("historian", ""),
-                    
-                    "CUSTOM1": entry.get("custom1", ""), "CUSTOM2": entry.get("custom2", ""),
-                    "CUSTOM3": entry.get("custom3", ""), "CUSTOM4": entry.get("custom4", ""),
-                    "CUSTOM5": entry.get("custom5", ""), "CUSTOM6": entry.get("custom6", ""),
-                    "CUSTOM7": entry.get("custom7", ""), "CUSTOM8": entry.get("custom8", ""),
-                    
-                    "WRITEROLES": entry.get("write_roles", ""),
-                    "GUID": entry.get("guid", "")
-                })
-                output["variable"].append(var_rec)
+                var_rec = VariableRecord.from_values(flat_to_dbf("variable")(entry))
+                yield "variable", var_rec
                 
                 # 2. MAP FLAT -> TREND DBF
                 # Only if is_trend is true
                 if entry.get("is_trend", False):
-                    trend_rec = self._get_default_record("trend")
-                    
                     # For imported records (manual override), use exact trend_* values
                     # For new records, fall back to shared var_* fields and defaults
                     is_imported = entry.get("is_manual_override", False)
-                    
-                    trend_rec.update({
-                        "NAME": entry.get("trend_name") or entry.get("name", ""),
-                        "EXPR": entry.get("trend_expr") or entry.get("name", ""),
-                        "TRIG": entry.get("trend_trig", ""),
-                        "SAMPLEPER": entry.get("trend_sample_per") if is_imported else entry.get("trend_sample_per", "1"),
-                        "PRIV": entry.get("trend_priv", ""),
-                        "AREA": entry.get("trend_area", ""),
-                        # For imported: use trend-specific values; else fallback to var_* 
-                        "ENG_UNITS": entry.get("trend_eng_units", "") if is_imported else entry.get("var_eng_units", ""),
-                        "FORMAT": entry.get("trend_format", "") if is_imported else entry.get("var_format", ""),
-                        "FILENAME": entry.get("trend_filename", ""),
-                        "FILES": entry.get("trend_files") if is_imported else entry.get("trend_files", "2"),
-                        "TIME": entry.get("trend_time", ""),
-                        "PERIOD": entry.get("trend_period", ""),
-                        "COMMENT": entry.get("trend_comment", "") if is_imported else entry.get("description", ""),
-                        "TYPE": entry.get("trend_type") if is_imported else entry.get("trend_type", "TRN_PERIODIC"),
-                        "SPCFLAG": entry.get("trend_spcflag", ""),
-                        "LSL": entry.get("trend_lsl", ""),
-                        "USL": entry.get("trend_usl", ""),
-                        "SUBGRPSIZE": entry.get("trend_subgrpsize", ""),
-                        "XDOUBLEBAR": entry.get("trend_xdoublebar", ""),
-                        "RANGE": entry.get("trend_range", ""),
-                        "SDEVIATION": entry.get("trend_sdeviation", ""),
-                        "STORMETHOD": entry.get("trend_stormethod") if is_imported else entry.get("trend_stormethod", "Scaled"),
-                        # For imported: use trend-specific shared fields
-                        "CLUSTER": entry.get("trend_cluster", "") if is_imported else entry.get("cluster", ""),
-                        "TAGGENLINK": entry.get("trend_taggenlink", "") if is_imported else entry.get("taggenlink", ""),
-                        "EDITCODE": entry.get("trend_editcode", "") if is_imported else entry.get("editcode", ""),
-                        "LINKED": entry.get("trend_linked", "") if is_imported else entry.get("linked", ""),
-                        "DEADBAND": entry.get("trend_deadband", "") if is_imported else entry.get("deadband", ""),
-                        "EQUIP": entry.get("trend_equip", "") if is_imported else entry.get("equipment", ""),
-                        "ITEM": entry.get("trend_item", "") if is_imported else entry.get("item", ""),
-                        "HISTORIAN": entry.get("trend_historian", "") if is_imported else entry.get("historian", ""),
-                        "ENG_ZERO": entry.get("trend_eng_zero", "") if is_imported else entry.get("var_eng_zero", ""),
-                        "ENG_FULL": entry.get("trend_eng_full", "") if is_imported else entry.get("var_eng_full", "")
-                    })
-                    output["trend"].append(trend_rec)
+                    trend_rec = TrendRecord.from_values(flat_to_dbf("trend", bool(is_imported))(entry))
+                    yield "trend", trend_rec
                     
                 # 3. MAP FLAT -> ALARM DBF
                 # Only if is_alarm is true
                 if entry.get("is_alarm", False):
-                    alm_rec = self._get_default_record("digalm")
-                    
                     # For imported records, use exact alarm_* values
                     # For new records, fall back to shared fields and defaults
                     is_imported = entry.get("is_manual_override", False)
-                    
-                    alm_rec.update({
-                        "TAG": entry.get("alarm_tag") or entry.get("name", ""),
-                        "NAME": entry.get("alarm_name") or entry.get("name", ""),
-                        "DESC": entry.get("alarm_desc") or entry.get("description", ""),
-                        "VAR_A": entry.get("alarm_var_a") or entry.get("name", ""),
-                        "VAR_B": entry.get("alarm_var_b", ""),
-                        "CATEGORY": entry.get("alarm_category") if is_imported else entry.get("alarm_category", "1"),
-                        "HELP": entry.get("alarm_help", ""),
-                        "PRIV": entry.get("alarm_priv", ""),
-                        "AREA": entry.get("alarm_area", ""),
-                        "COMMENT": entry.get("alarm_comment", "") if is_imported else entry.get("description", ""),
-                        "SEQUENCE": entry.get("alarm_sequence", ""),
-                        "DELAY": entry.get("alarm_delay", ""),
-                        # For imported: use alarm-specific custom fields
-                        "CUSTOM1": entry.get("alarm_custom1", "") if is_imported else entry.get("custom1", ""),
-                        "CUSTOM2": entry.get("alarm_custom2", "") if is_imported else entry.get("custom2", ""),
-                        "CUSTOM3": entry.get("alarm_custom3", "") if is_imported else entry.get("custom3", ""),
-                        "CUSTOM4": entry.get("alarm_custom4", "") if is_imported else entry.get("custom4", ""),
-                        "CUSTOM5": entry.get("alarm_custom5", "") if is_imported else entry.get("custom5", ""),
-                        "CUSTOM6": entry.get("alarm_custom6", "") if is_imported else entry.get("custom6", ""),
-                        "CUSTOM7": entry.get("alarm_custom7", "") if is_imported else entry.get("custom7", ""),
-                        "CUSTOM8": entry.get("alarm_custom8", "") if is_imported else entry.get("custom8", ""),
-                        # For imported: use alarm-specific shared fields
-                        "CLUSTER": entry.get("alarm_cluster", "") if is_imported else entry.get("cluster", ""),
-                        "TAGGENLINK": entry.get("alarm_taggenlink", "") if is_imported else entry.get("taggenlink", ""),
-                        "PAGING": entry.get("alarm_paging", ""),
-                        "PAGINGGRP": entry.get("alarm_paginggrp", ""),
-                        "EDITCODE": entry.get("alarm_editcode", "") if is_imported else entry.get("editcode", ""),
-                        "LINKED": entry.get("alarm_linked", "") if is_imported else entry.get("linked", ""),
-                        "EQUIP": entry.get("alarm_equip", "") if is_imported else entry.get("equipment", ""),
-                        "ITEM": entry.get("alarm_item", "") if is_imported else entry.get("item", ""),
-                        "HISTORIAN": entry.get("alarm_historian", "") if is_imported else entry.get("historian", "")
-                    })
-                    output["digalm"].append(alm_rec)
+                    alm_rec = DigalmRecord.from_values(flat_to_dbf("digalm", bool(is_imported))(entry))
+                    yield "digalm", alm_rec
 
             # --- UDT INSTANCE LOGIC ---
             elif entry_type == "udt_instance" and entry.get("udt_type") in templates:
-                # Retrieve Template
-                template = templates[entry["udt_type"]]
-                members = template.get("members", []) if isinstance(template, dict) else []
+                # Retrieve Template (nested templates flattened to their leaf members)
+                udt_type = entry["udt_type"]
+                if udt_type not in flattened:
+                    try:
+                        flattened[udt_type] = self.compiled_members(templates, udt_type)
+                    except ValueError as e:
+                        print(f"Skipping instances of {udt_type}: {e}")
+                        flattened[udt_type] = None
+                members = flattened[udt_type] or []
                 
                 # Identify Parent Props
                 parent_base = entry.get("name", "") # Prefix
                 parent_addr = entry.get("var_addr", "") # Base Address
-                parent_desc = entry.get("description", "")
                 cluster = entry.get("cluster", "Cluster1")
                 
                 # Iterate Members
-                for member in members:
+                for index, compiled in enumerate(members):
+                    member = compiled.member
                     # NOTE: In a Full-Fidelity system, the "Members" should theoretically already exist 
                     # as 'entry_type="member"' rows in the database/input list if they were previously generated.
                     # 
@@ -284,13 +419,35 @@ class UDTExpander:
                     
                     # Logic: Always generate unless collision? No, the Requirement is internal to Key.
                     
-                    # 1. Calculate Defaults
-                    sanitized_suffix = self.sanitizer.sanitize(member['suffix'])
-                    tag_name = f"{parent_base}{sanitized_suffix}"
-                    tag_addr = f"{parent_addr}{member['address_offset']}"
-                    tag_desc = member['comment_template'].format(parent_desc=parent_desc)
-                    equip_val = parent_base
-                    item_val = member['suffix'].lstrip('.')
+                    # 1. Calculate Defaults (member expressions see the instance columns and the member context)
+                    context = {"index": index, "number": index + 1}
+                    try:
+                        context["suffix"] = suffix = render(compiled.suffix, entry, context, sanitize)
+                        context["item"] = item_val = suffix.lstrip('.') if compiled.item is None else render(compiled.item, entry, context, sanitize)
+                        if compiled.name is None:
+                            sanitized_suffix = suffixes.get(suffix)
+                            if sanitized_suffix is None:
+                                sanitized_suffix = suffixes[suffix] = sanitize(suffix)
+                            tag_name = f"{parent_base}{sanitized_suffix}"
+                        else:
+                            tag_name = render(compiled.name, entry, context, sanitize)
+                        context["tag"] = tag_name
+                        if compiled.address is None:
+                            tag_addr = f"{parent_addr}{render(compiled.address_offset, entry, context, sanitize)}"
+                        else:
+                            tag_addr = render(compiled.address, entry, context, sanitize)
+                        context["addr"] = tag_addr
+                        context["desc"] = tag_desc = render(compiled.comment, entry, context, sanitize)
+                        equip_val = parent_base if compiled.equip is None else render(compiled.equip, entry, context, sanitize)
+                        values = compiled.constants
+                        if compiled.dynamic:
+                            values = dict(values)
+                            for key, template in compiled.dynamic:
+                                values[key] = render(template, entry, context, sanitize)
+                        overrides = {table_type: [(f, render(t, entry, context, sanitize)) for f, t in fields]
+                                     for table_type, fields in compiled.fields.items()} if compiled.fields else None
+                    except ExpressionError as e:
+                        raise ExpressionError(f"{udt_type} member {member.get('suffix', '')} of {parent_base}: {e}")
 
                     # Populate Virtual Record (Full Fidelity)
                     # We create a 'virtual' full record here, mimicking what we did for 'single' above.
@@ -298,7 +455,7 @@ class UDTExpander:
                     var_rec = self._get_default_record("variable")
                     var_rec.update({
                         "NAME": tag_name,
-                        "TYPE": member['type'],
+                        "TYPE": values.get("type", ""),
                         "UNIT": entry.get("var_unit", ""), # Inherit or default? Likely default or specific member property
                         "ADDR": tag_addr,
                         "COMMENT": tag_desc,
@@ -306,13 +463,15 @@ class UDTExpander:
                         "ITEM": item_val,
                         "CLUSTER": cluster,
                         
-                        "ENG_UNITS": member.get("engUnits", ""),
-                        "FORMAT": member.get("format", ""),
-                        "ENG_ZERO": member.get("engZero", ""),
-                        "ENG_FULL": member.get("engFull", ""),
+                        "ENG_UNITS": values.get("engUnits", ""),
+                        "FORMAT": values.get("format", ""),
+                        "ENG_ZERO": values.get("engZero", ""),
+                        "ENG_FULL": values.get("engFull", ""),
                         # ... other basic defaults empty
                     })
-                    output["variable"].append(var_rec)
+                    if overrides and "variable" in overrides:
+                        var_rec.update(overrides["variable"])
+                    yield "variable", var_rec
                     
                     # Trend (Virtual) - generate if template member has is_trend
                     if member.get("is_trend"):
@@ -320,20 +479,22 @@ class UDTExpander:
                         trend_rec.update({
                             "NAME": tag_name,
                             "EXPR": tag_name,
-                            "SAMPLEPER": member.get("sample_period", "1"),
-                            "TYPE": member.get("trend_type", "TRN_PERIODIC"),
+                            "SAMPLEPER": values.get("sample_period", "1"),
+                            "TYPE": values.get("trend_type", "TRN_PERIODIC"),
                             "COMMENT": tag_desc,
                             "EQUIP": equip_val,
                             "ITEM": item_val,
                             "CLUSTER": cluster,
                             "FILENAME": tag_name,
-                            "FILES": member.get("trend_files", "2"),
-                            "STORMETHOD": member.get("trend_storage", "Scaled"),
-                            "TRIG": member.get("trend_trigger", ""),
-                            "PRIV": member.get("trend_priv", ""),
-                            "AREA": member.get("trend_area", ""),
+                            "FILES": values.get("trend_files", "2"),
+                            "STORMETHOD": values.get("trend_storage", "Scaled"),
+                            "TRIG": values.get("trend_trigger", ""),
+                            "PRIV": values.get("trend_priv", ""),
+                            "AREA": values.get("trend_area", ""),
                         })
-                        output["trend"].append(trend_rec)
+                        if overrides and "trend" in overrides:
+                            trend_rec.update(overrides["trend"])
+                        yield "trend", trend_rec
 
                     # Alarm (Virtual) - generate if template member has is_alarm
                     if member.get("is_alarm"):
@@ -341,19 +502,74 @@ class UDTExpander:
                          alm_rec.update({
                             "TAG": tag_name,
                             "NAME": tag_name,
-                            "DESC": member.get("alarm_desc", tag_desc),
+                            "DESC": values.get("alarm_desc", tag_desc),
                             "VAR_A": tag_name,
-                            "CATEGORY": member.get("alarm_category", "1"),
+                            "CATEGORY": values.get("alarm_category", "1"),
 
-                            "AREA": member.get("alarm_area", ""),
+                            "AREA": values.get("alarm_area", ""),
                             "COMMENT": tag_desc,
                             "EQUIP": equip_val,
                             "ITEM": item_val,
                             "CLUSTER": cluster,
-                            "HELP": member.get("alarm_help", ""),
-                            "PRIV": member.get("alarm_priv", ""),
-                            "DELAY": member.get("alarm_delay", "0")
+                            "HELP": values.get("alarm_help", ""),
+                            "PRIV": values.get("alarm_priv", ""),
+                            "DELAY": values.get("alarm_delay", "0")
                         })
-                         output["digalm"].append(alm_rec)
-                         
-        return output
+                         if overrides and "digalm" in overrides:
+                             alm_rec.update(overrides["digalm"])
+                         yield "digalm", alm_rec
+
+# --- The shared pool behind _expand_parallel ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def expand_pool() -> ProcessPoolExecutor:
+    """The process pool parallel expansions share; started on first use (again after a shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXPAND_WORKERS, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+        return _pool
+
+def shutdown_expand_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# --- Worker side of _expand_parallel (module level so it pickles under spawn too) ---
+
+# Config sets a worker keeps (config_key -> (expander, templates)), a few so that projects
+# expanding at the same time do not keep re-priming each other's workers
+WORKER_CONFIGS = 4
+_worker_configs = OrderedDict()
+
+def _expand_chunk(config_key: str, entries: List[Dict], config: Optional[bytes] = None) -> Optional[Dict[str, List[tuple]]]:
+    """
+    Expands one chunk; records travel back as (values in schema order, extra fields or None).
+    Returns None, without expanding, when this worker does not hold `config_key` and no
+    `config` came with the chunk.
+    """
+    primed = _worker_configs.get(config_key)
+    if primed is None:
+        if config is None:
+            return None
+        templates, replacements = pickle.loads(config)
+        expander = UDTExpander(workers=1)
+        expander.sanitizer.replacements = replacements
+        primed = _worker_configs[config_key] = (expander, templates)
+        while len(_worker_configs) > WORKER_CONFIGS:
+            _worker_configs.popitem(last=False)
+    else:
+        _worker_configs.move_to_end(config_key)
+    expander, templates = primed
+    part = {
+        "variable": [],
+        "trend": [],
+        "digalm": []
+    }
+    for table_type, record in expander.iter_expand(entries, templates):
+        part[table_type].append((DBF_VALUE_GETTERS[table_type](record), record._extra))
+    return part
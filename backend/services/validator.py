@@ -0,0 +1,203 @@
+
+import os
+import time
+from collections import Counter
+from operator import attrgetter
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+import dbf
+from services.metrics import metrics
+from services.tag_schema import DBF_FIELDS, DBF_FIELD_NAMES, DBF_KEY_FIELDS
+from services.reference_graph import REFERENCE_FIELDS, expression_references
+
+# Problems that would break the write (the DBF refuses the value) or the compiled project
+ERROR_RULES = ("length", "missing_key", "duplicate_key")
+# Problems worth a look that may still be valid (e.g. variables defined in an included project)
+WARNING_RULES = ("unknown_reference", "unknown_cluster")
+
+# Violations returned inline (generate response); the counts always cover all of them
+DEFAULT_MAX_VIOLATIONS = 1000
+
+class PreflightError(Exception):
+    """Validation found errors, so the diff must not be written."""
+    def __init__(self, report: Dict[str, Any]):
+        self.report = report
+        rules = ", ".join(f"{rule}: {n}" for rule, n in report["counts"].items() if rule in ERROR_RULES)
+        super().__init__(f"Pre-flight validation found {report['errors']} error(s) ({rules}). Fix them and re-run Generate.")
+
+def project_clusters(cluster_dbf_path: str) -> Optional[Set[str]]:
+    """Cluster names defined in the project's cluster.dbf, or None if there is none to check against."""
+    if not os.path.exists(cluster_dbf_path):
+        return None
+    try:
+        table = dbf.Table(cluster_dbf_path)
+        table.open(dbf.READ_ONLY)
+        try:
+            if "NAME" not in table.field_names and "name" not in table.field_names:
+                return None
+            return {str(r["NAME"]).strip() for r in table if not dbf.is_deleted(r)}
+        finally:
+            table.close()
+    except Exception as e:
+        print(f"Error reading clusters from {cluster_dbf_path}: {e}")
+        return None
+
+def _as_text(column) -> List[str]:
+    return ["" if v is None else v if type(v) is str else str(v) for v in column]
+
+class TagValidator:
+    """
+    Pre-flight checks over the expanded records of all three DBFs, before anything is written.
+
+    Each check runs column-wise with built-ins over whole columns (max(map(len, ...)),
+    Counter, set difference), so per-row Python work only happens for the rows that
+    actually fail.
+
+    Rules:
+      length            value longer than the DBF field width (the write would fail)
+      missing_key       empty NAME / TAG
+      duplicate_key     the same key produced more than once (single vs member vs expanded rows)
+      unknown_reference trend EXPR / alarm VAR_A, VAR_B naming a tag that is not in the variables
+      unknown_cluster   CLUSTER not defined in the project's cluster.dbf (skipped without one)
+    """
+    def __init__(self, max_violations: int = DEFAULT_MAX_VIOLATIONS):
+        self.max_violations = max_violations
+        self.widths = {t: [f.length for f in fields] for t, fields in DBF_FIELDS.items()}
+
+    def validate(self, expanded: Dict[str, List[Any]], clusters: Optional[Iterable[str]] = None,
+                 max_violations: Optional[int] = None) -> Dict[str, Any]:
+        run = self.start(clusters, max_violations)
+        for table_type, records in expanded.items():
+            run.add(table_type, records)
+        return run.finish()
+
+    def start(self, clusters: Optional[Iterable[str]] = None, max_violations: Optional[int] = None) -> "ValidationRun":
+        """An incremental validation: records are added in batches, the report comes from finish()."""
+        return ValidationRun(self, clusters, self.max_violations if max_violations is None else max_violations)
+
+    def _check_lengths(self, table_type, records, keys, report):
+        for name, width in zip(DBF_FIELD_NAMES[table_type], self.widths[table_type]):
+            getter = attrgetter(name)
+            try:
+                # One C-level pass per column; the column is only materialized when it fails
+                if max(map(len, map(getter, records))) <= width:
+                    continue
+                column = list(map(getter, records))
+            except TypeError:
+                # Non-string values (None, numbers) are written as their text
+                column = _as_text(map(getter, records))
+                if max(map(len, column)) <= width:
+                    continue
+            for i, value in enumerate(column):
+                if len(value) > width:
+                    report(table_type, keys[i], name, "length",
+                           f"{name} is {len(value)} characters, the field holds {width}", value)
+
+    def _check_keys(self, table_type, counted, total, report):
+        key_field = DBF_KEY_FIELDS[table_type]
+        if len(counted) == total and "" not in counted:
+            return
+        for key, n in counted.items():
+            if not str(key).strip():
+                for _ in range(n):
+                    report(table_type, key, key_field, "missing_key", f"{key_field} is empty")
+            elif n > 1:
+                report(table_type, key, key_field, "duplicate_key", f"{key_field} '{key}' is produced {n} times")
+
+    def _check_clusters(self, table_type, records, keys, known, report):
+        column = list(map(attrgetter("CLUSTER"), records))
+        unknown = set(column) - known
+        unknown.discard("")
+        if not unknown:
+            return
+        for i, cluster in enumerate(column):
+            if cluster in unknown:
+                report(table_type, keys[i], "CLUSTER", "unknown_cluster", f"Cluster '{cluster}' is not defined in cluster.dbf", cluster)
+
+class ValidationRun:
+    """
+    One validation in progress. Lengths and clusters are checked per batch as records are
+    added; keys are counted and checked in finish(). References are checked against the
+    variables seen so far, and only the expressions still unresolved (with the keys of their
+    rows) are kept for finish(), so a streaming caller holds the keys, not the records.
+    """
+    def __init__(self, validator: TagValidator, clusters: Optional[Iterable[str]], limit: Optional[int]):
+        self.validator = validator
+        self.known_clusters = set(clusters) if clusters is not None else None
+        self.limit = limit
+        self.start = time.perf_counter()
+        self.counts = Counter()
+        self.violations = []
+        self.records: Dict[str, int] = {}
+        self.keys: Dict[str, Counter] = {}
+        self.variables: Set[str] = set()
+        self.references: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+
+    def report(self, table_type, key, field, rule, message, value=None):
+        self.counts[rule] += 1
+        if self.limit is None or len(self.violations) < self.limit:
+            item = {"table": table_type, "key": key, "field": field, "rule": rule,
+                    "severity": "error" if rule in ERROR_RULES else "warning", "message": message}
+            if value is not None:
+                item["value"] = value
+            self.violations.append(item)
+
+    def add(self, table_type: str, records: List[Any]):
+        if table_type not in DBF_FIELD_NAMES or not records:
+            return
+        keys = list(map(attrgetter(DBF_KEY_FIELDS[table_type]), records))
+        self.records[table_type] = self.records.get(table_type, 0) + len(records)
+        self.validator._check_lengths(table_type, records, keys, self.report)
+        self.keys.setdefault(table_type, Counter()).update(keys)
+        if table_type == "variable":
+            self.variables.update(keys)
+
+        for field in REFERENCE_FIELDS.get(table_type, ()):
+            column = list(map(attrgetter(field), records))
+            # Most expressions are a bare variable name (or empty); the rest wait for finish()
+            pending = set(column) - self.variables
+            pending.discard("")
+            if pending:
+                self.references.setdefault((table_type, field), []).extend(
+                    (keys[i], expression) for i, expression in enumerate(column) if expression in pending)
+
+        if self.known_clusters is not None and "CLUSTER" in DBF_FIELD_NAMES[table_type]:
+            self.validator._check_clusters(table_type, records, keys, self.known_clusters, self.report)
+
+    def finish(self) -> Dict[str, Any]:
+        for table_type, counted in self.keys.items():
+            self.validator._check_keys(table_type, counted, self.records[table_type], self.report)
+        for (table_type, field), rows in self.references.items():
+            self._check_references(table_type, field, rows)
+
+        counts = self.counts
+        errors = sum(n for rule, n in counts.items() if rule in ERROR_RULES)
+        warnings = sum(counts.values()) - errors
+        elapsed = time.perf_counter() - self.start
+        metrics.record_stage("validate", elapsed)
+        return {
+            "ok": errors == 0,
+            "errors": errors,
+            "warnings": warnings,
+            "counts": dict(counts),
+            "violations": self.violations,
+            "truncated": len(self.violations) < errors + warnings,
+            "records": dict(self.records),
+            "clusters_checked": self.known_clusters is not None,
+            "seconds": round(elapsed, 4),
+        }
+
+    def _check_references(self, table_type, field, rows):
+        variables = self.variables
+        unresolved = {}
+        for expression in {expression for _, expression in rows} - variables:
+            missing = [name for name in expression_references(expression) if name not in variables]
+            if missing:
+                unresolved[expression] = missing
+        if not unresolved:
+            return
+        for key, expression in rows:
+            missing = unresolved.get(expression)
+            if missing:
+                self.report(table_type, key, field, "unknown_reference",
+                            f"{field} references unknown tag(s): {', '.join(missing)}", expression)
@@ -0,0 +1,125 @@
+
+import datetime
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Optional
+
+from services.dbf_cache import dbf_rows
+from services.metrics import metrics
+from services.tag_store import iter_state_rows, load_templates
+
+# TAGGEN_WARMUP=0 starts the server cold
+WARMUP_ENABLED = os.environ.get("TAGGEN_WARMUP", "1") != "0"
+
+WARMUP_STEPS = ["templates", "state", "dbf"]
+
+class ProjectWarmup:
+    """
+    Preloads the last opened project after a restart, on a background thread, so the
+    first /api/state, template load and Generate do not pay the cold-start cost:
+
+    - templates: saved template JSON parsed and every template flattened / compiled
+      (the expander's per-version caches)
+    - state: the project's saved rows read once (SQLite pages into the OS cache,
+      statements into SQLAlchemy's compiled cache)
+    - dbf: variable / trend / digalm parsed into the DBF row cache
+
+    The server is ready while this runs; requests just find the caches warmer as each
+    step finishes. A failed step is logged and the next one still runs.
+    """
+    def __init__(self, session_factory, expander, dbf_paths: Callable[[str], Dict[str, str]], project_locks=None):
+        self.session_factory = session_factory
+        self.expander = expander
+        self.dbf_paths = dbf_paths
+        self.project_locks = project_locks
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._state = {"status": "idle", "project_path": None, "started_at": None, "finished_at": None,
+                       "steps": [{"name": name, "status": "pending"} for name in WARMUP_STEPS]}
+
+    def start(self, project_path: Optional[str]) -> bool:
+        """Starts the warm-up thread; False if it is disabled, already ran or there is no project to warm."""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            if not WARMUP_ENABLED:
+                self._state["status"] = "disabled"
+                return False
+            if not project_path or not os.path.isdir(project_path):
+                self._state.update({"status": "skipped", "project_path": project_path})
+                return False
+            self._state.update({"status": "running", "project_path": project_path, "started_at": datetime.datetime.now().isoformat()})
+            self._thread = threading.Thread(target=self._run, args=(project_path,), name="taggen-warmup", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self, project_path: str):
+        start = time.perf_counter()
+        failed = False
+        for step in self._state["steps"]:
+            self._update(step, status="running")
+            step_start = time.perf_counter()
+            try:
+                detail = getattr(self, f"_warm_{step['name']}")(project_path)
+                self._update(step, status="done", detail=detail)
+            except Exception as e:
+                failed = True
+                print(f"Warm-up step {step['name']} failed for {project_path}: {e}")
+                self._update(step, status="failed", error=str(e))
+            seconds = time.perf_counter() - step_start
+            self._update(step, seconds=round(seconds, 3))
+            metrics.observe("taggen_warmup_seconds", seconds, step=step["name"])
+
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self._state.update({"status": "failed" if failed else "done", "finished_at": datetime.datetime.now().isoformat(),
+                                "seconds": round(seconds, 3)})
+        print(f"Warm-up of {project_path} {'finished with errors' if failed else 'done'} in {seconds:.1f}s")
+
+    def _update(self, step: Dict[str, Any], **values):
+        with self._lock:
+            step.update(values)
+
+    def _warm_templates(self, project_path: str) -> Dict[str, Any]:
+        db = self.session_factory()
+        try:
+            templates = load_templates(db, self.expander.templates)
+        finally:
+            db.close()
+        invalid = []
+        for name in templates:
+            try:
+                self.expander.compiled_members(templates, name)
+            except ValueError:
+                # Reported properly when the template is used
+                invalid.append(name)
+        return {"templates": len(templates), "invalid": invalid}
+
+    def _warm_state(self, project_path: str) -> Dict[str, Any]:
+        lock = self.project_locks.shared(project_path, "warmup") if self.project_locks is not None else nullcontext()
+        db = self.session_factory()
+        try:
+            with lock:
+                rows = sum(1 for _ in iter_state_rows(db, project_path))
+        finally:
+            db.close()
+        return {"rows": rows}
+
+    def _warm_dbf(self, project_path: str) -> Dict[str, Any]:
+        records = {}
+        for table_type, path in self.dbf_paths(project_path).items():
+            loaded = dbf_rows.rows(path)
+            if loaded is not None:
+                records[table_type] = len(loaded[1])
+        return {"records": records}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = dict(self._state)
+            state["steps"] = [dict(step) for step in self._state["steps"]]
+        finished = sum(1 for step in state["steps"] if step["status"] in ("done", "failed"))
+        state["progress"] = round(finished / len(state["steps"]), 2)
+        state["warm"] = state["status"] == "done"
+        return state
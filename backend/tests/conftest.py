@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Tests import the backend the way main.py does (cwd = backend)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# database.py resolves ./project_data.db when it is imported (test modules import it while
+# being collected): run from a scratch directory so no test opens the checked-in database
+os.chdir(tempfile.mkdtemp(prefix="taggen-tests-"))
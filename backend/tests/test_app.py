@@ -0,0 +1,29 @@
+
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope="module")
+def main():
+    # conftest runs the tests from a scratch directory, so main opens a scratch project_data.db
+    import main
+    return main
+
+def test_lifespan_starts_warmup_and_stops_the_executors(main, monkeypatch):
+    calls = []
+    monkeypatch.setattr(main.warmup, "start", lambda project: calls.append("warmup"))
+    for name, service in (("jobs", main.job_manager), ("dbf_io", main.dbf_io), ("db_io", main.db_io)):
+        monkeypatch.setattr(service, "shutdown", lambda *args, name=name, **kwargs: calls.append(name))
+    monkeypatch.setattr(main, "shutdown_expand_pool", lambda: calls.append("expand_pool"))
+    with TestClient(main.app) as client:
+        assert client.get("/api/ready").json()["ready"]
+        assert calls == ["warmup"]
+    assert calls == ["warmup", "jobs", "dbf_io", "db_io", "expand_pool"]
+
+def test_slow_requests_are_logged_with_their_stages(main, monkeypatch, caplog):
+    monkeypatch.setattr(main, "SLOW_REQUEST_SECONDS", 0.0)
+    with caplog.at_level(logging.WARNING, logger="main"):
+        response = TestClient(main.app).get("/")
+    assert response.status_code == 200 and "total;dur=" in response.headers["Server-Timing"]
+    assert [r.getMessage().split(" in ")[0] for r in caplog.records] == ["Slow request: GET / -> 200"]
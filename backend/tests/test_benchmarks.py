@@ -0,0 +1,34 @@
+
+import os
+
+from benchmarks.run_benchmarks import compare, summarize
+from benchmarks.synthetic_project import MANIFEST_FILE, SyntheticProject, parse_size, size_label
+from services.dbf_writer import DBFWriter
+
+def test_sizes():
+    assert [parse_size(s) for s in ("250", "1k", "2.5k", "1m")] == [250, 1000, 2500, 1_000_000]
+    assert [size_label(n) for n in (250, 1000, 2_000_000, 1500)] == ["250", "1k", "2m", "1500"]
+
+def test_projects_are_seeded_and_drift_from_what_generate_produces(tmp_path):
+    project = SyntheticProject(300, modified_ratio=0.1, new_ratio=0.1, orphan_ratio=0.05)
+    tags = project.grid_tags()
+    assert tags == SyntheticProject(300, modified_ratio=0.1, new_ratio=0.1, orphan_ratio=0.05).grid_tags()
+    assert tags != SyntheticProject(300, seed=7).grid_tags()
+
+    path = str(tmp_path / "synthetic")
+    manifest = project.write(path)
+    assert sorted(f for f in os.listdir(path)) == sorted(["digalm.dbf", "trend.dbf", "variable.dbf", MANIFEST_FILE])
+    assert project.write(path)["generated_in"] == manifest["generated_in"]  # same parameters: re-used
+
+    expanded = project.expander.expand_tags([dict(t) for t in tags])
+    assert len(expanded["variable"]) >= 300
+    diff = DBFWriter().reconcile_changes(expanded["variable"], os.path.join(path, "variable.dbf"))
+    assert all(diff[change] for change in ("new", "modified", "orphaned", "unchanged"))
+
+def test_compare_flags_regressions_above_tolerance_and_noise_floor():
+    stages = summarize([{"expand": {"seconds": 1.0}}, {"expand": {"seconds": 3.0}}, {"expand": {"seconds": 2.0}}], None)
+    assert stages["expand"] == {"seconds": 2.0, "seconds_min": 1.0}
+    baseline = {"sizes": {"1k": {"stages": {"expand": {"seconds": 1.0}, "save": {"seconds": 0.01}}}}}
+    current = {"sizes": {"1k": {"stages": {"expand": {"seconds": 1.5}, "save": {"seconds": 0.03}}}}}
+    regressions = compare(current, baseline, tolerance=0.2)
+    assert len(regressions) == 1 and regressions[0].startswith("1k expand seconds")
@@ -0,0 +1,50 @@
+
+import pytest
+
+from database import create_session_factory
+from models import TagEntry, TagReference
+from services.bulk_edit import BulkEditConflict, BulkEditor
+from services.history import HistoryStore
+from services.reference_graph import ReferenceGraph
+from services.tag_store import current_revision, sync_tags
+from services.udt_expander import UDTExpander
+
+PROJECT = "/projects/bulk"
+
+@pytest.fixture
+def db(tmp_path):
+    db = create_session_factory(str(tmp_path / "bulk.db"))()
+    sync_tags(db, PROJECT, [{"name": f"PUMP_{i}", "description": f"Pump {i} speed", "var_addr": f"PLC.P{i}", "is_trend": i == 0,
+                             "trend_expr": "PUMP_1 + PUMP_2" if i == 0 else ""} for i in range(4)])
+    yield db
+    db.close()
+
+def _column(db, column):
+    return [v for (v,) in db.query(getattr(TagEntry, column)).filter(TagEntry.project_path == PROJECT).order_by(TagEntry.id)]
+
+def test_preview_then_apply(db):
+    editor = BulkEditor(history=HistoryStore())
+    where = [{"field": "name", "op": "startswith", "value": "pump_"}]
+    operations = [{"field": "description", "find": "speed", "replace": "rate"}, {"field": "var_addr", "find": r"P(\d)", "replace": r"Q\1", "regex": True}]
+    preview = editor.run(db, PROJECT, where, operations, dry_run=True, sample=1)
+    assert preview["matched"] == 4 and [op["changed"] for op in preview["operations"]] == [4, 4]
+    assert preview["operations"][0]["sample"] == [{"id": "1", "name": "PUMP_0", "before": "Pump 0 speed", "after": "Pump 0 rate"}]
+    assert _column(db, "description")[0] == "Pump 0 speed"
+
+    with pytest.raises(BulkEditConflict):
+        editor.run(db, PROJECT, where, operations, dry_run=False, expect_matched=3)
+    applied = editor.run(db, PROJECT, where, operations, dry_run=False, expect_matched=4)
+    assert applied["revision"] == current_revision(db, PROJECT) == 2 and applied["version"] is not None
+    assert _column(db, "description") == [f"Pump {i} rate" for i in range(4)]
+    assert _column(db, "var_addr") == [f"PLC.Q{i}" for i in range(4)]
+
+def test_preview_does_not_build_the_reference_graph(db):
+    editor = BulkEditor(reference_graph=ReferenceGraph(UDTExpander()))
+    operations = [{"field": "trend_expr", "set": "PUMP_3"}]
+    where = [{"field": "name", "op": "eq", "value": "PUMP_0"}]
+    editor.run(db, PROJECT, where, operations, dry_run=True)
+    assert db.query(TagReference).count() == 0
+
+    applied = editor.run(db, PROJECT, where, operations, dry_run=False)
+    assert applied["changed"] == 1
+    assert [t for (t,) in db.query(TagReference.target).filter(TagReference.owner == "PUMP_0")] == ["PUMP_3"]
@@ -0,0 +1,44 @@
+
+import json
+
+import pytest
+
+import cli
+from benchmarks.synthetic_project import SyntheticProject
+
+def _run(capsys, *argv):
+    code = cli.main(list(argv))
+    return code, json.loads(capsys.readouterr().out)
+
+def test_import_diff_and_write_a_project(tmp_path, capsys):
+    project = str(tmp_path / "plant")
+    SyntheticProject(120).write(project)
+    db = str(tmp_path / "state.db")
+
+    code, summary = _run(capsys, "import", project, "--db", db, "--workers", "1")
+    assert code == 0 and summary["succeeded"] == 1
+    assert summary["projects"][0]["tags"] > 0 and summary["projects"][0]["history"]
+
+    code, summary = _run(capsys, "diff", "--all", "--db", db, "--workers", "1")
+    result = summary["projects"][0]
+    assert code == 0 and result["project"] == project and set(result["diff"]) == set(result["counts"])
+    assert summary["totals"] == result["counts"]
+
+    code, summary = _run(capsys, "write", project, "--db", db, "--workers", "1")
+    assert code == 0 and summary["projects"][0]["written"] is True
+    code, summary = _run(capsys, "generate", project, "--db", db, "--workers", "1")
+    # Written rows now match; orphaned rows stay in the DBFs and keep being reported
+    counts = summary["projects"][0]["counts"]
+    assert all(c["new"] == c["modified"] == 0 and c["unchanged"] for c in counts.values())
+
+def test_failures_are_reported_not_raised(tmp_path, capsys):
+    out = tmp_path / "summary.json"
+    code = cli.main(["generate", str(tmp_path / "missing"), "--db", str(tmp_path / "state.db"), "--workers", "1", "--out", str(out)])
+    summary = json.loads(out.read_text())
+    assert code == 1 and summary["failed"] == 1
+    assert "No saved tags" in summary["projects"][0]["error"]
+    assert "[failed]" in capsys.readouterr().err
+
+def test_projects_are_required(tmp_path):
+    with pytest.raises(SystemExit):
+        cli.main(["validate", "--db", str(tmp_path / "state.db")])
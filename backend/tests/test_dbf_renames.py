@@ -0,0 +1,51 @@
+
+from services.dbf_writer import DBFWriter
+from services.job_manager import Job
+from services.pipeline import TagPipeline
+from services.project_scanner import ProjectScanner
+from services.dbf_reader import DBFReader
+from services.diff_store import DiffStore
+from services.udt_expander import UDTExpander
+
+from test_dbf_write_paths import _rows
+
+def _diff(orphaned, new):
+    return {"new": list(new), "modified": [], "orphaned": list(orphaned), "unchanged": []}
+
+def test_guid_match_moves_the_pair_to_renamed():
+    diff = DBFWriter().detect_renames(_diff([{"NAME": "OLD", "GUID": "g-1", "ADDR": "A"}],
+                                            [{"NAME": "NEW", "GUID": "g-1", "ADDR": "B"}, {"NAME": "OTHER", "GUID": ""}]))
+    assert [r["old_key"] for r in diff["renamed"]] == ["OLD"]
+    assert diff["renamed"][0]["proposed"]["NAME"] == "NEW" and set(diff["renamed"][0]["changed_fields"]) == {"NAME", "ADDR"}
+    assert diff["orphaned"] == [] and [r["NAME"] for r in diff["new"]] == ["OTHER"]
+
+def test_renames_carry_over_and_ambiguous_pairs_stay_apart():
+    writer = DBFWriter()
+    carried = writer.detect_renames(_diff([{"NAME": "OLD"}], [{"NAME": "NEW"}]), enable_guid=False, renamed_keys={"OLD": "NEW"})
+    assert [r["old_key"] for r in carried["renamed"]] == ["OLD"]
+
+    ambiguous = writer.detect_renames(_diff([{"TAG": "A1", "EQUIP": "P", "ITEM": "Run"}],
+                                            [{"TAG": "B1", "EQUIP": "P", "ITEM": "Run"}, {"TAG": "B2", "EQUIP": "P", "ITEM": "Run"}]),
+                                      key_field="TAG", enable_guid=False)
+    assert ambiguous["renamed"] == [] and len(ambiguous["new"]) == 2 and len(ambiguous["orphaned"]) == 1
+
+def test_renamed_tag_is_updated_in_place_and_keeps_its_guid(tmp_path):
+    pipeline = TagPipeline(ProjectScanner(), DBFReader(), DBFWriter(), UDTExpander(), DiffStore())
+    tags = [{"name": f"PUMP_{i}", "equipment": f"Pump{i}", "item": "Run", "var_addr": f"PLC.P{i}", "is_trend": True}
+            for i in range(3)]
+
+    def write(tags):
+        generated = pipeline.generate(str(tmp_path), [dict(t) for t in tags], lambda: {}, Job("generate"))
+        pipeline.write(str(tmp_path), None, Job("write"), handle=generated["handle"])
+        return generated
+
+    write(tags)
+    before = _rows(tmp_path / "variable.dbf")
+    tags[1]["name"] = "PUMP_1_RENAMED"
+    generated = write(tags)
+    assert generated["counts"]["variable"]["renamed"] == 1 and generated["counts"]["variable"]["new"] == 0
+    # The trend row follows its variable's rename
+    assert generated["counts"]["trend"]["renamed"] == 1
+    after = _rows(tmp_path / "variable.dbf")
+    assert set(after) == {"PUMP_0", "PUMP_1_RENAMED", "PUMP_2"}
+    assert after["PUMP_1_RENAMED"]["GUID"] == before["PUMP_1"]["GUID"]
@@ -0,0 +1,121 @@
+
+import dbf
+import pytest
+
+from services.dbf_reader import DBFReader
+from services.dbf_writer import DBFWriter
+from services.diff_store import DiffStore
+from services.job_manager import Job
+from services.pipeline import DBF_TABLES, TagPipeline
+from services.project_scanner import ProjectScanner
+from services.tag_schema import DBF_FIELD_NAMES
+from services.udt_expander import UDTExpander
+from services.validator import PreflightError
+
+def _tags(count, description="Tag"):
+    return [{"name": f"TAG_{i:03d}", "description": f"{description} {i}", "var_addr": f"PLC.TAG_{i:03d}", "cluster": "Cluster1",
+             "is_trend": i % 2 == 0, "is_alarm": i % 3 == 0} for i in range(count)]
+
+def _pipeline():
+    return TagPipeline(ProjectScanner(), DBFReader(), DBFWriter(), UDTExpander(), DiffStore())
+
+def _rows(path):
+    """Live rows as {key: {field: value}}."""
+    table = dbf.Table(str(path))
+    table.open(dbf.READ_ONLY)
+    try:
+        names = table.field_names
+        rows = [dict(zip(names, (str(v).strip() for v in record))) for record in table if not dbf.is_deleted(record)]
+    finally:
+        table.close()
+    key = "TAG" if "TAG" in names else "NAME"
+    return {r[key]: r for r in rows}
+
+def _generate_and_write(pipeline, project, tags):
+    generated = pipeline.generate(str(project), tags, lambda: {}, Job("generate"))
+    pipeline.write(str(project), None, Job("write"), handle=generated["handle"])
+
+def _apply_both(tmp_path, rounds):
+    """Runs every round of tags through generate + write (in-memory diff) and through the streaming rebuild."""
+    memory, streamed = tmp_path / "memory", tmp_path / "stream"
+    memory.mkdir()
+    streamed.mkdir()
+    pipeline = _pipeline()
+    for tags in rounds:
+        _generate_and_write(pipeline, memory, [dict(t) for t in tags])
+        pipeline.rebuild(str(streamed), iter([dict(t) for t in tags]), lambda: {}, Job("rebuild"), run_size=7)
+    return memory, streamed
+
+def _assert_same_output(memory, streamed):
+    for table_type, name, _, enable_guid in DBF_TABLES:
+        expected, actual = _rows(memory / name), _rows(streamed / name)
+        assert expected.keys() == actual.keys(), table_type
+        for key, row in expected.items():
+            other = actual[key]
+            # GUIDs are random per write path: both must have one, the rest must match
+            if enable_guid:
+                assert row["GUID"] and other["GUID"], (table_type, key)
+            fields = [f for f in DBF_FIELD_NAMES[table_type] if f != "GUID"]
+            assert {f: row[f] for f in fields} == {f: other[f] for f in fields}, (table_type, key)
+
+def test_stream_apply_matches_in_memory_write_for_new_tables(tmp_path):
+    memory, streamed = _apply_both(tmp_path, [_tags(25)])
+    _assert_same_output(memory, streamed)
+
+def test_stream_apply_matches_in_memory_write_for_changes(tmp_path):
+    first = _tags(25)
+    second = _tags(30, description="Changed")[:10] + _tags(30)[15:]
+    memory, streamed = _apply_both(tmp_path, [first, second])
+    _assert_same_output(memory, streamed)
+
+def test_stream_apply_keeps_existing_guids(tmp_path):
+    memory, streamed = _apply_both(tmp_path, [_tags(10)])
+    before = {k: r["GUID"] for k, r in _rows(streamed / "variable.dbf").items()}
+    _pipeline().rebuild(str(streamed), iter(_tags(10, description="Again")), lambda: {}, Job("rebuild"), run_size=7)
+    after = {k: r["GUID"] for k, r in _rows(streamed / "variable.dbf").items()}
+    assert after == before
+    assert len(set(after.values())) == len(after)
+
+def test_rebuild_refuses_records_that_fail_validation(tmp_path):
+    tags = _tags(10) + [{"name": "X" * 200, "var_addr": "PLC.LONG", "cluster": "Cluster1"}, dict(_tags(1)[0])]
+    with pytest.raises(PreflightError) as raised:
+        _pipeline().rebuild(str(tmp_path), iter(tags), lambda: {}, Job("rebuild"), run_size=4)
+    assert raised.value.report["counts"]["length"] >= 1
+    assert raised.value.report["counts"]["duplicate_key"] >= 1
+    assert not any((tmp_path / name).exists() for _, name, _, _ in DBF_TABLES)
+
+def test_batched_validation_matches_whole_validation(tmp_path):
+    tags = _tags(20) + [{"name": "TAG_000", "var_addr": "PLC.DUP"}, {"name": "", "var_addr": "PLC.EMPTY"}]
+    expanded = UDTExpander().expand_tags(tags)
+    pipeline = _pipeline()
+    whole = pipeline.validate(str(tmp_path), expanded)
+    run = pipeline.start_validation(str(tmp_path))
+    for table_type, records in expanded.items():
+        for i in range(0, len(records), 3):
+            run.add(table_type, records[i:i + 3])
+    batched = run.finish()
+    assert whole["errors"] and batched["counts"] == whole["counts"]
+    key = lambda v: (v["table"], v["rule"], v["key"], v["field"])
+    assert sorted(map(key, batched["violations"])) == sorted(map(key, whole["violations"]))
+
+def test_sorted_reconcile_matches_in_memory_reconcile(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    _generate_and_write(_pipeline(), project, _tags(40))
+    expander, writer = UDTExpander(), DBFWriter()
+    tags = _tags(50, description="Changed")[:10] + _tags(50)[20:]
+    proposed = expander.expand_tags(tags)["variable"]
+    path = str(project / "variable.dbf")
+
+    memory = writer.reconcile_changes([dict(r) for r in proposed], path, mode="memory")
+    sorted_diff = {"new": [], "modified": [], "orphaned": [], "unchanged": []}
+    # A run size of 3 spills both sides into many runs
+    for change_type, item in writer.iter_reconcile_sorted([dict(r) for r in proposed], path, run_size=3, spill_dir=str(tmp_path)):
+        sorted_diff[change_type].append(item)
+    sorted_diff = writer.detect_renames(sorted_diff)
+
+    def keys(diff):
+        return {t: sorted((i.get("proposed", i) if t in ("modified", "renamed") else i)["NAME"] for i in items) for t, items in diff.items()}
+    assert keys(sorted_diff) == keys(memory)
+    assert [len(memory[t]) for t in ("new", "modified", "orphaned", "unchanged")] == [10, 10, 10, 20]
+    assert list(tmp_path.glob("taggen_*")) == []
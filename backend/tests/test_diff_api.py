@@ -0,0 +1,33 @@
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope="module")
+def client():
+    import main
+    return TestClient(main.app)
+
+def test_generate_returns_a_first_page_and_the_rest_is_paged(client, tmp_path):
+    tags = [{"name": f"TAG_{i:02d}", "description": f"Tag {i}", "var_addr": f"PLC.T{i}", "is_trend": i < 3} for i in range(12)]
+    generated = client.post("/api/generate", json={"project_path": str(tmp_path), "tags": tags, "page_size": 5}).json()
+    handle = generated["handle"]
+    assert generated["counts"]["variable"]["new"] == 12 and generated["counts"]["trend"]["new"] == 3
+    assert len(generated["diff"]["variable"]["new"]) == 5 and "unchanged" not in generated["diff"]["variable"]
+
+    summary = client.get(f"/api/diff/{handle}").json()
+    assert summary["counts"] == generated["counts"] and summary["project_path"] == str(tmp_path)
+
+    page = client.get(f"/api/diff/{handle}/variable", params={"change_type": "new", "offset": 10, "limit": 5}).json()
+    assert page["total"] == 12 and [r["key"] for r in page["items"]] == ["TAG_10", "TAG_11"]
+    assert client.get(f"/api/diff/{handle}/variable", params={"change_type": "new", "prefix": "tag_1"}).json()["total"] == 2
+    full = client.get(f"/api/diff/{handle}/trend", params={"change_type": "new", "full": True}).json()["items"]
+    assert full[0]["NAME"] == "TAG_00"
+
+    record = client.get(f"/api/diff/{handle}/variable/record", params={"key": "TAG_04"}).json()
+    assert record["change_type"] == "new" and record["existing"] is None and record["proposed"]["ADDR"] == "PLC.T4"
+
+def test_unknown_handles_records_and_change_types(client, tmp_path):
+    handle = client.post("/api/generate", json={"project_path": str(tmp_path), "tags": [{"name": "A", "var_addr": "X"}]}).json()["handle"]
+    assert client.get("/api/diff/nope").status_code == 404
+    assert client.get(f"/api/diff/{handle}/variable/record", params={"key": "B"}).status_code == 404
+    assert client.get(f"/api/diff/{handle}/variable", params={"change_type": "bogus"}).status_code == 400
@@ -0,0 +1,52 @@
+
+import os
+
+import pytest
+
+from services.diff_store import DiffNotFoundError, DiffStore, StaleDiffError
+
+def _diff(unchanged=None):
+    return {"variable": {
+        "new": [{"NAME": "A", "COMMENT": "new"}],
+        "modified": [{"existing": {"NAME": "B", "ADDR": "1"}, "proposed": {"NAME": "B", "ADDR": "2"}, "changed_fields": ["ADDR"]},
+                     {"existing": {"NAME": "C", "ADDR": "1"}, "proposed": {"NAME": "C", "ADDR": "3"}, "changed_fields": ["ADDR"]}],
+        "renamed": [],
+        "orphaned": [{"NAME": "D"}],
+        "unchanged": unchanged if unchanged is not None else [{"NAME": "E"}],
+    }}
+
+def test_handle_hashes_the_changes_and_mtimes():
+    store = DiffStore()
+    mtimes = {"variable": 1}
+    handle = store.put("/p", _diff(), {}, mtimes)
+    assert store.content_handle("/p", _diff([{"NAME": "E", "COMMENT": "not serialized"}]), mtimes) == handle
+    assert store.content_handle("/p", _diff([]), mtimes) != handle
+    assert store.content_handle("/p", _diff(), {"variable": 2}) != handle
+    assert store.content_handle("/q", _diff(), mtimes) != handle
+
+def test_select_query_and_record():
+    store = DiffStore()
+    handle = store.put("/p", _diff(), {}, {"variable": None})
+    selected = store.select(handle, excluded={"variable": {"modified": ["*"], "orphaned": ["D"]}}, included={"variable": {"modified": ["C"]}})
+    assert [m["proposed"]["NAME"] for m in selected["variable"]["modified"]] == ["C"]
+    assert selected["variable"]["orphaned"] == [] and len(selected["variable"]["new"]) == 1
+
+    page = store.query(handle, "variable", "modified", prefix="c")
+    assert page["total"] == 1 and page["items"][0] == {"key": "C", "comment": "", "changed_fields": ["ADDR"]}
+    assert store.record(handle, "variable", "B")["proposed"] == {"NAME": "B", "ADDR": "2"}
+    assert store.summary(handle)["changed_fields"] == {"variable": {"ADDR": 2}}
+
+def test_stale_and_evicted_handles(tmp_path):
+    path = tmp_path / "variable.dbf"
+    path.write_bytes(b"x")
+    store = DiffStore(max_entries=1)
+    paths = {"variable": str(path)}
+    handle = store.put("/p", _diff(), paths, store.snapshot_mtimes(paths))
+    store.check_fresh(handle)
+    os.utime(path, ns=(0, 0))
+    with pytest.raises(StaleDiffError):
+        store.check_fresh(handle)
+
+    store.put("/other", _diff(), {}, {})
+    with pytest.raises(DiffNotFoundError):
+        store.get(handle)
@@ -0,0 +1,87 @@
+
+import asyncio
+import contextvars
+import threading
+
+import database
+from models import UdtTemplate
+from services.executors import IOExecutor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+def test_work_runs_off_the_loop_with_the_callers_context():
+    executor = IOExecutor("test", 2)
+
+    async def main():
+        request_id.set("r-1")
+        loop_thread = threading.current_thread()
+        thread, value = await executor.run(lambda: (threading.current_thread(), request_id.get()))
+        return thread is not loop_thread, value
+
+    try:
+        assert asyncio.run(main()) == (True, "r-1")
+        assert executor.snapshot() == {"name": "test", "workers": 2, "running": 0, "queued": 0}
+    finally:
+        executor.shutdown()
+
+def test_cancelled_requests_drop_queued_work():
+    executor = IOExecutor("test", 1)
+    release, ran = threading.Event(), []
+
+    async def main():
+        blocker = asyncio.ensure_future(executor.run(release.wait, 5))
+        queued = asyncio.ensure_future(executor.run(ran.append, "queued"))
+        await asyncio.sleep(0.05)
+        assert executor.snapshot()["running"] == 1 and executor.snapshot()["queued"] == 1
+        queued.cancel()
+        await asyncio.sleep(0.05)
+        release.set()
+        await blocker
+
+    try:
+        asyncio.run(main())
+        assert ran == [] and executor.snapshot()["queued"] == 0
+        # A shut down pool starts again on the next call
+        executor.shutdown()
+        assert asyncio.run(executor.run(sum, [1, 2])) == 3
+    finally:
+        executor.shutdown()
+
+def _store(db, name):
+    db.add(UdtTemplate(name=name, description="", members_json="[]"))
+    db.commit()
+    return [t.name for t in db.query(UdtTemplate).filter(UdtTemplate.name.like("RunDb%")).order_by(UdtTemplate.name)]
+
+def test_run_db_runs_sync_orm_code_with_and_without_the_async_engine(monkeypatch):
+    database.init_db()
+    assert asyncio.run(database.run_db(_store, "RunDb1")) == ["RunDb1"]
+    monkeypatch.setattr(database, "AsyncSessionLocal", None)
+    assert asyncio.run(database.run_db(_store, "RunDb2")) == ["RunDb1", "RunDb2"]
+    database.db_io.shutdown()
+
+def test_a_slow_locked_read_does_not_hold_up_the_event_loop(monkeypatch):
+    import httpx
+    import main
+
+    release = threading.Event()
+
+    def slow_versions(db, project_path, limit, offset):
+        release.wait(5)
+        return []
+    monkeypatch.setattr(main.history, "versions", slow_versions)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.ensure_future(client.get("/api/history", params={"project_path": "/projects/slow"}))
+            await asyncio.sleep(0.05)
+            templates = await asyncio.wait_for(client.get("/api/templates"), 2)
+            done_first = not slow.done()
+            release.set()
+            return templates.status_code, done_first, (await slow).json()
+
+    try:
+        assert asyncio.run(scenario()) == (200, True, [])
+    finally:
+        release.set()
+        main.db_io.shutdown()
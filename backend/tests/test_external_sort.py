@@ -0,0 +1,32 @@
+
+import os
+import random
+
+from services.external_sort import ExternalSorter, merge_join
+
+def test_spilled_sort_is_stable_and_cleans_up(tmp_path):
+    rng = random.Random(3)
+    items = [(rng.randrange(20), i) for i in range(200)]
+    with ExternalSorter(run_size=16, spill_dir=str(tmp_path), name="test") as sorter:
+        sorter.extend(items)
+        assert sorter.spilled_runs == 12 and sorter.count == 200
+        assert list(sorter) == sorted(items, key=lambda item: item[0])
+        assert len(os.listdir(tmp_path)) == 1
+    assert os.listdir(tmp_path) == []
+
+def test_small_inputs_stay_in_memory(tmp_path):
+    with ExternalSorter(run_size=100, spill_dir=str(tmp_path)) as sorter:
+        sorter.extend([("b", 1), ("a", 2), ("b", 0)])
+        assert list(sorter) == [("a", 2), ("b", 1), ("b", 0)]
+        assert sorter.spilled_runs == 0 and os.listdir(tmp_path) == []
+
+def test_merge_join_groups_both_sides_by_key():
+    left = [("a", 1), ("b", 2), ("b", 3), ("d", 4)]
+    right = [("b", "x"), ("c", "y"), ("d", "z")]
+    assert list(merge_join(left, right)) == [
+        ("a", [("a", 1)], []),
+        ("b", [("b", 2), ("b", 3)], [("b", "x")]),
+        ("c", [], [("c", "y")]),
+        ("d", [("d", 4)], [("d", "z")]),
+    ]
+    assert list(merge_join([], right[:1])) == [("b", [], [("b", "x")])]
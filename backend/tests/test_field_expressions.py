@@ -0,0 +1,48 @@
+
+import pytest
+
+from services.field_expressions import ExpressionError, check_template, compile_template, offset, parse_template, render
+
+INSTANCE = {"name": "LW_Pump1", "description": "Lift pump", "var_addr": "N7:010", "cluster": "cluster1"}
+CONTEXT = {"index": 2, "number": 3, "suffix": "_Run", "item": "Run", "tag": "LW_Pump1_Run", "addr": "N7:012", "desc": "Lift pump run"}
+
+def _render(text, instance=INSTANCE):
+    return render(compile_template(text), instance, CONTEXT, lambda v: str(v).replace(" ", "_"))
+
+def test_plain_text_stays_text():
+    assert compile_template("Motor {{1}}") == "Motor {1}"
+    assert parse_template("a{b:03d}c") == ["a", ("b", "03d"), "c"]
+
+def test_expressions_render_against_instance_and_member():
+    assert _render("{parent_desc} motor {number}") == "Lift pump motor 3"
+    assert _render("{offset(parent_addr, index * 2)}") == "N7:014"
+    assert _render("{upper(cluster)}_{sanitize(description)}") == "CLUSTER1_Lift_pump"
+    assert _render("{index:03d}|{'hi' if number > 2 else 'lo'}|{name[:2]}|{default(equipment, 'none')}") == "002|hi|LW|none"
+    assert _render("{num('1.5') * 2}") == "3.0"
+
+def test_offset_keeps_padding():
+    assert offset("PLC.N7:010", 5) == "PLC.N7:015" and offset("D99.X", 1) == "D100.X"
+    with pytest.raises(ExpressionError, match="negative"):
+        offset("N7:1", -2)
+    with pytest.raises(ExpressionError, match="no number"):
+        offset("TAG", 1)
+
+@pytest.mark.parametrize("text, message", [
+    ("{__import__('os')}", "can be called"),
+    ("{name.upper}", "not allowed"),
+    ("{[n for n in name]}", "not allowed"),
+    ("{bogus}", "Unknown name"),
+    ("{upper}", "is a function"),
+    ("{name", "Unclosed"),
+    ("name}", "Unmatched"),
+    ("{}", "Empty expression"),
+    ("{1 +}", "Invalid expression"),
+])
+def test_anything_outside_the_language_is_rejected(text, message):
+    with pytest.raises(ExpressionError, match=message):
+        compile_template(text)
+
+def test_evaluation_errors_are_expression_errors():
+    with pytest.raises(ExpressionError, match="ZeroDivisionError"):
+        _render("{index // 0}")
+    assert check_template("{parent}{suffix}") == "TAG.Member"
@@ -0,0 +1,44 @@
+
+import pytest
+
+from database import create_session_factory
+from models import TagEntry
+from services import hierarchy
+
+PROJECT = "/projects/hierarchy"
+
+@pytest.fixture
+def db(tmp_path):
+    db = create_session_factory(str(tmp_path / "hierarchy.db"))()
+    # NULL and '' clusters are one group; each holds tags of equipment E1 and E2
+    rows = [(None, "E1", True), ("", "E2", False), ("", "E1", False), (None, "E2", True), ("C1", "E1", True), ("C2", "E3", False)]
+    db.add_all(TagEntry(project_path=PROJECT, name=f"T{i}", cluster=cluster or "", equipment=equipment, is_trend=trend, is_alarm=False)
+               for i, (cluster, equipment, trend) in enumerate(rows))
+    db.flush()
+    # The column default turns None into '' on insert; rows saved before it existed hold NULL
+    db.query(TagEntry).filter(TagEntry.name.in_([f"T{i}" for i, row in enumerate(rows) if row[0] is None])) \
+        .update({TagEntry.cluster: None}, synchronize_session=False)
+    db.commit()
+    yield db
+    db.close()
+
+def test_null_and_empty_are_one_group(db):
+    tree = hierarchy.children(db, PROJECT)
+    assert [(g["value"], g["tags"], g["trends"], g["groups"]) for g in tree["groups"]] == [("", 4, 2, 2), ("C1", 1, 1, 1), ("C2", 1, 0, 1)]
+    assert tree["total_groups"] == 3 and tree["totals"] == {"tags": 6, "trends": 3, "alarms": 0}
+
+    nested = hierarchy.children(db, PROJECT, depth=2)["groups"][0]
+    assert [(c["value"], c["tags"]) for c in nested["children"]] == [("E1", 2), ("E2", 2)] and nested["groups"] == 2
+
+def test_paging_counts_the_merged_group_once(db):
+    first = hierarchy.children(db, PROJECT, limit=2)
+    assert [g["value"] for g in first["groups"]] == ["", "C1"] and first["total_groups"] == 3
+    second = hierarchy.children(db, PROJECT, limit=2, offset=2, depth=2)
+    assert [g["value"] for g in second["groups"]] == ["C2"] and second["total_groups"] == 3
+    assert second["totals"]["tags"] == 6
+
+def test_rows_under_a_node(db):
+    page, total = hierarchy.rows(db, PROJECT, path=["", "E2"])
+    assert total == 2 and len(page) == 2
+    with pytest.raises(ValueError):
+        hierarchy.children(db, PROJECT, levels=["cluster", "bogus"])
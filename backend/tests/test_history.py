@@ -0,0 +1,50 @@
+
+from database import create_session_factory
+from models import ProjectVersion, TagEntry
+from services.history import HistoryStore
+from services.tag_store import sync_tags
+
+PROJECT = "/projects/history"
+
+def _save(db, history, names):
+    before_ids = {}
+    before = history.current_rows(db, PROJECT, before_ids)
+    sync_tags(db, PROJECT, [{"name": n, "description": f"{n} desc", "var_addr": f"PLC.{n}"} for n in names], commit=False)
+    version = history.record_save(db, PROJECT, before, commit=False, before_ids=before_ids)["version"]
+    db.commit()
+    return version
+
+def _rows(db):
+    return [(row_id, name) for row_id, name in db.query(TagEntry.id, TagEntry.name).filter(TagEntry.project_path == PROJECT).order_by(TagEntry.id)]
+
+def _versions(db):
+    return db.query(ProjectVersion).filter(ProjectVersion.project_path == PROJECT).count()
+
+def test_restore_puts_deleted_rows_back_in_place(tmp_path):
+    db = create_session_factory(str(tmp_path / "history.db"))()
+    history = HistoryStore()
+    first = _save(db, history, ["A", "B", "C", "D"])
+    original = _rows(db)
+    _save(db, history, ["A", "C", "D"])
+    assert [name for _, name in _rows(db)] == ["A", "C", "D"]
+
+    # A dry run reports the restore and writes nothing
+    preview = history.restore(db, PROJECT, first, dry_run=True)
+    assert preview["tags"] == {"added": 1, "modified": 0, "removed": 0} and preview["conflicts"] == []
+    assert not (db.new or db.dirty or db.deleted)
+    assert _rows(db) == original[:1] + original[2:] and _versions(db) == 2
+
+    restored = history.restore(db, PROJECT, first)
+    assert restored["new_version"] is not None
+    assert _rows(db) == original
+    assert sorted(history.tags_at(db, PROJECT, restored["new_version"])) == sorted(history.tags_at(db, PROJECT, first))
+
+    # Undoing the restore and restoring again nets out: no empty version is recorded
+    history.restore(db, PROJECT, restored["new_version"] - 1)
+    assert [name for _, name in _rows(db)] == ["A", "C", "D"]
+    history.restore(db, PROJECT, restored["new_version"])
+    assert _rows(db) == original
+    versions = _versions(db)
+    again = history.restore(db, PROJECT, restored["new_version"])
+    assert again["new_version"] is None and _versions(db) == versions
+    db.close()
@@ -0,0 +1,70 @@
+
+import threading
+
+import pytest
+
+from services.job_manager import Job, JobManager
+
+def _wait(job, timeout=5.0):
+    job._future.result(timeout)
+    return job.snapshot()
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1)
+    yield manager
+    manager.shutdown()
+
+def test_stages_progress_and_result(manager):
+    def work(job):
+        for name in ("read", "expand"):
+            with job.stage(name):
+                pass
+        return {"count": 3}
+    job = manager.submit("generate", "/p", work, stages=["read", "expand", "write"])
+    snapshot = _wait(job)
+    assert snapshot["status"] == "succeeded" and snapshot["progress"] == 1.0 and job.result == {"count": 3}
+    assert [(s["name"], s["status"]) for s in snapshot["stages"]] == [("read", "done"), ("expand", "done")]
+    assert manager.get(job.id) is job and manager.list_jobs()[0]["id"] == job.id
+
+def test_failures_are_reported(manager):
+    def work(job):
+        with job.stage("read"):
+            raise ValueError("broken DBF")
+    snapshot = _wait(manager.submit("import", "/p", work))
+    assert snapshot["status"] == "failed" and snapshot["error"] == "broken DBF"
+    assert snapshot["stages"][0]["status"] == "failed"
+
+def test_cancel_stops_at_the_next_stage(manager):
+    started, release = threading.Event(), threading.Event()
+    def blocking(job):
+        with job.stage("read"):
+            started.set()
+            release.wait(5)
+        with job.stage("write"):
+            return "written"
+    running = manager.submit("write", "/p", blocking, stages=["read", "write"])
+    queued = manager.submit("write", "/p", lambda job: "never")
+    started.wait(5)
+    assert manager.cancel(queued.id) and queued.status == "cancelled"
+    assert running.cancel()
+    release.set()
+    snapshot = _wait(running)
+    assert snapshot["status"] == "cancelled" and [s["name"] for s in snapshot["stages"]] == ["read"]
+    assert not running.cancel()
+
+def test_finished_jobs_expire():
+    manager = JobManager(max_workers=1, result_ttl=0.0)
+    try:
+        job = manager.submit("import", "/p", lambda job: None)
+        _wait(job)
+        job.finished_at -= 1
+        assert manager.get(job.id) is None
+    finally:
+        manager.shutdown()
+
+def test_a_job_used_synchronously():
+    job = Job("write", "/p", ["write"])
+    with job.stage("write"):
+        pass
+    assert job.progress() == 1.0 and job.status == "queued"
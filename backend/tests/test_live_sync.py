@@ -0,0 +1,69 @@
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.live_sync import ProjectChannels, reset_message
+
+def _delta(previous, revision):
+    return {"type": "delta", "previous": previous, "revision": revision, "source": "save"}
+
+def test_replay_covers_only_gapless_ranges():
+    channels = ProjectChannels(replay=3)
+    for revision in range(1, 6):
+        channels.publish("/p", _delta(revision - 1, revision))
+    channels.publish("/p", None)
+    assert [m["revision"] for m in channels.replay("/p", 3, 5)] == [4, 5]
+    assert channels.replay("/p", 5, 5) == []
+    assert channels.replay("/p", 1, 5) is None  # revision 2 is no longer kept
+    channels.publish("/p", _delta(7, 8))  # written without a broadcast in between
+    assert channels.replay("/p", 5, 8) is None
+
+def test_slow_subscribers_get_one_reset():
+    channels = ProjectChannels(queue_size=2)
+
+    async def scenario():
+        queue = channels.subscribe("/p")
+        for revision in range(1, 5):
+            channels.publish("/p", _delta(revision - 1, revision))
+        await asyncio.sleep(0)
+        messages = [queue.get_nowait() for _ in range(queue.qsize())]
+        channels.unsubscribe("/p", queue)
+        return messages
+
+    messages = asyncio.run(scenario())
+    assert messages[0] == reset_message(3, source="overflow") and messages[-1]["revision"] == 4
+    assert channels.snapshot() == {"projects": {}, "subscribers": 0}
+
+@pytest.fixture(scope="module")
+def client():
+    import main
+    return TestClient(main.app)
+
+def test_saves_reach_open_grids_as_row_deltas(client):
+    project_path = "/projects/live"
+    client.post("/api/save_tags", json={"project_path": project_path, "tags": [{"name": "A", "description": "one"}]})
+    with client.websocket_connect(f"/api/projects/live?project_path={project_path}") as socket:
+        hello = socket.receive_json()
+        assert hello == {"type": "hello", "project_path": project_path, "revision": 1}
+        state = client.get("/api/state", params={"path": project_path}).json()["tags"]
+        row = state[0] if isinstance(state, list) else dict(zip(state["$columns"], state["$rows"][0]))
+        client.post("/api/save_tags", json={"project_path": project_path, "base_revision": 1,
+                                            "tags": [{**row, "description": "two"}, {"id": "new_1", "name": "B"}]})
+        delta = socket.receive_json()
+        assert delta["type"] == "delta" and (delta["previous"], delta["revision"]) == (1, 2)
+        assert [u["fields"]["description"] for u in delta["updated"]] == ["two"]
+        assert [(a["client_id"], a["fields"]["name"]) for a in delta["added"]] == [("new_1", "B")]
+        socket.send_text("ping")
+        assert socket.receive_json() == {"type": "pong"}
+
+    # Reconnecting with the revision it had, a client gets what it missed
+    with client.websocket_connect(f"/api/projects/live?project_path={project_path}&since=1") as socket:
+        assert socket.receive_json()["revision"] == 2
+        missed = socket.receive_json()
+        assert missed["type"] == "delta" and (missed["previous"], missed["revision"]) == (1, 2)
+    # A revision the server never had cannot be caught up: reload
+    with client.websocket_connect(f"/api/projects/live?project_path={project_path}&since=9") as socket:
+        socket.receive_json()
+        assert socket.receive_json() == reset_message(2, 9, "replay")
@@ -0,0 +1,56 @@
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.metrics import MetricsRegistry, RequestProfiler
+
+def test_counters_histograms_and_gauges_render_as_prometheus_text():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.describe("taggen_rows_total", "counter", "Rows.")
+    registry.inc("taggen_rows_total", 2, table="variable")
+    registry.inc("taggen_rows_total", 3, table="variable")
+    registry.inc("taggen_rows_total", 0, table="trend")
+    registry.add("taggen_open", 1)
+    registry.observe("taggen_seconds", 0.5, stage='say "hi"')
+    text = registry.render()
+    assert "# HELP taggen_rows_total Rows.\n# TYPE taggen_rows_total counter\n" in text
+    assert 'taggen_rows_total{table="variable"} 5\n' in text and "trend" not in text
+    assert "# TYPE taggen_open gauge\ntaggen_open 1\n" in text
+    assert 'taggen_seconds_bucket{stage="say \\"hi\\"",le="0.1"} 0\n' in text
+    assert 'taggen_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 1\n' in text
+    registry.reset()
+    assert "taggen_rows_total" not in registry.render() and "taggen_open 1" in registry.render()
+
+def test_request_scope_collects_stages_and_counters():
+    registry = MetricsRegistry()
+    with registry.request_scope("GET", "/api/state") as scope:
+        with registry.timer("load"):
+            pass
+        registry.inc("taggen_rows_read_total", 4)
+    registry.inc("taggen_rows_read_total", 1)
+    assert [s["name"] for s in scope.stages] == ["load"] and scope.counters == {"rows_read": 4}
+    assert scope.breakdown().endswith("rows_read=4")
+    assert registry.current_scope() is None
+
+def test_profiles_only_requests_that_ask_for_one():
+    profiler = RequestProfiler(max_reports=1)
+    work = profiler.wrap(lambda: sum(range(100)))
+    assert work() == 4950 and profiler.list_reports() == []
+    with profiler.requested("1") as holder:
+        assert work() == 4950
+    assert len(holder) == 1 and "function calls" in profiler.get(holder[0])["text"]
+    with profiler.requested("bogus") as holder:
+        assert holder is None
+
+@pytest.fixture(scope="module")
+def main():
+    import main
+    return main
+
+def test_metrics_endpoint_and_server_timing(main):
+    client = TestClient(main.app)
+    response = client.get("/", headers={"X-Profile": "1"})
+    assert "total;dur=" in response.headers["Server-Timing"]
+    report = client.get(f"/api/metrics/profiles/{response.headers['X-Profile-Id']}")
+    assert report.status_code == 200 and "function calls" in report.text
+    assert 'taggen_request_seconds_count{method="GET",route="/",status="200"}' in client.get("/api/metrics").text
@@ -0,0 +1,23 @@
+
+import os
+
+import pytest
+
+from services.project_locks import LockTimeout, ProjectLockManager
+
+def test_spellings_of_one_project_share_a_lock(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "plant").mkdir()
+    locks = ProjectLockManager()
+    with locks.exclusive(str(tmp_path / "plant"), "save"):
+        for other in ("plant", "./plant", "plant" + os.sep, str(tmp_path / "x" / ".." / "plant")):
+            with pytest.raises(LockTimeout):
+                with locks.shared(other, "state", timeout=0.01):
+                    pass
+    assert locks.snapshot() == []
+
+def test_different_projects_do_not_wait(tmp_path):
+    locks = ProjectLockManager()
+    with locks.exclusive(str(tmp_path / "a"), "save"):
+        with locks.exclusive(str(tmp_path / "b"), "save", timeout=0.01):
+            assert len(locks.snapshot()) == 2
@@ -0,0 +1,54 @@
+
+from database import create_session_factory
+from models import TagEntry, TagReference
+from services.reference_graph import ReferenceGraph, expression_references, rename_references
+from services.tag_store import sync_tags
+from services.udt_expander import UDTExpander
+
+PROJECT = "/projects/references"
+
+def _tags():
+    return [
+        {"name": "M1", "entry_type": "udt_instance", "udt_type": "Motor_Basic", "type": "Motor_Basic", "var_addr": "PLC.M1"},
+        {"name": "M1_Run", "entry_type": "member", "var_addr": "PLC.M1.Run"},
+        {"name": "M1_Fault", "entry_type": "member", "var_addr": "PLC.M1.Fault"},
+        {"name": "M10_Run", "var_addr": "PLC.M10"},
+        {"name": "SUM", "var_addr": "PLC.SUM", "is_trend": True, "trend_expr": "M1_Run + M10_Run"},
+        {"name": "DUP", "var_addr": "PLC.D1", "is_trend": True, "trend_expr": "M1_Fault"},
+        {"name": "DUP", "var_addr": "PLC.D2", "is_alarm": True, "alarm_var_a": "M10_Run"},
+    ]
+
+def _graph(tmp_path):
+    db = create_session_factory(str(tmp_path / "references.db"))()
+    graph = ReferenceGraph(UDTExpander())
+    sync_tags(db, PROJECT, _tags())
+    graph.rebuild(db, PROJECT)
+    return db, graph
+
+def test_expressions_skip_functions_literals_and_fields():
+    assert expression_references('TAG_A + Max(TAG_B, 2) AND "TAG_C" + TAG_D.Field') == ["TAG_A", "TAG_B", "TAG_D"]
+    assert rename_references('TAG_A + TAG_AB + "TAG_A" + TAG_A.Q', {"TAG_A": "X"}) == 'X + TAG_AB + "TAG_A" + X.Q'
+
+def test_rows_sharing_a_name_keep_all_their_edges(tmp_path):
+    db, graph = _graph(tmp_path)
+    referenced_by = {e["target"] for e in graph.references(db, PROJECT, "DUP")["references"]}
+    assert referenced_by == {"M1_Fault", "M10_Run"}
+    # An unchanged save leaves the graph alone
+    assert graph.sync(db, PROJECT, _tags())["owners_changed"] == 0
+    db.close()
+
+def test_rename_cascades_to_saved_members_and_references(tmp_path):
+    db, graph = _graph(tmp_path)
+    preview = graph.rename(db, PROJECT, "M1", "PUMP", dry_run=True)
+    assert preview["renamed"]["M1_Run"] == "PUMP_Run"
+    assert db.query(TagEntry).filter(TagEntry.name == "M1_Run").count() == 1
+
+    result = graph.rename(db, PROJECT, "M1", "PUMP")
+    names = [n for (n,) in db.query(TagEntry.name).filter(TagEntry.project_path == PROJECT).order_by(TagEntry.id)]
+    assert names == ["PUMP", "PUMP_Run", "PUMP_Fault", "M10_Run", "SUM", "DUP", "DUP"]
+    exprs = dict(db.query(TagEntry.var_addr, TagEntry.trend_expr).filter(TagEntry.project_path == PROJECT))
+    assert exprs["PLC.SUM"] == "PUMP_Run + M10_Run" and exprs["PLC.D1"] == "PUMP_Fault"
+    assert result["changed_rows"] == 5
+    targets = {t for (t,) in db.query(TagReference.target).filter(TagReference.project_path == PROJECT)}
+    assert "M1_Run" not in targets and {"PUMP", "PUMP_Run", "PUMP_Fault", "M10_Run"} <= targets
+    db.close()
@@ -0,0 +1,97 @@
+
+import os
+
+import pytest
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    # main opens ./project_data.db on import: keep it in a scratch directory
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("db"))
+    try:
+        import main
+        yield main
+    finally:
+        os.chdir(cwd)
+
+def _tags(count):
+    return [{"name": f"TAG_{i:03d}", "description": f"Tag {i}", "var_addr": f"PLC.TAG_{i:03d}", "is_trend": i % 2 == 0}
+            for i in range(count)]
+
+def _saved(main, project_path):
+    from models import ProjectVersion, TagEntry, TagReference
+    db = main.SessionLocal()
+    try:
+        return {"tags": db.query(TagEntry).filter(TagEntry.project_path == project_path).count(),
+                "references": db.query(TagReference).filter(TagReference.project_path == project_path).count(),
+                "versions": db.query(ProjectVersion).filter(ProjectVersion.project_path == project_path).count(),
+                "revision": main.current_revision(db, project_path)}
+    finally:
+        db.close()
+
+def test_failed_history_record_leaves_nothing_saved(main, monkeypatch):
+    project_path = "/projects/history_failure"
+    tags = _tags(5)
+    tags[1]["trend_expr"] = "TAG_000 + TAG_002"
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("history unavailable")
+    monkeypatch.setattr(main.history, "record_save", fail)
+    with pytest.raises(RuntimeError):
+        main.with_session(main._save_tags, main.SaveTagsRequest(project_path=project_path, tags=tags))
+    assert _saved(main, project_path) == {"tags": 0, "references": 0, "versions": 0, "revision": 0}
+
+    monkeypatch.undo()
+    main.with_session(main._save_tags, main.SaveTagsRequest(project_path=project_path, tags=tags))
+    saved = _saved(main, project_path)
+    assert saved["tags"] == 5 and saved["versions"] == 1 and saved["revision"] == 1
+
+def _state(client, project_path):
+    state = client.get("/api/state", params={"path": project_path}).json()
+    tags = state["tags"]
+    if isinstance(tags, dict):
+        tags = [dict(zip(tags["$columns"], row)) for row in tags["$rows"]]
+    return state["revision"], tags
+
+def _apply_saved(tags, saved):
+    # What the grid does with a save response: every row takes the id / version it was saved as
+    return [{**t, "id": row_id, "version": version} for t, (row_id, version) in zip(tags, saved["rows"])]
+
+def test_consecutive_saves_from_one_client(main):
+    from fastapi.testclient import TestClient
+    project_path = "/projects/two_saves"
+    client = TestClient(main.app)
+    first = client.post("/api/save_tags", json={"project_path": project_path, "tags": _tags(3)}).json()
+    revision, tags = _state(client, project_path)
+    assert revision == first["revision"] == 1
+
+    # First save: one edit and one new row (client id)
+    tags[1]["description"] = "Edited once"
+    tags.append({"id": "new_1", "name": "TAG_NEW", "var_addr": "PLC.NEW"})
+    saved = client.post("/api/save_tags", json={"project_path": project_path, "tags": tags, "base_revision": revision})
+    assert saved.status_code == 200
+    saved = saved.json()
+    assert saved["previous"] == 1 and saved["revision"] == 2
+    assert [version for _, version in saved["rows"]] == [1, 2, 1, 2]
+    assert saved["rows"][3][0] == saved["added"][0]["id"] and saved["added"][0]["client_id"] == "new_1"
+
+    # Without the returned versions the client's own first save reads as a newer change
+    stale = [dict(t) for t in tags]
+    stale[1]["description"] = "Edited twice"
+    conflict = client.post("/api/save_tags", json={"project_path": project_path, "tags": stale, "base_revision": saved["revision"]})
+    assert conflict.status_code == 409
+
+    # Second save, with them: accepted, and the new row is not added again
+    tags = _apply_saved(tags, saved)
+    tags[1]["description"] = "Edited twice"
+    tags[3]["description"] = "New row edited"
+    second = client.post("/api/save_tags", json={"project_path": project_path, "tags": tags, "base_revision": saved["revision"]})
+    assert second.status_code == 200
+    second = second.json()
+    assert second["revision"] == 3 and second["added"] == []
+    assert [row_id for row_id, _ in second["rows"]] == [row_id for row_id, _ in saved["rows"]]
+
+    revision, tags = _state(client, project_path)
+    assert revision == 3
+    assert [t["description"] for t in tags] == ["Tag 0", "Edited twice", "Tag 2", "New row edited"]
+    assert [t["version"] for t in tags] == [1, 3, 1, 3]
@@ -0,0 +1,51 @@
+
+import gzip
+import json
+
+import pytest
+
+from services.serialization import (
+    COLUMNAR_MEDIA_TYPE, MIN_COMPRESS_BYTES, PayloadResponse, Rows, encode, negotiate, negotiated_encoding,
+    negotiated_format, to_columnar,
+)
+from services.tag_record import TagRecord
+
+def test_negotiation_honours_q_zero():
+    with negotiate(f"{COLUMNAR_MEDIA_TYPE};q=0, application/json", "gzip;q=0"):
+        assert negotiated_format() == "json" and negotiated_encoding() is None
+    with negotiate(f"application/json, {COLUMNAR_MEDIA_TYPE}", "deflate, gzip"):
+        assert negotiated_format() == "columnar" and negotiated_encoding() == "gzip"
+    assert negotiated_format() == "json"
+
+def test_rows_and_records_encode_as_objects():
+    payload = {"revision": 3, "tags": Rows(["name", "is_trend"], [("A", True), ("B", False)]), "record": TagRecord(name="C")}
+    body, media_type = encode(payload, "json")
+    assert media_type == "application/json"
+    assert json.loads(body) == {"revision": 3, "tags": [{"name": "A", "is_trend": True}, {"name": "B", "is_trend": False}],
+                                "record": {"name": "C"}}
+
+def test_columnar_sends_keys_once():
+    rows = [{"name": "A", "type": "DIGITAL"}, TagRecord(name="B", cluster="C1")]
+    assert to_columnar({"tags": rows, "one": [{"x": 1}]}) == {
+        "tags": {"$columns": ["name", "type", "cluster"], "$rows": [["A", "DIGITAL", None], ["B", None, "C1"]]},
+        "one": [{"x": 1}],
+    }
+    body, media_type = encode({"tags": Rows(["name"], [("A",)])}, "columnar")
+    assert media_type == COLUMNAR_MEDIA_TYPE and json.loads(body) == {"tags": {"$columns": ["name"], "$rows": [["A"]]}}
+
+def test_large_bodies_are_compressed():
+    content = {"tags": [{"name": f"TAG_{i:05d}"} for i in range(MIN_COMPRESS_BYTES // 10)]}
+    with negotiate("application/json", "gzip"):
+        response = PayloadResponse(content)
+    assert response.headers["Content-Encoding"] == "gzip" and response.headers["Vary"] == "Accept, Accept-Encoding"
+    assert json.loads(gzip.decompress(response.body)) == content
+    with negotiate("application/json", "gzip"):
+        small = PayloadResponse({"ok": True})
+    assert "Content-Encoding" not in small.headers and json.loads(small.body) == {"ok": True}
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    with negotiate("application/msgpack", None):
+        response = PayloadResponse({"tags": Rows(["name"], [("A",)])})
+    assert response.media_type == "application/msgpack"
+    assert msgpack.unpackb(response.body) == {"tags": [{"name": "A"}]}
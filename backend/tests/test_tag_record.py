@@ -0,0 +1,42 @@
+
+import copy
+import json
+import pickle
+import sys
+
+import pytest
+
+from services.tag_record import TagRecord, json_default, make_record_class, to_plain
+
+def test_record_behaves_like_a_dict():
+    rec = TagRecord({"name": "PUMP_01", "cluster": "C1"}, custom="x")
+    assert rec["name"] == "PUMP_01" and rec.get("var_addr") is None and "var_addr" not in rec
+    assert rec == {"name": "PUMP_01", "cluster": "C1", "custom": "x"}
+    rec["var_addr"] = "PLC.P1"
+    del rec["custom"]
+    assert list(rec) == [k for k in TagRecord.FIELDS if k in ("name", "cluster", "var_addr")]
+    with pytest.raises(KeyError):
+        rec["custom"]
+    with pytest.raises(KeyError):
+        del rec["description"]
+    other = rec.copy()
+    other["name"] = "PUMP_02"
+    assert rec["name"] == "PUMP_01" and copy.copy(rec) == rec
+
+def test_rows_intern_low_cardinality_fields():
+    cluster = "".join(["Clu", "ster1"])
+    rec = TagRecord.from_row(["name", "cluster", "unknown"], ["A", cluster, 1])
+    assert rec["cluster"] is sys.intern("Cluster1") and rec["unknown"] == 1
+    blank = TagRecord.blank()
+    assert blank["name"] == "" and len(blank) == len(TagRecord.FIELDS)
+    assert TagRecord.from_values(["v"] * len(TagRecord.FIELDS))["name"] == "v"
+
+def test_records_pickle_and_serialize():
+    rec = TagRecord(name="A", extra=[1])
+    assert pickle.loads(pickle.dumps(rec)) == rec
+    assert to_plain({"rows": [rec], "pair": (rec,)}) == {"rows": [{"name": "A", "extra": [1]}], "pair": [{"name": "A", "extra": [1]}]}
+    assert json.loads(json.dumps([rec], default=json_default)) == [{"name": "A", "extra": [1]}]
+
+def test_field_names_may_not_shadow_record_methods():
+    with pytest.raises(ValueError, match="items"):
+        make_record_class("Bad", ["name", "items"])
@@ -0,0 +1,47 @@
+
+from services.tag_schema import (
+    API_FIELDS, DBF_FIELD_NAMES, DBF_FIELDS, DBF_RECORD_TYPES, DBF_SCHEMAS, DBF_VALUE_GETTERS,
+    StateMapper, api_to_columns, dbf_to_flat, flat_to_dbf,
+)
+
+def test_tables_are_consistent():
+    for table, fields in DBF_FIELDS.items():
+        names = DBF_FIELD_NAMES[table]
+        assert len(set(names)) == len(names)
+        assert [name for name, _, _ in DBF_SCHEMAS[table]] == names == list(DBF_RECORD_TYPES[table].FIELDS)
+        assert all(0 < f.length <= 254 for f in fields)
+    columns = [f.column for f in API_FIELDS]
+    assert len(set(columns)) == len(columns)
+
+def test_flat_entry_to_dbf_values():
+    entry = {"name": "PUMP_01", "description": "Pump", "var_addr": "PLC.P1"}
+    variable = dict(zip(DBF_FIELD_NAMES["variable"], flat_to_dbf("variable")(entry)))
+    assert variable["NAME"] == "PUMP_01" and variable["COMMENT"] == "Pump" and variable["ADDR"] == "PLC.P1"
+    assert variable["TYPE"] == "DIGITAL" and variable["CLUSTER"] == "Cluster1"
+
+    # Imported rows keep their exact trend values, generated rows fall back to shared fields
+    entry.update(var_eng_units="kW", trend_eng_units="W")
+    imported = dict(zip(DBF_FIELD_NAMES["trend"], flat_to_dbf("trend", True)(entry)))
+    generated = dict(zip(DBF_FIELD_NAMES["trend"], flat_to_dbf("trend", False)(entry)))
+    assert imported["NAME"] == generated["NAME"] == "PUMP_01"
+    assert imported["ENG_UNITS"] == "W" and generated["ENG_UNITS"] == "kW"
+    assert generated["SAMPLEPER"] == "1" and generated["COMMENT"] == "Pump"
+
+def test_dbf_rows_map_to_flat_keys_with_defaults_for_missing_columns():
+    mapper = dbf_to_flat("variable", ("ADDR", "NAME"))
+    flat = dict(mapper.items(["PLC.P1", "PUMP_01"]))
+    assert flat["name"] == "PUMP_01" and flat["var_addr"] == "PLC.P1"
+    assert flat["type"] == "DIGITAL" and flat["description"] == ""
+    assert mapper.column(["PLC.P1", "PUMP_01"], "NAME") == "PUMP_01" and mapper.column([], "GUID") is None
+
+def test_api_aliases_round_trip_through_columns():
+    columns = api_to_columns().to_dict({"citectName": "", "name": "PUMP_01", "address": "PLC.P1", "isTrend": True})
+    assert columns["name"] == "PUMP_01" and columns["var_addr"] == "PLC.P1"
+    assert columns["is_trend"] is True and columns["is_alarm"] is False and columns["entry_type"] == "single"
+    state = StateMapper(list(columns))(tuple(columns.values()))
+    assert state["name"] == "PUMP_01" and state["address"] == state["var_addr"] == "PLC.P1"
+    assert state["isTrend"] is True
+
+def test_value_getters_follow_schema_order():
+    record = DBF_RECORD_TYPES["digalm"].from_values(range(len(DBF_FIELD_NAMES["digalm"])))
+    assert DBF_VALUE_GETTERS["digalm"](record) == tuple(range(len(DBF_FIELD_NAMES["digalm"])))
@@ -0,0 +1,60 @@
+
+import pytest
+
+from database import create_session_factory
+from models import TagEntry
+from services import tag_search
+from services.tag_search import build_query, search
+
+PROJECT = "/projects/search"
+
+@pytest.fixture
+def db(tmp_path):
+    db = create_session_factory(str(tmp_path / "search.db"))()
+    db.add_all([
+        TagEntry(project_path=PROJECT, name="LW_Pump1_Run", description="Lift pump running", var_addr="PLC.N7:0", equipment="Pump1"),
+        TagEntry(project_path=PROJECT, name="LW_Pump2_Run", description="Spare pump", var_addr="PLC.N7:1", equipment="Pump2"),
+        TagEntry(project_path=PROJECT, name="LW_Valve1_Open", description="Inlet valve, pump side", var_addr="PLC.N7:2"),
+        TagEntry(project_path="/projects/other", name="LW_Pump9_Run", description="Other project pump"),
+    ])
+    db.commit()
+    yield db
+    db.close()
+
+def test_queries_are_quoted_prefix_terms():
+    assert build_query('pum "lift pump" a"b') == '"pum"* "lift pump" "a""b"*'
+    assert build_query("pum", prefix=False) == '"pum"'
+
+def test_search_is_scoped_ranked_and_highlighted(db):
+    result = search(db, PROJECT, "pum")
+    assert result["total"] == 3 and result["ranked"]
+    names = [item["name"] for item in result["items"]]
+    assert set(names) == {"LW_Pump1_Run", "LW_Pump2_Run", "LW_Valve1_Open"}
+    assert names[-1] == "LW_Valve1_Open"  # matched in the description only
+    first = result["items"][0]
+    assert first["highlights"]["name"].startswith("LW_<mark>Pump")
+    assert search(db, PROJECT, "pump1 lift")["total"] == 1
+
+def test_index_follows_updates_and_deletes(db):
+    tag = db.query(TagEntry).filter(TagEntry.name == "LW_Pump2_Run").one()
+    tag.name = "LW_Blower2_Run"
+    db.commit()
+    assert [i["name"] for i in search(db, PROJECT, "blower")["items"]] == ["LW_Blower2_Run"]
+    db.delete(tag)
+    db.commit()
+    assert search(db, PROJECT, "blower")["total"] == 0
+
+def test_fields_raw_queries_and_errors(db):
+    assert search(db, PROJECT, "pump", fields=["name"])["total"] == 2
+    assert search(db, PROJECT, "valve OR spare", raw=True)["total"] == 2
+    assert search(db, PROJECT, "  ")["items"] == []
+    with pytest.raises(ValueError, match="Unknown search field"):
+        search(db, PROJECT, "pump", fields=["guid"])
+    with pytest.raises(ValueError, match="Invalid search query"):
+        search(db, PROJECT, '"unbalanced', raw=True)
+
+def test_large_result_sets_come_back_in_grid_order(db, monkeypatch):
+    monkeypatch.setattr(tag_search, "RANK_MAX_MATCHES", 1)
+    result = search(db, PROJECT, "pump", limit=2)
+    assert not result["ranked"] and result["total"] == 3
+    assert [i["name"] for i in result["items"]] == ["LW_Pump1_Run", "LW_Pump2_Run"] and result["items"][0]["rank"] is None
@@ -0,0 +1,90 @@
+
+import pytest
+
+from services import udt_expander
+from services.tag_schema import DBF_VALUE_GETTERS
+from services.udt_expander import UDTExpander
+
+def _entries(count):
+    return [{"name": f"M{i}", "entry_type": "udt_instance", "type": "Motor_Basic", "udt_type": "Motor_Basic",
+             "description": f"Motor {i}", "var_addr": f"PLC.M{i}"} if i % 3 == 0 else
+            {"name": f"T{i}", "var_addr": f"PLC.T{i}", "is_trend": True, "is_alarm": i % 2 == 0} for i in range(count)]
+
+def _values(output):
+    return {t: [DBF_VALUE_GETTERS[t](r) for r in records] for t, records in output.items()}
+
+def test_parallel_expansion_matches_serial(monkeypatch):
+    monkeypatch.setattr(udt_expander, "PARALLEL_CHUNK_SIZE", 50)
+    entries = _entries(400)
+    templates = {"Valve": {"members": [{"suffix": ".Open", "type": "DIGITAL", "address_offset": ".Open",
+                                        "comment_template": "{parent_desc} Open", "is_trend": True}]}}
+    valves = [{"name": f"V{i}", "entry_type": "udt_instance", "type": "Valve", "udt_type": "Valve",
+               "description": f"Valve {i}", "var_addr": f"PLC.V{i}"} for i in range(120)]
+    parallel = UDTExpander(workers=2, parallel_threshold=100)
+    serial = UDTExpander(workers=1)
+    try:
+        assert _values(parallel.expand_tags(entries)) == _values(serial.expand_tags(entries))
+        # Same pool, other templates: workers must not reuse the previous call's
+        assert _values(parallel.expand_tags(valves, templates)) == _values(serial.expand_tags(valves, templates))
+        assert udt_expander.expand_pool() is udt_expander.expand_pool()
+    finally:
+        udt_expander.shutdown_expand_pool()
+
+def test_chunks_carry_the_config_only_to_unprimed_workers(monkeypatch):
+    monkeypatch.setattr(udt_expander, "_worker_configs", udt_expander.OrderedDict())
+    entries = _entries(30)
+    config = udt_expander.pickle.dumps((UDTExpander().templates, {}))
+    assert udt_expander._expand_chunk("k1", entries) is None
+    primed = udt_expander._expand_chunk("k1", entries, config)
+    assert udt_expander._expand_chunk("k1", entries) == primed
+    assert primed["variable"] and len(udt_expander._worker_configs) == 1
+
+    sent = []
+    submit = udt_expander.ProcessPoolExecutor.submit
+    def record(pool, fn, *args):
+        sent.append(args)
+        return submit(pool, fn, *args)
+    monkeypatch.setattr(udt_expander.ProcessPoolExecutor, "submit", record)
+    monkeypatch.setattr(udt_expander, "PARALLEL_CHUNK_SIZE", 50)
+    try:
+        entries = _entries(400)
+        assert _values(UDTExpander(workers=2, parallel_threshold=100).expand_tags(entries)) == _values(UDTExpander(workers=1).expand_tags(entries))
+    finally:
+        udt_expander.shutdown_expand_pool()
+    first_sends = [args for args in sent if len(args) == 2]
+    assert len(first_sends) == 8 and len(sent) - len(first_sends) <= len(first_sends)
+
+def test_member_properties_constants_expressions_and_numbers():
+    templates = {"Meter": {"members": [{"suffix": "_Flow", "address_offset": ".Flow", "comment_template": "{parent_desc} flow",
+                                        "is_trend": True, "sample_period": 5, "trend_files": "{number}", "engFull": 100.0}]}}
+    entries = [{"name": f"FT{i}", "entry_type": "udt_instance", "type": "Meter", "udt_type": "Meter",
+                "description": f"Meter {i}", "var_addr": f"PLC.FT{i}"} for i in range(2)]
+    output = UDTExpander(workers=1).expand_tags(entries, templates)
+    variable, trend = output["variable"][1], output["trend"][1]
+    assert (variable.NAME, variable.ADDR, variable.COMMENT, variable.ENG_FULL) == ("FT1_Flow", "PLC.FT1.Flow", "Meter 1 flow", 100.0)
+    assert (trend.SAMPLEPER, trend.FILES) == (5, "1")
+
+def test_nested_templates_compose_and_reject_cycles():
+    templates = {
+        "Motor": {"members": [{"suffix": "_Run", "address_offset": ".Run", "comment_template": "{parent_desc} running"}]},
+        "Pump": {"members": [{"suffix": "_M1", "address_offset": ".M1", "comment_template": "{parent_desc} motor 1", "template": "Motor"},
+                             {"suffix": "_Fault", "address_offset": ".Fault", "comment_template": "{parent_desc} fault"}]},
+    }
+    expander = UDTExpander(workers=1)
+    entry = {"name": "P1", "entry_type": "udt_instance", "type": "Pump", "udt_type": "Pump", "description": "Pump 1", "var_addr": "PLC.P1"}
+    variable = expander.expand_tags([dict(entry)], templates)["variable"]
+    assert [(r.NAME, r.ADDR, r.COMMENT) for r in variable] == [
+        ("P1_M1_Run", "PLC.P1.M1.Run", "Pump 1 motor 1 running"), ("P1_Fault", "PLC.P1.Fault", "Pump 1 fault")]
+    assert expander.flatten(templates, "Pump") is expander.flatten(templates, "Pump")
+
+    # Editing a nested template changes the outer template's version, so nothing stale is reused
+    version = udt_expander.template_version(templates, "Pump")
+    templates["Motor"]["members"][0]["suffix"] = "_Running"
+    assert udt_expander.template_version(templates, "Pump") != version
+    assert expander.flatten(templates, "Pump")[0]["suffix"] == "_M1_Running"
+
+    templates["Motor"]["members"].append({"suffix": "_P", "template": "Pump"})
+    with pytest.raises(udt_expander.TemplateError, match="Pump -> Motor -> Pump"):
+        expander.flatten(templates, "Pump")
+    with pytest.raises(udt_expander.TemplateError, match="unknown template 'Gearbox'"):
+        udt_expander.template_closure({"Drive": {"members": [{"template": "Gearbox"}]}}, "Drive")
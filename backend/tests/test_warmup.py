@@ -0,0 +1,73 @@
+
+import json
+import os
+
+import pytest
+
+from database import create_session_factory
+from models import TagEntry, UdtTemplate
+from services import warmup as warmup_module
+from services.project_locks import ProjectLockManager
+from services.udt_expander import UDTExpander
+from services.warmup import ProjectWarmup
+
+from benchmarks.synthetic_project import SyntheticProject
+
+@pytest.fixture
+def project(tmp_path):
+    path = str(tmp_path / "plant")
+    SyntheticProject(60).write(path)
+    sessions = create_session_factory(str(tmp_path / "warmup.db"))
+    db = sessions()
+    db.add_all(TagEntry(project_path=path, name=f"T{i}") for i in range(5))
+    db.add(UdtTemplate(name="Broken", description="", members_json=json.dumps([{"suffix": "{bogus}"}])))
+    db.commit()
+    db.close()
+    return path, sessions
+
+def _dbf_paths(project_path):
+    return {t: os.path.join(project_path, f"{t}.dbf") for t in ("variable", "trend", "digalm")}
+
+def _finish(warmup):
+    warmup._thread.join(10)
+    return warmup.snapshot()
+
+def _started(warmup, path):
+    assert warmup.start(path)
+    return warmup
+
+def test_warms_templates_state_and_dbfs(project):
+    path, sessions = project
+    expander = UDTExpander(workers=1)
+    warmup = ProjectWarmup(sessions, expander, _dbf_paths, ProjectLockManager())
+    assert warmup.start(path) and not warmup.start(path)
+    state = _finish(warmup)
+    assert state["status"] == "done" and state["warm"] and state["progress"] == 1.0
+    steps = {s["name"]: s for s in state["steps"]}
+    assert steps["templates"]["detail"]["invalid"] == ["Broken"]
+    assert steps["templates"]["detail"]["templates"] == len(expander.templates) + 1
+    assert steps["state"]["detail"] == {"rows": 5}
+    assert steps["dbf"]["detail"]["records"]["variable"] > 0
+
+def test_a_failed_step_does_not_stop_the_others(project):
+    path, sessions = project
+
+    def broken(project_path):
+        raise OSError("share offline")
+    state = _finish(_started(ProjectWarmup(sessions, UDTExpander(workers=1), broken), path))
+    assert state["status"] == "failed" and not state["warm"]
+    assert [(s["name"], s["status"]) for s in state["steps"]] == [("templates", "done"), ("state", "done"), ("dbf", "failed")]
+    assert state["steps"][2]["error"] == "share offline"
+
+def test_nothing_to_warm(tmp_path, monkeypatch):
+    warmup = ProjectWarmup(None, None, _dbf_paths)
+    assert not warmup.start(str(tmp_path / "missing")) and warmup.snapshot()["status"] == "skipped"
+    monkeypatch.setattr(warmup_module, "WARMUP_ENABLED", False)
+    warmup = ProjectWarmup(None, None, _dbf_paths)
+    assert not warmup.start(str(tmp_path)) and warmup.snapshot()["status"] == "disabled"
+
+def test_ready_reports_the_warmup():
+    from fastapi.testclient import TestClient
+    import main
+    ready = TestClient(main.app).get("/api/ready").json()
+    assert ready["ready"] is True and [s["name"] for s in ready["warmup"]["steps"]] == warmup_module.WARMUP_STEPS
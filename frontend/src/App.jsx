@@ -7,13 +7,15 @@ import ImportDiffModal from './components/ImportDiffModal'
 import SettingsModal from './components/SettingsModal'
 import DBFPreviewModal from './components/DBFPreviewModal'
 import UDTBuilderModal from './components/UDTBuilderModal'
+import { columnarGet } from './columnar'
 import { Settings, Download, Eye, Database, Moon, Sun } from 'lucide-react'
 import './index.css'
 
 function App() {
   const [projects, setProjects] = useState([]);
   const [selectedProject, setSelectedProject] = useState(null);
-  const [diff, setDiff] = useState(null);
+  const [diffHandle, setDiffHandle] = useState(null);
+  const [diffCounts, setDiffCounts] = useState(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [isPreviewOpen, setIsPreviewOpen] = useState(false);
 
@@ -26,6 +28,10 @@ function App() {
   const [templates, setTemplates] = useState({});
   const [defaults, setDefaults] = useState(null);
 
+  // Background job state (import / generate / write progress)
+  const [jobStatus, setJobStatus] = useState(null);
+  const activeJobRef = useRef(null);
+
   // Theme state
   const [theme, setTheme] = useState(() => localStorage.getItem('theme') || 'dark');
 
@@ -40,6 +46,10 @@ function App() {
   // Ref to access tag data from TagGrid
   const gridRef = useRef();
 
+  // Live sync: the project revision the grid holds, and the socket that keeps it current
+  const revisionRef = useRef(null);
+  const liveRef = useRef(null);
+
   useEffect(() => {
     // Fetch projects and restore last opened
     const init = async () => {
@@ -105,8 +115,9 @@ function App() {
 
   const loadProjectState = async (path) => {
     if (!gridRef.current) return;
+    closeLive();
     try {
-      const res = await axios.get(`http://127.0.0.1:8000/api/state?path=${encodeURIComponent(path)}`);
+      const res = await columnarGet(`http://127.0.0.1:8000/api/state?path=${encodeURIComponent(path)}`);
       if (res.data.found && res.data.tags && res.data.tags.length > 0) {
         console.log("Loaded state from DB");
         gridRef.current.importTags(res.data.tags);
@@ -115,25 +126,127 @@ function App() {
         console.log("No saved state, resetting to default");
         gridRef.current.importTags([]);
       }
+      revisionRef.current = res.data.revision ?? 0;
     } catch (e) {
       console.error("Failed to load state", e);
       // On error, also reset to avoid stale data
       gridRef.current.importTags([]);
+      revisionRef.current = null;
     }
+    openLive(path);
+  };
+
+  // Subscribes to the project's saves / edits from other clients, starting at the revision the grid holds
+  // (the server replays what was missed). Deltas that follow on are merged into the grid; a gap or a
+  // reset reloads the project.
+  const openLive = (path) => {
+    const since = revisionRef.current !== null ? `&since=${revisionRef.current}` : '';
+    const socket = new WebSocket(`ws://127.0.0.1:8000/api/projects/live?project_path=${encodeURIComponent(path)}${since}`);
+    liveRef.current = socket;
+
+    socket.onmessage = (e) => {
+      const message = JSON.parse(e.data);
+      if (liveRef.current !== socket || !gridRef.current) return;
+      if (message.type === 'hello') {
+        if (revisionRef.current === null) revisionRef.current = message.revision;
+      } else if (message.type === 'delta') {
+        if (message.revision <= revisionRef.current) return; // Already in the grid (e.g. our own save)
+        if (message.previous !== revisionRef.current) {
+          loadProjectState(path);
+          return;
+        }
+        gridRef.current.applyDelta(message);
+        revisionRef.current = message.revision;
+      } else if (message.type === 'reset') {
+        loadProjectState(path);
+      }
+    };
+    socket.onclose = () => {
+      // Server restarted / connection lost: resume from the revision the grid holds
+      if (liveRef.current === socket) setTimeout(() => liveRef.current === socket && openLive(path), 3000);
+    };
+  };
+
+  const closeLive = () => {
+    const socket = liveRef.current;
+    liveRef.current = null;
+    if (socket) socket.close();
+  };
+
+  useEffect(() => closeLive, []);
+
+  // Submits a background job and resolves with its result once it succeeds.
+  // Stage progress streams over SSE into `jobStatus` for the header indicator.
+  const runJob = async (kind, payload) => {
+    const res = await axios.post(`http://127.0.0.1:8000/api/jobs/${kind}`, payload);
+    const jobId = res.data.job_id;
+    activeJobRef.current = jobId;
+
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(`http://127.0.0.1:8000/api/jobs/${jobId}/events`);
+
+      source.addEventListener('progress', (e) => setJobStatus(JSON.parse(e.data)));
+
+      const finish = async (e) => {
+        source.close();
+        activeJobRef.current = null;
+        setJobStatus(null);
+        const snap = JSON.parse(e.data);
+        if (snap.status === 'succeeded') {
+          try {
+            const result = await columnarGet(`http://127.0.0.1:8000/api/jobs/${jobId}/result`);
+            resolve(result.data);
+          } catch (err) {
+            reject(err);
+          }
+        } else {
+          const err = new Error(snap.error || `Job ${snap.status}`);
+          err.cancelled = snap.status === 'cancelled';
+          reject(err);
+        }
+      };
+      ['succeeded', 'failed', 'cancelled'].forEach(evt => source.addEventListener(evt, finish));
+
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          activeJobRef.current = null;
+          setJobStatus(null);
+          reject(new Error('Lost connection to job stream'));
+        }
+      };
+    });
+  };
+
+  const cancelJob = () => {
+    if (!activeJobRef.current) return;
+    axios.delete(`http://127.0.0.1:8000/api/jobs/${activeJobRef.current}`).catch(console.error);
   };
 
   const handleSave = async () => {
     if (!gridRef.current || !selectedProject) return;
     const tags = gridRef.current.getTags();
     try {
-      await axios.post('http://127.0.0.1:8000/api/save_tags', {
+      // base_revision: the server refuses to overwrite rows changed (or to drop rows added) since then
+      const res = await axios.post('http://127.0.0.1:8000/api/save_tags', {
         project_path: selectedProject.path,
-        tags: tags
+        tags: tags,
+        base_revision: revisionRef.current
       });
+      // The rows now carry the ids / versions they were saved as, so the next save is not
+      // taken for a stale copy of this one
+      gridRef.current.applySaved(new Map(tags.map((t, i) => [String(t.id), res.data.rows[i]])));
+      revisionRef.current = Math.max(revisionRef.current ?? 0, res.data.revision);
       alert("Project saved to database.");
     } catch (e) {
       console.error("Save failed:", e);
-      alert("Save failed.");
+      if (e.response?.status === 409) {
+        const names = (e.response.data.conflicts || []).map(c => c.name).join(', ');
+        if (window.confirm(`Save refused: these rows were changed by someone else since you loaded them: ${names}\n\nReload the project? (Your unsaved edits will be lost.)`)) {
+          loadProjectState(selectedProject.path);
+        }
+      } else {
+        alert("Save failed.");
+      }
     }
   };
 
@@ -149,30 +262,36 @@ function App() {
 
     try {
       // 2. Send to backend
-      const res = await axios.post('http://127.0.0.1:8000/api/generate', {
+      const result = await runJob('generate', {
         project_path: selectedProject.path,
-        tags: tags
+        tags: tags,
+        page_size: 0 // Pages are fetched on demand from /api/diff/{handle}
       });
-      return res.data.diff;
+      return result;
     } catch (err) {
       console.error("Analysis Failed:", err);
-      alert("Analysis failed. Check console.");
+      if (!err.cancelled) alert("Analysis failed. Check console.");
       return null;
     }
   };
 
+  const applyGenerateResult = (result) => {
+    setDiffHandle(result.handle);
+    setDiffCounts(result.counts);
+  };
+
   const handleGenerate = async () => {
-    const generatedDiff = await generateData();
-    if (generatedDiff) {
-      setDiff(generatedDiff);
+    const result = await generateData();
+    if (result) {
+      applyGenerateResult(result);
       setIsModalOpen(true);
     }
   };
 
   const handlePreview = async () => {
-    const generatedDiff = await generateData();
-    if (generatedDiff) {
-      setDiff(generatedDiff);
+    const result = await generateData();
+    if (result) {
+      applyGenerateResult(result);
       setIsPreviewOpen(true);
     }
   };
@@ -181,16 +300,16 @@ function App() {
     if (!selectedProject) return;
 
     try {
-      const res = await axios.post('http://127.0.0.1:8000/api/import', {
+      const incoming = await runJob('import', {
         project_path: selectedProject.path
       });
 
       // Store incoming tags and show preview modal
-      setImportIncomingTags(res.data);
+      setImportIncomingTags(incoming);
       setIsImportPreviewOpen(true);
     } catch (e) {
       console.error("Import failed:", e);
-      alert("Import failed. Check console.");
+      if (!e.cancelled) alert("Import failed. Check console.");
     }
   };
 
@@ -202,19 +321,23 @@ function App() {
     setImportIncomingTags([]);
   };
 
-  const confirmWrite = async (filteredDiff) => {
-    if (!selectedProject || !filteredDiff) return;
+  // The diff itself stays on the server; only the handle and the accept/reject decisions go back
+  const confirmWrite = async ({ excluded, included }) => {
+    if (!selectedProject || !diffHandle) return;
 
     try {
-      await axios.post('http://127.0.0.1:8000/api/write', {
+      await runJob('write', {
         project_path: selectedProject.path,
-        diff: filteredDiff
+        handle: diffHandle,
+        excluded: excluded,
+        included: included
       });
+      setDiffHandle(null);
       alert("Success! DBF files updated.");
       setIsModalOpen(false);
     } catch (err) {
       console.error("Write Failed:", err);
-      alert("Write failed: " + (err.response?.data?.detail || err.message));
+      if (!err.cancelled) alert("Write failed: " + (err.response?.data?.detail || err.message));
     }
   };
 
@@ -242,6 +365,15 @@ function App() {
           </select>
         </div>
         <div style={{ display: 'flex', gap: 8 }}>
+          {jobStatus && (
+            <div style={{ display: 'flex', alignItems: 'center', gap: 8, fontSize: '0.85rem', color: 'var(--text-secondary)' }}>
+              <span>
+                {jobStatus.kind}: {jobStatus.stages.length > 0 ? jobStatus.stages[jobStatus.stages.length - 1].name : jobStatus.status}
+                {' '}({Math.round(jobStatus.progress * 100)}%)
+              </span>
+              <button onClick={cancelJob} title="Cancel running job">Cancel</button>
+            </div>
+          )}
           <button onClick={() => setIsUDTBuilderOpen(true)} title="Manage UDTs">
             <Database size={18} style={{ marginRight: 4 }} /> UDTs
           </button>
@@ -270,14 +402,16 @@ function App() {
 
       <DiffModal
         isOpen={isModalOpen}
-        diff={diff}
+        handle={diffHandle}
+        counts={diffCounts}
         onClose={() => setIsModalOpen(false)}
         onConfirm={confirmWrite}
       />
 
       <DBFPreviewModal
         isOpen={isPreviewOpen}
-        diff={diff}
+        handle={diffHandle}
+        counts={diffCounts}
         onClose={() => setIsPreviewOpen(false)}
       />
 
@@ -0,0 +1,35 @@
+import axios from 'axios'
+
+// Keys-once response format for large payloads (see backend/services/serialization.py).
+// Lists of objects arrive as { "$columns": [...], "$rows": [[...], ...] }.
+export const COLUMNAR_ACCEPT = 'application/vnd.taggen.columnar+json, application/json;q=0.9';
+
+// Expands columnar lists back into arrays of objects (recursively).
+// Null cells are dropped: the server sends keys a row does not have as null.
+export function decodeColumnar(value) {
+  if (Array.isArray(value)) return value.map(decodeColumnar);
+  if (!value || typeof value !== 'object') return value;
+
+  if (Array.isArray(value.$columns) && Array.isArray(value.$rows)) {
+    const columns = value.$columns;
+    return value.$rows.map(row => {
+      const obj = {};
+      for (let i = 0; i < columns.length; i++) {
+        const cell = row[i];
+        if (cell !== null && cell !== undefined) obj[columns[i]] = decodeColumnar(cell);
+      }
+      return obj;
+    });
+  }
+
+  const out = {};
+  for (const key of Object.keys(value)) out[key] = decodeColumnar(value[key]);
+  return out;
+}
+
+// axios wrappers that ask for the columnar format and decode it
+const withAccept = (config = {}) => ({ ...config, headers: { ...(config.headers || {}), Accept: COLUMNAR_ACCEPT } });
+const decoded = (res) => ({ ...res, data: decodeColumnar(res.data) });
+
+export const columnarGet = (url, config) => axios.get(url, withAccept(config)).then(decoded);
+export const columnarPost = (url, data, config) => axios.post(url, data, withAccept(config)).then(decoded);
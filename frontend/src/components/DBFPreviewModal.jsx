@@ -1,37 +1,49 @@
 
-import React, { useState, useMemo } from 'react';
+import React, { useState, useMemo, useEffect } from 'react';
+import axios from 'axios';
 import { X, Copy, Download } from 'lucide-react';
 
-const DBFPreviewModal = ({ isOpen, onClose, diff }) => {
-    if (!isOpen || !diff) return null;
+const PREVIEW_LIMIT = 5000; // Per change type; matches the API page cap
+
+const DBFPreviewModal = ({ isOpen, onClose, handle, counts }) => {
+    if (!isOpen || !handle) return null;
 
     const [activeTab, setActiveTab] = useState('variable');
+    const [tables, setTables] = useState({});
+    const [loading, setLoading] = useState(false);
 
-    // Reconstruct full tables from Diff (New + Modified + Unchanged)
+    // Reconstruct the resulting table (New + Modified + Unchanged) for the active tab only.
     // We ignore 'orphaned' as they would be deleted.
-    const tables = useMemo(() => {
-        const process = (type) => {
-            if (!diff[type]) return [];
-            const newRecs = diff[type].new || [];
-            const modRecs = diff[type].modified || [];
-            const uncRecs = diff[type].unchanged || [];
-            // Combine and sort by Name/Tag
-            const all = [...newRecs, ...modRecs, ...uncRecs];
-            return all.sort((a, b) => {
-                const keyA = a.NAME || a.TAG || '';
-                const keyB = b.NAME || b.TAG || '';
-                return keyA.localeCompare(keyB);
-            });
-        };
-
-        return {
-            variable: process('variable'),
-            trend: process('trend'),
-            digalm: process('digalm')
-        };
-    }, [diff]);
+    useEffect(() => {
+        if (tables[activeTab]) return;
+        setLoading(true);
+        const fetchType = (changeType) => axios.get(`http://127.0.0.1:8000/api/diff/${handle}/${activeTab}`, {
+            params: { change_type: changeType, offset: 0, limit: PREVIEW_LIMIT, full: true }
+        }).then(res => res.data.items);
+
+        Promise.all(['new', 'modified', 'unchanged'].map(fetchType))
+            .then(parts => {
+                // Combine and sort by Name/Tag
+                const all = parts.flat().sort((a, b) => {
+                    const keyA = a.NAME || a.TAG || '';
+                    const keyB = b.NAME || b.TAG || '';
+                    return keyA.localeCompare(keyB);
+                });
+                setTables(prev => ({ ...prev, [activeTab]: all }));
+            })
+            .catch(err => console.error("Failed to load preview", err))
+            .finally(() => setLoading(false));
+    }, [handle, activeTab]);
+
+    useEffect(() => { setTables({}); }, [handle]);
+
+    const totalFor = (type) => {
+        const c = counts?.[type] || {};
+        return (c.new || 0) + (c.modified || 0) + (c.unchanged || 0);
+    };
 
     const activeData = tables[activeTab] || [];
+    const truncated = activeData.length < totalFor(activeTab);
 
     const COLUMN_ORDER = {
         variable: [
@@ -127,14 +139,22 @@ const DBFPreviewModal = ({ isOpen, onClose, diff }) => {
 
                 {/* Tabs */}
                 <div style={{ display: 'flex', borderBottom: '1px solid #333', background: 'rgba(0,0,0,0.2)' }}>
-                    <div onClick={() => setActiveTab('variable')} style={tabStyle('variable')}>VARIABLE.DBF ({tables.variable.length})</div>
-                    <div onClick={() => setActiveTab('trend')} style={tabStyle('trend')}>TREND.DBF ({tables.trend.length})</div>
-                    <div onClick={() => setActiveTab('digalm')} style={tabStyle('digalm')}>DIGALM.DBF ({tables.digalm.length})</div>
+                    <div onClick={() => setActiveTab('variable')} style={tabStyle('variable')}>VARIABLE.DBF ({totalFor('variable')})</div>
+                    <div onClick={() => setActiveTab('trend')} style={tabStyle('trend')}>TREND.DBF ({totalFor('trend')})</div>
+                    <div onClick={() => setActiveTab('digalm')} style={tabStyle('digalm')}>DIGALM.DBF ({totalFor('digalm')})</div>
                 </div>
 
+                {!loading && truncated && (
+                    <div style={{ padding: '6px 16px', fontSize: '0.8rem', color: '#ca4', borderBottom: '1px solid #333' }}>
+                        Showing {activeData.length} of {totalFor(activeTab)} records (first {PREVIEW_LIMIT} per change type).
+                    </div>
+                )}
+
                 {/* Content */}
                 <div style={{ flex: 1, overflow: 'auto', padding: 0 }}>
-                    {activeData.length === 0 ? (
+                    {loading ? (
+                        <div style={{ padding: 20, fontStyle: 'italic', color: '#666' }}>Loading…</div>
+                    ) : activeData.length === 0 ? (
                         <div style={{ padding: 20, fontStyle: 'italic', color: '#666' }}>No records generated for this file.</div>
                     ) : (
                         <table style={{ width: '100%', borderCollapse: 'collapse', fontSize: '0.8rem', whiteSpace: 'nowrap' }}>
@@ -1,66 +1,165 @@
 
-import React, { useState, useMemo, useEffect } from 'react';
-import { X, Check, FileText, Activity, Bell, ChevronDown, ChevronRight, Plus, Trash2, RefreshCw } from 'lucide-react';
-
-const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
-    if (!isOpen || !diff) return null;
+import React, { useState, useEffect } from 'react';
+import axios from 'axios';
+import { X, Check, FileText, Activity, Bell, ChevronDown, ChevronRight, Plus, Trash2, RefreshCw, Search, ArrowRight, AlertTriangle } from 'lucide-react';
+
+const DIFF_API = 'http://127.0.0.1:8000/api/diff';
+const PAGE_SIZE = 100;
+const TABLES = ['variable', 'trend', 'digalm'];
+const CHANGE_TYPES = ['new', 'modified', 'renamed', 'orphaned'];
+
+/**
+ * DiffModal - Review generated changes before writing to DBF.
+ *
+ * The diff lives on the server under `handle`. The modal loads the per-table
+ * summary first, then pages of each change type for the active tab, and only
+ * fetches the side-by-side existing/proposed payload when a record is expanded.
+ * The summary also carries the pre-flight validation report; errors block the write.
+ *
+ * Props:
+ * - isOpen, onClose
+ * - handle: string - diff handle from /api/generate
+ * - counts: { table: { new, modified, renamed, orphaned } } - totals returned by generate
+ * - onConfirm: ({ excluded, included }) => void
+ */
+const DiffModal = ({ isOpen, onClose, handle, counts, onConfirm }) => {
+    if (!isOpen || !handle) return null;
 
     const [activeTab, setActiveTab] = useState('variable');
     const [expandedRecords, setExpandedRecords] = useState({});
+    const [summary, setSummary] = useState(null);
+
+    // `${table}_${type}` -> { items, total, loading }
+    const [pages, setPages] = useState({});
+    // `${table}_${key}` -> { existing, proposed, changed_fields }
+    const [details, setDetails] = useState({});
+
+    // Filters (prefix debounced into `filters`)
+    const [prefixDraft, setPrefixDraft] = useState('');
+    const [filters, setFilters] = useState({ prefix: '', field: '' });
+    const [showViolations, setShowViolations] = useState(false);
 
-    // Accept/Reject state for each table type
-    // Keys: "variable_new_NAME", "variable_modified_NAME", "variable_orphaned_NAME", etc.
-    const [acceptedChanges, setAcceptedChanges] = useState({});
+    // Accept/Reject state: a section-level decision plus per-record overrides.
+    // Records that were never loaded follow their section's decision.
+    const [sectionAccepted, setSectionAccepted] = useState({}); // `${table}_${type}` -> bool
+    const [overrides, setOverrides] = useState({}); // `${table}_${type}_${key}` -> bool
 
-    // Initialize all changes as accepted when diff changes
+    // Reset when a new diff arrives
     useEffect(() => {
-        const accepted = {};
-        ['variable', 'trend', 'digalm'].forEach(tableType => {
-            const changes = diff[tableType];
-            if (!changes) return;
-
-            changes.new?.forEach(r => {
-                const key = `${tableType}_new_${r.NAME || r.TAG}`;
-                accepted[key] = true;
-            });
-            changes.modified?.forEach(m => {
-                const key = `${tableType}_modified_${m.proposed?.NAME || m.proposed?.TAG}`;
-                accepted[key] = true;
-            });
-            changes.orphaned?.forEach(r => {
-                const key = `${tableType}_orphaned_${r.NAME || r.TAG}`;
-                accepted[key] = true;
+        setSummary(null);
+        setPages({});
+        setDetails({});
+        setExpandedRecords({});
+        setSectionAccepted({});
+        setOverrides({});
+        axios.get(`${DIFF_API}/${handle}`)
+            .then(res => setSummary(res.data))
+            .catch(err => console.error("Failed to load diff summary", err));
+    }, [handle]);
+
+    useEffect(() => {
+        const t = setTimeout(() => setFilters(prev => ({ ...prev, prefix: prefixDraft })), 300);
+        return () => clearTimeout(t);
+    }, [prefixDraft]);
+
+    // Load the first page of each change type for the active tab
+    useEffect(() => {
+        CHANGE_TYPES.forEach(type => loadPage(activeTab, type, true));
+    }, [handle, activeTab, filters]);
+
+    const loadPage = async (tableType, changeType, reset = false) => {
+        const pageKey = `${tableType}_${changeType}`;
+        const current = pages[pageKey];
+        const offset = reset || !current ? 0 : current.items.length;
+
+        setPages(prev => ({ ...prev, [pageKey]: { ...(reset ? { items: [], total: 0 } : prev[pageKey]), loading: true } }));
+        try {
+            const res = await axios.get(`${DIFF_API}/${handle}/${tableType}`, {
+                params: {
+                    change_type: changeType,
+                    offset,
+                    limit: PAGE_SIZE,
+                    prefix: filters.prefix || undefined,
+                    field: changeType === 'modified' && filters.field ? filters.field : undefined
+                }
             });
-        });
-        setAcceptedChanges(accepted);
-    }, [diff]);
+            setPages(prev => ({
+                ...prev,
+                [pageKey]: {
+                    items: offset === 0 ? res.data.items : [...(prev[pageKey]?.items || []), ...res.data.items],
+                    total: res.data.total,
+                    loading: false
+                }
+            }));
+        } catch (err) {
+            console.error(`Failed to load ${pageKey}`, err);
+            setPages(prev => ({ ...prev, [pageKey]: { ...prev[pageKey], loading: false } }));
+        }
+    };
 
-    const toggleChange = (key) => {
-        setAcceptedChanges(prev => ({ ...prev, [key]: !prev[key] }));
+    const loadDetail = async (tableType, key) => {
+        const detailKey = `${tableType}_${key}`;
+        if (details[detailKey]) return;
+        try {
+            const res = await axios.get(`${DIFF_API}/${handle}/${tableType}/record`, { params: { key } });
+            setDetails(prev => ({ ...prev, [detailKey]: res.data }));
+        } catch (err) {
+            console.error(`Failed to load record ${key}`, err);
+        }
+    };
+
+    // --- Accept / Reject ---
+
+    const isAccepted = (tableType, changeType, key) => {
+        const override = overrides[`${tableType}_${changeType}_${key}`];
+        if (override !== undefined) return override;
+        return sectionAccepted[`${tableType}_${changeType}`] !== false;
     };
 
-    const toggleRecord = (key) => {
-        setExpandedRecords(prev => ({ ...prev, [key]: !prev[key] }));
+    const toggleChange = (tableType, changeType, key) => {
+        const next = !isAccepted(tableType, changeType, key);
+        setOverrides(prev => ({ ...prev, [`${tableType}_${changeType}_${key}`]: next }));
     };
 
     const selectAll = (tableType, changeType, value) => {
-        setAcceptedChanges(prev => {
-            const next = { ...prev };
-            const changes = diff[tableType];
-            if (!changes) return next;
-
-            const items = changes[changeType] || [];
-            items.forEach(r => {
-                const name = changeType === 'modified'
-                    ? (r.proposed?.NAME || r.proposed?.TAG)
-                    : (r.NAME || r.TAG);
-                const key = `${tableType}_${changeType}_${name}`;
-                next[key] = value;
-            });
+        const prefix = `${tableType}_${changeType}_`;
+        setSectionAccepted(prev => ({ ...prev, [`${tableType}_${changeType}`]: value }));
+        setOverrides(prev => {
+            const next = {};
+            Object.entries(prev).forEach(([k, v]) => { if (!k.startsWith(prefix)) next[k] = v; });
             return next;
         });
     };
 
+    const toggleRecord = (tableType, key) => {
+        const recordKey = `${tableType}_${key}`;
+        const willExpand = !expandedRecords[recordKey];
+        setExpandedRecords(prev => ({ ...prev, [recordKey]: willExpand }));
+        if (willExpand) loadDetail(tableType, key);
+    };
+
+    // --- Counts ---
+
+    const totalOf = (tableType, changeType) => {
+        const c = summary?.counts || counts;
+        return c?.[tableType]?.[changeType] || 0;
+    };
+
+    const getChangeCount = (tableType) =>
+        CHANGE_TYPES.reduce((acc, type) => acc + totalOf(tableType, type), 0);
+
+    const countAccepted = (tableType, changeType) => {
+        const prefix = `${tableType}_${changeType}_`;
+        const overrideValues = Object.entries(overrides).filter(([k]) => k.startsWith(prefix)).map(([, v]) => v);
+        if (sectionAccepted[`${tableType}_${changeType}`] === false) {
+            return overrideValues.filter(v => v === true).length;
+        }
+        return totalOf(tableType, changeType) - overrideValues.filter(v => v === false).length;
+    };
+
+    const getAcceptedCount = (tableType) =>
+        CHANGE_TYPES.reduce((acc, type) => acc + countAccepted(tableType, type), 0);
+
     const tabStyle = (id) => ({
         padding: '8px 16px',
         cursor: 'pointer',
@@ -71,26 +170,8 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
         gap: 6
     });
 
-    // Count changes for tab badges
-    const getChangeCount = (tableType) => {
-        const changes = diff[tableType];
-        if (!changes) return 0;
-        return (changes.new?.length || 0) + (changes.modified?.length || 0) + (changes.orphaned?.length || 0);
-    };
-
-    const getAcceptedCount = (tableType) => {
-        let count = 0;
-        Object.entries(acceptedChanges).forEach(([key, val]) => {
-            if (key.startsWith(tableType + '_') && val) count++;
-        });
-        return count;
-    };
-
     // Styles for diff highlighting
     const styles = {
-        newRow: { background: 'rgba(50, 200, 50, 0.15)' },
-        deletedRow: { background: 'rgba(200, 50, 50, 0.15)' },
-        modifiedField: { background: 'rgba(255, 200, 0, 0.25)', fontWeight: 600 },
         fieldName: { color: '#888', fontSize: '0.75rem', textTransform: 'uppercase', padding: '4px 8px', borderRight: '1px solid #333' },
         fieldValue: { padding: '4px 8px', fontFamily: 'monospace', fontSize: '0.85rem' },
         recordHeader: {
@@ -101,40 +182,58 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
         checkbox: { width: 16, height: 16, cursor: 'pointer' },
         sectionHeader: {
             display: 'flex', alignItems: 'center', gap: 8, marginBottom: 8, flexWrap: 'wrap'
-        }
+        },
+        smallButton: { fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, cursor: 'pointer' }
     };
 
-    // Render side-by-side comparison for a single modified record
-    const renderModifiedRecord = (modItem, index, tableType) => {
-        const { existing, proposed, changed_fields } = modItem;
-        const recordKey = proposed?.NAME || proposed?.TAG || `record-${index}`;
-        const acceptKey = `${tableType}_modified_${recordKey}`;
-        const isExpanded = expandedRecords[recordKey] !== false; // Default expanded
-        const isAccepted = acceptedChanges[acceptKey] !== false;
+    const renderLoadMore = (tableType, changeType) => {
+        const page = pages[`${tableType}_${changeType}`];
+        if (!page) return null;
+        if (page.loading) return <div style={{ padding: '6px 8px', fontSize: '0.8rem', color: '#888' }}>Loading…</div>;
+        if (page.items.length >= page.total) return null;
+        return (
+            <div style={{ padding: '6px 8px', display: 'flex', alignItems: 'center', gap: 8, fontSize: '0.8rem', color: '#888' }}>
+                Showing {page.items.length} of {page.total}
+                <button onClick={() => loadPage(tableType, changeType)} style={{ ...styles.smallButton, color: '#ccc' }}>Load more</button>
+            </div>
+        );
+    };
 
-        // Get all unique field names
-        const allFields = [...new Set([...Object.keys(existing || {}), ...Object.keys(proposed || {})])];
-        // Filter to only show fields with differences
-        const fieldsToShow = allFields.filter(f => changed_fields?.includes(f));
+    // Render side-by-side comparison for a single modified / renamed record (detail fetched on expand)
+    const renderModifiedRecord = (row, tableType, changeType = 'modified') => {
+        const recordKey = row.key;
+        const isExpanded = !!expandedRecords[`${tableType}_${recordKey}`];
+        const accepted = isAccepted(tableType, changeType, recordKey);
+        const detail = details[`${tableType}_${recordKey}`];
 
         return (
-            <div key={recordKey} style={{ marginBottom: 8, opacity: isAccepted ? 1 : 0.5 }}>
+            <div key={recordKey} style={{ marginBottom: 8, opacity: accepted ? 1 : 0.5 }}>
                 <div style={styles.recordHeader}>
                     <input
                         type="checkbox"
-                        checked={isAccepted}
-                        onChange={() => toggleChange(acceptKey)}
+                        checked={accepted}
+                        onChange={() => toggleChange(tableType, changeType, recordKey)}
                         onClick={(e) => e.stopPropagation()}
                         style={styles.checkbox}
                     />
-                    <div style={{ flex: 1, display: 'flex', alignItems: 'center', gap: 8 }} onClick={() => toggleRecord(recordKey)}>
+                    <div style={{ flex: 1, display: 'flex', alignItems: 'center', gap: 8 }} onClick={() => toggleRecord(tableType, recordKey)}>
                         {isExpanded ? <ChevronDown size={14} /> : <ChevronRight size={14} />}
-                        <span style={{ fontWeight: 600, color: 'var(--warning-color)' }}>{recordKey}</span>
-                        <span style={{ opacity: 0.6, fontSize: '0.8rem' }}>({changed_fields?.length || 0} changes)</span>
+                        {changeType === 'renamed' && (
+                            <>
+                                <span style={{ color: '#888' }}>{row.old_key}</span>
+                                <ArrowRight size={12} style={{ opacity: 0.6 }} />
+                            </>
+                        )}
+                        <span style={{ fontWeight: 600, color: changeType === 'renamed' ? '#6af' : 'var(--warning-color)' }}>{recordKey}</span>
+                        <span style={{ opacity: 0.6, fontSize: '0.8rem' }}>({row.changed_fields?.length || 0} changes: {row.changed_fields?.join(', ')})</span>
                     </div>
                 </div>
 
-                {isExpanded && (
+                {isExpanded && !detail && (
+                    <div style={{ marginLeft: 40, padding: 8, fontSize: '0.8rem', color: '#888' }}>Loading…</div>
+                )}
+
+                {isExpanded && detail && (
                     <table style={{ width: '100%', borderCollapse: 'collapse', marginLeft: 40 }}>
                         <thead>
                             <tr style={{ borderBottom: '1px solid #333' }}>
@@ -144,26 +243,17 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
                             </tr>
                         </thead>
                         <tbody>
-                            {fieldsToShow.map(field => {
-                                const existingVal = existing?.[field] || '';
-                                const proposedVal = proposed?.[field] || '';
-                                const isChanged = changed_fields?.includes(field);
+                            {(detail.changed_fields || []).map(field => {
+                                const existingVal = detail.existing?.[field] || '';
+                                const proposedVal = detail.proposed?.[field] || '';
 
                                 return (
                                     <tr key={field} style={{ borderBottom: '1px solid #222' }}>
                                         <td style={styles.fieldName}>{field}</td>
-                                        <td style={{
-                                            ...styles.fieldValue,
-                                            background: isChanged ? 'rgba(200, 50, 50, 0.15)' : 'transparent',
-                                            color: isChanged ? '#ff8888' : 'inherit'
-                                        }}>
+                                        <td style={{ ...styles.fieldValue, background: 'rgba(200, 50, 50, 0.15)', color: '#ff8888' }}>
                                             {existingVal || <span style={{ opacity: 0.3 }}>—</span>}
                                         </td>
-                                        <td style={{
-                                            ...styles.fieldValue,
-                                            background: isChanged ? 'rgba(50, 200, 50, 0.15)' : 'transparent',
-                                            color: isChanged ? '#88ff88' : 'inherit'
-                                        }}>
+                                        <td style={{ ...styles.fieldValue, background: 'rgba(50, 200, 50, 0.15)', color: '#88ff88' }}>
                                             {proposedVal || <span style={{ opacity: 0.3 }}>—</span>}
                                         </td>
                                     </tr>
@@ -176,124 +266,153 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
         );
     };
 
+    const renderSimpleRows = (tableType, changeType) => {
+        const items = pages[`${tableType}_${changeType}`]?.items || [];
+        const isNew = changeType === 'new';
+        return items.map((r, i) => {
+            const accepted = isAccepted(tableType, changeType, r.key);
+            return (
+                <div key={r.key} style={{
+                    padding: '6px 8px',
+                    borderBottom: i < items.length - 1 ? '1px solid #333' : 'none',
+                    display: 'flex', alignItems: 'center', gap: 10,
+                    opacity: accepted ? 1 : 0.5
+                }}>
+                    <input type="checkbox" checked={accepted} onChange={() => toggleChange(tableType, changeType, r.key)} style={styles.checkbox} />
+                    {isNew ? (
+                        <>
+                            <span style={{ fontWeight: 600, color: '#88ff88' }}>+ {r.key}</span>
+                            <span style={{ marginLeft: 12, opacity: 0.7 }}>{r.comment}</span>
+                        </>
+                    ) : (
+                        <span style={{ color: accepted ? '#ff8888' : '#888', textDecoration: accepted ? 'line-through' : 'none' }}>
+                            − {r.key}
+                        </span>
+                    )}
+                </div>
+            );
+        });
+    };
+
     const renderChanges = (tableType) => {
-        const changes = diff[tableType];
-        if (!changes) return <div style={{ padding: 20, textAlign: 'center', color: '#666' }}>No changes found for {tableType}.</div>;
+        if (!summary && !counts) return <div style={{ padding: 20, textAlign: 'center', color: '#666' }}>Loading summary…</div>;
 
-        const hasChanges = (changes.new?.length || 0) > 0 || (changes.modified?.length || 0) > 0 || (changes.orphaned?.length || 0) > 0;
+        const hasChanges = getChangeCount(tableType) > 0;
         if (!hasChanges) return <div style={{ padding: 20, textAlign: 'center', color: '#4a4' }}>✓ No changes detected. Files are in sync.</div>;
 
-        const countAccepted = (type) => {
-            const items = changes[type] || [];
-            return items.filter(r => {
-                const name = type === 'modified' ? (r.proposed?.NAME || r.proposed?.TAG) : (r.NAME || r.TAG);
-                return acceptedChanges[`${tableType}_${type}_${name}`] !== false;
-            }).length;
-        };
+        const fieldOptions = Object.entries(summary?.changed_fields?.[tableType] || {}).sort((a, b) => b[1] - a[1]);
 
         return (
             <div style={{ padding: '0 16px' }}>
+                {/* FILTERS */}
+                <div style={{ display: 'flex', gap: 8, alignItems: 'center', marginBottom: 12 }}>
+                    <Search size={14} style={{ opacity: 0.6 }} />
+                    <input
+                        value={prefixDraft}
+                        onChange={(e) => setPrefixDraft(e.target.value)}
+                        placeholder="Filter by name prefix…"
+                        style={{ padding: '4px 8px', background: '#222', color: '#ddd', border: '1px solid #444', borderRadius: 4 }}
+                    />
+                    <select
+                        value={filters.field}
+                        onChange={(e) => setFilters(prev => ({ ...prev, field: e.target.value }))}
+                        style={{ padding: '4px', background: '#222', color: '#ddd', border: '1px solid #444', borderRadius: 4 }}
+                    >
+                        <option value="">Any changed field</option>
+                        {fieldOptions.map(([field, n]) => (
+                            <option key={field} value={field}>{field} ({n})</option>
+                        ))}
+                    </select>
+                </div>
+
                 {/* NEW */}
-                {changes.new?.length > 0 && (
+                {totalOf(tableType, 'new') > 0 && (
                     <div style={{ marginBottom: 16 }}>
                         <div style={styles.sectionHeader}>
                             <Plus size={16} style={{ color: '#4a4' }} />
                             <span style={{ background: 'rgba(50, 200, 50, 0.2)', padding: '2px 8px', borderRadius: 4, color: '#4a4' }}>+ NEW</span>
-                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted('new')}/{changes.new.length} will be written</span>
+                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted(tableType, 'new')}/{totalOf(tableType, 'new')} will be written</span>
                             <div style={{ marginLeft: 'auto', display: 'flex', gap: 8 }}>
-                                <button onClick={() => selectAll(tableType, 'new', true)}
-                                    style={{ fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#4a4', cursor: 'pointer' }}>
+                                <button onClick={() => selectAll(tableType, 'new', true)} style={{ ...styles.smallButton, color: '#4a4' }}>
                                     Accept All
                                 </button>
-                                <button onClick={() => selectAll(tableType, 'new', false)}
-                                    style={{ fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#a44', cursor: 'pointer' }}>
+                                <button onClick={() => selectAll(tableType, 'new', false)} style={{ ...styles.smallButton, color: '#a44' }}>
                                     Reject All
                                 </button>
                             </div>
                         </div>
                         <div style={{ background: 'rgba(50, 200, 50, 0.05)', borderRadius: 4, padding: 8, border: '1px solid #333' }}>
-                            {changes.new.map((r, i) => {
-                                const name = r.NAME || r.TAG;
-                                const key = `${tableType}_new_${name}`;
-                                const isAccepted = acceptedChanges[key] !== false;
-                                return (
-                                    <div key={i} style={{
-                                        padding: '6px 8px',
-                                        borderBottom: i < changes.new.length - 1 ? '1px solid #333' : 'none',
-                                        display: 'flex', alignItems: 'center', gap: 10,
-                                        opacity: isAccepted ? 1 : 0.5
-                                    }}>
-                                        <input type="checkbox" checked={isAccepted} onChange={() => toggleChange(key)} style={styles.checkbox} />
-                                        <span style={{ fontWeight: 600, color: '#88ff88' }}>+ {name}</span>
-                                        <span style={{ marginLeft: 12, opacity: 0.7 }}>{r.COMMENT || r.DESC || ''}</span>
-                                    </div>
-                                );
-                            })}
+                            {renderSimpleRows(tableType, 'new')}
+                            {renderLoadMore(tableType, 'new')}
                         </div>
                     </div>
                 )}
 
                 {/* MODIFIED - Side-by-Side */}
-                {changes.modified?.length > 0 && (
+                {totalOf(tableType, 'modified') > 0 && (
                     <div style={{ marginBottom: 16 }}>
                         <div style={styles.sectionHeader}>
                             <RefreshCw size={16} style={{ color: '#ca4' }} />
                             <span style={{ background: 'rgba(255, 200, 0, 0.2)', padding: '2px 8px', borderRadius: 4, color: '#ca4' }}>~ MODIFIED</span>
-                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted('modified')}/{changes.modified.length} will be updated</span>
+                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted(tableType, 'modified')}/{totalOf(tableType, 'modified')} will be updated</span>
+                            <div style={{ marginLeft: 'auto', display: 'flex', gap: 8 }}>
+                                <button onClick={() => selectAll(tableType, 'modified', true)} style={{ ...styles.smallButton, color: '#ca4' }}>
+                                    Accept All
+                                </button>
+                                <button onClick={() => selectAll(tableType, 'modified', false)} style={{ ...styles.smallButton, color: '#666' }}>
+                                    Keep Existing
+                                </button>
+                            </div>
+                        </div>
+                        <div style={{ maxHeight: 400, overflowY: 'auto' }}>
+                            {(pages[`${tableType}_modified`]?.items || []).map(row => renderModifiedRecord(row, tableType))}
+                            {renderLoadMore(tableType, 'modified')}
+                        </div>
+                    </div>
+                )}
+
+                {/* RENAMED - in-place key update, GUID kept */}
+                {totalOf(tableType, 'renamed') > 0 && (
+                    <div style={{ marginBottom: 16 }}>
+                        <div style={styles.sectionHeader}>
+                            <ArrowRight size={16} style={{ color: '#6af' }} />
+                            <span style={{ background: 'rgba(80, 160, 255, 0.2)', padding: '2px 8px', borderRadius: 4, color: '#6af' }}>→ RENAMED</span>
+                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted(tableType, 'renamed')}/{totalOf(tableType, 'renamed')} will be renamed in place</span>
                             <div style={{ marginLeft: 'auto', display: 'flex', gap: 8 }}>
-                                <button onClick={() => selectAll(tableType, 'modified', true)}
-                                    style={{ fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#ca4', cursor: 'pointer' }}>
+                                <button onClick={() => selectAll(tableType, 'renamed', true)} style={{ ...styles.smallButton, color: '#6af' }}>
                                     Accept All
                                 </button>
-                                <button onClick={() => selectAll(tableType, 'modified', false)}
-                                    style={{ fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#666', cursor: 'pointer' }}>
+                                <button onClick={() => selectAll(tableType, 'renamed', false)} style={{ ...styles.smallButton, color: '#666' }}>
                                     Keep Existing
                                 </button>
                             </div>
                         </div>
                         <div style={{ maxHeight: 400, overflowY: 'auto' }}>
-                            {changes.modified.map((modItem, i) => renderModifiedRecord(modItem, i, tableType))}
+                            {(pages[`${tableType}_renamed`]?.items || []).map(row => renderModifiedRecord(row, tableType, 'renamed'))}
+                            {renderLoadMore(tableType, 'renamed')}
                         </div>
                     </div>
                 )}
 
                 {/* ORPHANED */}
-                {changes.orphaned?.length > 0 && (
+                {totalOf(tableType, 'orphaned') > 0 && (
                     <div style={{ marginBottom: 16 }}>
                         <div style={styles.sectionHeader}>
                             <Trash2 size={16} style={{ color: '#a44' }} />
                             <span style={{ background: 'rgba(200, 50, 50, 0.2)', padding: '2px 8px', borderRadius: 4, color: '#a44' }}>- ORPHANED</span>
-                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted('orphaned')}/{changes.orphaned.length} will be removed</span>
+                            <span style={{ opacity: 0.6, fontWeight: 400 }}>{countAccepted(tableType, 'orphaned')}/{totalOf(tableType, 'orphaned')} will be removed</span>
                             <div style={{ marginLeft: 'auto', display: 'flex', gap: 8 }}>
-                                <button onClick={() => selectAll(tableType, 'orphaned', true)}
-                                    style={{ fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#a44', cursor: 'pointer' }}>
+                                <button onClick={() => selectAll(tableType, 'orphaned', true)} style={{ ...styles.smallButton, color: '#a44' }}>
                                     Remove All
                                 </button>
-                                <button onClick={() => selectAll(tableType, 'orphaned', false)}
-                                    style={{ fontSize: '0.7rem', padding: '2px 6px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#4a4', cursor: 'pointer' }}>
+                                <button onClick={() => selectAll(tableType, 'orphaned', false)} style={{ ...styles.smallButton, color: '#4a4' }}>
                                     Keep All
                                 </button>
                             </div>
                         </div>
                         <div style={{ background: 'rgba(200, 50, 50, 0.05)', borderRadius: 4, padding: 8, border: '1px solid #333' }}>
-                            {changes.orphaned.map((r, i) => {
-                                const name = r.NAME || r.TAG;
-                                const key = `${tableType}_orphaned_${name}`;
-                                const isAccepted = acceptedChanges[key] !== false;
-                                return (
-                                    <div key={i} style={{
-                                        padding: '6px 8px',
-                                        borderBottom: i < changes.orphaned.length - 1 ? '1px solid #333' : 'none',
-                                        display: 'flex', alignItems: 'center', gap: 10,
-                                        opacity: isAccepted ? 1 : 0.5
-                                    }}>
-                                        <input type="checkbox" checked={isAccepted} onChange={() => toggleChange(key)} style={styles.checkbox} />
-                                        <span style={{ color: isAccepted ? '#ff8888' : '#888', textDecoration: isAccepted ? 'line-through' : 'none' }}>
-                                            − {name}
-                                        </span>
-                                    </div>
-                                );
-                            })}
+                            {renderSimpleRows(tableType, 'orphaned')}
+                            {renderLoadMore(tableType, 'orphaned')}
                         </div>
                     </div>
                 )}
@@ -301,36 +420,69 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
         );
     };
 
-    // Build filtered diff based on accepted changes
+    // Send only decisions; the full diff stays on the server under its handle.
+    // A rejected section is sent as "*" with any individually re-accepted keys in `included`.
     const handleConfirm = () => {
-        const filteredDiff = {};
-
-        ['variable', 'trend', 'digalm'].forEach(tableType => {
-            const changes = diff[tableType];
-            if (!changes) return;
-
-            filteredDiff[tableType] = {
-                new: (changes.new || []).filter(r => {
-                    const key = `${tableType}_new_${r.NAME || r.TAG}`;
-                    return acceptedChanges[key] !== false;
-                }),
-                modified: (changes.modified || []).filter(m => {
-                    const key = `${tableType}_modified_${m.proposed?.NAME || m.proposed?.TAG}`;
-                    return acceptedChanges[key] !== false;
-                }),
-                orphaned: (changes.orphaned || []).filter(r => {
-                    const key = `${tableType}_orphaned_${r.NAME || r.TAG}`;
-                    return acceptedChanges[key] !== false;
-                })
-            };
+        const excluded = {};
+        const included = {};
+
+        TABLES.forEach(tableType => {
+            CHANGE_TYPES.forEach(changeType => {
+                const prefix = `${tableType}_${changeType}_`;
+                const sectionRejected = sectionAccepted[`${tableType}_${changeType}`] === false;
+                const keys = Object.entries(overrides)
+                    .filter(([k, v]) => k.startsWith(prefix) && v === sectionRejected)
+                    .map(([k]) => k.slice(prefix.length));
+
+                if (sectionRejected) {
+                    excluded[tableType] = { ...excluded[tableType], [changeType]: ['*'] };
+                    if (keys.length) included[tableType] = { ...included[tableType], [changeType]: keys };
+                } else if (keys.length) {
+                    excluded[tableType] = { ...excluded[tableType], [changeType]: keys };
+                }
+            });
         });
 
-        onConfirm(filteredDiff);
+        onConfirm({ excluded, included });
     };
 
     // Calculate total stats
-    const totalChanges = ['variable', 'trend', 'digalm'].reduce((acc, t) => acc + getChangeCount(t), 0);
-    const totalAccepted = ['variable', 'trend', 'digalm'].reduce((acc, t) => acc + getAcceptedCount(t), 0);
+    const totalChanges = TABLES.reduce((acc, t) => acc + getChangeCount(t), 0);
+    const totalAccepted = TABLES.reduce((acc, t) => acc + getAcceptedCount(t), 0);
+
+    const validation = summary?.validation;
+    const blocked = !!validation?.errors;
+
+    const renderValidation = () => {
+        if (!validation || (!validation.errors && !validation.warnings)) return null;
+        const color = blocked ? '#e55' : '#db4';
+        return (
+            <div style={{ padding: '8px 20px', borderBottom: '1px solid #333', background: 'rgba(0,0,0,0.25)', fontSize: '0.85rem' }}>
+                <div style={{ display: 'flex', alignItems: 'center', gap: 8, color, cursor: 'pointer' }} onClick={() => setShowViolations(v => !v)}>
+                    {showViolations ? <ChevronDown size={14} /> : <ChevronRight size={14} />}
+                    <AlertTriangle size={14} />
+                    Pre-flight: {validation.errors} error(s), {validation.warnings} warning(s)
+                    <span style={{ color: '#888' }}>
+                        ({Object.entries(validation.counts).map(([rule, n]) => `${rule}: ${n}`).join(', ')})
+                    </span>
+                    {blocked && <span style={{ color: '#888' }}>- fix the errors and re-run Generate before writing</span>}
+                </div>
+                {showViolations && (
+                    <div style={{ maxHeight: 180, overflow: 'auto', marginTop: 6, fontFamily: 'monospace', fontSize: '0.75rem' }}>
+                        {validation.violations.map((v, i) => (
+                            <div key={i} style={{ color: v.severity === 'error' ? '#e88' : '#cb7' }}>
+                                [{v.table}] {v.key} {v.field}: {v.message}
+                            </div>
+                        ))}
+                        {validation.truncated && <div style={{ color: '#888' }}>… only the first {validation.violations.length} are listed</div>}
+                    </div>
+                )}
+            </div>
+        );
+    };
+
+    const tabIcons = { variable: FileText, trend: Activity, digalm: Bell };
+    const tabLabels = { variable: 'Variable.dbf', trend: 'Trend.dbf', digalm: 'DigAlm.dbf' };
 
     return (
         <div style={{
@@ -358,32 +510,23 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
 
                 {/* Tabs */}
                 <div style={{ display: 'flex', borderBottom: '1px solid #333', background: 'rgba(0,0,0,0.3)' }}>
-                    <div onClick={() => setActiveTab('variable')} style={tabStyle('variable')}>
-                        <FileText size={14} /> Variable.dbf
-                        {getChangeCount('variable') > 0 && (
-                            <span style={{ background: 'var(--accent-color)', color: 'black', padding: '1px 6px', borderRadius: 10, fontSize: '0.7rem', fontWeight: 700 }}>
-                                {getAcceptedCount('variable')}/{getChangeCount('variable')}
-                            </span>
-                        )}
-                    </div>
-                    <div onClick={() => setActiveTab('trend')} style={tabStyle('trend')}>
-                        <Activity size={14} /> Trend.dbf
-                        {getChangeCount('trend') > 0 && (
-                            <span style={{ background: 'var(--accent-color)', color: 'black', padding: '1px 6px', borderRadius: 10, fontSize: '0.7rem', fontWeight: 700 }}>
-                                {getAcceptedCount('trend')}/{getChangeCount('trend')}
-                            </span>
-                        )}
-                    </div>
-                    <div onClick={() => setActiveTab('digalm')} style={tabStyle('digalm')}>
-                        <Bell size={14} /> DigAlm.dbf
-                        {getChangeCount('digalm') > 0 && (
-                            <span style={{ background: 'var(--accent-color)', color: 'black', padding: '1px 6px', borderRadius: 10, fontSize: '0.7rem', fontWeight: 700 }}>
-                                {getAcceptedCount('digalm')}/{getChangeCount('digalm')}
-                            </span>
-                        )}
-                    </div>
+                    {TABLES.map(tableType => {
+                        const Icon = tabIcons[tableType];
+                        return (
+                            <div key={tableType} onClick={() => setActiveTab(tableType)} style={tabStyle(tableType)}>
+                                <Icon size={14} /> {tabLabels[tableType]}
+                                {getChangeCount(tableType) > 0 && (
+                                    <span style={{ background: 'var(--accent-color)', color: 'black', padding: '1px 6px', borderRadius: 10, fontSize: '0.7rem', fontWeight: 700 }}>
+                                        {getAcceptedCount(tableType)}/{getChangeCount(tableType)}
+                                    </span>
+                                )}
+                            </div>
+                        );
+                    })}
                 </div>
 
+                {renderValidation()}
+
                 {/* Content */}
                 <div style={{ padding: '16px 0', overflow: 'auto', flex: 1 }}>
                     {renderChanges(activeTab)}
@@ -396,7 +539,7 @@ const DiffModal = ({ isOpen, onClose, diff, onConfirm }) => {
                     </div>
                     <div style={{ display: 'flex', gap: 12 }}>
                         <button onClick={onClose} style={{ minWidth: 100, padding: '8px 16px' }}>Cancel</button>
-                        <button className="primary" onClick={handleConfirm} style={{ display: 'flex', alignItems: 'center', gap: 6, minWidth: 140, justifyContent: 'center', padding: '8px 16px' }}>
+                        <button className="primary" onClick={handleConfirm} disabled={blocked} title={blocked ? 'Pre-flight validation found errors' : undefined} style={{ display: 'flex', alignItems: 'center', gap: 6, minWidth: 140, justifyContent: 'center', padding: '8px 16px' }}>
                             <Check size={16} /> Confirm Write
                         </button>
                     </div>
@@ -2,6 +2,8 @@
 import React, { useState, useMemo } from 'react';
 import { X, Check, Download, Trash2, Plus, ChevronDown, ChevronRight } from 'lucide-react';
 
+const CHUNK_SIZE = 200; // Rows rendered per section before "Show more"
+
 /**
  * ImportDiffModal - Shows a preview of import changes with accept/reject toggles
  * 
@@ -54,6 +56,24 @@ const ImportDiffModal = ({ isOpen, onClose, currentTags, incomingTags, onConfirm
     // Expanded sections
     const [expandedSections, setExpandedSections] = useState({ new: true, deleted: true });
 
+    // Rendered row window per section (large imports would otherwise mount every row)
+    const [visible, setVisible] = useState({ new: CHUNK_SIZE, deleted: CHUNK_SIZE });
+
+    const renderShowMore = (section, total) => {
+        if (visible[section] >= total) return null;
+        return (
+            <div style={{ ...styles.row, borderBottom: 'none', color: '#888', fontSize: '0.85rem' }}>
+                Showing {visible[section]} of {total}
+                <button
+                    onClick={() => setVisible(prev => ({ ...prev, [section]: prev[section] + CHUNK_SIZE }))}
+                    style={{ fontSize: '0.75rem', padding: '2px 8px', background: '#2a2a2a', border: '1px solid #444', borderRadius: 3, color: '#ccc', cursor: 'pointer' }}
+                >
+                    Show more
+                </button>
+            </div>
+        );
+    };
+
     const toggleSection = (section) => {
         setExpandedSections(prev => ({ ...prev, [section]: !prev[section] }));
     };
@@ -230,7 +250,7 @@ const ImportDiffModal = ({ isOpen, onClose, currentTags, incomingTags, onConfirm
                                     </div>
                                     {expandedSections.new && (
                                         <div style={{ background: 'rgba(50, 200, 50, 0.05)', borderRadius: 4, border: '1px solid #333' }}>
-                                            {diff.newTags.map(tag => (
+                                            {diff.newTags.slice(0, visible.new).map(tag => (
                                                 <div key={tag.name} style={styles.row}>
                                                     <input
                                                         type="checkbox"
@@ -242,6 +262,7 @@ const ImportDiffModal = ({ isOpen, onClose, currentTags, incomingTags, onConfirm
                                                     <span style={styles.description}>{tag.description || tag.trend_comment || ''}</span>
                                                 </div>
                                             ))}
+                                            {renderShowMore('new', diff.newTags.length)}
                                         </div>
                                     )}
                                 </div>
@@ -279,7 +300,7 @@ const ImportDiffModal = ({ isOpen, onClose, currentTags, incomingTags, onConfirm
                                     </div>
                                     {expandedSections.deleted && (
                                         <div style={{ background: 'rgba(200, 50, 50, 0.05)', borderRadius: 4, border: '1px solid #333' }}>
-                                            {diff.deletedTags.map(tag => (
+                                            {diff.deletedTags.slice(0, visible.deleted).map(tag => (
                                                 <div key={tag.name} style={styles.row}>
                                                     <input
                                                         type="checkbox"
@@ -297,6 +318,7 @@ const ImportDiffModal = ({ isOpen, onClose, currentTags, incomingTags, onConfirm
                                                     <span style={styles.description}>{tag.description || ''}</span>
                                                 </div>
                                             ))}
+                                            {renderShowMore('deleted', diff.deletedTags.length)}
                                         </div>
                                     )}
                                 </div>
@@ -1,7 +1,7 @@
 
 import React, { useState, useMemo, useEffect, useImperativeHandle, forwardRef, useCallback, memo } from 'react';
 import { useReactTable, getCoreRowModel, getExpandedRowModel, getSortedRowModel, getFilteredRowModel, flexRender } from '@tanstack/react-table';
-import axios from 'axios';
+import { columnarPost } from '../columnar';
 import { ChevronRight, ChevronDown, Plus, Lock, Unlock, ArrowUpDown, Search, Trash2 } from 'lucide-react';
 import TagDetailModal from './TagDetailModal';
 
@@ -60,6 +60,70 @@ const DebouncedInput = memo(({ value: externalValue, onChange, debounceMs = 750,
     );
 });
 
+// Helper: Sanitize PLC address for comparison
+const sanitize = (addr) => {
+    if (!addr) return '';
+    let result = '';
+    for (let i = 0; i < addr.length; i++) {
+        const char = addr[i];
+        if (/[a-zA-Z0-9_]/.test(char)) {
+            result += char;
+        } else if (char === ':' || char === '.' || char === '[' || char === ']') {
+            result += '_';
+        } else {
+            result += '_' + char.charCodeAt(0).toString(16).toUpperCase() + '_';
+        }
+    }
+    result = result.replace(/_+/g, '_').replace(/^_+|_+$/g, '');
+    return result;
+};
+
+// A saved tag (/api/state row, live-sync fields) as a grid row
+const toGridRow = (t, i) => {
+    // Derive plc_addr and prefix from existing data
+    const plcAddr = t.plc_addr || t.var_addr || '';
+    const tagName = t.name || '';
+
+    // Reverse-engineer prefix: if tagName ends with sanitized(plcAddr), prefix is the remainder
+    let prefix = t.prefix || '';
+    if (!prefix && plcAddr && tagName) {
+        const sanitizedAddr = sanitize(plcAddr);
+        if (tagName.endsWith(sanitizedAddr)) {
+            prefix = tagName.slice(0, tagName.length - sanitizedAddr.length);
+        }
+    }
+
+    return {
+        ...t,
+        id: t.id || `import_${i}_${Date.now()}`,
+        plc_addr: plcAddr, // UI field
+        prefix: prefix,     // Derived prefix
+        // Ensure booleans are actual booleans
+        is_expanded: false, // Collapse by default
+        is_manual_override: t.is_manual_override !== undefined ? t.is_manual_override : true,
+
+        // Arrays/SubRows
+        subRows: [],
+
+        // UI State Helpers (if needed)
+        isTrend: t.is_trend,
+        isAlarm: t.is_alarm
+    };
+};
+
+// Server row ids (client-side rows use other ids until their first save)
+const SAVED_ID = /^\d+$/;
+
+// Fields changed elsewhere, applied over the grid row; the UI copies of those fields follow,
+// and a UDT instance re-expands its members
+const mergeDeltaRow = (row, { id, version, fields }) => {
+    const merged = { ...row, ...fields, id, version, subRows: [] };
+    if ('var_addr' in fields) merged.plc_addr = fields.var_addr;
+    if ('is_trend' in fields) merged.isTrend = fields.is_trend;
+    if ('is_alarm' in fields) merged.isAlarm = fields.is_alarm;
+    return merged;
+};
+
 const TagGrid = forwardRef(({ project, defaults, templates }, ref) => {
     const [data, setData] = useState([]);
     const [expanded, setExpanded] = useState({});
@@ -103,57 +167,60 @@ const TagGrid = forwardRef(({ project, defaults, templates }, ref) => {
             // Updated Import Logic for Full-Fidelity Flat Schema
             // The backend dbf_reader now returns the exact schema we need.
             // We mainly ensuring IDs are unique and types are set.
+            setData(tags.map(toGridRow));
+        },
+        // Ids / versions the server saved the rows as (Map: id the row was sent with -> [id, version]).
+        // Rows edited while the save was in flight keep their edits; versions only move forward.
+        applySaved: (saved) => {
+            setData(prev => prev.map(row => {
+                const entry = saved.get(String(row.id));
+                if (!entry) return row;
+                const [id, version] = entry;
+                return { ...row, id, version: Math.max(version, row.version || 0) };
+            }));
+        },
+        // A live-sync delta: updated rows take the changed fields, added rows replace the row they
+        // were sent as (client_id) or are placed by id (grid order is id order), deleted rows go
+        applyDelta: (delta) => {
+            setData(prev => {
+                const updated = new Map(delta.updated.map(u => [String(u.id), u]));
+                const deleted = new Set(delta.deleted.map(String));
+                const byClientId = new Map();
+                delta.added.forEach(a => {
+                    if (a.client_id !== null && a.client_id !== undefined && a.client_id !== '') byClientId.set(String(a.client_id), a);
+                });
 
-            // Helper: Sanitize PLC address for comparison
-            const sanitize = (addr) => {
-                if (!addr) return '';
-                let result = '';
-                for (let i = 0; i < addr.length; i++) {
-                    const char = addr[i];
-                    if (/[a-zA-Z0-9_]/.test(char)) {
-                        result += char;
-                    } else if (char === ':' || char === '.' || char === '[' || char === ']') {
-                        result += '_';
-                    } else {
-                        result += '_' + char.charCodeAt(0).toString(16).toUpperCase() + '_';
+                const next = [];
+                prev.forEach(row => {
+                    const key = String(row.id);
+                    const added = byClientId.get(key);
+                    if (added) {
+                        byClientId.delete(key);
+                        next.push(mergeDeltaRow(row, added));
+                    } else if (!deleted.has(key)) {
+                        const change = updated.get(key);
+                        next.push(change ? mergeDeltaRow(row, change) : row);
                     }
-                }
-                result = result.replace(/_+/g, '_').replace(/^_+|_+$/g, '');
-                return result;
-            };
-
-            const gridData = tags.map((t, i) => {
-                // Derive plc_addr and prefix from existing data
-                const plcAddr = t.plc_addr || t.var_addr || '';
-                const tagName = t.name || '';
-
-                // Reverse-engineer prefix: if tagName ends with sanitized(plcAddr), prefix is the remainder
-                let prefix = t.prefix || '';
-                if (!prefix && plcAddr && tagName) {
-                    const sanitizedAddr = sanitize(plcAddr);
-                    if (tagName.endsWith(sanitizedAddr)) {
-                        prefix = tagName.slice(0, tagName.length - sanitizedAddr.length);
+                });
+
+                // New to this grid: behind the last saved row with a lower id (walking back from the end)
+                const placed = new Set(next.map(row => String(row.id)));
+                const fresh = delta.added.filter(a => !placed.has(String(a.id)))
+                    .map((a, i) => toGridRow({ ...a.fields, id: a.id, version: a.version }, i))
+                    .sort((a, b) => Number(a.id) - Number(b.id));
+                if (fresh.length === 0) return next;
+                const merged = [];
+                let j = fresh.length - 1;
+                for (let k = next.length - 1; k >= 0; k--) {
+                    const row = next[k];
+                    if (SAVED_ID.test(String(row.id))) {
+                        while (j >= 0 && Number(fresh[j].id) > Number(row.id)) merged.push(fresh[j--]);
                     }
+                    merged.push(row);
                 }
-
-                return {
-                    ...t,
-                    id: t.id || `import_${i}_${Date.now()}`,
-                    plc_addr: plcAddr, // UI field
-                    prefix: prefix,     // Derived prefix
-                    // Ensure booleans are actual booleans
-                    is_expanded: false, // Collapse by default
-                    is_manual_override: t.is_manual_override !== undefined ? t.is_manual_override : true,
-
-                    // Arrays/SubRows
-                    subRows: [],
-
-                    // UI State Helpers (if needed)
-                    isTrend: t.is_trend,
-                    isAlarm: t.is_alarm
-                };
+                while (j >= 0) merged.push(fresh[j--]);
+                return merged.reverse();
             });
-            setData(gridData);
         }
     }));
 
@@ -214,7 +281,7 @@ const TagGrid = forwardRef(({ project, defaults, templates }, ref) => {
             if (isUdt && (!rowData.subRows || rowData.subRows.length === 0)) {
                 try {
                     // Send the full row data to the backend for expansion
-                    const res = await axios.post('http://127.0.0.1:8000/api/expand', {
+                    const res = await columnarPost('http://127.0.0.1:8000/api/expand', {
                         ...rowData,
                         entry_type: 'udt_instance' // Ensure backend knows it's a UDT
                     });